@@ -16,7 +16,15 @@ Structure:
     "total_tokens": 12000,
     "input_tokens": 8000,
     "output_tokens": 4000,
-    "duration_seconds": 120.5
+    "duration_seconds": 120.5,
+    "cache_hits": 40,
+    "cache_misses": 55,
+    "cache_saved_cost": 0.08,
+    "cached_input_tokens": 6000,
+    "cache_hit_ratio": 0.75,
+    "prompt_cache_saved_cost": 0.01,
+    "effective_cost_per_product": 0.002,
+    "cost_per_billed_product": 0.0035
   }
 }
 """
@@ -59,8 +67,9 @@ class FileTracker:
     
     def mark_completed(self, filename: str, run_id: str, success: int, filtered: int, 
                       errors: int, total_cost: float, total_tokens: int,
-                      input_tokens: int, output_tokens: int, duration_seconds: float):
-        """Mark file as completed"""
+                      input_tokens: int, output_tokens: int, duration_seconds: float,
+                      cache_stats: Optional[Dict] = None, cost_summary: Optional[Dict] = None):
+        """Mark file as completed (cost_summary: pricing.summarize_costs() of the run)"""
         self.files_state[filename] = {
             'status': 'completed',
             'last_run_id': run_id,
@@ -75,6 +84,20 @@ class FileTracker:
             'output_tokens': output_tokens,
             'duration_seconds': duration_seconds
         }
+        if cache_stats and cache_stats.get('enabled'):
+            self.files_state[filename].update({
+                'cache_hits': cache_stats['hits'],
+                'cache_misses': cache_stats['misses'],
+                'cache_saved_cost': cache_stats['saved_cost']
+            })
+        if cost_summary:
+            self.files_state[filename].update({
+                'cached_input_tokens': cost_summary['cached_input_tokens'],
+                'cache_hit_ratio': cost_summary['cache_hit_ratio'],
+                'prompt_cache_saved_cost': cost_summary['prompt_cache_saved_cost'],
+                'effective_cost_per_product': cost_summary['effective_cost_per_product'],
+                'cost_per_billed_product': cost_summary['cost_per_billed_product']
+            })
         self._save()
     
     def mark_error(self, filename: str, run_id: str, error_message: str):
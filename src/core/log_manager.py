@@ -20,15 +20,16 @@ from src.utils.file_utils import write_csv, write_log, ensure_dir
 class LogManager:
     """Centralized logging controller"""
     
-    def __init__(self, input_filename: str, base_path: str = 'data'):
+    def __init__(self, input_filename: str, base_path: str = 'data', run_id: str = None):
         self.input_filename = input_filename
         self.base_path = Path(base_path)
         
         # Extract file_id from filename (remove 'uncoded_' prefix if present)
         self.file_id = self._extract_file_id(input_filename)
         
-        # Get next run number
-        self.run_num = self._get_next_run_number()
+        # Get next run number (or reopen an existing run, e.g. --retry-errors run_3)
+        self.reopened = run_id is not None
+        self.run_num = int(run_id.split('_')[1]) if run_id else self._get_next_run_number()
         self.run_id = f"run_{self.run_num}"
         
         # Define paths
@@ -70,7 +71,8 @@ class LogManager:
     def _log_run_start(self):
         """Log run initialization"""
         timestamp = datetime.utcnow().isoformat()
-        message = f"[{timestamp}] RUN START: {self.input_filename} | Run: {self.run_id}"
+        event = 'RUN REOPENED' if self.reopened else 'RUN START'
+        message = f"[{timestamp}] {event}: {self.input_filename} | Run: {self.run_id}"
         write_log(self.logs_path / 'run.log', message)
     
     # ========== STEP LOGGING ==========
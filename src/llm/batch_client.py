@@ -0,0 +1,251 @@
+"""
+OpenAI Batch API Runner - Offline Step 2 for large, non-urgent files
+
+Instead of one interactive request per round trip, every pending
+conversation is written to a JSONL file and submitted through the Batch
+API (separate, much higher rate limits, 50% cheaper, up to 24h turnaround).
+
+Tool calls need several round trips, so the batch runs in ROUNDS:
+  1. Round 1: submit the initial prompt for every product
+  2. Products that answered with tool calls get their tools executed
+     locally (FREE - same registry as the interactive client)
+  3. Round N+1: resubmit only those conversations with the tool results
+  4. Repeat until every product has a final answer (or max rounds)
+
+Results come back in the same shape as GPTClient.extract_attributes(), so
+the rest of Step 2/3 is unchanged.
+"""
+
+import io
+import json
+import time
+from typing import Dict, List, Optional, Tuple
+from openai.types.chat import ChatCompletion
+from src.llm.gpt_client import ConversationResume, GPTClient, ToolResultSavings
+from src.llm.latency_presets import RoundPolicy, get_round_policy
+from src.llm.llm_config import LLMConfig, get_llm_config
+
+
+# Batch API pricing is 50% of the interactive price
+BATCH_PRICE_MULTIPLIER = 0.5
+
+# Batch API input file limits (200 MB / 50,000 requests) - stay a bit under
+MAX_BATCH_FILE_BYTES = 190 * 1024 * 1024
+MAX_BATCH_REQUESTS = 50_000
+
+BATCH_ENDPOINT = '/v1/chat/completions'
+TERMINAL_STATUSES = {'completed', 'failed', 'expired', 'cancelled'}
+
+
+class BatchRunner:
+    """Run many tool-calling conversations through the OpenAI Batch API"""
+
+    def __init__(self, client: GPTClient, config: LLMConfig = None):
+        self.client = client
+        self.config = config or get_llm_config()
+        self.batch_ids: List[str] = []
+
+    def run(self, prompts: Dict[str, str], tools: Optional[List[Dict]] = None, use_schema: bool = True,
+            response_format: Optional[Dict] = None, round_policy: Optional[RoundPolicy] = None) -> Dict[str, dict]:
+        """
+        Classify every prompt via multi-round batches
+
+        Args:
+            prompts: custom_id -> complete prompt
+            tools: Tool definitions (executed locally between rounds)
+            use_schema: Whether to use structured outputs
+            response_format: Structured output format to use instead (e.g. the lean schema)
+            round_policy: Per-round effort / token cap (None = the run's latency preset)
+
+        Returns:
+            custom_id -> parsed result with _metadata (or {'error', 'success': False})
+        """
+        conversations = {
+            custom_id: {
+                'messages': [{"role": "user", "content": prompt}],
+                'tokens': {'prompt': 0, 'completion': 0, 'total': 0, 'cached': 0, 'reasoning': 0},
+                'tool_calls_made': [],
+                'rounds': [],
+                'resume': ConversationResume(self.config.resume_max_steps),
+                'savings': ToolResultSavings()
+            }
+            for custom_id, prompt in prompts.items()
+        }
+        results: Dict[str, dict] = {}
+        pending = list(conversations.keys())
+        policy = round_policy or get_round_policy()
+
+        for round_num in range(1, self.config.batch_max_rounds + 1):
+            if not pending:
+                break
+
+            print(f"  📨 Batch round {round_num}: submitting {len(pending):,} requests...")
+            requests = []
+            for custom_id in pending:
+                conversation = conversations[custom_id]
+                conversation['resume'].start_round(conversation['tokens'])
+                conversation['savings'].start_round(conversation['messages'])
+                round_params = policy.params(round_num - 1, conversation['tool_calls_made'])
+                conversation['round_params'] = round_params
+                requests.append((custom_id, self.client._build_request(
+                    conversation['messages'], tools, use_schema, response_format,
+                    reasoning_effort=round_params['reasoning_effort'],
+                    max_completion_tokens=round_params['max_completion_tokens']
+                )))
+            responses = self._submit_and_wait(requests)
+
+            next_pending = []
+            for custom_id in pending:
+                response = responses.get(custom_id)
+                if response is None or 'error' in response:
+                    error = response['error'] if response else 'No result returned by batch'
+                    results[custom_id] = {'error': error, 'success': False}
+                    continue
+
+                conversation = conversations[custom_id]
+                try:
+                    if self._apply_response(conversation, response['body']):
+                        next_pending.append(custom_id)
+                    else:
+                        results[custom_id] = self._final_result(conversation, round_num, policy)
+                except Exception as e:
+                    results[custom_id] = {'error': str(e), 'success': False}
+
+            pending = next_pending
+
+        for custom_id in pending:
+            results[custom_id] = {
+                'error': f"Tool-call loop did not finish within {self.config.batch_max_rounds} batch rounds",
+                'success': False
+            }
+
+        return results
+
+    def _apply_response(self, conversation: Dict, body: Dict) -> bool:
+        """
+        Add one batch response to its conversation
+
+        Returns:
+            True if the model asked for tools or the answer is re-requested
+            (needs another round)
+        """
+        response = ChatCompletion.model_validate(body)
+        message = response.choices[0].message
+        self.client._add_usage(conversation['tokens'], response.usage)
+        # Batch turnaround says nothing about model latency - tokens only
+        entry = self.client._round_entry(conversation['round_params'], response.usage, 0)
+        entry['latency_sec'] = None
+        conversation['rounds'].append(entry)
+        tool_calls_made = conversation['tool_calls_made']
+
+        if not message.tool_calls:
+            # Invalid JSON is repaired in the next round on the same history
+            conversation['result'] = self.client._parse_or_resume(
+                message, conversation['messages'], conversation['resume'], tool_calls_made
+            )
+            return conversation['result'] is None
+
+        # Batch requests are plain JSON - store the assistant turn as a dict
+        conversation['messages'].append(message.model_dump(exclude_none=True))
+        round_start = len(tool_calls_made)
+        conversation['messages'].extend(self.client._execute_tool_calls(message.tool_calls, tool_calls_made))
+        conversation['savings'].add(tool_calls_made[round_start:])
+        self.client._resume_tool_errors(conversation['resume'], tool_calls_made, round_start)
+        return True
+
+    def _final_result(self, conversation: Dict, rounds: int, policy: RoundPolicy) -> dict:
+        """Attach (batch-priced) metadata to the parsed final answer"""
+        result = conversation['result']
+        metadata = self.client._build_metadata(conversation['tokens'], conversation['tool_calls_made'],
+                                               price_multiplier=BATCH_PRICE_MULTIPLIER, round_trips=rounds,
+                                               resume=conversation['resume'], savings=conversation['savings'],
+                                               effort={'preset': policy.name, 'rounds': conversation['rounds']})
+        metadata['batch'] = {'rounds': rounds, 'batch_ids': list(self.batch_ids)}
+        result['_metadata'] = metadata
+        return result
+
+    def _submit_and_wait(self, requests: List[Tuple[str, Dict]]) -> Dict[str, Dict]:
+        """Submit requests (split to fit the file limits) and collect every response"""
+        batch_ids = [self._submit(chunk) for chunk in self._chunk(requests)]
+
+        responses = {}
+        for batch_id in batch_ids:
+            responses.update(self._wait_and_collect(batch_id))
+        return responses
+
+    @staticmethod
+    def _chunk(requests: List[Tuple[str, Dict]]) -> List[List[str]]:
+        """Serialize requests to JSONL lines, split by request count and file size"""
+        chunks, current, current_bytes = [], [], 0
+        for custom_id, body in requests:
+            line = json.dumps({
+                'custom_id': custom_id,
+                'method': 'POST',
+                'url': BATCH_ENDPOINT,
+                'body': body
+            })
+            line_bytes = len(line.encode('utf-8')) + 1
+            if current and (len(current) >= MAX_BATCH_REQUESTS or current_bytes + line_bytes > MAX_BATCH_FILE_BYTES):
+                chunks.append(current)
+                current, current_bytes = [], 0
+            current.append(line)
+            current_bytes += line_bytes
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def _submit(self, lines: List[str]) -> str:
+        """Upload one JSONL file and create its batch"""
+        payload = io.BytesIO(('\n'.join(lines) + '\n').encode('utf-8'))
+        input_file = self.client.client.files.create(file=('step2_batch.jsonl', payload), purpose='batch')
+        batch = self.client.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=self.config.batch_completion_window
+        )
+        self.batch_ids.append(batch.id)
+        print(f"     Submitted batch {batch.id} ({len(lines):,} requests)")
+        return batch.id
+
+    def _wait_and_collect(self, batch_id: str) -> Dict[str, Dict]:
+        """Poll until the batch finishes, then read its output and error files"""
+        while True:
+            batch = self.client.client.batches.retrieve(batch_id)
+            if batch.status in TERMINAL_STATUSES:
+                break
+            counts = batch.request_counts
+            done = f"{counts.completed + counts.failed:,}/{counts.total:,}" if counts else "?"
+            print(f"     {batch_id}: {batch.status} ({done})")
+            time.sleep(self.config.batch_poll_interval)
+
+        print(f"     {batch_id}: {batch.status}")
+
+        responses = {}
+        # Expired/cancelled batches still return whatever finished
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                responses.update(self._read_results(file_id))
+
+        if batch.status == 'failed' and not responses:
+            errors = getattr(batch, 'errors', None)
+            messages = [e.message for e in (errors.data or [])] if errors else []
+            print(f"     ⚠️  Batch {batch_id} failed: {'; '.join(m for m in messages if m) or 'unknown error'}")
+
+        return responses
+
+    def _read_results(self, file_id: str) -> Dict[str, Dict]:
+        """Parse a batch output/error JSONL file"""
+        text = self.client.client.files.content(file_id).text
+        responses = {}
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            response = item.get('response') or {}
+            if item.get('error') or response.get('status_code') != 200:
+                error = item.get('error') or (response.get('body') or {}).get('error') or {}
+                message = error.get('message') if isinstance(error, dict) else str(error)
+                responses[item['custom_id']] = {'error': f"Batch request failed: {message or response.get('status_code')}"}
+            else:
+                responses[item['custom_id']] = {'body': response['body']}
+        return responses
@@ -0,0 +1,349 @@
+"""
+Adaptive Concurrency - AIMD limit on in-flight LLM requests
+
+A fixed worker count is a guess: too low wastes throughput, too high turns
+into a storm of 429s where every thread sleeps on its own. Every chat
+completion call takes a slot from ONE shared limiter instead:
+  - slow start: the limit doubles per window until the first congestion signal
+  - additive increase: then +1 per window of healthy responses
+  - multiplicative decrease: the limit is cut on a 429, an exhausted
+    x-ratelimit-remaining-* header or a latency spike
+Only one cut happens per window - signals from requests that started before
+the last cut describe the old limit and are ignored.
+
+Worker threads / coroutines stay at the configured maximum; the limiter
+decides how many of them are actually talking to the API.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict, Mapping, Optional
+
+from src.llm.llm_config import get_llm_config
+
+
+# Fast/slow latency averages - a spike is fast > ratio * slow
+LATENCY_FAST_ALPHA = 0.3
+LATENCY_SLOW_ALPHA = 0.02
+LATENCY_WARMUP_SAMPLES = 20
+LATENCY_SPIKE_MIN_SEC = 0.5  # Ignore jitter on very fast responses
+
+# Stop growing when less than this share of the rate-limit window is left
+RATELIMIT_LOW_WATERMARK = 0.05
+
+
+def _parse_int(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value) if value not in (None, '') else None
+    except ValueError:
+        return None
+
+
+def ratelimit_headroom(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """
+    Smallest remaining/limit share across x-ratelimit-*-requests/-tokens
+
+    Returns:
+        0.0 - 1.0, or None when the response carries no rate-limit headers
+    """
+    if not headers:
+        return None
+
+    shares = []
+    for kind in ('requests', 'tokens'):
+        remaining = _parse_int(headers.get(f'x-ratelimit-remaining-{kind}'))
+        limit = _parse_int(headers.get(f'x-ratelimit-limit-{kind}'))
+        if remaining is not None and limit:
+            shares.append(remaining / limit)
+    return min(shares) if shares else None
+
+
+class _Waiter:
+    """A blocked acquire() - a thread Event or an asyncio Future on its own loop"""
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._set_future)
+
+    def _set_future(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Shared AIMD limiter for sync (threads) and async (asyncio) callers
+
+    Use slot() / slot_async() around ONE API call and report the outcome
+    on the returned slot (on_success / on_rate_limit).
+    """
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int, decrease_factor: float = 0.5,
+                 latency_spike_ratio: float = 3.0, adaptive: bool = True):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self._base_min_limit = self.min_limit
+        self.adaptive = adaptive
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit) if adaptive else self.max_limit)
+        self.decrease_factor = decrease_factor
+        self.latency_spike_ratio = latency_spike_ratio
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._waiters = deque()
+        self._slow_start = True
+        self._window_successes = 0
+        self._last_cut_at = 0.0
+        self._latency_fast = None
+        self._latency_slow = None
+        self._latency_samples = 0
+        self._stats = {
+            'requests': 0,
+            'rate_limited': 0,
+            'latency_spikes': 0,
+            'header_throttles': 0,
+            'decreases': 0,
+            'peak_limit': int(self.limit),
+            'min_seen_limit': int(self.limit)
+        }
+        self._last_headroom = None
+
+    # ----- slots -----
+
+    @contextmanager
+    def slot(self):
+        """Hold one in-flight slot (blocks the thread while the limit is reached)"""
+        self._acquire()
+        slot = _Slot(self)
+        try:
+            yield slot
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def slot_async(self):
+        """Hold one in-flight slot (awaits without blocking the event loop)"""
+        await self._acquire_async()
+        slot = _Slot(self)
+        try:
+            yield slot
+        finally:
+            self._release()
+
+    def _try_acquire_locked(self) -> bool:
+        if self._in_flight < int(self.limit) and not self._waiters:
+            self._in_flight += 1
+            return True
+        return False
+
+    def _acquire(self):
+        with self._lock:
+            if self._try_acquire_locked():
+                return
+            waiter = _Waiter()
+            self._waiters.append(waiter)
+        # The releaser hands the slot over (in_flight already counted)
+        waiter.event.wait()
+
+    async def _acquire_async(self):
+        with self._lock:
+            if self._try_acquire_locked():
+                return
+            waiter = _Waiter(asyncio.get_running_loop())
+            self._waiters.append(waiter)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    handed_over = False
+                else:
+                    handed_over = True
+            if handed_over:
+                self._release()
+            raise
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+            self._wake_locked()
+
+    def _wake_locked(self):
+        """Hand free slots to waiters in FIFO order (caller holds lock)"""
+        while self._waiters and self._in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            self._in_flight += 1
+            waiter.wake()
+
+    # ----- signals -----
+
+    def _on_success(self, started_at: float, latency: float, headers: Optional[Mapping[str, str]]):
+        headroom = ratelimit_headroom(headers)
+        with self._lock:
+            self._stats['requests'] += 1
+            self._last_headroom = headroom if headroom is not None else self._last_headroom
+            spike = self._observe_latency_locked(latency)
+
+            if not self.adaptive:
+                return
+            if headroom is not None and headroom <= 0:
+                self._stats['header_throttles'] += 1
+                self._decrease_locked(started_at)
+                return
+            if spike:
+                self._stats['latency_spikes'] += 1
+                self._decrease_locked(started_at)
+                return
+            if headroom is not None and headroom < RATELIMIT_LOW_WATERMARK:
+                # Close to the provider's limit - hold steady
+                self._stats['header_throttles'] += 1
+                return
+
+            # One window = `limit` healthy responses
+            self._window_successes += 1
+            if self._window_successes >= int(self.limit):
+                self._window_successes = 0
+                grown = self.limit * 2 if self._slow_start else self.limit + 1
+                self._set_limit_locked(grown)
+
+    def _on_rate_limit(self, started_at: float):
+        with self._lock:
+            self._stats['requests'] += 1
+            self._stats['rate_limited'] += 1
+            if self.adaptive:
+                self._decrease_locked(started_at)
+
+    def _observe_latency_locked(self, latency: float) -> bool:
+        """Update latency averages; True if the fast average spiked over the baseline"""
+        self._latency_samples += 1
+        if self._latency_fast is None:
+            self._latency_fast = self._latency_slow = latency
+            return False
+        self._latency_fast += LATENCY_FAST_ALPHA * (latency - self._latency_fast)
+        self._latency_slow += LATENCY_SLOW_ALPHA * (latency - self._latency_slow)
+        return (self._latency_samples > LATENCY_WARMUP_SAMPLES
+                and self._latency_fast > self.latency_spike_ratio * self._latency_slow
+                and self._latency_fast - self._latency_slow > LATENCY_SPIKE_MIN_SEC)
+
+    def _decrease_locked(self, started_at: float):
+        """Multiplicative decrease, at most once per window"""
+        if started_at < self._last_cut_at:
+            return
+        self._last_cut_at = time.monotonic()
+        self._slow_start = False
+        self._window_successes = 0
+        self._stats['decreases'] += 1
+        self._set_limit_locked(self.limit * self.decrease_factor)
+        # Don't let the spike itself become the new baseline
+        self._latency_fast = self._latency_slow
+
+    def _set_limit_locked(self, value: float):
+        self.limit = float(min(self.max_limit, max(self.min_limit, value)))
+        self._stats['peak_limit'] = max(self._stats['peak_limit'], int(self.limit))
+        self._stats['min_seen_limit'] = min(self._stats['min_seen_limit'], int(self.limit))
+        self._wake_locked()
+
+    def set_floor(self, value: int):
+        """
+        Raise (or lower back) the minimum limit - used by the run deadline scheduler
+
+        Never below the configured minimum or above the ceiling; the AIMD
+        cuts then stop at this floor.
+        """
+        with self._lock:
+            self.min_limit = max(self._base_min_limit, min(int(value), self.max_limit))
+            if self.limit < self.min_limit:
+                self._set_limit_locked(self.min_limit)
+
+    # ----- reporting -----
+
+    @property
+    def current_limit(self) -> int:
+        return int(self.limit)
+
+    def stats(self) -> Dict[str, Any]:
+        """Limiter state for progress output and the run manifest"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'enabled': True,
+                'adaptive': self.adaptive,
+                'current_limit': int(self.limit),
+                'min_limit': self.min_limit,
+                'max_limit': self.max_limit,
+                'in_flight': self._in_flight,
+                'waiting': len(self._waiters),
+                'slow_start': self._slow_start,
+                'latency_ewma_sec': round(self._latency_slow, 3) if self._latency_slow is not None else None,
+                'ratelimit_headroom': round(self._last_headroom, 4) if self._last_headroom is not None else None
+            })
+        return stats
+
+
+class _Slot:
+    """One held slot - report how its API call went"""
+
+    def __init__(self, limiter: AdaptiveConcurrencyLimiter):
+        self.limiter = limiter
+        self.started_at = time.monotonic()
+
+    def on_success(self, headers: Optional[Mapping[str, str]] = None):
+        self.limiter._on_success(self.started_at, time.monotonic() - self.started_at, headers)
+
+    def on_rate_limit(self):
+        self.limiter._on_rate_limit(self.started_at)
+
+
+# Global instance (lazy loaded)
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_concurrency_limiter(max_limit: Optional[int] = None) -> AdaptiveConcurrencyLimiter:
+    """
+    Get the process-wide limiter
+
+    Args:
+        max_limit: Ceiling for in-flight requests, used on first call only
+                   (default: LLM config concurrency, else 1000)
+    """
+    global _limiter
+
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                config = get_llm_config()
+                _limiter = AdaptiveConcurrencyLimiter(
+                    initial=config.concurrency_initial,
+                    min_limit=config.concurrency_min,
+                    max_limit=max_limit or config.concurrency or 1000,
+                    decrease_factor=config.concurrency_decrease_factor,
+                    latency_spike_ratio=config.latency_spike_ratio,
+                    adaptive=config.adaptive_concurrency
+                )
+
+    return _limiter
+
+
+def get_concurrency_stats() -> Dict[str, Any]:
+    """Stats for the run manifest ({'enabled': False} before any LLM call)"""
+    return _limiter.stats() if _limiter is not None else {'enabled': False}
+
+
+def concurrency_status() -> str:
+    """Short 'limit=N in_flight=M' text for progress output ('' before any LLM call)"""
+    if _limiter is None:
+        return ''
+    stats = _limiter.stats()
+    return f"limit={stats['current_limit']} in_flight={stats['in_flight']}"
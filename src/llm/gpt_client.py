@@ -5,35 +5,835 @@ Uses Structured Outputs for guaranteed JSON schema compliance
 
 import os
 import json
+import time
+import asyncio
 import inspect
-from typing import List, Dict, Optional, Callable
-from openai import OpenAI
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from typing import List, Dict, Optional, Callable, Set, Tuple
+import httpx
+import openai
+from openai import OpenAI, AsyncOpenAI
 from dotenv import load_dotenv
 from src.llm.response_schema import RESPONSE_FORMAT_SCHEMA
+from src.llm.llm_config import LLMConfig, get_llm_config
+from src.llm.concurrency import get_concurrency_limiter
+from src.llm.rate_limiter import get_rate_limiter
+from src.llm.hedging import get_request_hedger
+from src.llm.pricing import compute_cost
+from src.llm.latency_presets import RoundPolicy, get_round_policy
+from src.llm.responses_api import ResponsesConversation, wrap_response
+from src.llm.tools.compact import serialize_tool_result
+from src.llm.utils.retry_policy import build_retry_policy, get_retry_policy
 
 # Load environment variables from .env file
 load_dotenv()
 
 
+def _cached_prompt_tokens(usage) -> int:
+    """Prompt tokens served from the provider's prompt cache (0 if not reported)"""
+    details = getattr(usage, 'prompt_tokens_details', None)
+    return getattr(details, 'cached_tokens', 0) or 0
+
+
+def _reasoning_tokens(usage) -> int:
+    """Completion tokens spent on hidden reasoning (0 if not reported)"""
+    details = getattr(usage, 'completion_tokens_details', None)
+    return getattr(details, 'reasoning_tokens', 0) or 0
+
+
+def zero_usage_metadata(metadata: Dict) -> Dict:
+    """Zero the spend in a result's metadata (result was reused, nothing was billed)"""
+    metadata['tokens_used'] = {'prompt': 0, 'completion': 0, 'total': 0, 'cached': 0, 'reasoning': 0}
+    metadata['total_cost'] = 0.0
+    metadata['cost_breakdown'] = {
+        'input_tokens': 0,
+        'cached_input_tokens': 0,
+        'output_tokens': 0,
+        'input_cost': 0.0,
+        'cached_input_cost': 0.0,
+        'output_cost': 0.0,
+        'uncached_cost': 0.0
+    }
+    return metadata
+
+
+class _UnreportedSlot:
+    """Concurrency slot of an isolated client - outcomes are not reported to the shared limiter"""
+    
+    def on_success(self, headers=None):
+        pass
+    
+    def on_rate_limit(self):
+        pass
+
+
+class ProductDeadlineExceeded(TimeoutError):
+    """The product's total time budget (all rounds + retries) ran out"""
+
+
+# Sent after an unparseable final answer - the model repairs it from the kept history
+RESUME_JSON_MESSAGE = (
+    "Your previous reply was not valid JSON. Reply again with ONLY the complete JSON object "
+    "described in the instructions - no text before or after it."
+)
+
+
+class ConversationResume:
+    """
+    Resume-from-failure bookkeeping for one tool-call conversation
+    
+    A failed step (unparseable final answer, tool call that raised) is retried
+    inside the conversation instead of restarting the product: the prompt,
+    earlier tool calls and their results are kept. Each resumed step records
+    what a restart would have spent again - the tokens and time of every
+    round before the failing one, and the tool calls already executed.
+    """
+    
+    def __init__(self, max_steps: int):
+        self.max_steps = max_steps
+        self.started_at = time.monotonic()
+        self.steps: List[Dict] = []
+        self._round_tokens = 0
+        self._round_started_at = self.started_at
+    
+    def start_round(self, total_tokens: Dict[str, int]):
+        """Snapshot spend before an API round (what a restart would repeat if this round fails)"""
+        self._round_tokens = total_tokens['total']
+        self._round_started_at = time.monotonic()
+    
+    def try_resume(self, reason: str, tool_calls_made: List[Dict]) -> bool:
+        """Record a resumed step (False = out of resume steps, caller raises)"""
+        if len(self.steps) >= self.max_steps:
+            return False
+        self.steps.append({
+            'reason': reason,
+            'saved_tokens': self._round_tokens,
+            'saved_seconds': round(self._round_started_at - self.started_at, 3),
+            'reused_tool_calls': sum(1 for call in tool_calls_made if 'error' not in call)
+        })
+        return True
+    
+    def metadata(self) -> Optional[Dict]:
+        """Per-product resume summary (None if nothing was resumed)"""
+        if not self.steps:
+            return None
+        return {
+            'steps': len(self.steps),
+            'reasons': [step['reason'] for step in self.steps],
+            'saved_tokens': sum(step['saved_tokens'] for step in self.steps),
+            'saved_seconds': round(sum(step['saved_seconds'] for step in self.steps), 3),
+            'reused_tool_calls': sum(step['reused_tool_calls'] for step in self.steps)
+        }
+
+
+def _conversation_chars(messages: List) -> int:
+    """Size of a conversation payload (JSON chars; SDK message objects included)"""
+    return len(json.dumps(messages, default=lambda message: message.model_dump(exclude_none=True)))
+
+
+class ToolResultSavings:
+    """
+    Prompt tokens saved by compact tool results in one conversation
+    
+    A tool result stays in the context of every later round (re-sent on
+    chat.completions, replayed from the stored conversation on the Responses
+    API), so its saved chars count once per later round. Chars are turned
+    into tokens at the conversation's own chars-per-prompt-token ratio.
+    """
+    
+    def __init__(self):
+        self.saved_chars = 0
+        self.context_chars = 0
+        self._in_context = 0
+    
+    def start_round(self, messages: List):
+        """Count the context of the next request"""
+        self.saved_chars += self._in_context
+        self.context_chars += _conversation_chars(messages)
+    
+    def add(self, tool_calls: List[Dict]):
+        """Tool calls of the last round (audit records carry saved_chars when compacted)"""
+        self._in_context += sum(call.get('saved_chars', 0) for call in tool_calls)
+    
+    def metadata(self, prompt_tokens: int) -> Optional[Dict]:
+        """Per-product savings (None if nothing was compacted)"""
+        if not self.saved_chars or not self.context_chars:
+            return None
+        return {
+            'saved_chars': self.saved_chars,
+            'saved_prompt_tokens': round(self.saved_chars * prompt_tokens / self.context_chars)
+        }
+
+
+class ToolLoop:
+    """
+    State and per-round bookkeeping of one product's tool-call conversation
+    
+    Shared by extract_attributes() and extract_attributes_async(), which only
+    differ in how the round trips and tool calls are run:
+    
+        while tool_loop.result is None:
+            params = tool_loop.next_request()
+            message = tool_loop.add_response(create(params, tool_loop.deadline, context=tool_loop.messages))
+            if message.tool_calls:
+                tool_messages = execute_tool_calls(message.tool_calls, tool_loop.tool_calls_made)
+                tool_loop.add_tool_results(message, tool_messages)
+            else:
+                tool_loop.finish(message)
+    """
+    
+    def __init__(self, client: 'GPTClient', prompt: str, tools: Optional[List[Dict]], use_schema: bool,
+                 response_format: Optional[Dict], model: Optional[str], reasoning_effort: Optional[str],
+                 max_completion_tokens: Optional[int], round_policy: Optional[RoundPolicy]):
+        self.client = client
+        self.tools = tools
+        self.use_schema = use_schema
+        self.response_format = response_format
+        self.model = model
+        self.reasoning_effort = reasoning_effort
+        self.max_completion_tokens = max_completion_tokens
+        self.policy = round_policy or get_round_policy()
+        
+        self.messages = [{"role": "user", "content": prompt}]
+        self.total_tokens = {'prompt': 0, 'completion': 0, 'total': 0, 'cached': 0, 'reasoning': 0}
+        self.tool_calls_made: List[Dict] = []
+        self.round_trips = 0
+        self.rounds: List[Dict] = []
+        self.request_chars = 0
+        self.resume = ConversationResume(client.config.resume_max_steps)
+        self.savings = ToolResultSavings()
+        self.conversation = ResponsesConversation() if client.config.api == 'responses' else None
+        self.deadline = client._product_deadline()
+        self.started = time.monotonic()
+        self.result: Optional[dict] = None
+        
+        self._params: Dict = {}
+        self._round_params: Dict = {}
+        self._round_started = self.started
+        self._round_start = 0
+    
+    def next_request(self) -> Dict:
+        """Params of the next round trip (snapshots the spend a resumed step would save)"""
+        self.resume.start_round(self.total_tokens)
+        self.savings.start_round(self.messages)
+        self._round_params = self.client._round_params(self.policy, self.round_trips, self.tool_calls_made,
+                                                       self.reasoning_effort, self.max_completion_tokens)
+        self._params = self.client._conversation_request(
+            self.conversation, self.messages, self.tools, self.use_schema, self.response_format, self.model,
+            self._round_params['reasoning_effort'], self._round_params['max_completion_tokens']
+        )
+        self._round_started = time.monotonic()
+        return self._params
+    
+    def add_response(self, response):
+        """Account the usage of a round trip; returns its assistant message"""
+        self.rounds.append(self.client._round_entry(self._round_params, response.usage,
+                                                    time.monotonic() - self._round_started))
+        if self.conversation is not None:
+            self.conversation.advance(response)
+        self.request_chars += self.client._request_chars(self._params)
+        self.client._add_usage(self.total_tokens, response.usage)
+        self.round_trips += 1
+        self._round_start = len(self.tool_calls_made)
+        return response.choices[0].message
+    
+    def add_tool_results(self, message, tool_messages: List[Dict]):
+        """Add the assistant turn and its tool results to the history (tool calls that raised are resumed)"""
+        self.messages.append(message)
+        self.messages.extend(tool_messages)
+        self.savings.add(self.tool_calls_made[self._round_start:])
+        self.client._resume_tool_errors(self.resume, self.tool_calls_made, self._round_start)
+    
+    def finish(self, message):
+        """Parse the final answer into self.result (an invalid one is re-requested on the same history)"""
+        self.result = self.client._parse_or_resume(message, self.messages, self.resume, self.tool_calls_made,
+                                                   self.spent)
+        if self.result is not None:
+            self.result['_metadata'] = self.spent()
+    
+    def spent(self) -> Dict:
+        """Cost and audit metadata of the conversation so far"""
+        return self.client._build_metadata(
+            self.total_tokens, self.tool_calls_made, round_trips=self.round_trips, resume=self.resume,
+            latency_sec=time.monotonic() - self.started, api=self.client.config.api,
+            request_chars=self.request_chars, savings=self.savings, model=self.model,
+            reasoning_effort=self.reasoning_effort, effort={'preset': self.policy.name, 'rounds': self.rounds}
+        )
+
+
+# Shared pool for the tool calls of one assistant turn (lazy loaded)
+_tool_executor = None
+_tool_executor_lock = threading.Lock()
+
+
+def _get_tool_executor(workers: int) -> ThreadPoolExecutor:
+    """Process-wide executor for concurrent tool calls"""
+    global _tool_executor
+    
+    if _tool_executor is None:
+        with _tool_executor_lock:
+            if _tool_executor is None:
+                _tool_executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='llm-tool')
+    
+    return _tool_executor
+
+
 class GPTClient:
-    """Client for calling GPT-5-mini with function calling support"""
+    """
+    Client for calling GPT-5-mini with function calling support
+    
+    Thread-safe: one instance (and its keep-alive connection pool) is meant
+    to be shared by all workers - see get_llm_client() in step2_llm.
+    
+    An isolated client (shadow evaluation) has its own retry budget and
+    circuit breaker and stays out of the hedger, the adaptive concurrency
+    limiter and the RPM/TPM budget, so its traffic cannot slow, pause or
+    skew the stats of the primary requests. Its caller bounds concurrency.
+    """
     
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, config: LLMConfig = None, isolated: bool = False):
         self.api_key = api_key or os.getenv('OPENAI_API_KEY')
         if not self.api_key:
             raise ValueError("OPENAI_API_KEY not found in environment")
         
-        self.client = OpenAI(api_key=self.api_key)
-        self.model = "gpt-5-mini"  # GPT-5-mini - faster and more cost efficient
+        self.config = config or get_llm_config()
+        self.isolated = isolated
+        self.retry_policy = build_retry_policy(self.config) if isolated else None
+        self.timeout = httpx.Timeout(self.config.read_timeout, connect=self.config.connect_timeout)
         
-        # Tool registry
+        # Pooled keep-alive HTTP client - avoids a TLS handshake per request
+        self.http_client = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=self.config.max_connections,
+                max_keepalive_connections=self.config.max_keepalive_connections,
+                keepalive_expiry=self.config.keepalive_expiry
+            ),
+            timeout=self.timeout
+        )
+        # SDK retries off - the shared retry policy owns backoff, budget and breaker
+        self.client = OpenAI(api_key=self.api_key, http_client=self.http_client, timeout=self.timeout, max_retries=0)
+        
+        # Async client for the asyncio engine (created on first use, per event loop)
+        self._async_client = None
+        self._async_loop = None
+        self.model = self.config.model  # GPT-5-mini - faster and more cost efficient
+        
+        # Tool registry (+ accepted parameter names, resolved once at registration)
         self.tools: Dict[str, Callable] = {}
+        self.tool_params: Dict[str, Set[str]] = {}
+        self.tool_profiles: Dict[str, Dict] = {}  # Compact tool-message profiles (see tools/compact.py)
     
-    def register_tool(self, name: str, function: Callable):
-        """Register a tool function that can be called by the LLM."""
+    def register_tool(self, name: str, function: Callable, result_profile: Optional[Dict] = None):
+        """Register a tool function that can be called by the LLM (result_profile: compact tool message)"""
         self.tools[name] = function
+        self.tool_params[name] = set(inspect.signature(function).parameters.keys())
+        if result_profile:
+            self.tool_profiles[name] = result_profile
+    
+    def close(self):
+        """Close the pooled HTTP connections"""
+        self.client.close()
+    
+    def _get_async_client(self) -> AsyncOpenAI:
+        """
+        Pooled AsyncOpenAI client bound to the running event loop
+        
+        httpx async connections belong to the loop that opened them, so a new
+        pool is created if the engine starts a new loop (e.g. per batch).
+        """
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.config.max_connections,
+                    max_keepalive_connections=self.config.max_keepalive_connections,
+                    keepalive_expiry=self.config.keepalive_expiry
+                ),
+                timeout=self.timeout
+            )
+            self._async_client = AsyncOpenAI(api_key=self.api_key, http_client=http_client, timeout=self.timeout,
+                                             max_retries=0)
+            self._async_loop = loop
+        return self._async_client
+    
+    def _build_request(self, messages: List, tools: Optional[List[Dict]], use_schema: bool,
+                       response_format: Optional[Dict] = None, model: Optional[str] = None,
+                       reasoning_effort: Optional[str] = None,
+                       max_completion_tokens: Optional[int] = None) -> Dict:
+        """Build chat.completions params for one round trip (response_format overrides use_schema)"""
+        api_params = {
+            "model": model or self.model,
+            "messages": messages
+        }
+        if reasoning_effort:
+            api_params["reasoning_effort"] = reasoning_effort
+        if max_completion_tokens:
+            api_params["max_completion_tokens"] = max_completion_tokens  # Reasoning + answer tokens
+        
+        # ALWAYS use structured outputs for guaranteed JSON schema compliance
+        # OpenAI supports Structured Outputs WITH function calling (as of Aug 2024)
+        if response_format:
+            api_params["response_format"] = response_format
+        elif use_schema:
+            api_params["response_format"] = RESPONSE_FORMAT_SCHEMA
+        else:
+            api_params["response_format"] = {"type": "json_object"}
+        
+        # IMPORTANT: Include tools on every round so LLM can make more tool calls if needed
+        # (e.g., apply_business_rules after lookup_ingredient)
+        if tools:
+            api_params["tools"] = tools
+            api_params["tool_choice"] = "auto"  # LLM decides when to use tools
+        
+        return api_params
+    
+    def _product_deadline(self) -> Optional[float]:
+        """
+        Monotonic deadline for one product's whole tool loop (None = no limit)
+        
+        LLM_PRODUCT_DEADLINE_SEC from now, capped by the run deadline (--deadline).
+        """
+        deadlines = []
+        if self.config.product_deadline_sec > 0:
+            deadlines.append(time.monotonic() + self.config.product_deadline_sec)
+        if self.config.run_deadline:
+            deadlines.append(time.monotonic() + self.config.run_deadline - time.time())
+        return min(deadlines) if deadlines else None
+    
+    def _round_timeout(self, deadline: Optional[float]) -> httpx.Timeout:
+        """
+        Connect/read timeout for one round trip, clipped to the product deadline
+        
+        Raises:
+            ProductDeadlineExceeded if no time is left
+        """
+        if deadline is None:
+            return self.timeout
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise ProductDeadlineExceeded("No time left for another round trip")
+        return httpx.Timeout(min(self.config.read_timeout, remaining),
+                             connect=min(self.config.connect_timeout, remaining))
+    
+    @staticmethod
+    def _check_backoff(deadline: Optional[float], delay: float, error: Exception):
+        """Give up instead of sleeping past the product deadline"""
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            raise ProductDeadlineExceeded(f"No time left to retry: {error}") from error
+    
+    def _call_guards(self):
+        """(retry policy, hedger or None) for a round trip - an isolated client has its own policy and no hedger"""
+        return self.retry_policy or get_retry_policy(), None if self.isolated else get_request_hedger()
+    
+    def _retry_delay(self, policy, error: Exception, attempt: int, previous_delay: float,
+                     deadline: Optional[float]) -> float:
+        """Backoff before retrying a failed attempt (re-raises the error once the policy gives up)"""
+        delay = policy.next_delay(error, attempt, previous_delay)
+        if delay is None:
+            raise error
+        self._check_backoff(deadline, delay, error)
+        return delay
+    
+    def _create(self, params: Dict, deadline: Optional[float] = None, context: Optional[List] = None):
+        """
+        One chat completion, retried on transient errors by the shared retry policy
+        
+        Only THIS round trip is retried - earlier rounds of the tool-call
+        conversation are kept. Raises once the policy gives up. With hedging
+        on, a slow attempt gets a duplicate request (see hedging.py).
+        
+        params may also be Responses API params (see responses_api.py);
+        context is then the whole conversation, for the rate-limit estimate.
+        """
+        policy, hedger = self._call_guards()
+        policy.first_attempt()
+        attempt, delay = 0, 0.0
+        while True:
+            attempt += 1
+            policy.breaker.before_call()
+            try:
+                if hedger is not None:
+                    response = hedger.call(lambda: self._create_once(params, deadline, context), params.get('model'))
+                else:
+                    response = self._create_once(params, deadline, context)
+            except Exception as e:
+                delay = self._retry_delay(policy, e, attempt, delay, deadline)
+                time.sleep(delay)
+                continue
+            policy.record_success()
+            return response
+    
+    async def _create_async(self, client: AsyncOpenAI, params: Dict, deadline: Optional[float] = None,
+                            context: Optional[List] = None):
+        """Async version of _create() - backs off with asyncio.sleep"""
+        policy, hedger = self._call_guards()
+        policy.first_attempt()
+        attempt, delay = 0, 0.0
+        while True:
+            attempt += 1
+            await policy.breaker.before_call_async()
+            try:
+                if hedger is not None:
+                    response = await hedger.call_async(lambda: self._create_once_async(client, params, deadline, context),
+                                                      params.get('model'))
+                else:
+                    response = await self._create_once_async(client, params, deadline, context)
+            except Exception as e:
+                delay = self._retry_delay(policy, e, attempt, delay, deadline)
+                await asyncio.sleep(delay)
+                continue
+            policy.record_success()
+            return response
+    
+    @contextmanager
+    def _slot(self):
+        """Adaptive limiter slot for one HTTP attempt (none for an isolated client)"""
+        if self.isolated:
+            yield _UnreportedSlot()
+            return
+        with get_concurrency_limiter().slot() as slot:
+            yield slot
+    
+    @asynccontextmanager
+    async def _slot_async(self):
+        """Async version of _slot()"""
+        if self.isolated:
+            yield _UnreportedSlot()
+            return
+        async with get_concurrency_limiter().slot_async() as slot:
+            yield slot
+    
+    def _rate_limiter(self):
+        """Shared RPM/TPM budget (None for an isolated client or when it is off)"""
+        return None if self.isolated else get_rate_limiter()
+    
+    @staticmethod
+    def _parse_raw(raw, params: Dict):
+        """Parsed reply of a raw response - Responses API replies wrapped as a ChatCompletion"""
+        response = raw.parse()
+        return wrap_response(response) if 'input' in params else response
+    
+    @staticmethod
+    def _endpoint(client, params: Dict):
+        """Raw-response create() of the API the params are for (Responses params carry 'input')"""
+        api = client.responses if 'input' in params else client.chat.completions
+        return api.with_raw_response.create
+    
+    def _create_once(self, params: Dict, deadline: Optional[float] = None, context: Optional[List] = None):
+        """
+        One HTTP attempt within the RPM/TPM budget and an adaptive concurrency slot
+        
+        The raw response is requested so the limiter can read the
+        x-ratelimit-* headers; 429s are reported before re-raising. Timeouts
+        are set once the slot is held, so time spent queueing counts against
+        the product deadline.
+        """
+        rate_limiter = self._rate_limiter()
+        reservation = rate_limiter.acquire(context or params['messages']) if rate_limiter else None
+        response = None
+        try:
+            with self._slot() as slot:
+                try:
+                    raw = self._endpoint(self.client, params)(**params, timeout=self._round_timeout(deadline))
+                except openai.RateLimitError:
+                    slot.on_rate_limit()
+                    raise
+                slot.on_success(raw.headers)
+            response = self._parse_raw(raw, params)
+            return response
+        finally:
+            if reservation is not None:
+                reservation.settle(response.usage if response is not None else None)
+    
+    async def _create_once_async(self, client: AsyncOpenAI, params: Dict, deadline: Optional[float] = None,
+                                 context: Optional[List] = None):
+        """Async version of _create_once() - waits for budget and a slot without blocking the loop"""
+        rate_limiter = self._rate_limiter()
+        reservation = await rate_limiter.acquire_async(context or params['messages']) if rate_limiter else None
+        response = None
+        try:
+            async with self._slot_async() as slot:
+                try:
+                    raw = await self._endpoint(client, params)(**params, timeout=self._round_timeout(deadline))
+                except openai.RateLimitError:
+                    slot.on_rate_limit()
+                    raise
+                slot.on_success(raw.headers)
+            response = self._parse_raw(raw, params)
+            return response
+        finally:
+            if reservation is not None:
+                reservation.settle(response.usage if response is not None else None)
+    
+    def _execute_tool_calls(self, tool_calls: List, tool_calls_made: List[Dict]) -> List[Dict]:
+        """
+        Execute all tool calls of one assistant turn concurrently
+        
+        Returns the tool messages (and records the audit entries) in the
+        original tool_call order, whichever call finishes first.
+        """
+        if len(tool_calls) == 1:
+            outcomes = [self._run_tool_call(tool_calls[0])]
+        else:
+            executor = _get_tool_executor(self.config.tool_workers)
+            futures = [executor.submit(self._run_tool_call, tool_call) for tool_call in tool_calls]
+            outcomes = [future.result() for future in futures]
+        return self._collect_tool_outcomes(outcomes, tool_calls_made)
+    
+    async def _execute_tool_calls_async(self, tool_calls: List, tool_calls_made: List[Dict]) -> List[Dict]:
+        """Async version of _execute_tool_calls() - tools run off the event loop"""
+        executor = _get_tool_executor(self.config.tool_workers)
+        loop = asyncio.get_running_loop()
+        outcomes = await asyncio.gather(*(
+            loop.run_in_executor(executor, self._run_tool_call, tool_call) for tool_call in tool_calls
+        ))
+        return self._collect_tool_outcomes(outcomes, tool_calls_made)
     
-    def extract_attributes(self, prompt: str, tools: Optional[List[Dict]] = None, use_schema: bool = True) -> dict:
+    @staticmethod
+    def _collect_tool_outcomes(outcomes: List[Tuple[Dict, Optional[Dict]]], tool_calls_made: List[Dict]) -> List[Dict]:
+        """Record audit entries in call order and return the tool messages"""
+        messages = []
+        for message, record in outcomes:
+            if record is not None:
+                tool_calls_made.append(record)
+            messages.append(message)
+        return messages
+    
+    def _run_tool_call(self, tool_call) -> Tuple[Dict, Optional[Dict]]:
+        """
+        Execute one tool call locally (FREE - no OpenAI cost)
+        
+        The tool message carries the compact result (tools/compact.py) if the
+        tool has a profile; the audit record keeps the full one.
+        
+        A call that raises (malformed arguments, bad values) is answered with
+        an error tool message so the model can fix it in the next round; the
+        audit record then carries 'error'.
+        
+        Returns:
+            (tool message, audit record with latency_ms - None if the tool is unknown)
+        """
+        started = time.perf_counter()
+        record = None
+        function_name = tool_call.function.name
+        function_args = None
+        
+        try:
+            function_args = json.loads(tool_call.function.arguments)
+            
+            # Execute the tool function
+            if function_name in self.tools:
+                # 🛡️ DEFENSE: Filter out unexpected parameters to prevent LLM hallucination errors
+                # (e.g., LLM incorrectly passing 'position' to lookup_ingredient)
+                tool_func = self.tools[function_name]
+                expected_params = self.tool_params[function_name]
+                
+                # Filter function_args to only include expected parameters
+                filtered_args = {k: v for k, v in function_args.items() if k in expected_params}
+                
+                # Log warning if we filtered out params (LLM hallucination)
+                if filtered_args != function_args:
+                    removed_params = set(function_args.keys()) - expected_params
+                    print(f"⚠️  Filtered unexpected params from {function_name}(): {removed_params}")
+                
+                # Execute with filtered args
+                tool_result = tool_func(**filtered_args)
+                record = {
+                    'function': function_name,
+                    'arguments': function_args,  # Keep original args in audit trail
+                    'result': tool_result,
+                    'latency_ms': round((time.perf_counter() - started) * 1000, 2)
+                }
+            else:
+                tool_result = {"error": f"Tool '{function_name}' not found"}
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            tool_result = {"error": error, "hint": "Fix the arguments and call the tool again"}
+            record = {
+                'function': function_name,
+                'arguments': function_args if function_args is not None else tool_call.function.arguments,
+                'error': error,
+                'latency_ms': round((time.perf_counter() - started) * 1000, 2)
+            }
+        
+        # Compact tool message - the full result stays in the audit record
+        profile = self.tool_profiles.get(function_name) if self.config.compact_tool_results else None
+        content = serialize_tool_result(tool_result, profile)
+        if record is not None and profile:
+            record['saved_chars'] = len(json.dumps(tool_result)) - len(content)
+        
+        message = {
+            "role": "tool",
+            "tool_call_id": tool_call.id,
+            "content": content
+        }
+        return message, record
+    
+    @staticmethod
+    def _resume_tool_errors(resume: ConversationResume, tool_calls_made: List[Dict], round_start: int):
+        """
+        Let the model fix tool calls that raised in this round
+        
+        Raises:
+            RuntimeError once the resume steps are used up
+            (APIErrorHandler then restarts the conversation)
+        """
+        errors = [call['error'] for call in tool_calls_made[round_start:] if 'error' in call]
+        if errors and not resume.try_resume('tool_error', tool_calls_made[:round_start]):
+            raise RuntimeError(f"Tool call failed: {errors[0]}")
+    
+    def _parse_or_resume(self, message, messages: List, resume: ConversationResume,
+                         tool_calls_made: List[Dict], spent: Optional[Callable[[], Dict]] = None) -> Optional[dict]:
+        """
+        Parse the final answer, or queue a repair request on the kept history
+        
+        Returns:
+            Parsed result, or None if the next round should re-request the answer
+        
+        Raises:
+            json.JSONDecodeError once the resume steps are used up - with the
+            spend so far as e.metadata (from spent()), so callers that give up
+            on the attempt (escalation, packing) can still bill it
+        """
+        try:
+            return self._parse_content(message.content)
+        except json.JSONDecodeError as e:
+            if not resume.try_resume('invalid_json', tool_calls_made):
+                if spent is not None:
+                    e.metadata = spent()
+                raise
+            messages.append({"role": "assistant", "content": message.content})
+            messages.append({"role": "user", "content": RESUME_JSON_MESSAGE})
+            return None
+    
+    @staticmethod
+    def _add_usage(total_tokens: Dict[str, int], usage):
+        """Accumulate token usage across all calls"""
+        total_tokens['prompt'] += usage.prompt_tokens
+        total_tokens['completion'] += usage.completion_tokens
+        total_tokens['total'] += usage.total_tokens
+        total_tokens['cached'] += _cached_prompt_tokens(usage)
+        total_tokens['reasoning'] = total_tokens.get('reasoning', 0) + _reasoning_tokens(usage)
+    
+    @staticmethod
+    def _parse_content(content: str) -> dict:
+        """Parse the final message content into a dict"""
+        # Clean potential issues before parsing (defense in depth)
+        content = content.strip()
+        
+        # Handle edge case: multiple JSON objects (take first one)
+        if content.count('{') > 1 or content.count('}') > content.count('{'):
+            # Try to extract just the first complete JSON object
+            try:
+                first_brace = content.index('{')
+                brace_count = 0
+                for i, char in enumerate(content[first_brace:], start=first_brace):
+                    if char == '{':
+                        brace_count += 1
+                    elif char == '}':
+                        brace_count -= 1
+                        if brace_count == 0:
+                            content = content[first_brace:i+1]
+                            break
+            except Exception:
+                pass  # If extraction fails, try parsing as-is
+        
+        return json.loads(content)
+    
+    def _build_metadata(self, total_tokens: Dict[str, int], tool_calls_made: List[Dict],
+                        price_multiplier: float = 1.0, round_trips: int = 1,
+                        resume: Optional[ConversationResume] = None,
+                        latency_sec: Optional[float] = None, api: str = 'chat',
+                        request_chars: Optional[int] = None,
+                        savings: Optional[ToolResultSavings] = None, model: Optional[str] = None,
+                        reasoning_effort: Optional[str] = None, effort: Optional[Dict] = None) -> Dict:
+        """Cost and audit metadata attached to every result (price_multiplier: e.g. 0.5 for Batch API)"""
+        model = model or self.model
+        # Cost from the model's rates - cached prompt tokens at the cached-input rate
+        # Note: Function/tool calling has NO extra cost - just counted as tokens
+        cost = compute_cost(model, total_tokens['prompt'], total_tokens['cached'],
+                            total_tokens['completion'], price_multiplier)
+        
+        return {
+            'model': model,
+            'reasoning_effort': reasoning_effort,  # Per-product override (None = latency preset / model default)
+            'effort': effort,  # Latency preset and per-round phase, effort, latency and tokens
+            'tokens_used': total_tokens,
+            'total_cost': cost['total_cost'],
+            'cost_breakdown': {
+                'input_tokens': total_tokens['prompt'],
+                'cached_input_tokens': total_tokens['cached'],
+                'output_tokens': total_tokens['completion'],
+                'input_cost': cost['input_cost'],  # Uncached prompt tokens
+                'cached_input_cost': cost['cached_input_cost'],
+                'output_cost': cost['output_cost'],
+                'uncached_cost': cost['uncached_cost']  # Same tokens without the prompt cache
+            },
+            'pricing': cost['pricing'],  # Rates applied (USD per 1M tokens)
+            'tool_calls': tool_calls_made if tool_calls_made else None,
+            'tool_latency_ms': self._tool_latency(tool_calls_made),
+            'round_trips': round_trips,  # API calls made for this conversation
+            'latency_sec': round(latency_sec, 3) if latency_sec is not None else None,  # Wall time of the tool loop
+            'api': api,  # 'chat' (chat.completions) or 'responses' (server-side conversation state)
+            'request_chars': request_chars,  # Conversation payload sent, all rounds
+            'tool_result_savings': savings.metadata(total_tokens['prompt']) if savings else None,  # Compact tool messages
+            'resume': resume.metadata() if resume else None  # Failed steps retried in place
+        }
+    
+    @staticmethod
+    def _request_chars(params: Dict) -> int:
+        """Size of the conversation payload sent in one round (JSON chars)"""
+        return _conversation_chars(params['input'] if 'input' in params else params['messages'])
+    
+    def _conversation_request(self, conversation: Optional[ResponsesConversation], messages: List,
+                              tools: Optional[List[Dict]], use_schema: bool, response_format: Optional[Dict],
+                              model: Optional[str] = None, reasoning_effort: Optional[str] = None,
+                              max_completion_tokens: Optional[int] = None) -> Dict:
+        """Params for the next round - only the unsent messages on the Responses API"""
+        params = self._build_request(messages, tools, use_schema, response_format, model, reasoning_effort,
+                                     max_completion_tokens)
+        return conversation.request(params) if conversation is not None else params
+    
+    @staticmethod
+    def _round_params(policy: RoundPolicy, round_index: int, tool_calls_made: List[Dict],
+                      reasoning_effort: Optional[str], max_completion_tokens: Optional[int]) -> Dict:
+        """Phase, reasoning_effort and max_completion_tokens of the next round (per-product values win)"""
+        round_params = policy.params(round_index, tool_calls_made)
+        if reasoning_effort:
+            round_params['reasoning_effort'] = reasoning_effort
+        if max_completion_tokens:
+            round_params['max_completion_tokens'] = max_completion_tokens
+        return round_params
+    
+    @staticmethod
+    def _round_entry(round_params: Dict, usage, latency_sec: float) -> Dict:
+        """Audit entry for one round (see latency_presets.PresetStats)"""
+        return {
+            'phase': round_params['phase'],
+            'reasoning_effort': round_params['reasoning_effort'],
+            'max_completion_tokens': round_params['max_completion_tokens'],
+            'latency_sec': round(latency_sec, 3),
+            'completion_tokens': usage.completion_tokens,
+            'reasoning_tokens': _reasoning_tokens(usage)
+        }
+    
+    @staticmethod
+    def _tool_latency(tool_calls_made: List[Dict]) -> Dict[str, Dict]:
+        """Per-tool call count, total and max latency (ms)"""
+        latency = {}
+        for call in tool_calls_made:
+            entry = latency.setdefault(call['function'], {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            entry['calls'] += 1
+            entry['total_ms'] = round(entry['total_ms'] + call.get('latency_ms', 0), 2)
+            entry['max_ms'] = max(entry['max_ms'], call.get('latency_ms', 0))
+        return latency
+    
+    def extract_attributes(self, prompt: str, tools: Optional[List[Dict]] = None, use_schema: bool = True,
+                           response_format: Optional[Dict] = None, model: Optional[str] = None,
+                           reasoning_effort: Optional[str] = None, max_completion_tokens: Optional[int] = None,
+                           round_policy: Optional[RoundPolicy] = None) -> dict:
         """
         Call GPT-5-mini with the prompt and optional tools.
         
@@ -52,159 +852,68 @@ class GPTClient:
             prompt: The system prompt with instructions
             tools: List of tool definitions (OpenAI format)
             use_schema: Whether to use structured outputs (default: True)
+            response_format: Structured output format to use instead (e.g. the lean schema)
+            model: Model for this product (None = the configured model, see model_router.py)
+            reasoning_effort: reasoning_effort for every round of this product (None = round_policy)
+            max_completion_tokens: Completion cap for every round of this product (None = round_policy)
+            round_policy: Per-round effort / token cap (None = the run's latency preset, see latency_presets.py)
         
         Returns:
             Parsed JSON response with metadata
+        
+        A failing step (invalid final JSON, a tool call that raised) is retried
+        on the kept message history - see ConversationResume.
+        
+        Every round trip gets explicit connect/read timeouts, clipped so the
+        whole tool loop stays within LLM_PRODUCT_DEADLINE_SEC.
+        
+        Raises:
+            openai.APIError once the retry policy gives up on a round trip,
+            ProductDeadlineExceeded when the product's time budget runs out,
+            or tool / JSON errors once the resume steps are used up
+            (APIErrorHandler decides whether the conversation is restarted)
         """
         
-        try:
-            messages = [{"role": "user", "content": prompt}]
-            
-            # First API call - with or without tools
-            api_params = {
-                "model": self.model,
-                "messages": messages
-            }
-            
-            # ALWAYS use structured outputs for guaranteed JSON schema compliance
-            # OpenAI supports Structured Outputs WITH function calling (as of Aug 2024)
-            if use_schema:
-                api_params["response_format"] = RESPONSE_FORMAT_SCHEMA
+        tool_loop = ToolLoop(self, prompt, tools, use_schema, response_format, model, reasoning_effort,
+                             max_completion_tokens, round_policy)
+        while tool_loop.result is None:
+            params = tool_loop.next_request()
+            message = tool_loop.add_response(self._create(params, tool_loop.deadline, context=tool_loop.messages))
+            if message.tool_calls:
+                # Execute the tool calls locally (FREE!) - concurrently, results in call order
+                tool_messages = self._execute_tool_calls(message.tool_calls, tool_loop.tool_calls_made)
+                tool_loop.add_tool_results(message, tool_messages)
             else:
-                api_params["response_format"] = {"type": "json_object"}
-            
-            if tools:
-                api_params["tools"] = tools
-                api_params["tool_choice"] = "auto"  # LLM decides when to use tools
-            
-            response = self.client.chat.completions.create(**api_params)
-            message = response.choices[0].message
-            
-            # Track token usage across all calls
-            total_tokens = {
-                'prompt': response.usage.prompt_tokens,
-                'completion': response.usage.completion_tokens,
-                'total': response.usage.total_tokens
-            }
-            tool_calls_made = []
-            
-            # Handle tool calls (if any)
-            while message.tool_calls:
-                messages.append(message)  # Add assistant's response to history
-                
-                # Execute each tool call locally (FREE!)
-                for tool_call in message.tool_calls:
-                    function_name = tool_call.function.name
-                    function_args = json.loads(tool_call.function.arguments)
-                    
-                    # Execute the tool function
-                    if function_name in self.tools:
-                        # 🛡️ DEFENSE: Filter out unexpected parameters to prevent LLM hallucination errors
-                        # (e.g., LLM incorrectly passing 'position' to lookup_ingredient)
-                        tool_func = self.tools[function_name]
-                        sig = inspect.signature(tool_func)
-                        expected_params = set(sig.parameters.keys())
-                        
-                        # Filter function_args to only include expected parameters
-                        filtered_args = {k: v for k, v in function_args.items() if k in expected_params}
-                        
-                        # Log warning if we filtered out params (LLM hallucination)
-                        if filtered_args != function_args:
-                            removed_params = set(function_args.keys()) - expected_params
-                            print(f"⚠️  Filtered unexpected params from {function_name}(): {removed_params}")
-                        
-                        # Execute with filtered args
-                        tool_result = tool_func(**filtered_args)
-                        tool_calls_made.append({
-                            'function': function_name,
-                            'arguments': function_args,  # Keep original args in audit trail
-                            'result': tool_result
-                        })
-                    else:
-                        tool_result = {"error": f"Tool '{function_name}' not found"}
-                    
-                    # Add tool result to messages
-                    messages.append({
-                        "role": "tool",
-                        "tool_call_id": tool_call.id,
-                        "content": json.dumps(tool_result)
-                    })
-                
-                # Send tool results back to LLM for final response
-                # IMPORTANT: Include tools again so LLM can make more tool calls if needed (e.g., apply_business_rules after lookup_ingredient)
-                final_response_format = RESPONSE_FORMAT_SCHEMA if use_schema else {"type": "json_object"}
-                final_params = {
-                    "model": self.model,
-                    "messages": messages,
-                    "response_format": final_response_format
-                }
-                if tools:
-                    final_params["tools"] = tools
-                    final_params["tool_choice"] = "auto"  # Let LLM decide if it needs more tool calls
-                
-                response = self.client.chat.completions.create(**final_params)
-                message = response.choices[0].message
-                
-                # Update token usage
-                total_tokens['prompt'] += response.usage.prompt_tokens
-                total_tokens['completion'] += response.usage.completion_tokens
-                total_tokens['total'] += response.usage.total_tokens
-            
-            # Parse final response
-            content = message.content
-            
-            # Clean potential issues before parsing (defense in depth)
-            content = content.strip()
-            
-            # Handle edge case: multiple JSON objects (take first one)
-            if content.count('{') > 1 or content.count('}') > content.count('{'):
-                # Try to extract just the first complete JSON object
-                try:
-                    first_brace = content.index('{')
-                    brace_count = 0
-                    for i, char in enumerate(content[first_brace:], start=first_brace):
-                        if char == '{':
-                            brace_count += 1
-                        elif char == '}':
-                            brace_count -= 1
-                            if brace_count == 0:
-                                content = content[first_brace:i+1]
-                                break
-                except Exception:
-                    pass  # If extraction fails, try parsing as-is
-            
-            result = json.loads(content)
-            
-            # Calculate cost (GPT-5 mini pricing: $0.25/1M input, $2.00/1M output)
-            # Note: Function/tool calling has NO extra cost - just counted as tokens
-            cost_per_1m_input = 0.25
-            cost_per_1m_output = 2.00
-            input_cost = (total_tokens['prompt'] / 1_000_000) * cost_per_1m_input
-            output_cost = (total_tokens['completion'] / 1_000_000) * cost_per_1m_output
-            total_cost = input_cost + output_cost
-            
-            # Add metadata
-            result['_metadata'] = {
-                'model': self.model,
-                'tokens_used': total_tokens,
-                'total_cost': total_cost,
-                'cost_breakdown': {
-                    'input_tokens': total_tokens['prompt'],
-                    'output_tokens': total_tokens['completion'],
-                    'input_cost': input_cost,
-                    'output_cost': output_cost
-                },
-                'tool_calls': tool_calls_made if tool_calls_made else None
-            }
-            
-            return result
-            
-        except Exception as e:
-            return {
-                'error': str(e),
-                'success': False
-            }
-
+                # Parse final response (an invalid one is re-requested on the same history)
+                tool_loop.finish(message)
+        
+        return tool_loop.result
+    
+    async def extract_attributes_async(self, prompt: str, tools: Optional[List[Dict]] = None, use_schema: bool = True,
+                                       response_format: Optional[Dict] = None, model: Optional[str] = None,
+                                       reasoning_effort: Optional[str] = None, max_completion_tokens: Optional[int] = None,
+                                       round_policy: Optional[RoundPolicy] = None) -> dict:
+        """
+        Async version of extract_attributes() - same tool-call loop (ToolLoop) on AsyncOpenAI
+        
+        Used by the asyncio Step 2 engine, where thousands of products can be
+        in flight on one thread instead of one OS thread per request.
+        """
+        
+        client = self._get_async_client()
+        tool_loop = ToolLoop(self, prompt, tools, use_schema, response_format, model, reasoning_effort,
+                             max_completion_tokens, round_policy)
+        while tool_loop.result is None:
+            params = tool_loop.next_request()
+            message = tool_loop.add_response(await self._create_async(client, params, tool_loop.deadline,
+                                                                      context=tool_loop.messages))
+            if message.tool_calls:
+                tool_messages = await self._execute_tool_calls_async(message.tool_calls, tool_loop.tool_calls_made)
+                tool_loop.add_tool_results(message, tool_messages)
+            else:
+                tool_loop.finish(message)
+        
+        return tool_loop.result
 
 def create_gpt_client() -> GPTClient:
     """Factory function"""
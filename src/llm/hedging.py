@@ -0,0 +1,313 @@
+"""
+Request Hedging - Duplicate slow LLM calls to cut tail latency
+
+A batch only finishes when its slowest product does, and a few stuck
+completions (slow replica, long queue) dominate wall time. With hedging on,
+a call that has not answered by the p-th percentile of recent latencies
+gets ONE duplicate request; whichever answers first wins:
+  - the trigger comes from a live (decaying) latency histogram per model,
+    so it follows the API's current speed and a fast routed tier never
+    hedges against a slow model's percentile
+  - hedges are capped at a share of all calls (each call earns that share
+    of a hedge), which bounds the extra spend
+  - the losing request is not cancelled mid-flight (its tokens are billed
+    anyway) - its usage is priced and counted as wasted, and its latency
+    still feeds the histogram, which is how the unhedged p99 is measured
+"""
+
+import asyncio
+import math
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from src.llm.llm_config import get_llm_config
+from src.llm.pricing import compute_cost
+
+
+# Log-spaced latency buckets: 10ms ... ~20min, 10% apart
+HISTOGRAM_MIN_SEC = 0.01
+HISTOGRAM_GROWTH = 1.1
+HISTOGRAM_BUCKETS = 160
+
+# Halve all counts every N samples so old latencies fade out
+HISTOGRAM_DECAY_EVERY = 2000
+
+
+class LatencyHistogram:
+    """Thread-safe log-bucket histogram with percentile lookup"""
+
+    def __init__(self, decay_every: int = HISTOGRAM_DECAY_EVERY):
+        self.decay_every = decay_every
+        self._counts = [0.0] * HISTOGRAM_BUCKETS
+        self._total = 0.0
+        self._since_decay = 0
+        self.samples = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _bucket(seconds: float) -> int:
+        if seconds <= HISTOGRAM_MIN_SEC:
+            return 0
+        index = int(math.log(seconds / HISTOGRAM_MIN_SEC, HISTOGRAM_GROWTH)) + 1
+        return min(index, HISTOGRAM_BUCKETS - 1)
+
+    @staticmethod
+    def _upper_bound(index: int) -> float:
+        return HISTOGRAM_MIN_SEC * HISTOGRAM_GROWTH ** index
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._counts[self._bucket(seconds)] += 1
+            self._total += 1
+            self.samples += 1
+            self._since_decay += 1
+            if self.decay_every and self._since_decay >= self.decay_every:
+                self._counts = [count / 2 for count in self._counts]
+                self._total /= 2
+                self._since_decay = 0
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Latency (seconds, bucket upper bound) below which p% of samples fall (None if empty)"""
+        with self._lock:
+            if self._total <= 0:
+                return None
+            target = self._total * p / 100.0
+            seen = 0.0
+            for index, count in enumerate(self._counts):
+                seen += count
+                if seen >= target:
+                    return round(self._upper_bound(index), 3)
+            return round(self._upper_bound(HISTOGRAM_BUCKETS - 1), 3)
+
+
+class RequestHedger:
+    """
+    Runs one API attempt, duplicating it if it outlives the hedge delay
+
+    call() is for sync callers (attempts run on a shared thread pool while
+    the caller waits); call_async() is for the asyncio engine.
+    """
+
+    def __init__(self, percentile: float = 95.0, max_ratio: float = 0.05, min_samples: int = 50,
+                 min_delay: float = 0.5, workers: int = 1000):
+        self.percentile = percentile
+        self.max_ratio = max_ratio
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.workers = max(2, workers)
+
+        self.unhedged = LatencyHistogram()   # Every primary attempt, run to completion
+        self.effective = LatencyHistogram()  # What the caller waited
+        self._by_model: Dict[str, LatencyHistogram] = {}  # Primary attempts per model (hedge trigger)
+
+        self._executor = None
+        self._lock = threading.Lock()
+        self._credit = 0.0
+        self._stats = {'calls': 0, 'hedges': 0, 'hedge_wins': 0, 'skipped_no_budget': 0, 'wasted_tokens': 0,
+                       'wasted_cost': 0.0}
+
+    # ----- policy -----
+
+    def _histogram(self, model: Optional[str]) -> LatencyHistogram:
+        with self._lock:
+            histogram = self._by_model.get(model)
+            if histogram is None:
+                histogram = self._by_model[model] = LatencyHistogram()
+            return histogram
+
+    def hedge_delay(self, model: Optional[str] = None) -> Optional[float]:
+        """Seconds to wait before hedging a call to model (None until its histogram has enough samples)"""
+        histogram = self._histogram(model)
+        if histogram.samples < self.min_samples:
+            return None
+        return max(self.min_delay, histogram.percentile(self.percentile))
+
+    def _observe_unhedged(self, model: Optional[str], seconds: float):
+        self.unhedged.observe(seconds)
+        self._histogram(model).observe(seconds)
+
+    def _start_call(self):
+        with self._lock:
+            self._stats['calls'] += 1
+            self._credit = min(self._credit + self.max_ratio, max(1.0, self.max_ratio * 100))
+
+    def _try_spend(self) -> bool:
+        with self._lock:
+            if self._credit >= 1.0:
+                self._credit -= 1.0
+                self._stats['hedges'] += 1
+                return True
+            self._stats['skipped_no_budget'] += 1
+            return False
+
+    def _record_win(self, hedge_won: bool):
+        if hedge_won:
+            with self._lock:
+                self._stats['hedge_wins'] += 1
+
+    def _record_wasted(self, model: Optional[str], response: Any):
+        usage = getattr(response, 'usage', None)
+        if usage is None:
+            return
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached = getattr(details, 'cached_tokens', 0) or 0
+        cost = compute_cost(model or getattr(response, 'model', None) or get_llm_config().model,
+                            usage.prompt_tokens, cached, usage.completion_tokens)
+        with self._lock:
+            self._stats['wasted_tokens'] += usage.total_tokens
+            self._stats['wasted_cost'] += cost['total_cost']
+
+    # ----- sync -----
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='llm-hedge')
+        return self._executor
+
+    def call(self, attempt: Callable[[], Any], model: Optional[str] = None) -> Any:
+        """Run attempt() - and a duplicate if it is slow; returns the first successful response"""
+        self._start_call()
+        started = time.monotonic()
+        delay = self.hedge_delay(model)
+
+        if delay is None:
+            # Warming up: measure only
+            try:
+                return attempt()
+            finally:
+                self._observe_unhedged(model, time.monotonic() - started)
+                self.effective.observe(time.monotonic() - started)
+
+        executor = self._get_executor()
+        primary = executor.submit(attempt)
+        primary.add_done_callback(lambda _: self._observe_unhedged(model, time.monotonic() - started))
+        try:
+            done, _ = wait([primary], timeout=delay)
+            if done or not self._try_spend():
+                return primary.result()
+
+            hedge = executor.submit(attempt)
+            return self._first_success([primary, hedge], hedge, model)
+        finally:
+            self.effective.observe(time.monotonic() - started)
+
+    def _first_success(self, futures: List, hedge, model: Optional[str]) -> Any:
+        """First successful result of the racing futures (raises the first error if all fail)"""
+        pending, first_error = list(futures), None
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.remove(future)
+                if future.exception() is None:
+                    for loser in pending:
+                        loser.add_done_callback(partial(self._on_loser_done, model))
+                    self._record_win(future is hedge)
+                    return future.result()
+                first_error = first_error or future.exception()
+        raise first_error
+
+    def _on_loser_done(self, model: Optional[str], future):
+        if not future.cancelled() and future.exception() is None:
+            self._record_wasted(model, future.result())
+
+    # ----- async -----
+
+    async def call_async(self, attempt: Callable[[], Awaitable[Any]], model: Optional[str] = None) -> Any:
+        """Async version of call() - attempts are tasks on the running loop"""
+        self._start_call()
+        started = time.monotonic()
+        delay = self.hedge_delay(model)
+
+        if delay is None:
+            try:
+                return await attempt()
+            finally:
+                self._observe_unhedged(model, time.monotonic() - started)
+                self.effective.observe(time.monotonic() - started)
+
+        primary = asyncio.ensure_future(attempt())
+        primary.add_done_callback(lambda _: self._observe_unhedged(model, time.monotonic() - started))
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done or not self._try_spend():
+                return await primary
+
+            hedge = asyncio.ensure_future(attempt())
+            return await self._first_success_async([primary, hedge], hedge, model)
+        finally:
+            self.effective.observe(time.monotonic() - started)
+
+    async def _first_success_async(self, tasks: List, hedge, model: Optional[str]) -> Any:
+        pending, first_error = set(tasks), None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    for loser in pending:
+                        loser.add_done_callback(partial(self._on_loser_done, model))
+                    self._record_win(task is hedge)
+                    return task.result()
+                first_error = first_error or task.exception()
+        raise first_error
+
+    # ----- reporting -----
+
+    def stats(self) -> Dict[str, Any]:
+        """Hedge counts and tail latency for the run manifest"""
+        with self._lock:
+            stats = dict(self._stats)
+            models = list(self._by_model)
+        stats['wasted_cost'] = round(stats['wasted_cost'], 6)
+        p99_unhedged = self.unhedged.percentile(99)
+        p99_effective = self.effective.percentile(99)
+        stats.update({
+            'enabled': True,
+            'percentile': self.percentile,
+            'max_ratio': self.max_ratio,
+            'hedge_ratio': round(stats['hedges'] / stats['calls'], 4) if stats['calls'] else 0,
+            'hedge_delay_sec': {model: self.hedge_delay(model) for model in models},
+            'p50_sec': self.effective.percentile(50),
+            'p99_sec': p99_effective,
+            'p99_unhedged_sec': p99_unhedged,
+            'p99_improvement_sec': round(p99_unhedged - p99_effective, 3)
+            if p99_unhedged is not None and p99_effective is not None else None
+        })
+        return stats
+
+
+# Global instance (lazy loaded)
+_hedger = None
+_hedger_lock = threading.Lock()
+
+
+def get_request_hedger() -> Optional[RequestHedger]:
+    """Get the process-wide hedger (None when hedging is off)"""
+    global _hedger
+
+    config = get_llm_config()
+    if not config.hedge:
+        return None
+
+    if _hedger is None:
+        with _hedger_lock:
+            if _hedger is None:
+                _hedger = RequestHedger(
+                    percentile=config.hedge_percentile,
+                    max_ratio=config.hedge_max_ratio,
+                    min_samples=config.hedge_min_samples,
+                    min_delay=config.hedge_min_delay,
+                    workers=config.max_connections
+                )
+
+    return _hedger
+
+
+def get_hedge_stats() -> Dict[str, Any]:
+    """Stats for the run manifest ({'enabled': False} when hedging is off)"""
+    hedger = get_request_hedger()
+    return hedger.stats() if hedger else {'enabled': False}
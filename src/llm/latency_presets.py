@@ -0,0 +1,232 @@
+"""
+Latency Presets - reasoning_effort / max_completion_tokens per tool-loop round
+
+Without these the API uses the model's default reasoning depth on every
+round, and the latency of a product varies with how long the model decides
+to think. A run-level preset (LLM_LATENCY_PRESET / --latency-preset) sets
+both, per phase of the tool loop:
+  - first: the attribute-extraction round that reads the title and issues
+    the ingredient lookups
+  - tools: follow-up rounds while the workflow tools are still running
+  - final: rounds after the last workflow tool (apply_postprocessing, or the
+    lookups when rules run locally) - the model writes its answer and
+    reasoning here
+LLM_EFFORT_FIRST / LLM_EFFORT_TOOLS / LLM_EFFORT_FINAL and
+LLM_MAX_COMPLETION_TOKENS override single values of the preset. A
+per-product reasoning_effort (model routing, extract_llm_attributes) wins
+over the preset for every round of that product.
+
+Latency and token distributions are recorded per preset for the manifest.
+"""
+
+import math
+import threading
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from src.llm.llm_config import get_llm_config
+
+
+PHASE_FIRST = 'first'
+PHASE_TOOLS = 'tools'
+PHASE_FINAL = 'final'
+
+PRESETS = {
+    'fast': {
+        'efforts': {PHASE_FIRST: 'minimal', PHASE_TOOLS: 'minimal', PHASE_FINAL: 'low'},
+        'max_completion_tokens': 4000
+    },
+    'balanced': {
+        'efforts': {PHASE_FIRST: 'low', PHASE_TOOLS: 'low', PHASE_FINAL: 'medium'},
+        'max_completion_tokens': 8000
+    },
+    'thorough': {
+        'efforts': {PHASE_FIRST: 'medium', PHASE_TOOLS: 'medium', PHASE_FINAL: 'high'},
+        'max_completion_tokens': 16000
+    }
+}
+
+# Name used in the stats when no preset is set (model defaults, no token cap)
+DEFAULT_PRESET = 'default'
+
+# Samples kept per preset for the percentiles
+MAX_SAMPLES = 20000
+
+
+# Workflow tools whose results start the final phase, by rules mode
+FINAL_AFTER_TOOLS = {
+    'tools': {'apply_postprocessing'},
+    'local': {'lookup_ingredient', 'lookup_ingredients'}
+}
+
+
+class RoundPolicy:
+    """
+    Per-round reasoning_effort / max_completion_tokens for one preset
+
+    The 'default' policy (no preset) sends neither parameter; it still names
+    the phase of every round for the stats.
+    """
+
+    def __init__(self, name: str, efforts: Dict[str, Optional[str]], max_completion_tokens: Optional[int] = None,
+                 final_after: Iterable[str] = ('apply_postprocessing',)):
+        self.name = name
+        self.efforts = efforts
+        self.max_completion_tokens = max_completion_tokens
+        self.final_after: Set[str] = set(final_after)
+
+    def phase(self, round_index: int, tool_calls_made: List[Dict]) -> str:
+        """Phase of the next round (round_index starts at 0)"""
+        if round_index == 0:
+            return PHASE_FIRST
+        called = {call.get('function') for call in tool_calls_made if 'result' in call}
+        return PHASE_FINAL if called & self.final_after else PHASE_TOOLS
+
+    def params(self, round_index: int, tool_calls_made: List[Dict]) -> Dict[str, Any]:
+        """{'phase', 'reasoning_effort', 'max_completion_tokens'} for the next round"""
+        phase = self.phase(round_index, tool_calls_made)
+        return {
+            'phase': phase,
+            'reasoning_effort': self.efforts.get(phase),
+            'max_completion_tokens': self.max_completion_tokens
+        }
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    """p50 / p90 / p99 (nearest rank) of a sample"""
+    if not values:
+        return {'p50': None, 'p90': None, 'p99': None}
+    ordered = sorted(values)
+    pick = lambda p: ordered[min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))]
+    return {'p50': round(pick(50), 3), 'p90': round(pick(90), 3), 'p99': round(pick(99), 3)}
+
+
+class PresetStats:
+    """Latency and token samples per preset and round phase (thread-safe)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._products: Dict[str, Dict[str, deque]] = {}
+        self._rounds: Dict[str, Dict[str, Dict[str, float]]] = {}
+
+    def record(self, preset: str, metadata: Dict[str, Any]):
+        """Add one product's latency, tokens and per-round timings"""
+        tokens = metadata.get('tokens_used') or {}
+        with self._lock:
+            samples = self._products.setdefault(preset, {
+                'latency_sec': deque(maxlen=MAX_SAMPLES),
+                'completion_tokens': deque(maxlen=MAX_SAMPLES),
+                'reasoning_tokens': deque(maxlen=MAX_SAMPLES)
+            })
+            if metadata.get('latency_sec') is not None:
+                samples['latency_sec'].append(metadata['latency_sec'])
+            samples['completion_tokens'].append(tokens.get('completion', 0) or 0)
+            samples['reasoning_tokens'].append(tokens.get('reasoning', 0) or 0)
+
+            phases = self._rounds.setdefault(preset, {})
+            for entry in (metadata.get('effort') or {}).get('rounds') or []:
+                phase = phases.setdefault(entry['phase'], {'rounds': 0, 'timed_rounds': 0, 'latency_sec': 0.0,
+                                                           'completion_tokens': 0, 'reasoning_tokens': 0})
+                phase['rounds'] += 1
+                if entry.get('latency_sec') is not None:  # Batch rounds are not timed
+                    phase['timed_rounds'] += 1
+                    phase['latency_sec'] += entry['latency_sec']
+                phase['completion_tokens'] += entry.get('completion_tokens') or 0
+                phase['reasoning_tokens'] += entry.get('reasoning_tokens') or 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            products = {name: {key: list(values) for key, values in samples.items()}
+                        for name, samples in self._products.items()}
+            rounds = {name: {phase: dict(values) for phase, values in phases.items()}
+                      for name, phases in self._rounds.items()}
+
+        report = {}
+        for name, samples in products.items():
+            per_phase = {}
+            for phase, values in rounds.get(name, {}).items():
+                count, timed = values['rounds'], values['timed_rounds']
+                per_phase[phase] = {
+                    'rounds': count,
+                    'avg_latency_sec': round(values['latency_sec'] / timed, 3) if timed else None,
+                    'avg_completion_tokens': round(values['completion_tokens'] / count) if count else 0,
+                    'avg_reasoning_tokens': round(values['reasoning_tokens'] / count) if count else 0
+                }
+            report[name] = {
+                'products': len(samples['completion_tokens']),
+                'latency_sec': percentiles(samples['latency_sec']),
+                'completion_tokens': percentiles(samples['completion_tokens']),
+                'reasoning_tokens': percentiles(samples['reasoning_tokens']),
+                'phases': per_phase
+            }
+        return report
+
+
+def build_round_policy(preset: Optional[str], overrides: Optional[Dict[str, Any]] = None,
+                       final_after: Iterable[str] = ('apply_postprocessing',)) -> RoundPolicy:
+    """
+    Policy for a preset name plus per-phase overrides (no preset and no overrides = 'default')
+
+    Raises:
+        ValueError for an unknown preset name
+    """
+    overrides = {key: value for key, value in (overrides or {}).items() if value}
+    if not preset and not overrides:
+        return RoundPolicy(DEFAULT_PRESET, {}, None, final_after)
+    if preset and preset not in PRESETS:
+        raise ValueError(f"Unknown latency preset: {preset} (choose from {', '.join(PRESETS)})")
+
+    base = PRESETS.get(preset, {'efforts': {}, 'max_completion_tokens': None})
+    efforts = dict(base['efforts'])
+    for phase in (PHASE_FIRST, PHASE_TOOLS, PHASE_FINAL):
+        if overrides.get(phase):
+            efforts[phase] = overrides[phase]
+    max_tokens = overrides.get('max_completion_tokens') or base['max_completion_tokens']
+    return RoundPolicy(preset or 'custom', efforts, max_tokens, final_after)
+
+
+# Global instances (lazy loaded)
+_policy = None
+_policy_lock = threading.Lock()
+_preset_stats = PresetStats()
+
+
+def get_round_policy() -> RoundPolicy:
+    """Get the run's round policy ('default' when no preset or override is set)"""
+    global _policy
+
+    if _policy is None:
+        with _policy_lock:
+            if _policy is None:
+                config = get_llm_config()
+                _policy = round_policy_for(config.latency_preset, config.rules_mode)
+
+    return _policy
+
+
+def round_policy_for(preset: Optional[str], rules_mode: str) -> RoundPolicy:
+    """Policy for a preset and rules mode with the configured per-phase overrides (e.g. a shadow variant)"""
+    config = get_llm_config()
+    return build_round_policy(preset, {
+        PHASE_FIRST: config.effort_first,
+        PHASE_TOOLS: config.effort_tools,
+        PHASE_FINAL: config.effort_final,
+        'max_completion_tokens': config.max_completion_tokens
+    }, FINAL_AFTER_TOOLS.get(rules_mode, FINAL_AFTER_TOOLS['tools']))
+
+
+def record_preset_usage(metadata: Dict[str, Any]):
+    """Count a finished product against the preset it ran with"""
+    preset = (metadata.get('effort') or {}).get('preset') or DEFAULT_PRESET
+    _preset_stats.record(preset, metadata)
+
+
+def get_preset_stats() -> Dict[str, Any]:
+    """Latency / token distributions per preset for the run manifest"""
+    policy = get_round_policy()
+    return {
+        'preset': policy.name,
+        'efforts': dict(policy.efforts),
+        'max_completion_tokens': policy.max_completion_tokens,
+        'presets': _preset_stats.stats()
+    }
@@ -0,0 +1,213 @@
+"""
+LLM Runtime Configuration - Run-level settings for Step 2
+
+Defaults come from environment variables (set by the ECS task in AWS mode
+or a local .env file). The CLI can override them once at startup via
+configure_llm() before any worker starts.
+"""
+
+import os
+import threading
+from typing import Any, Dict
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+
+def _env_int(name: str, default: int) -> int:
+    """Read an integer environment variable (falls back to default)"""
+    value = os.getenv(name)
+    try:
+        return int(value) if value not in (None, '') else default
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    """Read a float environment variable (falls back to default)"""
+    value = os.getenv(name)
+    try:
+        return float(value) if value not in (None, '') else default
+    except ValueError:
+        return default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    """Read an on/off environment variable ('off', 'false', '0', 'no' = False; unset = default)"""
+    value = os.getenv(name)
+    if value in (None, ''):
+        return default
+    return value.lower() not in ('off', 'false', '0', 'no')
+
+
+class LLMConfig:
+    """Run-level LLM settings shared by all workers"""
+
+    def __init__(self):
+        self.model = os.getenv('OPENAI_MODEL', 'gpt-5-mini')
+
+        # HTTP connection pool - ONE pool shared by all worker threads
+        self.max_connections = _env_int('OPENAI_MAX_CONNECTIONS', 1000)
+        self.max_keepalive_connections = _env_int('OPENAI_MAX_KEEPALIVE', 200)
+        self.keepalive_expiry = _env_float('OPENAI_KEEPALIVE_EXPIRY', 60.0)
+
+        # HTTP timeouts (seconds)
+        self.connect_timeout = _env_float('OPENAI_CONNECT_TIMEOUT', 10.0)
+        self.read_timeout = _env_float('OPENAI_READ_TIMEOUT', 120.0)
+        # Total time for one product's tool loop - all rounds and retries (0 = no limit)
+        self.product_deadline_sec = _env_float('LLM_PRODUCT_DEADLINE_SEC', 600.0)
+        # Run deadline (Unix time, 0 = none) - set by --deadline, caps every product deadline
+        self.run_deadline = 0.0
+
+        # Step 2 fan-out: 'threads' (ThreadPoolExecutor) or 'async' (asyncio)
+        self.engine = os.getenv('STEP2_ENGINE', 'threads')
+        # Max parallel API calls (None = mode default: 1000 local, 200 AWS)
+        self.concurrency = _env_int('LLM_CONCURRENCY', 0) or None
+
+        # Adaptive (AIMD) limit on in-flight API calls - concurrency above is the ceiling
+        self.adaptive_concurrency = _env_bool('LLM_ADAPTIVE_CONCURRENCY', True)
+        self.concurrency_initial = _env_int('LLM_CONCURRENCY_INITIAL', 32)  # Slow start from here
+        self.concurrency_min = _env_int('LLM_CONCURRENCY_MIN', 4)
+        self.concurrency_decrease_factor = _env_float('LLM_CONCURRENCY_DECREASE', 0.5)  # Cut on 429 / spike
+        self.latency_spike_ratio = _env_float('LLM_LATENCY_SPIKE_RATIO', 3.0)  # Recent vs. baseline latency
+        
+        # Org rate-limit budgets (0 = no limiter); calls block to stay under target * limit
+        self.rpm_limit = _env_int('OPENAI_RPM_LIMIT', 0)
+        self.tpm_limit = _env_int('OPENAI_TPM_LIMIT', 0)
+        self.rate_limit_target = _env_float('OPENAI_RATE_LIMIT_TARGET', 0.9)
+        self.rate_limit_burst_sec = _env_float('OPENAI_RATE_LIMIT_BURST_SEC', 10.0)  # Bucket size in seconds of budget
+        
+        # Per-call retries: decorrelated jitter, run-wide budget, circuit breaker
+        self.retry_max_attempts = _env_int('LLM_RETRY_MAX_ATTEMPTS', 5)
+        self.retry_base_delay = _env_float('LLM_RETRY_BASE_DELAY', 1.0)
+        self.retry_max_delay = _env_float('LLM_RETRY_MAX_DELAY', 60.0)
+        self.retry_budget_ratio = _env_float('LLM_RETRY_BUDGET_RATIO', 0.2)  # Retries per first attempt
+        self.retry_budget_min = _env_int('LLM_RETRY_BUDGET_MIN', 10)
+        self.breaker_error_rate = _env_float('LLM_BREAKER_ERROR_RATE', 0.5)  # Open at this share of errors...
+        self.breaker_window = _env_int('LLM_BREAKER_WINDOW', 50)  # ...over the last N calls
+        self.breaker_min_calls = _env_int('LLM_BREAKER_MIN_CALLS', 20)
+        self.breaker_cooldown_sec = _env_float('LLM_BREAKER_COOLDOWN_SEC', 30.0)
+        
+        # Hedged requests: duplicate a call still running at the p-th latency percentile
+        self.hedge = _env_bool('LLM_HEDGE', False)
+        self.hedge_percentile = _env_float('LLM_HEDGE_PERCENTILE', 95.0)
+        self.hedge_max_ratio = _env_float('LLM_HEDGE_MAX_RATIO', 0.05)  # Max hedges per call (extra cost cap)
+        self.hedge_min_samples = _env_int('LLM_HEDGE_MIN_SAMPLES', 50)  # Latencies seen before hedging starts
+        self.hedge_min_delay = _env_float('LLM_HEDGE_MIN_DELAY_SEC', 0.5)
+        
+        # Failed conversation steps (invalid final JSON, tool error) retried on the kept history
+        self.resume_max_steps = _env_int('LLM_RESUME_MAX_STEPS', 2)
+        
+        # Dead-letter second pass for records that failed Step 2 (few workers, longer timeout)
+        self.dlq_redrive = _env_bool('LLM_DLQ_REDRIVE', True)
+        self.dlq_concurrency = _env_int('LLM_DLQ_CONCURRENCY', 8)
+        self.dlq_read_timeout = _env_float('LLM_DLQ_READ_TIMEOUT', 300.0)
+        self.dlq_max_retries = _env_int('LLM_DLQ_MAX_RETRIES', 5)  # Conversation restarts per record
+        
+        # Threads for running the tool calls of one assistant turn concurrently
+        self.tool_workers = _env_int('LLM_TOOL_WORKERS', 16)
+        # Send tool results back as compact JSON (profiled fields only; full result kept for audit)
+        # (off by default: changes what the model sees - measure before enabling)
+        self.compact_tool_results = _env_bool('LLM_COMPACT_TOOL_RESULTS', False)
+        
+        # Persistent response cache: 'on', 'off' (bypass) or 'refresh' (overwrite)
+        self.cache_mode = os.getenv('LLM_CACHE', 'on')
+        self.cache_path = os.getenv('LLM_CACHE_PATH', 'data/cache/llm_responses.sqlite')
+        self.cache_max_mb = _env_float('LLM_CACHE_MAX_MB', 512.0)
+
+        # Collapse duplicate titles into one LLM request per run
+        self.dedup = _env_bool('LLM_DEDUP', True)
+
+        # Business rules + post-processing: 'tools' (LLM tool calls) or 'local' (in-process)
+        self.rules_mode = os.getenv('LLM_RULES_MODE', 'tools')
+
+        # Tool-loop API: 'chat' (chat.completions, full history every round) or
+        # 'responses' (Responses API - server keeps the conversation, rounds send only new items)
+        self.api = os.getenv('LLM_API', 'chat')
+
+        # Final answer format: 'full' ({value, reasoning} per attribute) or 'lean' (values + codes)
+        self.output_mode = os.getenv('LLM_OUTPUT_MODE', 'full')
+
+        # Offer lookup_ingredients (all names in one tool call) and ask the model to use it
+        # (off by default: changes the tool list and prompt workflow - validate first)
+        self.batch_lookup = _env_bool('LLM_BATCH_LOOKUP', False)
+        
+        # Latency preset: reasoning_effort / max_completion_tokens per tool-loop round
+        # ('' = model defaults, or fast / balanced / thorough) - see latency_presets.py
+        self.latency_preset = os.getenv('LLM_LATENCY_PRESET', '') or None
+        self.effort_first = os.getenv('LLM_EFFORT_FIRST', '') or None  # Per-phase overrides of the preset
+        self.effort_tools = os.getenv('LLM_EFFORT_TOOLS', '') or None
+        self.effort_final = os.getenv('LLM_EFFORT_FINAL', '') or None
+        self.max_completion_tokens = _env_int('LLM_MAX_COMPLETION_TOKENS', 0) or None
+        
+        # Model routing: simple titles go to a cheaper tier, escalated to the standard tier
+        # (model above) when the answer fails validation - see model_router.py
+        self.route_models = _env_bool('LLM_ROUTE_MODELS', False)
+        self.route_simple_model = os.getenv('LLM_ROUTE_SIMPLE_MODEL', 'gpt-5-nano')
+        self.route_simple_effort = os.getenv('LLM_ROUTE_SIMPLE_EFFORT', 'minimal') or None
+        self.route_standard_effort = os.getenv('LLM_ROUTE_STANDARD_EFFORT', '') or None  # None = model default
+        self.route_simple_max_score = _env_float('LLM_ROUTE_SIMPLE_MAX_SCORE', 1.0)  # Complexity cut-off
+
+        # Shadow evaluation: a fraction of Step 2 titles also go to a second model / prompt
+        # variant in the background and are compared with the primary answer - see shadow.py
+        self.shadow_rate = _env_float('LLM_SHADOW_RATE', 0.0)  # 0 = off, 1 = every title
+        self.shadow_model = os.getenv('LLM_SHADOW_MODEL', '') or None  # None = same model
+        self.shadow_latency_preset = os.getenv('LLM_SHADOW_LATENCY_PRESET', '') or None  # None = same as primary
+        self.shadow_rules_mode = os.getenv('LLM_SHADOW_RULES_MODE', '') or None  # Prompt variant (None = same)
+        self.shadow_output_mode = os.getenv('LLM_SHADOW_OUTPUT_MODE', '') or None
+        self.shadow_workers = _env_int('LLM_SHADOW_WORKERS', 8)
+        self.shadow_drain_sec = _env_float('LLM_SHADOW_DRAIN_SEC', 120.0)  # Wait for in-flight shadows at run end
+        
+        # Pre-resolve unambiguous title ingredients in Python and list them in the prompt
+        # (off by default: changes the prompt - validate with shadow evaluation first)
+        self.ingredient_prescan = _env_bool('LLM_INGREDIENT_PRESCAN', False)
+        
+        # Multi-product packing: K titles per request (1 = off), adaptive up to max
+        self.pack_size = _env_int('LLM_PACK_SIZE', 1)
+        self.pack_max_size = _env_int('LLM_PACK_MAX_SIZE', 16)
+        self.pack_adaptive = _env_bool('LLM_PACK_ADAPTIVE', True)
+        self.pack_max_wait_ms = _env_float('LLM_PACK_MAX_WAIT_MS', 250.0)  # Max wait to fill a pack
+        self.pack_workers = _env_int('LLM_PACK_WORKERS', 100)  # Packed requests in flight
+
+        # Step 2 transport: 'realtime' (interactive calls) or 'batch' (OpenAI Batch API)
+        self.llm_mode = os.getenv('LLM_MODE', 'realtime')
+        self.batch_size = _env_int('OPENAI_BATCH_SIZE', 50000)  # Records per batch submission
+        self.batch_poll_interval = _env_float('OPENAI_BATCH_POLL_SEC', 30.0)
+        self.batch_max_rounds = _env_int('OPENAI_BATCH_MAX_ROUNDS', 8)  # Tool-call round trips
+        self.batch_completion_window = os.getenv('OPENAI_BATCH_WINDOW', '24h')
+
+    def update(self, **overrides) -> 'LLMConfig':
+        """Apply overrides (None values are ignored)"""
+        for key, value in overrides.items():
+            if not hasattr(self, key):
+                raise ValueError(f"Unknown LLM config option: {key}")
+            if value is not None:
+                setattr(self, key, value)
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Settings snapshot for the run manifest"""
+        return dict(self.__dict__)
+
+
+# Global instance (lazy loaded)
+_config = None
+_config_lock = threading.Lock()
+
+
+def get_llm_config() -> LLMConfig:
+    """Get the process-wide LLM config"""
+    global _config
+
+    if _config is None:
+        with _config_lock:
+            if _config is None:
+                _config = LLMConfig()
+
+    return _config
+
+
+def configure_llm(**overrides) -> LLMConfig:
+    """Override run-level settings (call once at startup, before workers start)"""
+    return get_llm_config().update(**overrides)
@@ -0,0 +1,274 @@
+"""
+Model Routing - Send simple titles to a cheaper, faster model tier
+
+Most titles ("Vitamin D3 5000 IU 360 Softgels") are trivial to classify, yet
+every product went to the same model. With routing on (LLM_ROUTE_MODELS /
+--route-models) each title gets a complexity score from cheap features:
+  - title length in words
+  - ingredients the lookup index resolves in the title (pre-scan) - none
+    or several means the model has work to do
+  - Step 1 REMAP (the category is already known from the Amazon subcategory)
+  - combo keywords (two or more ingredients of a postprocessing combo,
+    "complex", "blend", "+", ...) - combos need the full rules workflow
+A score up to LLM_ROUTE_SIMPLE_MAX_SCORE goes to the simple tier
+(LLM_ROUTE_SIMPLE_MODEL at LLM_ROUTE_SIMPLE_EFFORT), everything else to the
+standard tier (OPENAI_MODEL). A simple-tier answer that fails validation is
+escalated: the title is re-run on the standard tier and the spend of both
+attempts is billed to the product.
+
+Routing applies to single realtime requests; packed and Batch API requests
+keep the standard model.
+"""
+
+import json
+import re
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from src.llm.llm_config import get_llm_config
+from src.llm.tools.ingredient_lookup import prescan_title_ingredients
+
+
+TIER_SIMPLE = 'simple'
+TIER_STANDARD = 'standard'
+
+# Score weights (see TitleRouter.score)
+WORDS_FREE = 8  # Words before length adds to the score
+WORD_WEIGHT = 0.25
+EXTRA_INGREDIENT_WEIGHT = 1.0  # Per pre-scanned ingredient beyond the first
+NO_INGREDIENT_WEIGHT = 1.5  # Nothing resolved - the model must find the ingredients
+COMBO_WEIGHT = 2.0  # Per likely combo / formula marker
+REMAP_BONUS = 1.0  # Category already known from Step 1
+
+# Words that signal a multi-ingredient formula (besides the combo ingredients)
+COMBO_MARKERS = ('complex', 'blend', 'formula', 'multi', 'stack', 'plus', '+', '&')
+
+# Required in every answer (see packing.REQUIRED_MEMBER_FIELDS)
+REQUIRED_FIELDS = ['age', 'gender', 'form', 'organic', 'ingredients']
+
+POSTPROCESSING_RULES_PATH = Path(__file__).parent.parent.parent / 'reference_data' / 'postprocessing_rules.json'
+
+_WORD = re.compile(r"[A-Za-z0-9][A-Za-z0-9'\-]*|[+&]")
+
+
+class Route:
+    """Model tier chosen for one product"""
+
+    def __init__(self, tier: str, model: str, reasoning_effort: Optional[str], score: float,
+                 features: Dict[str, Any]):
+        self.tier = tier
+        self.model = model
+        self.reasoning_effort = reasoning_effort
+        self.score = score
+        self.features = features
+
+    def metadata(self) -> Dict[str, Any]:
+        return {'tier': self.tier, 'model': self.model, 'reasoning_effort': self.reasoning_effort,
+                'score': self.score, 'features': self.features}
+
+
+def _load_combos() -> List[List[str]]:
+    """Required ingredient names of each postprocessing combo (lowercase)"""
+    with open(POSTPROCESSING_RULES_PATH, 'r') as f:
+        rules = json.load(f)
+    return [[name.lower() for name in combo.get('required_ingredients', [])]
+            for combo in rules.get('ingredient_combos', {}).get('combos', [])]
+
+
+class TitleRouter:
+    """Scores title complexity, picks a tier and tracks per-tier cost and latency (thread-safe)"""
+
+    def __init__(self, simple_model: str, simple_effort: Optional[str], standard_model: str,
+                 standard_effort: Optional[str], simple_max_score: float = 1.0):
+        self.tiers = {
+            TIER_SIMPLE: (simple_model, simple_effort),
+            TIER_STANDARD: (standard_model, standard_effort)
+        }
+        self.simple_max_score = simple_max_score
+        self.combos = _load_combos()
+
+        self._lock = threading.Lock()
+        self._stats = {
+            tier: {'routed': 0, 'products': 0, 'cost': 0.0, 'latency_sec': 0.0, 'tokens': 0}
+            for tier in self.tiers
+        }
+        self._escalations = 0
+        self._escalation_reasons: Dict[str, int] = {}
+
+    # ----- routing -----
+
+    def features(self, title: str, lookup_action: Optional[str] = None) -> Dict[str, Any]:
+        """Complexity features of a title"""
+        words = _WORD.findall(title or '')
+        text = (title or '').lower()
+        lowered = [word.lower() for word in words]
+        # A combo counts once two of its ingredients appear ("vitamin d3" alone is no A+D combo)
+        combo_hits = sum(1 for combo in self.combos if sum(1 for name in combo if name in text) >= 2)
+        combo_hits += sum(1 for word in lowered if word in COMBO_MARKERS)
+        return {
+            'words': len(words),
+            'ingredients': len(prescan_title_ingredients(title)),
+            'remap': lookup_action == 'REMAP',
+            'combo_keywords': combo_hits
+        }
+
+    @staticmethod
+    def score(features: Dict[str, Any]) -> float:
+        """Complexity score (0 = trivial); higher means more work for the model"""
+        score = max(0, features['words'] - WORDS_FREE) * WORD_WEIGHT
+        if features['ingredients'] == 0:
+            score += NO_INGREDIENT_WEIGHT
+        else:
+            score += (features['ingredients'] - 1) * EXTRA_INGREDIENT_WEIGHT
+        score += features['combo_keywords'] * COMBO_WEIGHT
+        if features['remap']:
+            score -= REMAP_BONUS
+        return round(max(0.0, score), 2)
+
+    def route(self, title: str, lookup_action: Optional[str] = None) -> Route:
+        """Tier for a title (not counted - the cache key needs it before we know a request is sent)"""
+        features = self.features(title, lookup_action)
+        score = self.score(features)
+        tier = TIER_SIMPLE if score <= self.simple_max_score else TIER_STANDARD
+        return self._route(tier, score, features)
+
+    def count(self, route: Route):
+        """Count a routing decision that is really sent to its tier (no cache hit, not packed)"""
+        with self._lock:
+            self._stats[route.tier]['routed'] += 1
+
+    def escalate(self, route: Route, reason: str) -> Route:
+        """Standard-tier route for a simple-tier answer that failed validation"""
+        with self._lock:
+            self._escalations += 1
+            self._escalation_reasons[reason] = self._escalation_reasons.get(reason, 0) + 1
+        return self._route(TIER_STANDARD, route.score, route.features)
+
+    def _route(self, tier: str, score: float, features: Dict[str, Any]) -> Route:
+        model, effort = self.tiers[tier]
+        return Route(tier=tier, model=model, reasoning_effort=effort, score=score, features=features)
+
+    # ----- validation -----
+
+    @staticmethod
+    def validate(llm_result: Dict[str, Any], local_rules: bool = False) -> Optional[str]:
+        """
+        Check a raw answer is complete enough to keep
+
+        Returns:
+            None if valid, else a short failure reason (escalation trigger)
+        """
+        if 'error' in llm_result:
+            return 'error'
+        for name in REQUIRED_FIELDS:
+            if name not in llm_result:
+                return f'missing_{name}'
+
+        ingredients = llm_result.get('ingredients')
+        if not isinstance(ingredients, list) or not ingredients:
+            return 'no_ingredients'
+        for ingredient in ingredients:
+            if not isinstance(ingredient, dict) or ingredient.get('category') in (None, '', 'UNKNOWN'):
+                return 'unknown_ingredient'
+
+        if local_rules:
+            return None
+        called = {call.get('function') for call in (llm_result.get('_metadata', {}).get('tool_calls') or [])
+                  if 'result' in call}
+        for tool in ('apply_business_rules', 'apply_postprocessing'):
+            if tool not in called:
+                return f'skipped_{tool}'
+        return None
+
+    # ----- reporting -----
+
+    def record(self, metadata: Dict[str, Any]):
+        """Count a finished product against its final tier (spend of escalated attempts included)"""
+        routing = metadata.get('routing')
+        if not routing:
+            return
+        with self._lock:
+            stats = self._stats[routing['tier']]
+            stats['products'] += 1
+            stats['cost'] += metadata.get('total_cost', 0) or 0
+            stats['latency_sec'] += metadata.get('latency_sec') or 0
+            stats['tokens'] += (metadata.get('tokens_used') or {}).get('total', 0) or 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Routing decisions, escalations and cost / latency per tier for the run manifest"""
+        with self._lock:
+            tiers = {tier: dict(values) for tier, values in self._stats.items()}
+            escalations = self._escalations
+            reasons = dict(self._escalation_reasons)
+
+        for tier, values in tiers.items():
+            model, effort = self.tiers[tier]
+            products = values['products']
+            values.update({
+                'model': model,
+                'reasoning_effort': effort,
+                'cost': round(values['cost'], 6),
+                'latency_sec': round(values['latency_sec'], 3),
+                'avg_cost_per_product': round(values['cost'] / products, 6) if products else 0,
+                'avg_latency_sec': round(values['latency_sec'] / products, 3) if products else None,
+                'avg_tokens_per_product': round(values['tokens'] / products) if products else 0
+            })
+
+        routed_simple = tiers[TIER_SIMPLE]['routed']
+        return {
+            'enabled': True,
+            'simple_max_score': self.simple_max_score,
+            'tiers': tiers,
+            'escalations': escalations,
+            'escalation_rate': round(escalations / routed_simple, 4) if routed_simple else 0,
+            'escalation_reasons': reasons
+        }
+
+
+def merge_spend(metadata: Dict[str, Any], earlier: Dict[str, Any]):
+    """Add the tokens and cost of an earlier (escalated) attempt to a result's metadata"""
+    tokens = metadata.setdefault('tokens_used', {})
+    for key, value in (earlier.get('tokens_used') or {}).items():
+        tokens[key] = tokens.get(key, 0) + value
+    metadata['total_cost'] = (metadata.get('total_cost', 0) or 0) + (earlier.get('total_cost', 0) or 0)
+    breakdown = metadata.setdefault('cost_breakdown', {})
+    for key, value in (earlier.get('cost_breakdown') or {}).items():
+        if isinstance(value, (int, float)):
+            breakdown[key] = breakdown.get(key, 0) + value
+    metadata['round_trips'] = metadata.get('round_trips', 1) + earlier.get('round_trips', 1)
+    if metadata.get('latency_sec') is not None and earlier.get('latency_sec') is not None:
+        metadata['latency_sec'] = round(metadata['latency_sec'] + earlier['latency_sec'], 3)
+
+
+# Global instance (lazy loaded)
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_title_router() -> Optional[TitleRouter]:
+    """Get the process-wide router (None when routing is off)"""
+    global _router
+
+    config = get_llm_config()
+    if not config.route_models:
+        return None
+
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = TitleRouter(
+                    simple_model=config.route_simple_model,
+                    simple_effort=config.route_simple_effort,
+                    standard_model=config.model,
+                    standard_effort=config.route_standard_effort,
+                    simple_max_score=config.route_simple_max_score
+                )
+
+    return _router
+
+
+def get_routing_stats() -> Dict[str, Any]:
+    """Stats for the run manifest ({'enabled': False} when routing is off)"""
+    router = get_title_router()
+    return router.stats() if router else {'enabled': False}
@@ -0,0 +1,151 @@
+"""
+Model Pricing - Token rates per model from reference_data/model_pricing.json
+
+Cost is computed from the full usage breakdown: prompt tokens served from
+the prompt cache are billed at the cached-input rate, the rest at the input
+rate, completion tokens (reasoning included) at the output rate.
+
+Snapshot names resolve to the longest matching model name
+('gpt-5-mini-2025-08-07' -> 'gpt-5-mini'); an unknown model falls back to
+default_model with a one-time warning instead of reporting $0.
+"""
+
+import json
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable
+
+
+PRICING_PATH = Path(__file__).parent.parent.parent / 'reference_data' / 'model_pricing.json'
+
+
+class PricingTable:
+    """Per-model input / cached input / output rates (USD per 1M tokens)"""
+
+    def __init__(self, path: Path = PRICING_PATH):
+        with open(path, 'r') as f:
+            data = json.load(f)
+        self.models: Dict[str, Dict[str, float]] = data['models']
+        self.default_model: str = data['default_model']
+        self._warned = set()
+        self._lock = threading.Lock()
+
+    def resolve(self, model: str) -> str:
+        """Pricing entry for a model name (exact, longest prefix, else default_model)"""
+        if model in self.models:
+            return model
+        matches = [name for name in self.models if model and model.startswith(name)]
+        if matches:
+            return max(matches, key=len)
+
+        with self._lock:
+            if model not in self._warned:
+                self._warned.add(model)
+                print(f"⚠ No pricing for model '{model}' - costs use {self.default_model} rates")
+        return self.default_model
+
+    def rates(self, model: str) -> Dict[str, float]:
+        """Rates for a model (cached_input defaults to the input rate)"""
+        entry = self.models[self.resolve(model)]
+        return {
+            'input': entry['input'],
+            'cached_input': entry.get('cached_input', entry['input']),
+            'output': entry['output']
+        }
+
+    def cost(self, model: str, prompt_tokens: int, cached_tokens: int, completion_tokens: int,
+             price_multiplier: float = 1.0) -> Dict[str, Any]:
+        """
+        Cost of one usage breakdown (price_multiplier: e.g. 0.5 for Batch API)
+
+        Returns:
+            Dict with input_cost (uncached prompt tokens), cached_input_cost,
+            output_cost, total_cost, uncached_cost (same tokens without the
+            prompt cache) and the rates applied
+        """
+        rates = self.rates(model)
+        cached_tokens = min(cached_tokens, prompt_tokens)
+        per_token = {key: value * price_multiplier / 1_000_000 for key, value in rates.items()}
+
+        input_cost = (prompt_tokens - cached_tokens) * per_token['input']
+        cached_input_cost = cached_tokens * per_token['cached_input']
+        output_cost = completion_tokens * per_token['output']
+        return {
+            'input_cost': input_cost,
+            'cached_input_cost': cached_input_cost,
+            'output_cost': output_cost,
+            'total_cost': input_cost + cached_input_cost + output_cost,
+            'uncached_cost': prompt_tokens * per_token['input'] + output_cost,
+            'pricing': {
+                'model': self.resolve(model),
+                'input_per_1m': rates['input'],
+                'cached_input_per_1m': rates['cached_input'],
+                'output_per_1m': rates['output'],
+                'multiplier': price_multiplier
+            }
+        }
+
+
+# Global instance (lazy loaded)
+_pricing = None
+_pricing_lock = threading.Lock()
+
+
+def get_pricing_table() -> PricingTable:
+    """Get the process-wide pricing table"""
+    global _pricing
+
+    if _pricing is None:
+        with _pricing_lock:
+            if _pricing is None:
+                _pricing = PricingTable()
+
+    return _pricing
+
+
+def compute_cost(model: str, prompt_tokens: int, cached_tokens: int, completion_tokens: int,
+                 price_multiplier: float = 1.0) -> Dict[str, Any]:
+    """Cost of a usage breakdown at the model's rates (see PricingTable.cost)"""
+    return get_pricing_table().cost(model, prompt_tokens, cached_tokens, completion_tokens, price_multiplier)
+
+
+def summarize_costs(metadatas: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Run-level cost roll-up from per-product _metadata dicts
+
+    Products reused from the response cache or a duplicate title carry zero
+    spend; they count towards the effective cost per product but not the
+    billed one. Old metadata without a cost_breakdown['uncached_cost'] is
+    re-priced from its tokens.
+    """
+    summary = {'products': 0, 'billed_products': 0, 'input_tokens': 0, 'cached_input_tokens': 0,
+               'output_tokens': 0, 'total_cost': 0.0, 'cached_input_cost': 0.0, 'uncached_cost': 0.0}
+    for metadata in metadatas:
+        metadata = metadata or {}
+        tokens = metadata.get('tokens_used') or {}
+        breakdown = metadata.get('cost_breakdown') or {}
+        summary['products'] += 1
+        if not tokens.get('total'):
+            continue
+        summary['billed_products'] += 1
+        summary['input_tokens'] += tokens.get('prompt', 0) or 0
+        summary['cached_input_tokens'] += tokens.get('cached', 0) or 0
+        summary['output_tokens'] += tokens.get('completion', 0) or 0
+        if 'uncached_cost' in breakdown:
+            summary['total_cost'] += metadata.get('total_cost', 0) or 0
+            summary['cached_input_cost'] += breakdown.get('cached_input_cost', 0) or 0
+            summary['uncached_cost'] += breakdown['uncached_cost']
+        else:
+            cost = compute_cost(metadata.get('model') or get_pricing_table().default_model, tokens.get('prompt', 0) or 0,
+                                tokens.get('cached', 0) or 0, tokens.get('completion', 0) or 0)
+            summary['total_cost'] += metadata.get('total_cost') or cost['total_cost']
+            summary['cached_input_cost'] += cost['cached_input_cost']
+            summary['uncached_cost'] += cost['uncached_cost']
+
+    summary.update({
+        'cache_hit_ratio': round(summary['cached_input_tokens'] / summary['input_tokens'], 4) if summary['input_tokens'] else 0,
+        'prompt_cache_saved_cost': max(0.0, summary['uncached_cost'] - summary['total_cost']),
+        'effective_cost_per_product': summary['total_cost'] / summary['products'] if summary['products'] else 0,
+        'cost_per_billed_product': summary['total_cost'] / summary['billed_products'] if summary['billed_products'] else 0
+    })
+    return summary
@@ -5,8 +5,164 @@ Complete Prompt Builder - Shows the FULL prompt sent to LLM
 
 import json
 import csv
+import hashlib
+import os
+import threading
+import time
 from pathlib import Path
 from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from src.llm.llm_config import get_llm_config
+from src.llm.response_schema import LEAN_CODES
+from src.llm.tools.ingredient_lookup import prescan_title_ingredients
+
+
+# Reference files rendered into the static prompt prefix
+PROMPT_REFERENCE_FILES = [
+    'reference_data/general_instructions.json',
+    'reference_data/safety_check_instructions.json',
+    'reference_data/age_extraction_rules.json',
+    'reference_data/gender_extraction_rules.json',
+    'reference_data/form_extraction_rules.json',
+    'reference_data/form_priority_rules.json',
+    'reference_data/organic_extraction_rules.json',
+    'reference_data/pack_count_extraction_rules.json',
+    'reference_data/unit_extraction_rules.json',
+    'reference_data/size_extraction_rules.json',
+    'reference_data/potency_extraction_rules.json',
+    'reference_data/ingredient_extraction_rules.json',
+    'reference_data/business_rules.json',
+    'reference_data/non_supplement_keywords.csv',
+]
+
+# How often (seconds) to stat reference files for changes
+TEMPLATE_CHECK_INTERVAL_SEC = 5.0
+
+# Output format + workflow when business rules / post-processing run locally
+LOCAL_RULES_OUTPUT_FORMAT = """OUTPUT FORMAT:
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+Return a JSON object with this structure:
+
+{
+  "age": { "value": "AGE GROUP - NON SPECIFIC", "reasoning": "..." },
+  "gender": { "value": "GENDER - NON SPECIFIC", "reasoning": "..." },
+  "form": { "value": "SOFTGEL", "reasoning": "..." },
+  "organic": { "value": "N/A", "reasoning": "..." },
+  "count": { "value": "60", "reasoning": "..." },
+  "unit": { "value": "N/A", "reasoning": "..." },
+  "size": { "value": "1", "reasoning": "..." },
+  "potency": { "value": "5000 IU", "reasoning": "..." },
+  "ingredients": [ /* array from lookup_ingredient calls: name, position, category, subcategory */ ]
+}
+
+IMPORTANT:
+- Always provide reasoning for EVERY attribute extraction
+- For count: Be careful NOT to confuse dosage (mg, IU) with count
+- For size: Default to 1 if no pack keywords found
+- For ingredients: Call lookup_ingredient() for EACH ingredient found
+- Business rules, ingredient combos, health focus and high-level category are
+  applied by the pipeline AFTER your answer - do NOT return them
+
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━"""
+
+LOCAL_RULES_WORKFLOW = """WORKFLOW (CRITICAL - FOLLOW EXACTLY):
+1. Extract age, gender, form, organic, count, unit, size, potency from the title
+2. Extract ingredient names from the title
+3. For EACH ingredient, call lookup_ingredient() to get category/subcategory
+4. Return the JSON above with every looked-up ingredient
+
+Interpret the title as best as you can and extract all relevant attributes."""
+
+# Lean output mode: values only, coded closed-set attributes (see response_schema.py)
+LEAN_OUTPUT_FORMAT = """LEAN OUTPUT:
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+Return ONE compact JSON object - values only, NO per-attribute reasoning:
+
+{{"age":"NS","gender":"F","form":"SOFTGEL","organic":"N","count":"60","unit":"N/A","size":"1","potency":"5000 IU","ingredients":[{{"name":"vitamin d3","position":12,"category":"BASIC VITAMINS & MINERALS","subcategory":"LETTER VITAMINS"}}],"reasoning":null}}
+
+CODES - return the code on the left, not the full value:
+{codes}
+
+IMPORTANT:
+- count, unit, size, potency: same values the extraction rules above describe
+- For count: Be careful NOT to confuse dosage (mg, IU) with count
+- ingredients: every ingredient with its category/subcategory from lookup_ingredient() (or pre-resolved)
+- reasoning: {reasoning_rule}
+- Do NOT return business_rules, postprocessing or primary_ingredient - the pipeline
+  takes them from the tool results
+
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━"""
+
+LEAN_REASONING_TOOLS = "1-2 sentences ONLY if apply_business_rules() returned should_explain=true (based on its reasoning_context), otherwise null"
+LEAN_REASONING_LOCAL = "always null (business rules run after your answer)"
+
+LEAN_WORKFLOW_TOOLS = """WORKFLOW (CRITICAL - FOLLOW EXACTLY):
+1. Extract age, gender, form, organic, count, unit, size, potency from the title
+2. Extract ingredient names from the title
+3. For EACH ingredient, call lookup_ingredient() to get category/subcategory
+4. Call apply_business_rules() with ingredients array, age_group, gender, and title
+   (pass the FULL age/gender values, not the codes)
+5. ⚠️  AFTER business rules, you MUST call apply_postprocessing()
+   with the SAME ingredients array, age_group, gender, and title
+6. Return the lean JSON above
+
+Interpret the title as best as you can and extract all relevant attributes."""
+
+LEAN_WORKFLOW_LOCAL = """WORKFLOW (CRITICAL - FOLLOW EXACTLY):
+1. Extract age, gender, form, organic, count, unit, size, potency from the title
+2. Extract ingredient names from the title
+3. For EACH ingredient, call lookup_ingredient() to get category/subcategory
+4. Return the lean JSON above with every looked-up ingredient
+
+Interpret the title as best as you can and extract all relevant attributes."""
+
+
+def format_lean_output(local_rules: bool) -> str:
+    """Lean output section with the code table"""
+    codes = '\n'.join(
+        f"- {field}: " + ', '.join(f"{code}={value}" for code, value in values.items())
+        for field, values in LEAN_CODES.items()
+    )
+    return LEAN_OUTPUT_FORMAT.format(codes=codes, reasoning_rule=LEAN_REASONING_LOCAL if local_rules else LEAN_REASONING_TOOLS)
+
+
+# Added after the workflow when the batch lookup tool is offered
+BATCH_LOOKUP_INSTRUCTIONS = """INGREDIENT LOOKUP IN ONE CALL:
+Instead of one lookup_ingredient() call per ingredient, call
+lookup_ingredients(ingredient_names=[...]) ONCE with EVERY ingredient name you
+identified - it returns one result per name with the same fields as
+lookup_ingredient(). Use lookup_ingredient() only for a follow-up lookup that a
+result calls for (e.g. the 'probiotic' fallback, or splitting a combo phrase
+that was not found). With several products, one call may cover all of them."""
+
+
+# Appended instead of the single title when K products share one request
+PACK_INSTRUCTIONS = """MULTIPLE PRODUCTS IN THIS REQUEST:
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+This request contains {count} separate products. Classify EACH product independently:
+- Follow the complete WORKFLOW above for every product (its own lookup_ingredient,
+  apply_business_rules and apply_postprocessing calls - always pass THAT product's title)
+- Never mix ingredients or attributes between products
+- Return ONE JSON object: {{"products": [ ... ]}} with exactly one entry per ASIN
+- Each entry has an "asin" field plus the same structure as OUTPUT FORMAT above
+
+PRODUCTS TO CLASSIFY:
+"""
+
+# Inserted right before the title when ingredient pre-scan found database matches
+PRESCAN_INSTRUCTIONS = """PRE-RESOLVED INGREDIENTS (exact database matches found in this title):
+{lines}
+Use these name/position/category/subcategory values directly - do NOT call
+lookup_ingredient() for them. Call lookup_ingredient() ONLY for ingredients in the
+title that are NOT listed here. Drop any listed term that is only a flavor.
+
+"""
+
+# Per-product hint under each "ASIN | Title" line of a packed request
+PRESCAN_PACK_HINT = "  Pre-resolved (no lookup needed): {items}"
 
 
 def load_json(filepath):
@@ -78,8 +234,20 @@ def format_safety_check_section():
     return '\n'.join(lines)
 
 
-def build_complete_prompt(product_title: str):
-    """Build the complete LLM prompt (brand not needed - R removes it before processing)"""
+def _build_static_prefix(local_rules: bool = False, lean: bool = False, batch_lookup: bool = False) -> str:
+    """
+    Render every static prompt section (everything except the product title)
+    
+    The title is the ONLY per-product content, so it goes at the very end.
+    Every request then shares a byte-identical prefix and the provider's
+    automatic prompt caching can reuse it.
+    
+    Args:
+        local_rules: Leave out the apply_business_rules / apply_postprocessing
+                     tool steps - the pipeline runs them in-process instead
+        lean: Ask for the lean values-only answer instead of {value, reasoning} pairs
+        batch_lookup: Ask for one lookup_ingredients() call instead of one call per ingredient
+    """
     
     # Load all files
     general_instructions = load_json('reference_data/general_instructions.json')
@@ -516,8 +684,9 @@ Priority Order (check in this order):
     
     prompt += f"Default: \"{potency_rules['default']}\" ({potency_rules['default_reasoning']})\n"
     
-    # Potency Extraction (STEP 9 - must come after ingredients!)
-    prompt += f"""
+    # Business rules + post-processing as LLM tools (skipped when the pipeline runs them locally)
+    if not local_rules:
+        prompt += f"""
 
 
 ================================================================================
@@ -585,7 +754,7 @@ When should_explain is FALSE:
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 """
 
-    prompt += f"""
+        prompt += f"""
 ================================================================================
 STEP 11: APPLY POST-PROCESSING (FINAL STEP)
 ================================================================================
@@ -637,12 +806,26 @@ Examples of GOOD final reasoning:
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 """
     
+    if lean:
+        output_format = format_lean_output(local_rules)
+        workflow = LEAN_WORKFLOW_LOCAL if local_rules else LEAN_WORKFLOW_TOOLS
+    elif local_rules:
+        output_format = LOCAL_RULES_OUTPUT_FORMAT
+        workflow = LOCAL_RULES_WORKFLOW
+    else:
+        output_format = general_instructions['output_format_instructions']
+        workflow = general_instructions['workflow_instructions']
+    if batch_lookup:
+        workflow += '\n\n' + BATCH_LOOKUP_INSTRUCTIONS
+    
     prompt += f"""
 ================================================================================
 OUTPUT FORMAT
 ================================================================================
 
-{general_instructions['output_format_instructions']}
+{output_format}
+
+{workflow}
 
 ================================================================================
 PRODUCT TO CLASSIFY
@@ -650,22 +833,154 @@ PRODUCT TO CLASSIFY
 
 {general_instructions['formatting_issues_warning']}
 
-"""
-    prompt += f'Title: "{product_title}"\n\n'
-    
-    prompt += f"""{general_instructions['workflow_instructions']}
 """
     
     return prompt
 
 
+def _format_prescan_item(candidate: Dict) -> str:
+    """One pre-resolved ingredient: "vitamin d3"@12 → VITAMIN D | CATEGORY / SUBCATEGORY"""
+    return (f'"{candidate["name"]}"@{candidate["position"]} → {candidate["ingredient"]} | '
+            f'{candidate["category"]} / {candidate["subcategory"]}')
+
+
+def format_prescan_section(candidates: List[Dict]) -> str:
+    """Compact pre-resolved ingredient section ('' when nothing matched)"""
+    if not candidates:
+        return ''
+    return PRESCAN_INSTRUCTIONS.format(lines='\n'.join(f'- {_format_prescan_item(c)}' for c in candidates))
+
+
+class PromptTemplate:
+    """
+    Compiled prompt template - static prefix rendered once, title appended last
+    
+    Attributes:
+        prefix: Immutable rendered text of all static sections
+        fingerprint: SHA-256 of the prefix (changes when reference data changes)
+        local_rules: True if business rules / post-processing run in-process
+        prescan: True if pre-resolved ingredients are inserted before the title
+        lean: True if the model returns the lean values-only answer
+        batch_lookup: True if the model looks up all ingredients with one lookup_ingredients() call
+    """
+    
+    def __init__(self, prefix: str, local_rules: bool = False, prescan: bool = False, lean: bool = False,
+                 batch_lookup: bool = False):
+        self.prefix = prefix
+        self.local_rules = local_rules
+        self.prescan = prescan
+        self.lean = lean
+        self.batch_lookup = batch_lookup
+        # Pre-scan changes the per-title text, so it is part of the version
+        digest = hashlib.sha256(prefix.encode('utf-8'))
+        if prescan:
+            digest.update(PRESCAN_INSTRUCTIONS.encode('utf-8'))
+            digest.update(PRESCAN_PACK_HINT.encode('utf-8'))
+        self.fingerprint = digest.hexdigest()
+        self.compiled_at = time.time()
+    
+    @property
+    def version(self) -> str:
+        """Short prompt version id for audit files"""
+        return self.fingerprint[:12]
+    
+    def render(self, product_title: str) -> str:
+        """Append the product title (after any pre-resolved ingredients) to the shared prefix"""
+        section = format_prescan_section(prescan_title_ingredients(product_title)) if self.prescan else ''
+        return f'{self.prefix}{section}Title: "{product_title}"\n'
+    
+    def render_pack(self, products: List[Tuple[str, str]]) -> str:
+        """Append several (asin, title) products to the shared prefix"""
+        lines = []
+        for asin, title in products:
+            lines.append(f'ASIN: {asin} | Title: "{title}"')
+            candidates = prescan_title_ingredients(title) if self.prescan else []
+            if candidates:
+                lines.append(PRESCAN_PACK_HINT.format(items='; '.join(_format_prescan_item(c) for c in candidates)))
+        return self.prefix + PACK_INSTRUCTIONS.format(count=len(products)) + '\n'.join(lines) + '\n'
+
+
+# Global template cache, one per variant (rebuilt only when reference files change)
+_TEMPLATES = {}
+_TEMPLATE_STAMP = None
+_TEMPLATE_CHECKED_AT = 0.0
+_TEMPLATE_LOCK = threading.Lock()
+
+
+def _reference_stamp() -> tuple:
+    """Modification stamp of all reference files used by the prompt"""
+    stamp = []
+    for filepath in PROMPT_REFERENCE_FILES:
+        try:
+            stat = os.stat(filepath)
+            stamp.append((filepath, stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            stamp.append((filepath, None, None))
+    return tuple(stamp)
+
+
+def get_prompt_template(local_rules: Optional[bool] = None, prescan: Optional[bool] = None,
+                        lean: Optional[bool] = None, batch_lookup: Optional[bool] = None) -> PromptTemplate:
+    """
+    Get the compiled prompt template (thread-safe, built once per run)
+    
+    Reference files are re-checked at most every TEMPLATE_CHECK_INTERVAL_SEC;
+    the template is recompiled only if one of them changed on disk.
+    
+    Args:
+        local_rules: Template variant (default: from LLM config rules_mode)
+        prescan: Insert pre-resolved ingredients (default: from LLM config)
+        lean: Lean values-only answer (default: from LLM config output_mode)
+        batch_lookup: One lookup_ingredients() call per title (default: from LLM config)
+    """
+    global _TEMPLATE_STAMP, _TEMPLATE_CHECKED_AT
+    
+    config = get_llm_config()
+    if local_rules is None:
+        local_rules = config.rules_mode == 'local'
+    if prescan is None:
+        prescan = config.ingredient_prescan
+    if lean is None:
+        lean = config.output_mode == 'lean'
+    if batch_lookup is None:
+        batch_lookup = config.batch_lookup
+    variant = (local_rules, prescan, lean, batch_lookup)
+    
+    now = time.monotonic()
+    template = _TEMPLATES.get(variant)
+    if template is not None and now - _TEMPLATE_CHECKED_AT < TEMPLATE_CHECK_INTERVAL_SEC:
+        return template
+    
+    with _TEMPLATE_LOCK:
+        template = _TEMPLATES.get(variant)
+        if template is not None and now - _TEMPLATE_CHECKED_AT < TEMPLATE_CHECK_INTERVAL_SEC:
+            return template
+        
+        stamp = _reference_stamp()
+        if stamp != _TEMPLATE_STAMP:
+            _TEMPLATES.clear()
+            _TEMPLATE_STAMP = stamp
+        if variant not in _TEMPLATES:
+            _TEMPLATES[variant] = PromptTemplate(_build_static_prefix(local_rules, lean, batch_lookup),
+                                                 local_rules, prescan, lean, batch_lookup)
+        _TEMPLATE_CHECKED_AT = time.monotonic()
+        return _TEMPLATES[variant]
+
+
+def build_complete_prompt(product_title: str):
+    """Build the complete LLM prompt (brand not needed - R removes it before processing)"""
+    return get_prompt_template().render(product_title)
+
+
 if __name__ == '__main__':
     # Test with example product
     example_title = "Women's 50+ Multivitamin with Turmeric Powder in Vegetable Capsules"
     
     print(build_complete_prompt(example_title))
     
+    template = get_prompt_template()
     print("\n" + "="*80)
     print("PROMPT LENGTH:", len(build_complete_prompt(example_title)), "characters")
+    print("STATIC PREFIX:", len(template.prefix), "characters (version", template.version + ")")
 
 
@@ -0,0 +1,223 @@
+"""
+Rate Limiter - Process-wide RPM/TPM token buckets in front of GPTClient
+
+Without a shared budget every worker fires at once, the org limit answers
+with 429s and the retries line up into the next burst. Two buckets refill
+continuously at the configured budget (times a safety target):
+  - requests bucket: one unit per API call
+  - tokens bucket:   estimated prompt + completion tokens per call
+A call blocks until both buckets can cover it.
+
+Token estimates come from the prompt length (chars per token learned from
+response.usage) plus the running average completion size; after each
+response the bucket is corrected by the difference to the real usage.
+"""
+
+import asyncio
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from src.llm.llm_config import get_llm_config
+
+
+# Starting guesses - corrected from response.usage as calls complete
+INITIAL_CHARS_PER_TOKEN = 4.0
+INITIAL_COMPLETION_TOKENS = 800
+USAGE_EWMA_ALPHA = 0.1
+
+# Longest single sleep while waiting for capacity (re-checked after)
+MAX_WAIT_STEP_SEC = 1.0
+
+
+class _Bucket:
+    """Continuously refilling token bucket (caller holds the limiter lock)"""
+
+    def __init__(self, per_minute: float, burst_sec: float):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_sec)
+        self.level = self.capacity
+        self.updated_at = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_for(self, amount: float) -> float:
+        """Seconds until `amount` is available (requests larger than the bucket wait for a full bucket)"""
+        needed = min(amount, self.capacity)
+        return 0.0 if self.level >= needed else (needed - self.level) / self.rate
+
+
+class Reservation:
+    """Capacity taken for one API call - settle() it with the real usage"""
+
+    def __init__(self, limiter: 'TokenBucketRateLimiter', prompt_chars: int, estimated_tokens: int):
+        self.limiter = limiter
+        self.prompt_chars = prompt_chars
+        self.estimated_tokens = estimated_tokens
+        self.settled = False
+
+    def settle(self, usage=None):
+        """Correct the token bucket from response.usage (None = nothing was billed, refund)"""
+        if not self.settled:
+            self.settled = True
+            self.limiter._settle(self, usage)
+
+
+class TokenBucketRateLimiter:
+    """Shared requests-per-minute / tokens-per-minute limiter for sync and async callers"""
+
+    def __init__(self, rpm: int = 0, tpm: int = 0, target: float = 0.9, burst_sec: float = 10.0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.target = target
+        self._requests = _Bucket(rpm * target, burst_sec) if rpm > 0 else None
+        self._tokens = _Bucket(tpm * target, burst_sec) if tpm > 0 else None
+
+        self._lock = threading.Lock()
+        self._chars_per_token = INITIAL_CHARS_PER_TOKEN
+        self._completion_tokens = float(INITIAL_COMPLETION_TOKENS)
+        self._stats = {
+            'requests': 0,
+            'waits': 0,
+            'wait_seconds': 0.0,
+            'estimated_tokens': 0,
+            'actual_tokens': 0
+        }
+
+    def estimate_tokens(self, prompt_chars: int) -> int:
+        """Prompt + expected completion tokens for a request"""
+        return int(prompt_chars / self._chars_per_token + self._completion_tokens)
+
+    def acquire(self, messages: List) -> Reservation:
+        """Block the thread until the call fits both budgets"""
+        prompt_chars = _prompt_chars(messages)
+        reservation, wait = self._try_reserve(prompt_chars)
+        waited = 0.0
+        while reservation is None:
+            time.sleep(wait)
+            waited += wait
+            reservation, wait = self._try_reserve(prompt_chars)
+        self._record_wait(waited)
+        return reservation
+
+    async def acquire_async(self, messages: List) -> Reservation:
+        """Await (without blocking the event loop) until the call fits both budgets"""
+        prompt_chars = _prompt_chars(messages)
+        reservation, wait = self._try_reserve(prompt_chars)
+        waited = 0.0
+        while reservation is None:
+            await asyncio.sleep(wait)
+            waited += wait
+            reservation, wait = self._try_reserve(prompt_chars)
+        self._record_wait(waited)
+        return reservation
+
+    def _try_reserve(self, prompt_chars: int):
+        """Take capacity if available; else (None, seconds to wait)"""
+        with self._lock:
+            tokens = self.estimate_tokens(prompt_chars)
+            now = time.monotonic()
+            wait = 0.0
+            for bucket, amount in ((self._requests, 1), (self._tokens, tokens)):
+                if bucket is not None:
+                    bucket.refill(now)
+                    wait = max(wait, bucket.wait_for(amount))
+            if wait > 0:
+                return None, min(wait, MAX_WAIT_STEP_SEC)
+
+            if self._requests is not None:
+                self._requests.level -= 1
+            if self._tokens is not None:
+                self._tokens.level -= tokens
+            self._stats['requests'] += 1
+            self._stats['estimated_tokens'] += tokens
+        return Reservation(self, prompt_chars, tokens), 0.0
+
+    def _record_wait(self, waited: float):
+        if waited > 0:
+            with self._lock:
+                self._stats['waits'] += 1
+                self._stats['wait_seconds'] += waited
+
+    def _settle(self, reservation: Reservation, usage):
+        with self._lock:
+            if usage is None:
+                # Failed before billing (429, connection error) - give the tokens back
+                if self._tokens is not None:
+                    self._tokens.level = min(self._tokens.capacity, self._tokens.level + reservation.estimated_tokens)
+                return
+
+            actual = usage.total_tokens
+            self._stats['actual_tokens'] += actual
+            if self._tokens is not None:
+                # May go negative - later calls wait until the debt is repaid
+                self._tokens.level -= actual - reservation.estimated_tokens
+
+            # Learn chars/token and completion size for the next estimates
+            if usage.prompt_tokens:
+                observed = reservation.prompt_chars / usage.prompt_tokens
+                self._chars_per_token += USAGE_EWMA_ALPHA * (observed - self._chars_per_token)
+            self._completion_tokens += USAGE_EWMA_ALPHA * (usage.completion_tokens - self._completion_tokens)
+
+    def stats(self) -> Dict[str, Any]:
+        """Budget usage for the run manifest"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'enabled': True,
+                'rpm_limit': self.rpm,
+                'tpm_limit': self.tpm,
+                'target': self.target,
+                'wait_seconds': round(stats['wait_seconds'], 2),
+                'chars_per_token': round(self._chars_per_token, 2),
+                'avg_completion_tokens': round(self._completion_tokens)
+            })
+        return stats
+
+
+def _prompt_chars(messages: List) -> int:
+    """Approximate size of the conversation sent in one request"""
+    total = 0
+    for message in messages:
+        if isinstance(message, dict):
+            content = message.get('content')
+            total += len(content) if isinstance(content, str) else len(json.dumps(message, default=str))
+        else:
+            # Assistant message object from a previous round (tool calls)
+            total += len(message.model_dump_json(exclude_none=True))
+    return total
+
+
+# Global instance (lazy loaded)
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> Optional[TokenBucketRateLimiter]:
+    """Get the process-wide limiter (None when no RPM/TPM budget is configured)"""
+    global _rate_limiter
+
+    config = get_llm_config()
+    if config.rpm_limit <= 0 and config.tpm_limit <= 0:
+        return None
+
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                _rate_limiter = TokenBucketRateLimiter(
+                    rpm=config.rpm_limit,
+                    tpm=config.tpm_limit,
+                    target=config.rate_limit_target,
+                    burst_sec=config.rate_limit_burst_sec
+                )
+
+    return _rate_limiter
+
+
+def get_rate_limit_stats() -> Dict[str, Any]:
+    """Stats for the run manifest ({'enabled': False} when no budget is set)"""
+    limiter = get_rate_limiter()
+    return limiter.stats() if limiter else {'enabled': False}
@@ -0,0 +1,273 @@
+"""
+LLM Response Cache - Persistent SQLite cache in front of Step 2
+
+Re-running a file (or coding a new file with titles we already classified)
+should not pay GPT cost twice. Results are keyed on:
+  - normalized title (case / whitespace / unicode-insensitive)
+  - compiled prompt fingerprint (any rule change = new key)
+  - reference data fingerprint (tool lookups can change the answer)
+  - model name, plus the routed tier's model / reasoning_effort and the
+    latency preset when they differ from the defaults
+
+The database runs in WAL mode so many workers can read while one writes.
+When it grows past the size limit, least-recently-used entries are evicted.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from src.llm.llm_config import get_llm_config
+from src.llm.gpt_client import zero_usage_metadata
+
+
+# Cache modes
+CACHE_ON = 'on'            # Read and write
+CACHE_OFF = 'off'          # Bypass entirely
+CACHE_REFRESH = 'refresh'  # Skip reads, overwrite with fresh results
+
+# Check the size limit every N writes (PRAGMA calls are cheap but not free)
+EVICTION_CHECK_INTERVAL = 100
+
+# Evict down to this fraction of the size limit
+EVICTION_TARGET_RATIO = 0.9
+
+
+def normalize_title(title: str) -> str:
+    """Canonical form of a title for cache keys"""
+    text = unicodedata.normalize('NFKC', str(title or ''))
+    return ' '.join(text.lower().split())
+
+
+# Reference files that do not change LLM output (price updates keep cached responses)
+FINGERPRINT_EXCLUDE = {'model_pricing.json'}
+
+
+def reference_data_fingerprint(reference_dir: str = 'reference_data') -> str:
+    """Content hash of every reference file (prompt rules AND tool lookups)"""
+    digest = hashlib.sha256()
+    for path in sorted(Path(reference_dir).glob('*')):
+        if path.is_file() and path.name not in FINGERPRINT_EXCLUDE:
+            digest.update(path.name.encode('utf-8'))
+            digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed cache of successful LLM results"""
+
+    def __init__(self, db_path: str, max_mb: float = 512, mode: str = CACHE_ON, model: str = ''):
+        if mode not in (CACHE_ON, CACHE_REFRESH):
+            raise ValueError(f"Invalid cache mode: {mode}")
+
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.mode = mode
+        self.model = model
+        self.reference_fingerprint = reference_data_fingerprint()
+
+        # One connection shared by all workers (sqlite3 serializes access anyway)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_responses (
+                cache_key TEXT PRIMARY KEY,
+                title TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                model TEXT NOT NULL,
+                result_json TEXT NOT NULL,
+                cost REAL NOT NULL DEFAULT 0,
+                tokens INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL,
+                hit_count INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_llm_responses_last_used ON llm_responses(last_used_at)')
+        self._conn.commit()
+
+        self._writes_since_check = 0
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'writes': 0,
+            'evictions': 0,
+            'saved_cost': 0.0,
+            'saved_tokens': 0
+        }
+
+    def make_key(self, title: str, template, variant: str = '') -> str:
+        """
+        Cache key for a title under the current prompt template
+
+        variant names a non-default model / reasoning_effort / token cap the
+        title is answered with (routing tier, latency preset); empty keeps the
+        plain key so caches written without one stay valid.
+        """
+        parts = [normalize_title(title), template.fingerprint, self.reference_fingerprint, self.model]
+        if variant:
+            parts.append(variant)
+        raw = '|'.join(parts)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached result
+
+        Returns:
+            The stored LLM result with cost/tokens zeroed (nothing was spent)
+            and the original spend under _metadata['cache'], or None on a miss
+        """
+        if self.mode == CACHE_REFRESH:
+            with self._lock:
+                self._stats['misses'] += 1
+            return None
+
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT result_json, cost, tokens, created_at FROM llm_responses WHERE cache_key = ?',
+                (cache_key,)
+            ).fetchone()
+
+            if row is None:
+                self._stats['misses'] += 1
+                return None
+
+            self._conn.execute(
+                'UPDATE llm_responses SET last_used_at = ?, hit_count = hit_count + 1 WHERE cache_key = ?',
+                (time.time(), cache_key)
+            )
+            self._conn.commit()
+
+            result_json, cost, tokens, created_at = row
+            self._stats['hits'] += 1
+            self._stats['saved_cost'] += cost
+            self._stats['saved_tokens'] += tokens
+
+        result = json.loads(result_json)
+        metadata = zero_usage_metadata(result.setdefault('_metadata', {}))
+        metadata['cache'] = {
+            'hit': True,
+            'key': cache_key,
+            'saved_cost': cost,
+            'saved_tokens': tokens,
+            'cached_at': created_at
+        }
+        return result
+
+    def put(self, cache_key: str, title: str, llm_result: Dict[str, Any]):
+        """Store a successful LLM result (tool-call metadata included)"""
+        metadata = llm_result.get('_metadata', {})
+        cost = metadata.get('total_cost', 0) or 0
+        tokens = metadata.get('tokens_used', {}).get('total', 0) or 0
+        now = time.time()
+
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO llm_responses
+                    (cache_key, title, prompt_version, model, result_json, cost, tokens, created_at, last_used_at, hit_count)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0)
+                """,
+                (cache_key, normalize_title(title), metadata.get('prompt_version', ''), self.model,
+                 json.dumps(llm_result, default=str), cost, tokens, now, now)
+            )
+            self._conn.commit()
+            self._stats['writes'] += 1
+            self._writes_since_check += 1
+
+            if self._writes_since_check >= EVICTION_CHECK_INTERVAL:
+                self._writes_since_check = 0
+                self._evict_if_needed()
+
+    def _used_bytes(self) -> int:
+        """Bytes in use by live pages (freed pages are reused, so exclude them)"""
+        page_size = self._conn.execute('PRAGMA page_size').fetchone()[0]
+        page_count = self._conn.execute('PRAGMA page_count').fetchone()[0]
+        freelist = self._conn.execute('PRAGMA freelist_count').fetchone()[0]
+        return (page_count - freelist) * page_size
+
+    def _evict_if_needed(self):
+        """Drop least-recently-used entries until under the size limit (caller holds lock)"""
+        used = self._used_bytes()
+        if used <= self.max_bytes:
+            return
+
+        rows = self._conn.execute('SELECT COUNT(*) FROM llm_responses').fetchone()[0]
+        if rows == 0:
+            return
+
+        avg_row_bytes = max(1, used // rows)
+        to_delete = min(rows, (used - int(self.max_bytes * EVICTION_TARGET_RATIO)) // avg_row_bytes + 1)
+
+        self._conn.execute(
+            """
+            DELETE FROM llm_responses WHERE cache_key IN (
+                SELECT cache_key FROM llm_responses ORDER BY last_used_at ASC LIMIT ?
+            )
+            """,
+            (to_delete,)
+        )
+        self._conn.commit()
+        self._stats['evictions'] += to_delete
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counts and savings for this run (for manifest and tracker)"""
+        with self._lock:
+            stats = dict(self._stats)
+            entries = self._conn.execute('SELECT COUNT(*) FROM llm_responses').fetchone()[0]
+            size_bytes = self._used_bytes()
+
+        lookups = stats['hits'] + stats['misses']
+        stats['enabled'] = True
+        stats['mode'] = self.mode
+        stats['saved_cost'] = round(stats['saved_cost'], 6)
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0
+        stats['entries'] = entries
+        stats['size_mb'] = round(size_bytes / (1024 * 1024), 2)
+        return stats
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            self._conn.close()
+
+
+# Global instance (lazy loaded)
+_cache_instance = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Get the process-wide response cache (None when the cache is off)"""
+    global _cache_instance
+
+    config = get_llm_config()
+    if config.cache_mode == CACHE_OFF:
+        return None
+
+    if _cache_instance is None:
+        with _cache_lock:
+            if _cache_instance is None:
+                _cache_instance = ResponseCache(
+                    db_path=config.cache_path,
+                    max_mb=config.cache_max_mb,
+                    mode=config.cache_mode,
+                    model=config.model
+                )
+
+    return _cache_instance
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    """Stats for the run manifest ({'enabled': False} when the cache is off)"""
+    cache = get_response_cache()
+    return cache.stats() if cache else {'enabled': False, 'mode': CACHE_OFF}
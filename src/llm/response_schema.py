@@ -132,6 +132,144 @@ RESPONSE_FORMAT_SCHEMA = {
 }
 
 
+# ----- Lean output mode (LLM_OUTPUT_MODE=lean) -----
+# Values only, no per-attribute reasoning; the closed-set attributes come back as
+# short codes. Business rules / post-processing are filled in from the tool
+# results after the answer, so the model does not repeat them.
+
+LEAN_CODES = {
+    "age": {
+        "NS": "AGE GROUP - NON SPECIFIC",
+        "BABY": "AGE GROUP - BABY",
+        "CHILD": "AGE GROUP - CHILD",
+        "TEEN": "AGE GROUP - TEEN",
+        "ADULT": "AGE GROUP - ADULT",
+        "MATURE": "AGE GROUP - MATURE ADULT",
+        "REMOVE": "REMOVE"
+    },
+    "gender": {
+        "NS": "GENDER - NON SPECIFIC",
+        "M": "GENDER - MALE",
+        "F": "GENDER - FEMALE",
+        "REMOVE": "REMOVE"
+    },
+    "form": {
+        "CAP": "CAPSULE",
+        "VCAP": "VEGETABLE CAPSULE",
+        "TAB": "TABLET",
+        "CAPLET": "CAPLET",
+        "CHEWTAB": "CHEWABLE TABLET",
+        "SOFTGEL": "SOFTGEL",
+        "SOFTCHEW": "SOFT CHEW",
+        "POWDER": "POWDER",
+        "LIQUID": "LIQUID",
+        "GUMMY": "GUMMY",
+        "DROPS": "DROPS",
+        "LOZENGE": "LOZENGE",
+        "BAR": "BAR",
+        "SPRAY": "SPRAY",
+        "TOPICAL": "TOPICAL GELS & CREAMS",
+        "PELLET": "PELLET",
+        "TINCTURE": "TINCTURE",
+        "KIT": "TEST KITS AND OTHER KITS",
+        "HERBS": "LOOSE MEDICINAL HERBS",
+        "GEL": "ENERGY GEL & FOOD - GEL",
+        "GELCHEW": "ENERGY GEL & FOOD - CHEW",
+        "GUM": "GUM",
+        "SUPP": "SUPPOSITORIES",
+        "OTHER": "OTHER/UNKNOWN",
+        "REMOVE": "REMOVE"
+    },
+    "organic": {
+        "Y": "ORGANIC",
+        "N": "NOT ORGANIC"
+    }
+}
+
+LEAN_PRODUCT_PROPERTIES = {
+    "age": {"type": "string", "enum": list(LEAN_CODES["age"])},
+    "gender": {"type": "string", "enum": list(LEAN_CODES["gender"])},
+    "form": {"type": "string", "enum": list(LEAN_CODES["form"])},
+    "organic": {"type": "string", "enum": list(LEAN_CODES["organic"])},
+    "count": {"type": ["string", "number"]},
+    "unit": {"type": "string"},
+    "size": {"type": ["string", "number"]},
+    "potency": {"type": "string"},
+    "ingredients": {
+        "type": "array",
+        "items": {
+            "type": "object",
+            "properties": {
+                "name": {"type": "string"},
+                "position": {"type": "integer"},
+                "category": {"type": ["string", "null"]},
+                "subcategory": {"type": ["string", "null"]}
+            },
+            "required": ["name", "position", "category", "subcategory"],
+            "additionalProperties": False
+        }
+    },
+    "reasoning": {
+        "type": ["string", "null"],
+        "description": "1-2 sentences - only if apply_business_rules returned should_explain=true, else null"
+    }
+}
+
+LEAN_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": LEAN_PRODUCT_PROPERTIES,
+    "required": list(LEAN_PRODUCT_PROPERTIES),
+    "additionalProperties": False
+}
+
+# Packed requests: {"products": [{"asin": ..., <lean fields>}, ...]}
+LEAN_PACK_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "products": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"asin": {"type": "string"}, **LEAN_PRODUCT_PROPERTIES},
+                "required": ["asin"] + list(LEAN_PRODUCT_PROPERTIES),
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["products"],
+    "additionalProperties": False
+}
+
+LEAN_RESPONSE_FORMAT_SCHEMA = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "supplement_attributes_lean",
+        "strict": True,
+        "schema": LEAN_RESPONSE_SCHEMA
+    }
+}
+
+LEAN_PACK_RESPONSE_FORMAT_SCHEMA = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "supplement_attributes_lean_pack",
+        "strict": True,
+        "schema": LEAN_PACK_RESPONSE_SCHEMA
+    }
+}
+
+# Attributes returned as bare values in lean mode (expanded to {value, reasoning})
+LEAN_VALUE_FIELDS = ["age", "gender", "form", "organic", "count", "unit", "size", "potency"]
+
+
+def decode_lean_value(field: str, value):
+    """Full attribute value for a lean code (non-coded fields and unknown codes pass through)"""
+    codes = LEAN_CODES.get(field)
+    if codes is None or not isinstance(value, str):
+        return value
+    return codes.get(value.strip().upper(), value)
+
+
 if __name__ == '__main__':
     import json
     print("="*80)
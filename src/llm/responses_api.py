@@ -0,0 +1,151 @@
+"""
+Responses API Transport - Stateful tool-call conversations (LLM_API=responses)
+
+On chat.completions every round trip re-sends the whole conversation: the
+~29 KB prompt, every earlier assistant turn and all tool results. The
+Responses API keeps the conversation on the server, so a follow-up round
+only sends previous_response_id plus the new tool outputs (or the JSON
+repair message).
+
+GPTClient still builds chat-shaped requests and runs the same tool loop;
+ResponsesConversation translates each request into Responses params and
+wrap_response() turns the reply into a ChatCompletion, so the retry
+policy, hedger, rate limiter and metadata code work unchanged on either API.
+
+Note: billed input tokens still include the stored context (the server
+replays it) - what drops is the request payload per round.
+"""
+
+from typing import Any, Dict, List, Optional
+
+from openai.types.chat import ChatCompletion, ChatCompletionMessage
+from openai.types.chat.chat_completion import Choice
+from openai.types.chat.chat_completion_message_tool_call import ChatCompletionMessageToolCall, Function
+from openai.types.completion_usage import CompletionTokensDetails, CompletionUsage, PromptTokensDetails
+
+
+def to_responses_tools(tools: List[Dict]) -> List[Dict]:
+    """Chat tool definitions ({type, function: {...}}) in the flat Responses format"""
+    converted = []
+    for tool in tools:
+        function = tool.get('function', {})
+        entry = {'type': 'function', 'name': function['name'], 'parameters': function.get('parameters', {})}
+        if 'description' in function:
+            entry['description'] = function['description']
+        if 'strict' in function:
+            entry['strict'] = function['strict']
+        converted.append(entry)
+    return converted
+
+
+def to_text_format(response_format: Dict) -> Dict:
+    """Chat response_format as the Responses text.format setting"""
+    if response_format.get('type') == 'json_schema':
+        schema = response_format['json_schema']
+        return {'format': {'type': 'json_schema', 'name': schema['name'], 'schema': schema['schema'],
+                           'strict': schema.get('strict', False)}}
+    return {'format': {'type': response_format.get('type', 'text')}}
+
+
+def to_input_items(messages: List) -> List[Dict]:
+    """
+    New chat messages as Responses input items
+
+    Assistant turns are skipped - the server already holds them under the
+    previous response.
+    """
+    items = []
+    for message in messages:
+        if not isinstance(message, dict) or message.get('role') == 'assistant':
+            continue
+        if message.get('role') == 'tool':
+            items.append({'type': 'function_call_output', 'call_id': message['tool_call_id'],
+                          'output': message['content']})
+        else:
+            items.append({'role': message['role'], 'content': message['content']})
+    return items
+
+
+def wrap_response(response: Any) -> ChatCompletion:
+    """
+    A Responses reply as a ChatCompletion
+
+    Function calls become tool_calls (call_id as id), output text becomes the
+    message content and input/output tokens become prompt/completion usage,
+    as the tool loop, rate limiter and hedger expect (cached and reasoning
+    token details included). The response id is kept.
+    """
+    tool_calls, texts = [], []
+    for item in response.output or []:
+        if item.type == 'function_call':
+            tool_calls.append(ChatCompletionMessageToolCall(
+                id=item.call_id, type='function', function=Function(name=item.name, arguments=item.arguments)
+            ))
+        elif item.type == 'message':
+            texts.extend(part.text for part in item.content if getattr(part, 'type', None) == 'output_text')
+
+    usage = response.usage
+    input_details = getattr(usage, 'input_tokens_details', None)
+    output_details = getattr(usage, 'output_tokens_details', None)
+    message = ChatCompletionMessage(role='assistant', content=''.join(texts) if texts else None,
+                                    tool_calls=tool_calls or None)
+    return ChatCompletion(
+        id=response.id,
+        object='chat.completion',
+        created=int(response.created_at),
+        model=response.model,
+        choices=[Choice(index=0, message=message, finish_reason='tool_calls' if tool_calls else 'stop')],
+        usage=CompletionUsage(
+            prompt_tokens=usage.input_tokens,
+            completion_tokens=usage.output_tokens,
+            total_tokens=usage.total_tokens,
+            prompt_tokens_details=PromptTokensDetails(cached_tokens=getattr(input_details, 'cached_tokens', 0) or 0),
+            completion_tokens_details=CompletionTokensDetails(
+                reasoning_tokens=getattr(output_details, 'reasoning_tokens', 0) or 0
+            )
+        )
+    )
+
+
+class ResponsesConversation:
+    """
+    Server-side state of one tool-call conversation
+
+    request() turns the chat params of a round into Responses params with
+    only the messages the server has not seen; advance() moves the state on
+    once a round succeeded. Retries and hedges of a round all fork from the
+    same previous response.
+    """
+
+    def __init__(self):
+        self.previous_response_id: Optional[str] = None
+        self._sent = 0
+        self._pending = 0
+
+    def request(self, params: Dict) -> Dict:
+        """Responses params for the chat params of this round"""
+        messages = params['messages']
+        self._pending = len(messages)
+
+        request = {
+            'model': params['model'],
+            'input': to_input_items(messages[self._sent:]),
+            'store': True  # Required for previous_response_id
+        }
+        if self.previous_response_id:
+            request['previous_response_id'] = self.previous_response_id
+        if params.get('reasoning_effort'):
+            request['reasoning'] = {'effort': params['reasoning_effort']}
+        if params.get('max_completion_tokens'):
+            request['max_output_tokens'] = params['max_completion_tokens']
+        if params.get('response_format'):
+            request['text'] = to_text_format(params['response_format'])
+        if params.get('tools'):
+            request['tools'] = to_responses_tools(params['tools'])
+            request['tool_choice'] = params.get('tool_choice', 'auto')
+        return request
+
+    def advance(self, response: Any):
+        """Record a successful round (the server now holds everything sent so far)"""
+        self.previous_response_id = response.id
+        self._sent = self._pending
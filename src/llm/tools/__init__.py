@@ -4,20 +4,30 @@ LLM Tools Module
 This module contains all custom tools that the LLM can call via function calling.
 """
 
-from .ingredient_lookup import lookup_ingredient, TOOL_DEFINITION as INGREDIENT_TOOL
+from .ingredient_lookup import (lookup_ingredient, lookup_ingredients, TOOL_DEFINITION as INGREDIENT_TOOL,
+                                BATCH_TOOL_DEFINITION as BATCH_INGREDIENT_TOOL, RESULT_PROFILE as INGREDIENT_PROFILE,
+                                BATCH_RESULT_PROFILE as BATCH_INGREDIENT_PROFILE)
 from .health_focus_lookup import lookup_health_focus  # Used by postprocessing tool internally
-from .business_rules_tool import apply_business_rules_tool, TOOL_DEFINITION as BUSINESS_RULES_TOOL
-from .postprocessing_tool import apply_postprocessing_tool, TOOL_DEFINITION as POSTPROCESSING_TOOL
+from .business_rules_tool import (apply_business_rules_tool, TOOL_DEFINITION as BUSINESS_RULES_TOOL,
+                                  RESULT_PROFILE as BUSINESS_RULES_PROFILE)
+from .postprocessing_tool import (apply_postprocessing_tool, TOOL_DEFINITION as POSTPROCESSING_TOOL,
+                                  RESULT_PROFILE as POSTPROCESSING_PROFILE)
+from .compact import compact_tool_result, serialize_tool_result
 
 # Export all tools
 __all__ = [
     'lookup_ingredient',
+    'lookup_ingredients',
     'apply_business_rules_tool',
     'apply_postprocessing_tool',
     'INGREDIENT_TOOL',
+    'BATCH_INGREDIENT_TOOL',
     'BUSINESS_RULES_TOOL',
     'POSTPROCESSING_TOOL',
     'lookup_health_focus',  # Exported for internal use by postprocessing tool
+    'TOOL_RESULT_PROFILES',
+    'compact_tool_result',
+    'serialize_tool_result',
 ]
 
 # List of all tool definitions for OpenAI API
@@ -27,4 +37,20 @@ ALL_TOOLS = [
     POSTPROCESSING_TOOL,  # LLM calls this for final processing
 ]
 
+# Tools the LLM still calls when business rules / post-processing run locally
+LOCAL_RULES_TOOLS = [
+    INGREDIENT_TOOL,
+]
+
+# Added in front of either list when batch lookup is on (one call for all ingredients)
+BATCH_LOOKUP_TOOLS = [
+    BATCH_INGREDIENT_TOOL,
+]
 
+# Compact tool-message profile per tool name (see compact.py)
+TOOL_RESULT_PROFILES = {
+    'lookup_ingredient': INGREDIENT_PROFILE,
+    'lookup_ingredients': BATCH_INGREDIENT_PROFILE,
+    'apply_business_rules': BUSINESS_RULES_PROFILE,
+    'apply_postprocessing': POSTPROCESSING_PROFILE,
+}
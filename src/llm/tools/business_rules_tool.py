@@ -133,6 +133,14 @@ def apply_business_rules_tool(
     }
 
 
+# What the model gets back (see compact.py) - the fields listed in the prompt's STEP 10
+RESULT_PROFILE = {
+    "fields": ["initial_category", "initial_subcategory", "final_category", "final_subcategory",
+               "primary_ingredient", "changes_made", "has_changes", "has_unknown", "should_explain",
+               "reasoning_context"]
+}
+
+
 # Tool definition for OpenAI function calling
 TOOL_DEFINITION = {
     "type": "function",
@@ -0,0 +1,49 @@
+"""
+Compact Tool Results - What a tool call sends back into the conversation
+
+A tool result stays in the context of every later round of the tool loop,
+so audit-only detail (full_reasoning, rules_applied, full_ingredients_data,
+match scores of every lookup candidate...) is paid for again and again.
+Each tool has a result profile with the fields the prompt tells the model to
+use; everything else is dropped from the tool message, empty values are left
+out and the JSON has no whitespace. Field names are kept - the prompt and
+reference data refer to them. The full result stays in _metadata.tool_calls.
+"""
+
+import json
+from typing import Any, Dict, Optional
+
+
+def compact_tool_result(result: Any, profile: Optional[Dict]) -> Any:
+    """
+    The profiled view of a tool result (unchanged without a profile or for errors)
+
+    Profile keys:
+        fields: result fields the model uses (in this order)
+        candidate_fields / max_candidates: trimming of a 'candidates' list
+        each: profile for every value of a {key: result} answer (batch tools)
+    """
+    if not profile or not isinstance(result, dict) or 'error' in result:
+        return result
+    if 'each' in profile:
+        return {key: compact_tool_result(value, profile['each']) for key, value in result.items()}
+
+    compact = {}
+    for field in profile['fields']:
+        value = result.get(field)
+        if value is None or value == '' or value == []:
+            continue
+        if field == 'candidates':
+            value = [
+                {key: candidate[key] for key in profile['candidate_fields'] if key in candidate}
+                for candidate in value[:profile.get('max_candidates', len(value))]
+            ]
+        compact[field] = value
+    return compact
+
+
+def serialize_tool_result(result: Any, profile: Optional[Dict] = None) -> str:
+    """Tool message content - compact JSON when the tool has a profile"""
+    if not profile:
+        return json.dumps(result)
+    return json.dumps(compact_tool_result(result, profile), separators=(',', ':'))
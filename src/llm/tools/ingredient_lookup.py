@@ -9,14 +9,28 @@ This tool searches the ingredient_category_lookup.csv using a 3-tier approach:
 Returns exact data from CSV for 95%+ accuracy.
 """
 
+import json
 import os
 import re
+import threading
+from functools import lru_cache
 from typing import Dict, List, Optional, Tuple
+import numpy as np
 import pandas as pd
 from rapidfuzz import fuzz, process
 from rank_bm25 import BM25Okapi
 
 
+# Longest title phrase (in words) tried against the index during pre-scan
+PRESCAN_MAX_WORDS = 4
+
+# Words that turn a short code into a compound name ("vitamin d3", "omega 3")
+PRESCAN_COMPOUND_PREFIXES = {'vitamin', 'vit', 'omega'}
+
+# Title tokens with their character offsets (letters/digits runs)
+_TITLE_TOKEN = re.compile(r'[^\W_]+')
+
+
 class IngredientLookup:
     """
     Ingredient lookup using BM25 + Fuzzy matching.
@@ -64,12 +78,46 @@ class IngredientLookup:
                 self.all_searchable.append(keyword)
                 self.index_map.append(idx)
         
+        # Exact-match index for pre-scan (first row wins, same as _exact_match)
+        self.exact_index = {}
+        for text, df_idx in zip(self.all_searchable, self.index_map):
+            self.exact_index.setdefault(text, df_idx)
+        
+        # Flavor words are ambiguous (flavor vs. functional) - never pre-resolved
+        self.flavor_keywords = self._load_flavor_keywords(os.path.dirname(csv_path))
+        
         # Initialize BM25
         tokenized_corpus = [self._tokenize(text) for text in self.all_searchable]
         self.bm25 = BM25Okapi(tokenized_corpus)
+        self._build_bm25_weights()
         
         print(f"✅ Loaded {len(self.df)} ingredients with {len(self.all_searchable)} searchable variations")
     
+    def _build_bm25_weights(self):
+        """
+        Term x entry BM25 weight matrix, so many queries score in one product
+        
+        Same formula as BM25Okapi.get_scores (idf * tf * (k1 + 1) / (tf + k1 *
+        length norm)), which walks every entry once per query term.
+        """
+        bm25 = self.bm25
+        self.bm25_vocab = {term: i for i, term in enumerate(bm25.idf)}
+        doc_norm = bm25.k1 * (1 - bm25.b + bm25.b * np.array(bm25.doc_len) / bm25.avgdl)
+        self.bm25_weights = np.zeros((len(self.bm25_vocab), bm25.corpus_size))
+        for doc, freqs in enumerate(bm25.doc_freqs):
+            for term, tf in freqs.items():
+                self.bm25_weights[self.bm25_vocab[term], doc] = bm25.idf[term] * tf * (bm25.k1 + 1) / (tf + doc_norm[doc])
+    
+    @staticmethod
+    def _load_flavor_keywords(reference_dir: str) -> set:
+        """Flavor keywords from the ingredient extraction rules (empty if missing)"""
+        try:
+            with open(os.path.join(reference_dir, 'ingredient_extraction_rules.json'), 'r') as f:
+                rules = json.load(f)
+            return set(k.lower() for k in rules.get('exclusions', {}).get('flavor_keywords', []))
+        except (OSError, ValueError):
+            return set()
+    
     def _normalize(self, text: str) -> str:
         """Normalize text for matching."""
         if not text:
@@ -157,18 +205,45 @@ class IngredientLookup:
         
         return None, 0.0
     
-    def _get_candidates(self, query: str, top_n: int = 3) -> List[Dict]:
-        """Get top N candidates from both fuzzy and BM25."""
+    def _fuzzy_scores_many(self, queries: List[str]) -> np.ndarray:
+        """fuzz.ratio of several queries against every searchable entry (one row per query)"""
+        return process.cdist([self._normalize(query) for query in queries], self.all_searchable,
+                             scorer=fuzz.ratio, dtype=np.float64)
+    
+    def _bm25_scores_many(self, queries: List[str]) -> np.ndarray:
+        """BM25 scores of several queries against every searchable entry (one row per query)"""
+        counts = np.zeros((len(queries), len(self.bm25_vocab)))
+        for row, query in enumerate(queries):
+            for token in self._tokenize(query):
+                column = self.bm25_vocab.get(token)
+                if column is not None:
+                    counts[row, column] += 1
+        return counts @ self.bm25_weights
+    
+    def _best_match(self, scores: np.ndarray, threshold: float) -> Tuple[Optional[int], float]:
+        """(df_index, score) of the best entry in a score row - (None, 0) below threshold"""
+        best = int(scores.argmax())
+        if scores[best] >= threshold:
+            return self.index_map[best], scores[best]
+        return None, 0
+    
+    def _get_candidates(self, query: str, top_n: int = 3, fuzzy_scores: Optional[np.ndarray] = None,
+                        bm25_scores: Optional[np.ndarray] = None) -> List[Dict]:
+        """Get top N candidates from both fuzzy and BM25 (from precomputed score rows if given)."""
         candidates = []
         seen_indices = set()
         
         # Get top fuzzy matches
-        fuzzy_results = process.extract(
-            self._normalize(query),
-            self.all_searchable,
-            scorer=fuzz.ratio,
-            limit=top_n
-        )
+        if fuzzy_scores is not None:
+            top = np.argsort(-fuzzy_scores, kind='stable')[:top_n]
+            fuzzy_results = [(self.all_searchable[idx], fuzzy_scores[idx], idx) for idx in top]
+        else:
+            fuzzy_results = process.extract(
+                self._normalize(query),
+                self.all_searchable,
+                scorer=fuzz.ratio,
+                limit=top_n
+            )
         
         for match, score, idx in fuzzy_results:
             df_idx = self.index_map[idx]
@@ -188,7 +263,7 @@ class IngredientLookup:
         # Get top BM25 matches
         tokenized_query = self._tokenize(query)
         if tokenized_query:
-            scores = self.bm25.get_scores(tokenized_query)
+            scores = bm25_scores if bm25_scores is not None else self.bm25.get_scores(tokenized_query)
             top_bm25_indices = scores.argsort()[-top_n:][::-1]
             
             for idx in top_bm25_indices:
@@ -240,6 +315,77 @@ class IngredientLookup:
         
         return False
     
+    def prescan_title(self, title: str) -> List[Dict]:
+        """
+        Find ingredients in a title that resolve unambiguously (before the LLM).
+        
+        Slides 1-4 word windows over the title, longest first, and keeps
+        non-overlapping EXACT index matches. Short codes ("d3", "b12") are
+        only accepted as part of a compound ("vitamin d3"), which must also
+        resolve with high confidence. Flavor words and single letters are
+        left to the LLM (they need context).
+        
+        Returns:
+            List of {name, position, ingredient, category, subcategory, match_type}
+            sorted by position (character index in the title)
+        """
+        if not title:
+            return []
+        
+        tokens = [(m.start(), m.end()) for m in _TITLE_TOKEN.finditer(title)]
+        words = [title[start:end].lower() for start, end in tokens]
+        claimed = [False] * len(tokens)
+        found = []
+        
+        for size in range(min(PRESCAN_MAX_WORDS, len(tokens)), 0, -1):
+            for first in range(len(tokens) - size + 1):
+                last = first + size - 1
+                if any(claimed[first:last + 1]):
+                    continue
+                
+                # Try the phrase as written ("omega-3") and space-joined ("omega 3")
+                surface = title[tokens[first][0]:tokens[last][1]]
+                df_idx = self.exact_index.get(self._normalize(surface))
+                if df_idx is None:
+                    df_idx = self.exact_index.get(' '.join(words[first:last + 1]))
+                if df_idx is None:
+                    continue
+                
+                name = self._normalize(surface)
+                start = tokens[first][0]
+                match_type = 'exact'
+                
+                if size == 1 and (name in self.flavor_keywords or len(name) < 2):
+                    continue
+                
+                if size == 1 and len(name) <= 3 and any(ch.isdigit() for ch in name):
+                    # Short code - only as "<prefix> <code>" (compound names stay whole)
+                    if first == 0 or claimed[first - 1] or words[first - 1] not in PRESCAN_COMPOUND_PREFIXES:
+                        continue
+                    compound = self._normalize(title[tokens[first - 1][0]:tokens[last][1]])
+                    result = self.lookup(compound)
+                    if result.get('confidence') not in ('exact', 'high'):
+                        continue
+                    df_idx = self.df.index[self.df['ingredient'] == result['ingredient']][0]
+                    name, start, first = compound, tokens[first - 1][0], first - 1
+                    match_type = result['match_type']
+                
+                for i in range(first, last + 1):
+                    claimed[i] = True
+                
+                row = self.df.iloc[df_idx]
+                found.append({
+                    "name": name,
+                    "position": start,
+                    "ingredient": row['ingredient'],
+                    "category": row['nw_category'],
+                    "subcategory": row['nw_subcategory'],
+                    "match_type": match_type
+                })
+        
+        found.sort(key=lambda x: x['position'])
+        return found
+    
     def lookup(self, ingredient_name: str) -> Dict:
         """
         Main lookup function - this is what the LLM calls.
@@ -255,32 +401,84 @@ class IngredientLookup:
         - LLM only decides on edge cases
         """
         if not ingredient_name or not ingredient_name.strip():
-            return {
-                "found": False,
-                "ingredient": "UNKNOWN",
-                "reason": "Empty ingredient name",
-                "confidence": "none"
-            }
+            return self._empty_result()
         
         # Step 1: Try exact match
         exact_idx = self._exact_match(ingredient_name)
         if exact_idx is not None:
-            row = self.df.iloc[exact_idx]
-            return {
-                "found": True,
-                "ingredient": row['ingredient'],
-                "nw_category": row['nw_category'],
-                "nw_subcategory": row['nw_subcategory'],
-                "keyword": row['keyword'],
-                "match_type": "exact",
-                "confidence": "exact",
-                "score": 100
-            }
+            return self._exact_result(exact_idx)
         
         # Step 2: Try fuzzy and BM25
         fuzzy_idx, fuzzy_score = self._fuzzy_match(ingredient_name)
         bm25_idx, bm25_score = self._bm25_match(ingredient_name)
+        return self._resolve(ingredient_name, fuzzy_idx, fuzzy_score, bm25_idx, bm25_score,
+                             lambda: self._get_candidates(ingredient_name, top_n=3))
+    
+    def lookup_many(self, ingredient_names: List[str]) -> Dict[str, Dict]:
+        """
+        Look up several ingredients in one pass (what lookup_ingredients calls)
+        
+        Same 3-tier result per name as lookup(), but the fuzzy ratios of all
+        names that are not exact matches come from one rapidfuzz cdist call
+        and their BM25 scores from one matrix product.
         
+        Returns:
+            {ingredient_name: lookup result} in the given order (duplicates once)
+        """
+        names = list(dict.fromkeys(ingredient_names))
+        results = {}
+        pending = []
+        for name in names:
+            if not name or not name.strip():
+                results[name] = self._empty_result()
+                continue
+            exact_idx = self._exact_match(name)
+            if exact_idx is not None:
+                results[name] = self._exact_result(exact_idx)
+            else:
+                pending.append(name)
+        
+        if pending:
+            fuzzy_rows = self._fuzzy_scores_many(pending)
+            bm25_rows = self._bm25_scores_many(pending)
+            for name, fuzzy_row, bm25_row in zip(pending, fuzzy_rows, bm25_rows):
+                fuzzy_idx, fuzzy_score = self._best_match(fuzzy_row, 85)
+                if self._tokenize(name):
+                    bm25_idx, bm25_score = self._best_match(bm25_row, 5.0)
+                else:
+                    bm25_idx, bm25_score = None, 0.0
+                results[name] = self._resolve(
+                    name, fuzzy_idx, fuzzy_score, bm25_idx, bm25_score,
+                    lambda: self._get_candidates(name, top_n=3, fuzzy_scores=fuzzy_row, bm25_scores=bm25_row)
+                )
+        
+        return {name: results[name] for name in names}
+    
+    @staticmethod
+    def _empty_result() -> Dict:
+        return {
+            "found": False,
+            "ingredient": "UNKNOWN",
+            "reason": "Empty ingredient name",
+            "confidence": "none"
+        }
+    
+    def _exact_result(self, df_idx: int) -> Dict:
+        row = self.df.iloc[df_idx]
+        return {
+            "found": True,
+            "ingredient": row['ingredient'],
+            "nw_category": row['nw_category'],
+            "nw_subcategory": row['nw_subcategory'],
+            "keyword": row['keyword'],
+            "match_type": "exact",
+            "confidence": "exact",
+            "score": 100
+        }
+    
+    def _resolve(self, ingredient_name: str, fuzzy_idx: Optional[int], fuzzy_score: float,
+                 bm25_idx: Optional[int], bm25_score: float, get_candidates) -> Dict:
+        """Tiers 2 and 3 of lookup() from the best fuzzy / BM25 matches (get_candidates: top-3 fallback)"""
         # High confidence fuzzy match (>95)
         if fuzzy_score > 95:
             row = self.df.iloc[fuzzy_idx]
@@ -342,7 +540,7 @@ class IngredientLookup:
                 }
         
         # Step 3: Low confidence - return top 3 candidates for LLM to decide
-        candidates = self._get_candidates(ingredient_name, top_n=3)
+        candidates = get_candidates()
         
         if candidates:
             return {
@@ -367,6 +565,19 @@ class IngredientLookup:
 
 # Global instance (lazy loaded)
 _lookup_instance = None
+_lookup_lock = threading.Lock()
+
+
+def get_ingredient_lookup() -> IngredientLookup:
+    """Get the process-wide lookup (the CSV + BM25 index is built once)"""
+    global _lookup_instance
+    
+    if _lookup_instance is None:
+        with _lookup_lock:
+            if _lookup_instance is None:
+                _lookup_instance = IngredientLookup()
+    
+    return _lookup_instance
 
 
 def lookup_ingredient(ingredient_name: str) -> Dict:
@@ -375,12 +586,39 @@ def lookup_ingredient(ingredient_name: str) -> Dict:
     
     This is the interface OpenAI's function calling will use.
     """
-    global _lookup_instance
-    
-    if _lookup_instance is None:
-        _lookup_instance = IngredientLookup()
+    return get_ingredient_lookup().lookup(ingredient_name)
+
+
+def lookup_ingredients(ingredient_names: List[str]) -> Dict:
+    """
+    Batch tool function - every ingredient of a title in ONE tool call.
     
-    return _lookup_instance.lookup(ingredient_name)
+    Returns:
+        {ingredient_name: lookup result} (same fields as lookup_ingredient)
+    """
+    return get_ingredient_lookup().lookup_many(ingredient_names)
+
+
+@lru_cache(maxsize=65536)
+def _prescan_cached(title: str) -> Tuple[Dict, ...]:
+    return tuple(get_ingredient_lookup().prescan_title(title))
+
+
+def prescan_title_ingredients(title: str) -> List[Dict]:
+    """Pre-resolved ingredients for a title (memoized - packs, batch and retries re-render)"""
+    return [dict(item) for item in _prescan_cached(title)]
+
+
+# What the model gets back (see compact.py) - match scores and keywords stay in the audit trail
+RESULT_PROFILE = {
+    "fields": ["found", "ingredient", "nw_category", "nw_subcategory", "confidence",
+               "needs_disambiguation", "candidates"],
+    "candidate_fields": ["ingredient", "nw_category", "nw_subcategory", "confidence"],
+    "max_candidates": 3
+}
+
+# lookup_ingredients answers {name: result} - each result gets the profile above
+BATCH_RESULT_PROFILE = {"each": RESULT_PROFILE}
 
 
 # Tool definition for OpenAI function calling
@@ -411,3 +649,29 @@ TOOL_DEFINITION = {
     }
 }
 
+BATCH_TOOL_DEFINITION = {
+    "type": "function",
+    "function": {
+        "name": "lookup_ingredients",
+        "description": (
+            "Looks up SEVERAL ingredients in the supplement ingredient database in one call. "
+            "Pass every ingredient name you identified in the title; returns an object keyed "
+            "by ingredient name, each value with the same fields as lookup_ingredient "
+            "(standardized name, category, subcategory, candidates when ambiguous)."
+        ),
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "ingredient_names": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": (
+                        "All ingredient names to look up, as found in the title "
+                        "(e.g., ['vitamin d3', 'calcium', 'magnesium'])"
+                    )
+                }
+            },
+            "required": ["ingredient_names"]
+        }
+    }
+}
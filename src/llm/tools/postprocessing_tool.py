@@ -219,6 +219,13 @@ def apply_postprocessing_tool(
     }
 
 
+# What the model gets back (see compact.py) - the fields listed in the prompt's STEP 11
+RESULT_PROFILE = {
+    "fields": ["combo_detected", "combos_applied", "final_category", "final_subcategory",
+               "primary_ingredient", "health_focus", "high_level_category", "reasoning_context"]
+}
+
+
 # Tool definition for OpenAI function calling
 TOOL_DEFINITION = {
     "type": "function",
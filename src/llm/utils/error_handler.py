@@ -1,11 +1,22 @@
 """
 Error Handler - Centralized retry logic for API calls
+
+Transient API errors (429, 5xx, network) are already retried per round trip
+inside GPTClient by the shared RetryPolicy. What reaches this handler is
+either final (policy gave up, auth, bad request) or a malformed model answer
+(tool-call / JSON errors) that GPTClient could not repair in place - only the
+latter re-runs the conversation from scratch. A product that ran out of its
+time budget (ProductDeadlineExceeded) fails at once and goes to the dead letters.
 """
 
+import json
 import time
+import asyncio
 import openai
-from typing import Callable, Any, Dict
+from typing import Callable, Any, Dict, Awaitable, Optional, Tuple
 from src.core.log_manager import LogManager
+from src.llm.gpt_client import ProductDeadlineExceeded
+from src.llm.utils.retry_policy import get_retry_policy, is_transient_error
 
 
 class APIErrorHandler:
@@ -15,6 +26,8 @@ class APIErrorHandler:
         self.log_manager = log_manager
         self.asin = asin
         self.max_retries = max_retries
+        self.policy = get_retry_policy()
+        self._last_delay = 0.0
     
     def execute_with_retry(self, api_call: Callable, product_id: int) -> Dict[str, Any]:
         """
@@ -33,97 +46,110 @@ class APIErrorHandler:
                 # Execute the API call
                 result = api_call()
                 return {'success': True, 'data': result}
-                
-            except openai.RateLimitError as rate_error:
-                # ✅ TRANSIENT - Retry with exponential backoff
-                self.log_manager.log_step(
-                    'step2_llm',
-                    f"[{self.asin}] Rate limit hit (attempt {attempt + 1}/{self.max_retries})"
-                )
-                
-                if attempt < self.max_retries - 1:
-                    wait_time = (2 ** attempt) * 2  # Exponential backoff: 2s, 4s, 8s
-                    self.log_manager.log_step(
-                        'step2_llm',
-                        f"[{self.asin}] Waiting {wait_time}s before retry..."
-                    )
-                    print(f"\n⚠️  Rate limit hit for product {product_id}, waiting {wait_time}s... (attempt {attempt + 1}/{self.max_retries})")
-                    time.sleep(wait_time)
-                    continue
-                else:
-                    # Max retries reached
-                    error_msg = f'Rate limit exceeded after {self.max_retries} retries: {str(rate_error)}'
-                    self.log_manager.log_step(
-                        'step2_llm',
-                        f"[{self.asin}] ERROR: {error_msg}"
-                    )
-                    return {'success': False, 'error': error_msg}
             
-            except (openai.APIConnectionError, openai.APITimeoutError) as conn_error:
-                # ⚠️  TRANSIENT - Retry with exponential backoff
-                self.log_manager.log_step(
-                    'step2_llm',
-                    f"[{self.asin}] Connection error (attempt {attempt + 1}/{self.max_retries}): {str(conn_error)[:100]}"
-                )
-                
-                if attempt < self.max_retries - 1:
-                    wait_time = (2 ** attempt) * 2
-                    self.log_manager.log_step(
-                        'step2_llm',
-                        f"[{self.asin}] Retrying in {wait_time}s..."
-                    )
-                    print(f"\n⚠️  Connection error for product {product_id}, retrying... (attempt {attempt + 1}/{self.max_retries})")
-                    time.sleep(wait_time)
-                    continue
-                else:
-                    error_msg = f'Connection failed after {self.max_retries} retries: {str(conn_error)}'
-                    self.log_manager.log_step(
-                        'step2_llm',
-                        f"[{self.asin}] ERROR: {error_msg}"
-                    )
+            except Exception as api_error:
+                wait_time, error_msg = self._handle_error(api_error, attempt, product_id)
+                if error_msg is not None:
                     return {'success': False, 'error': error_msg}
-            
-            except (openai.AuthenticationError, openai.PermissionDeniedError) as auth_error:
-                # ❌ AUTH ERRORS - Fail immediately (no retry)
-                error_msg = f'Authentication error: {str(auth_error)}'
-                self.log_manager.log_step(
-                    'step2_llm',
-                    f"[{self.asin}] ERROR: {error_msg}"
-                )
-                return {'success': False, 'error': error_msg}
+                time.sleep(wait_time)
+        
+        # Should never reach here
+        return {'success': False, 'error': 'Max retries exceeded'}
+    
+    async def execute_with_retry_async(self, api_call: Callable[[], Awaitable], product_id: int) -> Dict[str, Any]:
+        """
+        Async version of execute_with_retry() - awaits the call and backs off with asyncio.sleep
+        
+        Args:
+            api_call: Coroutine function to execute (should return dict)
+            product_id: Product ID for logging
+        
+        Returns:
+            Result dict with 'success' flag and data or error message
+        """
+        
+        for attempt in range(self.max_retries):
+            try:
+                result = await api_call()
+                return {'success': True, 'data': result}
             
             except Exception as api_error:
-                error_str = str(api_error)
-                error_type = type(api_error).__name__
-                
-                # Check if it's a tool call error (LLM formatting issue) - these are retryable
-                is_tool_call_error = (
-                    'unexpected keyword argument' in error_str or
-                    'Invalid JSON' in error_str or
-                    'lookup_ingredient()' in error_str or
-                    'apply_business_rules()' in error_str or
-                    'got an unexpected keyword' in error_str
-                )
-                
-                if is_tool_call_error and attempt < self.max_retries - 1:
-                    # ⚠️  TRANSIENT - Tool call formatting error, retry
-                    self.log_manager.log_step(
-                        'step2_llm',
-                        f"[{self.asin}] Tool call error (attempt {attempt + 1}/{self.max_retries}): {error_str[:150]}"
-                    )
-                    wait_time = 2  # Short wait for tool call errors
-                    print(f"\n⚠️  Tool call error for product {product_id}, retrying... (attempt {attempt + 1}/{self.max_retries})")
-                    time.sleep(wait_time)
-                    continue
-                
-                # ❌ OTHER ERRORS - Fail immediately
-                error_msg = f'{error_type}: {error_str}'
-                self.log_manager.log_step(
-                    'step2_llm',
-                    f"[{self.asin}] ERROR: {error_msg[:200]}"
-                )
-                return {'success': False, 'error': error_msg}
+                wait_time, error_msg = self._handle_error(api_error, attempt, product_id)
+                if error_msg is not None:
+                    return {'success': False, 'error': error_msg}
+                await asyncio.sleep(wait_time)
         
         # Should never reach here
         return {'success': False, 'error': 'Max retries exceeded'}
-
+    
+    def _handle_error(self, api_error: Exception, attempt: int, product_id: int) -> Tuple[Optional[float], Optional[str]]:
+        """
+        Classify an error raised by the API call
+        
+        Returns:
+            (wait_time, None) to retry after wait_time seconds,
+            or (None, error_msg) to fail immediately
+        """
+        
+        if is_transient_error(api_error):
+            # ❌ Already retried per round trip by the retry policy (attempts / budget used up)
+            if isinstance(api_error, openai.RateLimitError):
+                error_msg = f'Rate limit exceeded after retries: {str(api_error)}'
+            else:
+                error_msg = f'API unavailable after retries ({type(api_error).__name__}): {str(api_error)}'
+            self.log_manager.log_step(
+                'step2_llm',
+                f"[{self.asin}] ERROR: {error_msg[:200]}"
+            )
+            return None, error_msg
+        
+        if isinstance(api_error, ProductDeadlineExceeded):
+            # ❌ Product's time budget is spent - a restart would exceed it too
+            error_msg = f'Deadline exceeded: {str(api_error)}'
+            self.log_manager.log_step(
+                'step2_llm',
+                f"[{self.asin}] ERROR: {error_msg[:200]}"
+            )
+            return None, error_msg
+        
+        if isinstance(api_error, (openai.AuthenticationError, openai.PermissionDeniedError)):
+            # ❌ AUTH ERRORS - Fail immediately (no retry)
+            error_msg = f'Authentication error: {str(api_error)}'
+            self.log_manager.log_step(
+                'step2_llm',
+                f"[{self.asin}] ERROR: {error_msg}"
+            )
+            return None, error_msg
+        
+        error_str = str(api_error)
+        error_type = type(api_error).__name__
+        
+        # Check if it's a tool call error (LLM formatting issue) - these are retryable
+        is_tool_call_error = (
+            isinstance(api_error, json.JSONDecodeError) or
+            'Tool call failed' in error_str or
+            'unexpected keyword argument' in error_str or
+            'Invalid JSON' in error_str or
+            'lookup_ingredient()' in error_str or
+            'apply_business_rules()' in error_str or
+            'got an unexpected keyword' in error_str
+        )
+        
+        if is_tool_call_error and attempt < self.max_retries - 1 and self.policy.budget.try_spend():
+            # ⚠️  TRANSIENT - Tool call formatting error, re-run the conversation (jittered, within budget)
+            self.log_manager.log_step(
+                'step2_llm',
+                f"[{self.asin}] Tool call error (attempt {attempt + 1}/{self.max_retries}): {error_str[:150]}"
+            )
+            wait_time = self.policy.backoff(self._last_delay)
+            self._last_delay = wait_time
+            print(f"\n⚠️  Tool call error for product {product_id}, retrying... (attempt {attempt + 1}/{self.max_retries})")
+            return wait_time, None
+        
+        # ❌ OTHER ERRORS - Fail immediately
+        error_msg = f'{error_type}: {error_str}'
+        self.log_manager.log_step(
+            'step2_llm',
+            f"[{self.asin}] ERROR: {error_msg[:200]}"
+        )
+        return None, error_msg
@@ -0,0 +1,347 @@
+"""
+Retry Policy - Per-call retries with jitter, retry budget and circuit breaker
+
+Transient API errors (429, 5xx, timeouts, dropped connections) are retried
+for the ONE failed HTTP call - the rest of the tool-call conversation is
+kept. Three guards keep retries from making an outage worse:
+  - decorrelated-jitter backoff, or the server's Retry-After hint if sent,
+    so workers don't wake up in lockstep
+  - a run-wide retry budget: retries may only add a fixed share on top of
+    first attempts
+  - a circuit breaker: when the recent error rate crosses a threshold ALL
+    Step 2 calls pause (instead of burning every record into 'error')
+    until a probe call succeeds
+"""
+
+import asyncio
+import email.utils
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+import openai
+
+from src.llm.llm_config import get_llm_config
+
+
+# Errors worth retrying - the same request can succeed a moment later
+TRANSIENT_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,  # Includes APITimeoutError
+    openai.InternalServerError,
+)
+
+# Circuit breaker states
+BREAKER_CLOSED = 'closed'
+BREAKER_OPEN = 'open'
+BREAKER_HALF_OPEN = 'half_open'
+
+# Longest single sleep while the breaker is open (state is re-checked after)
+BREAKER_POLL_SEC = 1.0
+
+# "1s", "6m0s", "120ms" (x-ratelimit-reset-* format)
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+_DURATION_UNITS = {'ms': 0.001, 's': 1.0, 'm': 60.0, 'h': 3600.0}
+
+
+def is_transient_error(error: Exception) -> bool:
+    """True for errors the retry policy handles (rate limits, 5xx, network)"""
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+def _parse_duration(value: str) -> Optional[float]:
+    parts = _DURATION_PART.findall(value or '')
+    if not parts:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+def server_retry_after(error: Exception) -> Optional[float]:
+    """
+    Wait (seconds) suggested by the server for a failed call
+
+    Checks retry-after-ms, Retry-After (seconds or HTTP date) and, for
+    429s, x-ratelimit-reset-requests / -tokens.
+    """
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+
+    value = headers.get('retry-after-ms')
+    if value:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+
+    value = headers.get('retry-after')
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            try:
+                return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+
+    if isinstance(error, openai.RateLimitError):
+        resets = [_parse_duration(headers.get(f'x-ratelimit-reset-{kind}', '')) for kind in ('requests', 'tokens')]
+        resets = [reset for reset in resets if reset is not None]
+        if resets:
+            return max(resets)
+
+    return None
+
+
+class RetryBudget:
+    """
+    Run-wide cap on retries: each first attempt earns `ratio` retry credit
+
+    With ratio 0.2, retries can add at most ~20% on top of normal traffic
+    (plus `min_retries` so a small run can still retry).
+    """
+
+    def __init__(self, ratio: float = 0.2, min_retries: int = 10):
+        self.ratio = ratio
+        self._credit = float(min_retries)
+        self._lock = threading.Lock()
+
+    def record_attempt(self):
+        with self._lock:
+            self._credit += self.ratio
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._credit >= 1.0:
+                self._credit -= 1.0
+                return True
+            return False
+
+
+class CircuitBreaker:
+    """
+    Pause all calls while the recent transient-error rate is too high
+
+    closed    -> calls flow; outcomes go into a sliding window
+    open      -> every call waits until the cooldown has passed
+    half_open -> one probe call goes through; success closes the breaker,
+                 failure re-opens it with a doubled cooldown
+    """
+
+    def __init__(self, error_rate: float = 0.5, window: int = 50, min_calls: int = 20,
+                 cooldown_sec: float = 30.0, max_cooldown_sec: float = 300.0):
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.base_cooldown = cooldown_sec
+        self.max_cooldown = max_cooldown_sec
+
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)
+        self.state = BREAKER_CLOSED
+        self._cooldown = cooldown_sec
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._stats = {'opens': 0, 'paused_calls': 0, 'paused_seconds': 0.0}
+
+    def _admit(self) -> float:
+        """0 if the call may go now, else seconds to wait before asking again"""
+        with self._lock:
+            if self.state == BREAKER_CLOSED:
+                return 0.0
+            if self.state == BREAKER_OPEN:
+                remaining = self._opened_at + self._cooldown - time.monotonic()
+                if remaining > 0:
+                    return min(remaining, BREAKER_POLL_SEC)
+                self.state = BREAKER_HALF_OPEN
+            if not self._probe_in_flight:
+                self._probe_in_flight = True
+                return 0.0
+            return BREAKER_POLL_SEC
+
+    def before_call(self):
+        """Block the thread while the breaker is open"""
+        waited = 0.0
+        wait = self._admit()
+        while wait > 0:
+            time.sleep(wait)
+            waited += wait
+            wait = self._admit()
+        self._record_pause(waited)
+
+    async def before_call_async(self):
+        """Await (without blocking the event loop) while the breaker is open"""
+        waited = 0.0
+        wait = self._admit()
+        while wait > 0:
+            await asyncio.sleep(wait)
+            waited += wait
+            wait = self._admit()
+        self._record_pause(waited)
+
+    def _record_pause(self, waited: float):
+        if waited > 0:
+            with self._lock:
+                self._stats['paused_calls'] += 1
+                self._stats['paused_seconds'] += waited
+
+    def record(self, success: bool):
+        """Report a call outcome (success = no transient error)"""
+        with self._lock:
+            if self.state == BREAKER_HALF_OPEN and self._probe_in_flight:
+                self._probe_in_flight = False
+                if success:
+                    self.state = BREAKER_CLOSED
+                    self._cooldown = self.base_cooldown
+                    self._outcomes.clear()
+                else:
+                    self._cooldown = min(self.max_cooldown, self._cooldown * 2)
+                    self._open_locked()
+                return
+
+            self._outcomes.append(success)
+            if self.state == BREAKER_CLOSED and len(self._outcomes) >= self.min_calls:
+                failures = self._outcomes.count(False)
+                if failures / len(self._outcomes) >= self.error_rate:
+                    self._open_locked()
+
+    def _open_locked(self):
+        self.state = BREAKER_OPEN
+        self._opened_at = time.monotonic()
+        self._stats['opens'] += 1
+        print(f"\n🛑 Circuit breaker OPEN - pausing LLM calls for {self._cooldown:.0f}s (too many API errors)")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['state'] = self.state
+            stats['paused_seconds'] = round(stats['paused_seconds'], 2)
+        return stats
+
+
+class RetryPolicy:
+    """
+    Retry decisions for one process: backoff, budget and breaker
+
+    Callers loop: before_call() -> make the call -> on success record_success(),
+    on error next_delay() (None = give up and raise).
+    """
+
+    def __init__(self, max_attempts: int = 5, base_delay: float = 1.0, max_delay: float = 60.0,
+                 budget: Optional[RetryBudget] = None, breaker: Optional[CircuitBreaker] = None):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget or RetryBudget()
+        self.breaker = breaker or CircuitBreaker()
+
+        self._lock = threading.Lock()
+        self._stats = {
+            'calls': 0,
+            'retries': 0,
+            'gave_up': 0,
+            'budget_exhausted': 0,
+            'server_hinted_waits': 0,
+            'backoff_seconds': 0.0
+        }
+
+    def backoff(self, previous_delay: float) -> float:
+        """Decorrelated jitter: uniform(base, 3 * previous), capped"""
+        return min(self.max_delay, random.uniform(self.base_delay, max(self.base_delay, previous_delay * 3)))
+
+    def first_attempt(self):
+        """Count a new logical call (earns retry budget)"""
+        self.budget.record_attempt()
+        with self._lock:
+            self._stats['calls'] += 1
+
+    def record_success(self):
+        self.breaker.record(True)
+
+    def next_delay(self, error: Exception, attempt: int, previous_delay: float) -> Optional[float]:
+        """
+        Decide whether to retry a failed call
+
+        Args:
+            error: Exception raised by the call
+            attempt: 1-based number of the attempt that failed
+            previous_delay: Delay used before this attempt (0 for the first)
+
+        Returns:
+            Seconds to wait before the next attempt, or None to give up
+        """
+        if not is_transient_error(error):
+            # The API answered (bad request, auth...) - not an availability problem
+            self.breaker.record(True)
+            return None
+
+        self.breaker.record(False)
+
+        if attempt >= self.max_attempts:
+            with self._lock:
+                self._stats['gave_up'] += 1
+            return None
+        if not self.budget.try_spend():
+            with self._lock:
+                self._stats['budget_exhausted'] += 1
+                self._stats['gave_up'] += 1
+            return None
+
+        hinted = server_retry_after(error)
+        delay = min(self.max_delay, hinted) if hinted is not None else self.backoff(previous_delay)
+        with self._lock:
+            self._stats['retries'] += 1
+            self._stats['backoff_seconds'] += delay
+            if hinted is not None:
+                self._stats['server_hinted_waits'] += 1
+        return delay
+
+    def stats(self) -> Dict[str, Any]:
+        """Retry + breaker counts for the run manifest"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['backoff_seconds'] = round(stats['backoff_seconds'], 2)
+        stats['retry_ratio'] = round(stats['retries'] / stats['calls'], 4) if stats['calls'] else 0
+        stats['breaker'] = self.breaker.stats()
+        return stats
+
+
+# Global instance (lazy loaded)
+_policy = None
+_policy_lock = threading.Lock()
+
+
+def build_retry_policy(config) -> RetryPolicy:
+    """A retry policy with its own budget and breaker from the LLM config"""
+    return RetryPolicy(
+        max_attempts=config.retry_max_attempts,
+        base_delay=config.retry_base_delay,
+        max_delay=config.retry_max_delay,
+        budget=RetryBudget(config.retry_budget_ratio, config.retry_budget_min),
+        breaker=CircuitBreaker(
+            error_rate=config.breaker_error_rate,
+            window=config.breaker_window,
+            min_calls=config.breaker_min_calls,
+            cooldown_sec=config.breaker_cooldown_sec
+        )
+    )
+
+
+def get_retry_policy() -> RetryPolicy:
+    """Get the process-wide retry policy (shared budget and breaker)"""
+    global _policy
+
+    if _policy is None:
+        with _policy_lock:
+            if _policy is None:
+                _policy = build_retry_policy(get_llm_config())
+
+    return _policy
+
+
+def get_retry_stats() -> Dict[str, Any]:
+    """Stats for the run manifest"""
+    return get_retry_policy().stats()
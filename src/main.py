@@ -8,10 +8,12 @@ import pandas as pd
 import json
 import sys
 import os
+import re
 import argparse
+import asyncio
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional
 import traceback
 import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
@@ -20,7 +22,7 @@ import openai
 
 # Import pipeline components
 from src.llm.gpt_client import GPTClient
-from src.llm.prompt_builder import build_complete_prompt
+from src.llm.prompt_builder import build_complete_prompt, get_prompt_template
 from src.llm.tools import INGREDIENT_TOOL
 from src.llm.tools.ingredient_lookup import lookup_ingredient
 from src.llm.tools.health_focus_lookup import lookup_health_focus
@@ -33,7 +35,22 @@ from src.utils.file_utils import write_csv
 from src.core.file_tracker import FileTracker
 from src.utils.result_builder import build_error_result, build_success_result, build_filtered_result
 from src.pipeline.step1_filter import generate_step1_audits, apply_step1_filter
-from src.pipeline.step2_llm import extract_llm_attributes, extract_attributes_from_llm_result, extract_metadata_from_llm_result
+from src.pipeline.step2_llm import extract_llm_attributes, extract_llm_attributes_async, extract_llm_attributes_batch, extract_attributes_from_llm_result, extract_metadata_from_llm_result, get_round_trip_stats
+from src.pipeline.async_engine import run_async_engine
+from src.pipeline.deadline import DeadlineScheduler, parse_deadline
+from src.llm.llm_config import get_llm_config, configure_llm
+from src.llm.response_cache import get_cache_stats
+from src.llm.concurrency import get_concurrency_limiter, get_concurrency_stats, concurrency_status
+from src.llm.rate_limiter import get_rate_limit_stats
+from src.llm.utils.retry_policy import get_retry_stats
+from src.llm.hedging import get_hedge_stats
+from src.llm.pricing import summarize_costs
+from src.llm.model_router import get_routing_stats
+from src.llm.latency_presets import get_preset_stats
+from src.pipeline.shadow import get_shadow_stats, observe_shadow
+from src.pipeline.dedup import get_dedup_stats
+from src.pipeline.packing import get_pack_stats
+from src.pipeline.dead_letter import DeadLetterQueue, DEAD_LETTER_FILE, redrive_settings
 # Post-processing is now handled by LLM tool - no longer needed here
 # from src.pipeline.step3_postprocess import apply_postprocessing
 
@@ -54,288 +71,385 @@ except ImportError:
     AWS_AVAILABLE = False
 
 
-def process_single_record(record: Dict, product_id: int, log_manager, max_retries: int = 3, test_step1_only: bool = False) -> Dict:
-    """Process a single record through the complete pipeline - ORCHESTRATION ONLY"""
-    start_time = datetime.now()
-    asin = record.get('asin', f'P{product_id}')
-    title = record.get('title', '')
-    amazon_subcat = record.get('amazon_subcategory', '').lower().strip()
-    
-    result = {
+def _init_record_result(record: Dict, product_id: int) -> Dict:
+    """Base result dict for one input record"""
+    return {
         'product_id': product_id,
-        'asin': asin,
-        'title': title,
+        'asin': record.get('asin', f'P{product_id}'),
+        'title': record.get('title', ''),
         'brand': record.get('brand', ''),
-        'source_subcategory': amazon_subcat,
+        'source_subcategory': record.get('amazon_subcategory', '').lower().strip(),
         'status': 'processing',
         'step_completed': 0
     }
+
+
+def _apply_step1(result: Dict, log_manager, start_time: datetime, test_step1_only: bool) -> Optional[Dict]:
+    """
+    Run Step 1 filtering for one record
+    
+    Returns:
+        The final result if the record stops after Step 1 (filtered / test mode),
+        None if it passed and needs LLM extraction
+    """
+    asin = result['asin']
+    title = result['title']
+    amazon_subcat = result['source_subcategory']
+    
+    # ========== STEP 1: NON-SUPPLEMENT FILTERING ==========
+    step1_result = apply_step1_filter(title, amazon_subcat, asin, log_manager)
+    
+    if not step1_result['passed']:
+        # Filtered out - add "Step 1 Filter:" prefix to reasoning
+        filter_type = step1_result['filter_type']
+        raw_reason = step1_result['filter_reason']
+        
+        if filter_type == 'filtered_by_remove':
+            detailed_reason = f"Step 1 Filter: Amazon subcategory marked as REMOVE - {raw_reason}"
+        elif filter_type == 'filtered_by_keyword':
+            detailed_reason = f"Step 1 Filter: {raw_reason}"
+        else:
+            detailed_reason = f"Step 1 Filter: {raw_reason}"
+        
+        result = build_filtered_result(
+            result,
+            detailed_reason,
+            filter_type,
+            start_time,
+            lookup_action=step1_result.get('action')
+        )
+        # 💾 Save Step 1 result immediately
+        log_manager.save_audit_json('step1_filter', result, f"{asin}.json")
+        return result
+    
+    # Passed filtering - store lookup action details
+    result['lookup_action'] = step1_result['action']
+    if step1_result['action'] == 'REMAP':
+        result['nw_category'] = step1_result['nw_category']
+        result['nw_subcategory'] = step1_result['nw_subcategory']
+        result['remap_reason'] = step1_result['remap_reason']
+    
+    log_manager.log_step('step1_filter', f"[{asin}] PASSED filtering")
+    
+    # ⚠️  TEST MODE: Stop after Step 1 if flag is set
+    if test_step1_only:
+        result['status'] = 'step1_complete'
+        result['step_completed'] = 1
+        result['processing_time_sec'] = (datetime.now() - start_time).total_seconds()
+        # 💾 Save Step 1 result immediately
+        log_manager.save_audit_json('step1_filter', result, f"{asin}.json")
+        return result
+    
+    return None
+
+
+def _complete_record(result: Dict, llm_extraction_result: Dict, log_manager, start_time: datetime) -> Dict:
+    """Steps 2-3 after the LLM call: attribute extraction, audits and final result"""
+    asin = result['asin']
+    
+    if not llm_extraction_result['success']:
+        result = build_error_result(result, llm_extraction_result['error'], 2, start_time)
+        # 💾 Save Step 2 error immediately
+        log_manager.save_audit_json('step2_llm', result, f"{asin}.json")
+        return result
+    
+    llm_result = llm_extraction_result['data']
+    
+    # Extract attributes
+    attributes = extract_attributes_from_llm_result(llm_result)
+    age = attributes['age']
+    gender = attributes['gender']
+    form = attributes['form']
+    organic = attributes['organic']
+    potency = attributes['potency']
+    
+    # ========== LLM SAFETY CHECK: If LLM returned REMOVE for any attribute, filter this product ==========
+    if age == 'REMOVE' or gender == 'REMOVE' or form == 'REMOVE':
+        log_manager.log_step('step2_llm', f"[{asin}] LLM detected non-supplement (returned REMOVE for attributes)")
+        detailed_reason = "Step 2 LLM Filter: LLM detected non-supplement product (safety check)"
+        filter_result = build_filtered_result(
+            result,
+            detailed_reason,
+            'filtered_by_llm',
+            start_time,
+            lookup_action='UNKNOWN'
+        )
+        # 💾 Save LLM filter result immediately
+        log_manager.save_audit_json('step2_llm', filter_result, f"{asin}.json")
+        return filter_result
+    
+    # Process size/pack_count/unit
+    llm_result = process_product_attributes(llm_result)
+    attributes = extract_attributes_from_llm_result(llm_result)
+    size = attributes['size']
+    unit = attributes['unit']
+    pack_count = attributes['pack_count']
+    ingredients = attributes['ingredients']
+    business_rules = attributes.get('business_rules', {})
+    
+    # Extract metadata
+    metadata = extract_metadata_from_llm_result(llm_result)
+    
+    # Build Step 2 result and save
+    step2_result = result.copy()
+    step2_result['status'] = 'step2_complete'
+    step2_result['step_completed'] = 2
+    step2_result['age'] = age
+    step2_result['gender'] = gender
+    step2_result['form'] = form
+    step2_result['organic'] = organic
+    step2_result['size'] = size
+    step2_result['unit'] = unit
+    step2_result['pack_count'] = pack_count
+    step2_result['potency'] = potency
+    step2_result['ingredients'] = ingredients
+    step2_result['tokens_used'] = metadata['tokens_used']
+    step2_result['api_cost'] = metadata['api_cost']
+    step2_result['_metadata'] = metadata['_metadata']
+    step2_result['processing_time_sec'] = (datetime.now() - start_time).total_seconds()
+    # 💾 Save Step 2 result immediately
+    log_manager.save_audit_json('step2_llm', step2_result, f"{asin}.json")
+    
+    # ========== STEP 3: EXTRACT POST-PROCESSING RESULTS FROM LLM ==========
+    # Post-processing is now done by LLM via apply_postprocessing() tool
+    # Extract results from LLM's JSON output
+    postprocessing = llm_result.get('postprocessing', {})
+    
+    if postprocessing and postprocessing.get('final_category'):
+        # LLM called apply_postprocessing() - use those results
+        category = postprocessing.get('final_category')
+        subcategory = postprocessing.get('final_subcategory')
+        primary_ingredient = postprocessing.get('primary_ingredient')
+        health_focus = postprocessing.get('health_focus', 'UNKNOWN')
+        high_level_category = postprocessing.get('high_level_category', 'PRIORITY VMS')
+        combo_detected = postprocessing.get('combo_detected', False)
+        combos_applied = postprocessing.get('combos_applied', [])
+        final_reasoning = postprocessing.get('reasoning', '')
+        
+        # Log post-processing results
+        log_manager.log_step('step3_postprocess', f"[{asin}] Post-processing complete from LLM")
+        log_manager.log_step('step3_postprocess', f"[{asin}] Category: {category}, Subcategory: {subcategory}")
+        log_manager.log_step('step3_postprocess', f"[{asin}] Health Focus: {health_focus}")
+        log_manager.log_step('step3_postprocess', f"[{asin}] High-Level Category: {high_level_category}")
+        
+        if combo_detected:
+            combos_str = ', '.join(combos_applied)
+            log_manager.log_step('step3_postprocess', f"[{asin}] Combos detected: {combos_str}")
+        
+    elif business_rules and business_rules.get('final_category'):
+        # LLM called business_rules but not postprocessing - use business_rules and add defaults
+        category = business_rules.get('final_category')
+        subcategory = business_rules.get('final_subcategory')
+        primary_ingredient = business_rules.get('primary_ingredient')
+        health_focus = 'UNKNOWN'  # Would need Python fallback
+        high_level_category = 'PRIORITY VMS' if category != 'ACTIVE NUTRITION' and category != 'OTC' else ('NON-PRIORITY VMS' if category == 'ACTIVE NUTRITION' else 'OTC')
+        combo_detected = False
+        combos_applied = []
+        final_reasoning = business_rules.get('reasoning', '')
+        
+        log_manager.log_step('step3_postprocess', f"[{asin}] WARNING: LLM did not call postprocessing tool, using business_rules only")
+        
+    else:
+        # Fallback: If LLM extracted 0 ingredients
+        # Use Step 1's NW Category/Subcategory from Amazon lookup if available
+        if result.get('nw_category') and result.get('nw_subcategory'):
+            category = result['nw_category']
+            subcategory = result['nw_subcategory']
+            primary_ingredient = 'UNKNOWN'
+            health_focus = 'UNKNOWN'
+            high_level_category = 'PRIORITY VMS'
+            combo_detected = False
+            combos_applied = []
+            final_reasoning = 'No ingredients extracted - using Step 1 Amazon category'
+            log_manager.log_step('step3_postprocess', f"[{asin}] No ingredients extracted, using Step 1 category: {category}/{subcategory}")
+        else:
+            # Final fallback - should rarely happen
+            category = 'UNKNOWN'
+            subcategory = 'UNKNOWN'
+            primary_ingredient = 'UNKNOWN'
+            health_focus = 'UNKNOWN'
+            high_level_category = 'REMOVE'
+            combo_detected = False
+            combos_applied = []
+            final_reasoning = 'Processing incomplete'
+            log_manager.log_step('step3_postprocess', f"[{asin}] ERROR: No valid results from LLM")
+    
+    # Build final result
+    result['status'] = 'success'
+    result['step_completed'] = 3
+    result['age'] = age
+    result['gender'] = gender
+    result['form'] = form
+    result['organic'] = organic
+    result['pack_count'] = pack_count
+    result['unit'] = unit
+    result['size'] = size
+    result['potency'] = potency
+    result['primary_ingredient'] = primary_ingredient
+    result['num_ingredients'] = len(ingredients)
+    
+    # Store all ingredients (up to 20) like R system
+    result['all_ingredients'] = []
+    for idx, ing in enumerate(ingredients):
+        ing_name = ing.get('name', '') if isinstance(ing, dict) else ing
+        result['all_ingredients'].append(ing_name)
+    
+    result['category'] = category
+    result['subcategory'] = subcategory
+    result['health_focus'] = health_focus
+    result['high_level_category'] = high_level_category
+    result['combo_detected'] = combo_detected
+    result['combos_applied'] = combos_applied
+    
+    # Add unified reasoning field from postprocessing
+    result['reasoning'] = final_reasoning if final_reasoning else f"Category: {category}, Subcategory: {subcategory}"
+    
+    result['tokens_used'] = metadata['tokens_used']
+    result['api_cost'] = metadata['api_cost']
+    result['_metadata'] = metadata['_metadata']
+    result['processing_time_sec'] = (datetime.now() - start_time).total_seconds()
+    
+    # 💾 Save Step 3 (final) result immediately
+    log_manager.save_audit_json('step3_postprocess', result, f"{asin}.json")
+    
+    log_manager.log_step('step3_postprocess', f"[{asin}] COMPLETE in {result['processing_time_sec']:.2f}s")
+    
+    return result
+
+
+def _record_exception(result: Dict, e: Exception, log_manager, start_time: datetime) -> Dict:
+    """Build and save the error result for an unexpected exception"""
+    asin = result['asin']
+    log_manager.log_step('error', f"[{asin}] EXCEPTION: {str(e)[:200]}")
+    result['traceback'] = traceback.format_exc()
+    error_result = build_error_result(result, str(e), result.get('step_completed', 0), start_time)
+    # 💾 Save error immediately
+    log_manager.save_audit_json('errors', error_result, f"{asin}.json")
+    return error_result
+
+
+def process_single_record(record: Dict, product_id: int, log_manager, max_retries: int = 3, test_step1_only: bool = False) -> Dict:
+    """Process a single record through the complete pipeline - ORCHESTRATION ONLY"""
+    start_time = datetime.now()
+    result = _init_record_result(record, product_id)
     
     try:
         # ========== STEP 1: NON-SUPPLEMENT FILTERING ==========
-        step1_result = apply_step1_filter(title, amazon_subcat, asin, log_manager)
-        
-        if not step1_result['passed']:
-            # Filtered out - add "Step 1 Filter:" prefix to reasoning
-            filter_type = step1_result['filter_type']
-            raw_reason = step1_result['filter_reason']
-            
-            if filter_type == 'filtered_by_remove':
-                detailed_reason = f"Step 1 Filter: Amazon subcategory marked as REMOVE - {raw_reason}"
-            elif filter_type == 'filtered_by_keyword':
-                detailed_reason = f"Step 1 Filter: {raw_reason}"
-            else:
-                detailed_reason = f"Step 1 Filter: {raw_reason}"
-            
-            result = build_filtered_result(
-                result,
-                detailed_reason,
-                filter_type,
-                start_time,
-                lookup_action=step1_result.get('action')
-            )
-            # 💾 Save Step 1 result immediately
-            log_manager.save_audit_json('step1_filter', result, f"{asin}.json")
-            return result
-        
-        # Passed filtering - store lookup action details
-        result['lookup_action'] = step1_result['action']
-        if step1_result['action'] == 'REMAP':
-            result['nw_category'] = step1_result['nw_category']
-            result['nw_subcategory'] = step1_result['nw_subcategory']
-            result['remap_reason'] = step1_result['remap_reason']
-        
-        log_manager.log_step('step1_filter', f"[{asin}] PASSED filtering")
-        
-        # ⚠️  TEST MODE: Stop after Step 1 if flag is set
-        if test_step1_only:
-            result['status'] = 'step1_complete'
-            result['step_completed'] = 1
-            result['processing_time_sec'] = (datetime.now() - start_time).total_seconds()
-            # 💾 Save Step 1 result immediately
-            log_manager.save_audit_json('step1_filter', result, f"{asin}.json")
-            return result
+        step1_final = _apply_step1(result, log_manager, start_time, test_step1_only)
+        if step1_final is not None:
+            return step1_final
         
         # ========== STEP 2: LLM EXTRACTION ==========
-        llm_extraction_result = extract_llm_attributes(title, asin, product_id, log_manager, max_retries)
-        
-        if not llm_extraction_result['success']:
-            result = build_error_result(result, llm_extraction_result['error'], 2, start_time)
-            # 💾 Save Step 2 error immediately
-            log_manager.save_audit_json('step2_llm', result, f"{asin}.json")
-            return result
+        llm_extraction_result = extract_llm_attributes(result['title'], result['asin'], product_id, log_manager, max_retries,
+                                                       lookup_action=result.get('lookup_action'))
         
-        llm_result = llm_extraction_result['data']
+        # ========== STEP 2-3: ATTRIBUTES + POST-PROCESSING RESULTS ==========
+        final = _complete_record(result, llm_extraction_result, log_manager, start_time)
+        # Shadow evaluation compares against the final record (no-op unless this title was shadowed)
+        observe_shadow(final, log_manager)
+        return final
         
-        # Extract attributes
-        attributes = extract_attributes_from_llm_result(llm_result)
-        age = attributes['age']
-        gender = attributes['gender']
-        form = attributes['form']
-        organic = attributes['organic']
-        potency = attributes['potency']
-        
-        # ========== LLM SAFETY CHECK: If LLM returned REMOVE for any attribute, filter this product ==========
-        if age == 'REMOVE' or gender == 'REMOVE' or form == 'REMOVE':
-            log_manager.log_step('step2_llm', f"[{asin}] LLM detected non-supplement (returned REMOVE for attributes)")
-            detailed_reason = "Step 2 LLM Filter: LLM detected non-supplement product (safety check)"
-            filter_result = build_filtered_result(
-                result,
-                detailed_reason,
-                'filtered_by_llm',
-                start_time,
-                lookup_action='UNKNOWN'
-            )
-            # 💾 Save LLM filter result immediately
-            log_manager.save_audit_json('step2_llm', filter_result, f"{asin}.json")
-            return filter_result
-        
-        # Process size/pack_count/unit
-        llm_result = process_product_attributes(llm_result)
-        attributes = extract_attributes_from_llm_result(llm_result)
-        size = attributes['size']
-        unit = attributes['unit']
-        pack_count = attributes['pack_count']
-        ingredients = attributes['ingredients']
-        business_rules = attributes.get('business_rules', {})
-        
-        # Extract metadata
-        metadata = extract_metadata_from_llm_result(llm_result)
-        
-        # Build Step 2 result and save
-        step2_result = result.copy()
-        step2_result['status'] = 'step2_complete'
-        step2_result['step_completed'] = 2
-        step2_result['age'] = age
-        step2_result['gender'] = gender
-        step2_result['form'] = form
-        step2_result['organic'] = organic
-        step2_result['size'] = size
-        step2_result['unit'] = unit
-        step2_result['pack_count'] = pack_count
-        step2_result['potency'] = potency
-        step2_result['ingredients'] = ingredients
-        step2_result['tokens_used'] = metadata['tokens_used']
-        step2_result['api_cost'] = metadata['api_cost']
-        step2_result['_metadata'] = metadata['_metadata']
-        step2_result['processing_time_sec'] = (datetime.now() - start_time).total_seconds()
-        # 💾 Save Step 2 result immediately
-        log_manager.save_audit_json('step2_llm', step2_result, f"{asin}.json")
-        
-        # ========== STEP 3: EXTRACT POST-PROCESSING RESULTS FROM LLM ==========
-        # Post-processing is now done by LLM via apply_postprocessing() tool
-        # Extract results from LLM's JSON output
-        postprocessing = llm_result.get('postprocessing', {})
-        
-        if postprocessing and postprocessing.get('final_category'):
-            # LLM called apply_postprocessing() - use those results
-            category = postprocessing.get('final_category')
-            subcategory = postprocessing.get('final_subcategory')
-            primary_ingredient = postprocessing.get('primary_ingredient')
-            health_focus = postprocessing.get('health_focus', 'UNKNOWN')
-            high_level_category = postprocessing.get('high_level_category', 'PRIORITY VMS')
-            combo_detected = postprocessing.get('combo_detected', False)
-            combos_applied = postprocessing.get('combos_applied', [])
-            final_reasoning = postprocessing.get('reasoning', '')
-            
-            # Log post-processing results
-            log_manager.log_step('step3_postprocess', f"[{asin}] Post-processing complete from LLM")
-            log_manager.log_step('step3_postprocess', f"[{asin}] Category: {category}, Subcategory: {subcategory}")
-            log_manager.log_step('step3_postprocess', f"[{asin}] Health Focus: {health_focus}")
-            log_manager.log_step('step3_postprocess', f"[{asin}] High-Level Category: {high_level_category}")
-            
-            if combo_detected:
-                combos_str = ', '.join(combos_applied)
-                log_manager.log_step('step3_postprocess', f"[{asin}] Combos detected: {combos_str}")
-            
-        elif business_rules and business_rules.get('final_category'):
-            # LLM called business_rules but not postprocessing - use business_rules and add defaults
-            category = business_rules.get('final_category')
-            subcategory = business_rules.get('final_subcategory')
-            primary_ingredient = business_rules.get('primary_ingredient')
-            health_focus = 'UNKNOWN'  # Would need Python fallback
-            high_level_category = 'PRIORITY VMS' if category != 'ACTIVE NUTRITION' and category != 'OTC' else ('NON-PRIORITY VMS' if category == 'ACTIVE NUTRITION' else 'OTC')
-            combo_detected = False
-            combos_applied = []
-            final_reasoning = business_rules.get('reasoning', '')
-            
-            log_manager.log_step('step3_postprocess', f"[{asin}] WARNING: LLM did not call postprocessing tool, using business_rules only")
-            
-        else:
-            # Fallback: If LLM extracted 0 ingredients
-            # Use Step 1's NW Category/Subcategory from Amazon lookup if available
-            if result.get('nw_category') and result.get('nw_subcategory'):
-                category = result['nw_category']
-                subcategory = result['nw_subcategory']
-                primary_ingredient = 'UNKNOWN'
-                health_focus = 'UNKNOWN'
-                high_level_category = 'PRIORITY VMS'
-                combo_detected = False
-                combos_applied = []
-                final_reasoning = 'No ingredients extracted - using Step 1 Amazon category'
-                log_manager.log_step('step3_postprocess', f"[{asin}] No ingredients extracted, using Step 1 category: {category}/{subcategory}")
-            else:
-                # Final fallback - should rarely happen
-                category = 'UNKNOWN'
-                subcategory = 'UNKNOWN'
-                primary_ingredient = 'UNKNOWN'
-                health_focus = 'UNKNOWN'
-                high_level_category = 'REMOVE'
-                combo_detected = False
-                combos_applied = []
-                final_reasoning = 'Processing incomplete'
-                log_manager.log_step('step3_postprocess', f"[{asin}] ERROR: No valid results from LLM")
-        
-        # Build final result
-        result['status'] = 'success'
-        result['step_completed'] = 3
-        result['age'] = age
-        result['gender'] = gender
-        result['form'] = form
-        result['organic'] = organic
-        result['pack_count'] = pack_count
-        result['unit'] = unit
-        result['size'] = size
-        result['potency'] = potency
-        result['primary_ingredient'] = primary_ingredient
-        result['num_ingredients'] = len(ingredients)
-        
-        # Store all ingredients (up to 20) like R system
-        result['all_ingredients'] = []
-        for idx, ing in enumerate(ingredients):
-            ing_name = ing.get('name', '') if isinstance(ing, dict) else ing
-            result['all_ingredients'].append(ing_name)
-        
-        result['category'] = category
-        result['subcategory'] = subcategory
-        result['health_focus'] = health_focus
-        result['high_level_category'] = high_level_category
-        result['combo_detected'] = combo_detected
-        result['combos_applied'] = combos_applied
-        
-        # Add unified reasoning field from postprocessing
-        result['reasoning'] = final_reasoning if final_reasoning else f"Category: {category}, Subcategory: {subcategory}"
-        
-        result['tokens_used'] = metadata['tokens_used']
-        result['api_cost'] = metadata['api_cost']
-        result['_metadata'] = metadata['_metadata']
-        result['processing_time_sec'] = (datetime.now() - start_time).total_seconds()
-        
-        # 💾 Save Step 3 (final) result immediately
-        log_manager.save_audit_json('step3_postprocess', result, f"{asin}.json")
+    except Exception as e:
+        return _record_exception(result, e, log_manager, start_time)
+
+
+async def process_single_record_async(record: Dict, product_id: int, log_manager, max_retries: int = 3, test_step1_only: bool = False) -> Dict:
+    """Async version of process_single_record() for the asyncio Step 2 engine"""
+    start_time = datetime.now()
+    result = _init_record_result(record, product_id)
+    
+    try:
+        step1_final = _apply_step1(result, log_manager, start_time, test_step1_only)
+        if step1_final is not None:
+            return step1_final
         
-        log_manager.log_step('step3_postprocess', f"[{asin}] COMPLETE in {result['processing_time_sec']:.2f}s")
+        llm_extraction_result = await extract_llm_attributes_async(result['title'], result['asin'], product_id, log_manager, max_retries,
+                                                                   lookup_action=result.get('lookup_action'))
         
-        return result
+        final = _complete_record(result, llm_extraction_result, log_manager, start_time)
+        observe_shadow(final, log_manager)
+        return final
         
     except Exception as e:
-        log_manager.log_step('error', f"[{asin}] EXCEPTION: {str(e)[:200]}")
-        result['traceback'] = traceback.format_exc()
-        error_result = build_error_result(result, str(e), result.get('step_completed', 0), start_time)
-        # 💾 Save error immediately
-        log_manager.save_audit_json('errors', error_result, f"{asin}.json")
-        return error_result
+        return _record_exception(result, e, log_manager, start_time)
 
 
-def save_results(output_dir: Path, results: List[Dict], input_filename: str, log_manager: LogManager):
-    """Save results to CSV only (simplified column set)"""
-    log_manager.log_step('step4_output', f"Saving {len(results)} results to CSV...")
+def process_records_batch_mode(records: List[Dict], first_product_id: int, log_manager, test_step1_only: bool = False) -> List[Dict]:
+    """
+    Process records with Step 2 through the OpenAI Batch API
     
-    df = pd.DataFrame([
-        {
-            # Core Output Columns (matching R system + Master Item File structure)
-            'RetailerSku': r.get('asin', ''),  # Original ASIN from input
-            'UPC': '',  # Empty - manual lookup required
-            'Description': r['title'],
-            'Brand': r['brand'],
-            'NW Category': r.get('category', ''),
-            'NW Subcategory': r.get('subcategory', ''),
-            'NW Sub Brand 1': '',  # Empty - manual entry (NW/IT only)
-            'NW Sub Brand 2': '',  # Empty - manual entry (NW/IT only)
-            'NW Sub Brand 3': '',  # Empty - manual entry (NW/IT only)
-            'Potency': r.get('potency', ''),  # LLM extracted (probiotics mostly)
-            'FORM': r.get('form', ''),
-            'AGE': r.get('age', ''),
-            'GENDER': r.get('gender', ''),
-            'COMPANY': r['brand'],  # Default to brand, manual refinement for parent companies
-            'FUNCTIONAL INGREDIENT': r.get('primary_ingredient', ''),
-            'HEALTH FOCUS': r.get('health_focus', ''),
-            'SIZE': r.get('size', ''),  # SIZE = quantity (60, 120, 35.274)
-            'HIGH LEVEL CATEGORY': r.get('high_level_category', ''),
-            'NW_UPC': '',  # Empty - manual lookup (NW/IT internal UPC only)
-            'Unit of Measure': r.get('unit', ''),
-            'Pack Count': r.get('pack_count', ''),  # Pack Count = pack size (1, 2, 3)
-            'Organic': r.get('organic', ''),
-            # Reasoning: Populated from 'reasoning' field (includes filter reason, LLM detection, or business rules)
-            'Reasoning': r.get('reasoning', '')
-            
-            # NOTE: Multiple ingredients are stored in audit JSON files only, not in CSV
-            # NOTE: Tracking columns (Product_ID, Status, Tokens, Cost, Time, Errors, etc.)
-            # are also stored in audit JSON files only, not in the CSV output
-        }
-        for r in results
-    ])
+    Step 1 runs for every record first, then all survivors go out as one
+    multi-round batch job, and each result goes through the same Step 2-3
+    completion as process_single_record().
+    """
+    start_time = datetime.now()
+    final_results = []
+    pending = []
+    
+    for idx, record in enumerate(records):
+        result = _init_record_result(record, first_product_id + idx)
+        try:
+            step1_final = _apply_step1(result, log_manager, start_time, test_step1_only)
+        except Exception as e:
+            final_results.append(_record_exception(result, e, log_manager, start_time))
+            continue
+        if step1_final is not None:
+            final_results.append(step1_final)
+        else:
+            pending.append(result)
+    
+    if not pending:
+        return final_results
+    
+    print(f"  {len(pending):,} records need LLM extraction (batch mode)")
+    llm_results = extract_llm_attributes_batch(pending, log_manager)
     
+    for result in pending:
+        try:
+            final_results.append(_complete_record(result, llm_results[result['product_id']], log_manager, start_time))
+        except Exception as e:
+            final_results.append(_record_exception(result, e, log_manager, start_time))
+    
+    return final_results
+
+
+def _output_row(r: Dict) -> Dict:
+    """One output CSV row (simplified column set)"""
+    return {
+        # Core Output Columns (matching R system + Master Item File structure)
+        'RetailerSku': r.get('asin', ''),  # Original ASIN from input
+        'UPC': '',  # Empty - manual lookup required
+        'Description': r['title'],
+        'Brand': r['brand'],
+        'NW Category': r.get('category', ''),
+        'NW Subcategory': r.get('subcategory', ''),
+        'NW Sub Brand 1': '',  # Empty - manual entry (NW/IT only)
+        'NW Sub Brand 2': '',  # Empty - manual entry (NW/IT only)
+        'NW Sub Brand 3': '',  # Empty - manual entry (NW/IT only)
+        'Potency': r.get('potency', ''),  # LLM extracted (probiotics mostly)
+        'FORM': r.get('form', ''),
+        'AGE': r.get('age', ''),
+        'GENDER': r.get('gender', ''),
+        'COMPANY': r['brand'],  # Default to brand, manual refinement for parent companies
+        'FUNCTIONAL INGREDIENT': r.get('primary_ingredient', ''),
+        'HEALTH FOCUS': r.get('health_focus', ''),
+        'SIZE': r.get('size', ''),  # SIZE = quantity (60, 120, 35.274)
+        'HIGH LEVEL CATEGORY': r.get('high_level_category', ''),
+        'NW_UPC': '',  # Empty - manual lookup (NW/IT internal UPC only)
+        'Unit of Measure': r.get('unit', ''),
+        'Pack Count': r.get('pack_count', ''),  # Pack Count = pack size (1, 2, 3)
+        'Organic': r.get('organic', ''),
+        # Reasoning: Populated from 'reasoning' field (includes filter reason, LLM detection, or business rules)
+        'Reasoning': r.get('reasoning', '')
+        
+        # NOTE: Multiple ingredients are stored in audit JSON files only, not in CSV
+        # NOTE: Tracking columns (Product_ID, Status, Tokens, Cost, Time, Errors, etc.)
+        # are also stored in audit JSON files only, not in the CSV output
+    }
+
+
+def _output_csv_path(output_dir: Path, input_filename: str) -> Path:
+    """Output CSV path for a run"""
     # Create output filename: remove "uncoded_" prefix and add "_coded" suffix
     # Example: uncoded_100_records -> 100_records_coded.csv
     if input_filename.lower().startswith('uncoded_'):
@@ -343,8 +457,16 @@ def save_results(output_dir: Path, results: List[Dict], input_filename: str, log
     else:
         base_name = input_filename
     
-    output_filename = f"{base_name}_coded.csv"
-    csv_file = output_dir / output_filename
+    return output_dir / f"{base_name}_coded.csv"
+
+
+def save_results(output_dir: Path, results: List[Dict], input_filename: str, log_manager: LogManager):
+    """Save results to CSV only (simplified column set)"""
+    log_manager.log_step('step4_output', f"Saving {len(results)} results to CSV...")
+    
+    df = pd.DataFrame([_output_row(r) for r in results])
+    
+    csv_file = _output_csv_path(output_dir, input_filename)
     df.to_csv(csv_file, index=False)
     
     log_manager.log_step('step4_output', f"Saved CSV: {csv_file} ({len(results)} records)")
@@ -353,6 +475,36 @@ def save_results(output_dir: Path, results: List[Dict], input_filename: str, log
     return csv_file
 
 
+def patch_results_csv(csv_file: Path, results: List[Dict], log_manager: LogManager) -> int:
+    """
+    Replace the rows of re-processed records in an existing output CSV
+    
+    Rows are in product_id order; the ASIN is checked (and searched for if
+    the row moved) before a row is overwritten.
+    
+    Returns:
+        Number of rows patched
+    """
+    df = pd.read_csv(csv_file, dtype=str, keep_default_na=False)
+    patched = 0
+    for r in results:
+        asin = str(r.get('asin', ''))
+        row = r['product_id'] - 1
+        if not (0 <= row < len(df) and df.at[row, 'RetailerSku'] == asin):
+            matches = df.index[df['RetailerSku'] == asin]
+            if len(matches) == 0:
+                log_manager.log_step('step4_output', f"[{asin}] Not found in {csv_file.name} - row not patched")
+                continue
+            row = matches[0]
+        values = _output_row(r)
+        df.loc[row, list(values)] = ['' if value is None else str(value) for value in values.values()]
+        patched += 1
+    
+    df.to_csv(csv_file, index=False)
+    log_manager.log_step('step4_output', f"Patched CSV: {csv_file} ({patched} rows)")
+    return patched
+
+
 def save_audit_step_files(log_manager: LogManager, results: List[Dict], step: str):
     """Save per-product audit files for a specific step - Named by ASIN for easy tracking"""
     for result in results:
@@ -364,7 +516,216 @@ def save_audit_step_files(log_manager: LogManager, results: List[Dict], step: st
         )
 
 
-def main():
+def _redrive_dead_letters(dead_letters: DeadLetterQueue, log_manager: LogManager) -> List[Dict]:
+    """
+    Re-process dead letters with a few workers, a longer timeout and more retries
+    
+    Recovered records are removed from the queue; records that fail again
+    stay in it (with the new error and attempt count).
+    
+    Returns:
+        The new result of every re-driven record
+    """
+    entries = dead_letters.entries()
+    results = []
+    
+    with redrive_settings() as config:
+        workers = max(1, min(config.dlq_concurrency, len(entries)))
+        print(f"\n☠️  Re-driving {len(entries):,} dead letters ({workers} workers, {config.read_timeout:.0f}s read timeout)...")
+        log_manager.log_step('run', f"Dead-letter pass: {len(entries)} records, {workers} workers, {config.read_timeout:.0f}s read timeout")
+        
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(process_single_record, entry['record'], entry['product_id'], log_manager, config.dlq_max_retries): entry
+                for entry in entries
+            }
+            with tqdm(total=len(futures), desc="  Dead letters", unit="record") as pbar:
+                for future in as_completed(futures):
+                    entry = futures[future]
+                    result = future.result()  # process_single_record turns exceptions into error results
+                    if result['status'] == 'error':
+                        dead_letters.add_result(result, entry['record'])
+                    else:
+                        dead_letters.remove(entry['product_id'])
+                    results.append(result)
+                    pbar.update(1)
+    
+    results.sort(key=lambda x: x['product_id'])
+    return results
+
+
+def _process_dead_letters(all_results: List[Dict], records: List[Dict], log_manager: LogManager, redrive: bool = True) -> Dict:
+    """
+    Collect the run's failed and deferred records, re-drive them once and persist what is left
+    
+    all_results is patched in place with the re-driven results. redrive=False
+    (run deadline reached) only saves them.
+    
+    Returns:
+        Dead-letter stats for the summary and run manifest
+    """
+    config = get_llm_config()
+    dead_letters = DeadLetterQueue()
+    for result in all_results:
+        if result['status'] in ('error', 'deferred'):
+            dead_letters.add_result(result, records[result['product_id'] - 1])
+    
+    stats = {'enabled': True, 'dead_letters': len(dead_letters), 'redriven': 0, 'recovered': 0, 'remaining': len(dead_letters)}
+    audit_path = log_manager.get_info()['audit_path']
+    if not len(dead_letters):
+        return stats
+    
+    # Persist first - a crash during the second pass must not lose the list
+    dead_letters.save(audit_path, stats)
+    
+    if config.dlq_redrive and redrive:
+        by_id = {result['product_id']: index for index, result in enumerate(all_results)}
+        for result in _redrive_dead_letters(dead_letters, log_manager):
+            all_results[by_id[result['product_id']]] = result
+            stats['redriven'] += 1
+        stats['remaining'] = len(dead_letters)
+        stats['recovered'] = stats['dead_letters'] - stats['remaining']
+    
+    stats['file'] = str(dead_letters.save(audit_path, stats))
+    log_manager.log_step('run', f"Dead letters: {stats['dead_letters']} failed, {stats['recovered']} recovered, {stats['remaining']} left in {DEAD_LETTER_FILE}")
+    return stats
+
+
+# Run manifest count per record status
+STATUS_COUNTS = {'success': 'success', 'filtered_out': 'filtered', 'error': 'errors', 'deferred': 'deferred'}
+
+
+def _merge_retry_into_manifest(manifest: Dict, results: List[Dict], original_status: Dict[int, str]) -> Dict:
+    """
+    Patch a run manifest with a --retry-errors pass
+    
+    Each re-driven record moves from its original count (errors / deferred)
+    to the one of its new status; the pass's spend is added to the cost
+    fields (losing hedge requests included). Deferred records that fail
+    again become errors.
+    
+    Returns:
+        The run's cost summary after the pass (FileTracker.mark_completed)
+    """
+    for result in results:
+        was = STATUS_COUNTS[original_status.get(result['product_id'], 'error')]
+        now = STATUS_COUNTS.get(result['status'], 'errors')
+        if was != now:
+            manifest[was] = max(0, manifest.get(was, 0) - 1)
+            manifest[now] = manifest.get(now, 0) + 1
+    
+    success = [r for r in results if r['status'] == 'success']
+    summary = summarize_costs(r.get('_metadata', {}) for r in success)
+    cost = manifest.setdefault('cost', {})
+    success_before = manifest['success'] - len(success)
+    billed_before = cost.get('billed_products', 0)
+    products_cost = cost.get('effective_cost_per_product', 0) * success_before + summary['total_cost']
+    billed_cost = cost.get('cost_per_billed_product', 0) * billed_before + summary['total_cost']
+    
+    # Losing hedge requests of this pass are billed to the run total, as in main()
+    hedge_stats = get_hedge_stats()
+    manifest['total_cost'] = (manifest.get('total_cost', 0) + sum(r['api_cost'] for r in success)
+                              + hedge_stats.get('wasted_cost', 0.0))
+    manifest['total_tokens'] = (manifest.get('total_tokens', 0) + sum(r['tokens_used'] for r in success)
+                                + hedge_stats.get('wasted_tokens', 0))
+    cost['hedge_wasted_cost'] = cost.get('hedge_wasted_cost', 0) + hedge_stats.get('wasted_cost', 0.0)
+    for key in ('input_tokens', 'output_tokens', 'cached_input_tokens'):
+        manifest[key] = manifest.get(key, 0) + summary[key]
+    manifest['cached_token_ratio'] = round(manifest['cached_input_tokens'] / manifest['input_tokens'], 4) if manifest['input_tokens'] else 0
+    for key in ('cached_input_cost', 'uncached_cost', 'prompt_cache_saved_cost', 'billed_products'):
+        cost[key] = cost.get(key, 0) + summary[key]
+    cost['effective_cost_per_product'] = products_cost / manifest['success'] if manifest['success'] else 0
+    cost['cost_per_billed_product'] = billed_cost / cost['billed_products'] if cost['billed_products'] else 0
+    
+    return {
+        'cached_input_tokens': manifest['cached_input_tokens'],
+        'cache_hit_ratio': manifest['cached_token_ratio'],
+        'prompt_cache_saved_cost': cost['prompt_cache_saved_cost'],
+        'effective_cost_per_product': cost['effective_cost_per_product'],
+        'cost_per_billed_product': cost['cost_per_billed_product']
+    }
+
+
+def retry_dead_letters(input_file: str, run_id: str):
+    """
+    --retry-errors: re-drive only the dead letters of an earlier local run
+    
+    The run's output CSV, final audit files, dead_letters.json and manifest
+    are patched in place - nothing else is re-processed.
+    """
+    print("="*80)
+    print(f"RETRY DEAD LETTERS - {run_id}")
+    print("="*80)
+    
+    if not re.fullmatch(r'run_\d+', run_id or ''):
+        print(f"\n⚠ ERROR: --retry-errors expects a run folder like 'run_3', got: {run_id}")
+        sys.exit(1)
+    
+    input_filename = Path(input_file).stem
+    log_manager = LogManager(input_filename=input_filename, base_path='data', run_id=run_id)
+    info = log_manager.get_info()
+    audit_path = Path(info['audit_path'])
+    csv_file = _output_csv_path(Path(f"data/output/{info['file_id']}/{info['run_id']}"), input_filename)
+    
+    dead_letters = DeadLetterQueue.load(audit_path)
+    if dead_letters is None or not csv_file.exists():
+        print(f"\n⚠ ERROR: No {DEAD_LETTER_FILE} / output CSV for {info['file_id']}/{run_id}")
+        sys.exit(1)
+    if not len(dead_letters):
+        print(f"\n✓ No dead letters left in {audit_path / DEAD_LETTER_FILE}")
+        return
+    
+    log_manager.log_step('run', f"RETRY ERRORS: {len(dead_letters)} dead letters from {audit_path / DEAD_LETTER_FILE}")
+    before = len(dead_letters)
+    # 'error' or 'deferred' in the original run (older files only had errors)
+    original_status = {entry['product_id']: entry.get('status', 'error') for entry in dead_letters.entries()}
+    started = time.time()
+    results = _redrive_dead_letters(dead_letters, log_manager)
+    recovered = [r for r in results if r['status'] != 'error']
+    
+    if recovered:
+        patch_results_csv(csv_file, recovered, log_manager)
+    save_audit_step_files(log_manager, results, "final")
+    
+    stats = {
+        'retried_at': datetime.utcnow().isoformat(),
+        'dead_letters': before,
+        'redriven': len(results),
+        'recovered': len(recovered),
+        'remaining': len(dead_letters)
+    }
+    dead_letters.save(audit_path, stats)
+    
+    manifest_path = audit_path / 'run_manifest.json'
+    if manifest_path.exists():
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        cost_summary = _merge_retry_into_manifest(manifest, results, original_status)
+        manifest.setdefault('retry_errors', []).append(stats)
+        log_manager.save_run_manifest(manifest)
+        
+        FileTracker().mark_completed(
+            filename=input_filename,
+            run_id=info['run_id'],
+            success=manifest['success'],
+            filtered=manifest.get('filtered', 0),
+            errors=manifest['errors'],
+            total_cost=manifest['total_cost'],
+            total_tokens=manifest['total_tokens'],
+            input_tokens=manifest['input_tokens'],
+            output_tokens=manifest['output_tokens'],
+            duration_seconds=manifest.get('duration_seconds', 0) + (time.time() - started),
+            cache_stats=manifest.get('llm_cache'),
+            cost_summary=cost_summary
+        )
+    
+    log_manager.log_step('run', f"RETRY ERRORS complete: {len(recovered)} recovered, {len(dead_letters)} still failing")
+    print(f"\n✓ Recovered: {len(recovered):,} of {before:,} | Still failing: {len(dead_letters):,}")
+    print(f"   CSV: {csv_file}")
+    print(f"   Dead letters: {audit_path / DEAD_LETTER_FILE}")
+
+
+def main(input_file: Optional[str] = None):
     print("="*80)
     print("PRODUCTION ORCHESTRATOR - PROCESS 1000+ RECORDS")
     print("="*80)
@@ -373,18 +734,30 @@ def main():
     print(f"\nStart Time: {start_time.strftime('%Y-%m-%d %H:%M:%S')}")
     
     # Configuration
-    import sys
-    INPUT_FILE = sys.argv[1] if len(sys.argv) > 1 else 'data/input/uncoded_100_records.csv'  # Allow command line override
-    MAX_WORKERS = 1000  # Number of parallel threads for maximum speed
+    INPUT_FILE = input_file or 'data/input/uncoded_100_records.csv'  # Command line override (see __main__)
+    llm_config = get_llm_config()
+    LLM_MODE = llm_config.llm_mode  # 'realtime' (interactive API) or 'batch' (OpenAI Batch API)
+    ENGINE = llm_config.engine  # 'threads' (ThreadPoolExecutor) or 'async' (asyncio event loop)
+    MAX_WORKERS = llm_config.concurrency or 1000  # Max parallel API calls (threads or in-flight coroutines)
     BATCH_SIZE = 1000  # Save results every 1000 records (faster processing)
+    if LLM_MODE == 'batch':
+        BATCH_SIZE = llm_config.batch_size  # One Batch API job per chunk - keep chunks large
     
     # ⚠️  TEST MODE: Stop after Step 1 (filtering only)
     TEST_STEP1_ONLY = False  # Run complete pipeline (Steps 1, 2, 3)  # Set to False to run full pipeline
     
     print(f"\nConfiguration:")
     print(f"   Input File: {INPUT_FILE}")
+    print(f"   LLM Mode: {LLM_MODE} (rules: {llm_config.rules_mode}, api: {llm_config.api})")
+    if LLM_MODE != 'batch':
+        print(f"   Step 2 Engine: {ENGINE}")
     print(f"   Max Workers: {MAX_WORKERS} (parallel API calls)")
+    if llm_config.adaptive_concurrency and LLM_MODE != 'batch':
+        print(f"   Adaptive Concurrency: start {get_concurrency_limiter(MAX_WORKERS).current_limit}, ceiling {MAX_WORKERS}")
     print(f"   Batch Size: {BATCH_SIZE} (save every N records)")
+    if llm_config.run_deadline:
+        print(f"   Deadline: {datetime.fromtimestamp(llm_config.run_deadline).strftime('%Y-%m-%d %H:%M:%S')}"
+              + (" (ignored in batch mode)" if LLM_MODE == 'batch' else ""))
     
     # Load data
     print(f"\nLoading data...")
@@ -433,6 +806,8 @@ def main():
     log_manager.log_step('run', "="*80)
     log_manager.log_step('run', f"Input file: {INPUT_FILE}")
     log_manager.log_step('run', f"Total records: {total_records}")
+    log_manager.log_step('run', f"LLM mode: {LLM_MODE}")
+    log_manager.log_step('run', f"Step 2 engine: {ENGINE}")
     log_manager.log_step('run', f"Max workers: {MAX_WORKERS}")
     log_manager.log_step('run', f"Batch size: {BATCH_SIZE}")
     log_manager.log_step('run', f"File ID: {info['file_id']}")
@@ -458,6 +833,19 @@ def main():
         print(f"\n⚠️  TEST MODE: Running Step 1 (Filtering) ONLY")
         print(f"   LLM extraction will be SKIPPED")
     
+    # ⏰ Run deadline: concurrency floor follows the needed throughput, late records are deferred
+    deadline_scheduler = None
+    if llm_config.run_deadline and LLM_MODE != 'batch' and not TEST_STEP1_ONLY:
+        deadline_scheduler = DeadlineScheduler(llm_config.run_deadline, total_records, get_concurrency_limiter(MAX_WORKERS))
+        log_manager.log_step('run', f"Deadline: {datetime.fromtimestamp(llm_config.run_deadline).isoformat(timespec='seconds')}")
+    
+    def track_deadline(result: Dict):
+        if deadline_scheduler is None:
+            return
+        if deadline_scheduler.is_deferred(result):
+            deadline_scheduler.defer(result)
+        deadline_scheduler.on_result(result)
+    
     print(f"\nProcessing {total_records:,} records with {MAX_WORKERS} workers...")
     if not TEST_STEP1_ONLY:
         print(f"   Estimated time: ~{(total_records * 50) / MAX_WORKERS / 60:.0f} minutes")
@@ -475,21 +863,36 @@ def main():
         print(f"📦 Batch {batch_num}: Records {batch_start+1}-{batch_end}")
         
         batch_results = []
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            # Submit all tasks in this batch
-            futures = {
-                executor.submit(process_single_record, record, batch_start + idx + 1, log_manager, test_step1_only=TEST_STEP1_ONLY): idx 
-                for idx, record in enumerate(batch_records)
-            }
+        if LLM_MODE == 'batch' and not TEST_STEP1_ONLY:
+            # Offline: Step 1 locally, then one multi-round Batch API job for the chunk
+            batch_results = process_records_batch_mode(batch_records, batch_start + 1, log_manager)
+        elif ENGINE == 'async':
+            # One event loop, at most MAX_WORKERS requests in flight
+            async def run_record(item):
+                idx, record = item
+                return await process_single_record_async(record, batch_start + idx + 1, log_manager, test_step1_only=TEST_STEP1_ONLY)
             
-            # Collect results with progress bar
-            for future in tqdm(as_completed(futures), total=len(futures), 
-                             desc=f"  Processing", unit="record"):
-                try:
-                    result = future.result()
-                    batch_results.append(result)
-                except Exception as e:
-                    print(f"  ⚠️  Task failed: {e}")
+            batch_results = run_async_engine(list(enumerate(batch_records)), run_record, MAX_WORKERS,
+                                             on_result=track_deadline, status=concurrency_status)
+        else:
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                # Submit all tasks in this batch
+                futures = {
+                    executor.submit(process_single_record, record, batch_start + idx + 1, log_manager, test_step1_only=TEST_STEP1_ONLY): idx 
+                    for idx, record in enumerate(batch_records)
+                }
+                
+                # Collect results with progress bar (+ current adaptive concurrency limit)
+                with tqdm(total=len(futures), desc=f"  Processing", unit="record") as pbar:
+                    for future in as_completed(futures):
+                        try:
+                            result = future.result()
+                            track_deadline(result)
+                            batch_results.append(result)
+                        except Exception as e:
+                            print(f"  ⚠️  Task failed: {e}")
+                        pbar.set_postfix_str(concurrency_status(), refresh=False)
+                        pbar.update(1)
         
         # Sort batch results by product_id
         batch_results.sort(key=lambda x: x['product_id'])
@@ -508,13 +911,25 @@ def main():
         batch_step1_complete = sum(1 for r in batch_results if r['status'] == 'step1_complete')
         batch_filtered = sum(1 for r in batch_results if r['status'] == 'filtered_out')
         batch_errors = sum(1 for r in batch_results if r['status'] == 'error')
+        batch_deferred = sum(1 for r in batch_results if r['status'] == 'deferred')
         
         if TEST_STEP1_ONLY:
             print(f"  ✓ Passed Filter: {batch_step1_complete} | Filtered: {batch_filtered} | Errors: {batch_errors}")
         else:
-            print(f"  ✓ Success: {batch_success} | Filtered: {batch_filtered} | Errors: {batch_errors}")
+            print(f"  ✓ Success: {batch_success} | Filtered: {batch_filtered} | Errors: {batch_errors}"
+                  + (f" | Deferred: {batch_deferred}" if batch_deferred else ""))
         print(f"  💾 Saved {len(all_results)} total results so far\n")
     
+    # ☠️ Dead letters: failed records get a second pass, the rest is saved for --retry-errors
+    dead_letter_stats = {'enabled': False}
+    if not TEST_STEP1_ONLY:
+        # No second pass once the run deadline has passed - the records wait for --retry-errors
+        past_deadline = deadline_scheduler is not None and deadline_scheduler.time_left() <= 0
+        dead_letter_stats = _process_dead_letters(all_results, records, log_manager, redrive=not past_deadline)
+        if dead_letter_stats['redriven']:
+            csv_file = save_results(output_dir, all_results, input_filename, log_manager)
+            save_audit_step_files(log_manager, all_results, "final")
+    
     end_time = datetime.now()
     duration = (end_time - start_time).total_seconds()
     
@@ -530,12 +945,14 @@ def main():
     filtered = [r for r in all_results if r['status'] == 'filtered_out']
     step1_complete = [r for r in all_results if r['status'] == 'step1_complete']
     errors = [r for r in all_results if r['status'] == 'error']
+    deferred = [r for r in all_results if r['status'] == 'deferred']
     
     # Initialize cost and token variables
     total_cost = 0
     total_tokens = 0
     input_tokens = 0
     output_tokens = 0
+    cached_input_tokens = 0
     
     print(f"\nOVERALL STATS:")
     print(f"   Total Records: {len(all_results):,}")
@@ -548,30 +965,163 @@ def main():
         print(f"   ✓ Success: {len(success):,} ({len(success)/len(all_results)*100:.1f}%)")
         print(f"   Filtered: {len(filtered):,} ({len(filtered)/len(all_results)*100:.1f}%)")
         print(f"   Errors: {len(errors):,} ({len(errors)/len(all_results)*100:.1f}%)")
+        if deferred:
+            print(f"   Deferred: {len(deferred):,} ({len(deferred)/len(all_results)*100:.1f}%)")
     
+    cost_summary = summarize_costs(r.get('_metadata', {}) for r in success)
+    # Failed packs and losing hedge requests were paid for but belong to no product - billed to the run total
+    pack_stats = get_pack_stats()
+    hedge_stats = get_hedge_stats()
+    hedge_wasted_cost = hedge_stats.get('wasted_cost', 0.0)
     if success:
-        total_cost = sum(r['api_cost'] for r in success)
-        total_tokens = sum(r['tokens_used'] for r in success)
-        
-        # Calculate input/output tokens separately
-        input_tokens = 0
-        output_tokens = 0
-        for r in success:
-            metadata = r.get('_metadata', {})
-            tokens_breakdown = metadata.get('tokens_used', {})  # ✅ FIXED: was 'tokens', should be 'tokens_used'
-            input_tokens += tokens_breakdown.get('prompt', 0)
-            output_tokens += tokens_breakdown.get('completion', 0)
+        total_cost = sum(r['api_cost'] for r in success) + pack_stats['failed_pack_cost'] + hedge_wasted_cost
+        total_tokens = (sum(r['tokens_used'] for r in success) + pack_stats['failed_pack_tokens']
+                        + hedge_stats.get('wasted_tokens', 0))
+        input_tokens = cost_summary['input_tokens']
+        output_tokens = cost_summary['output_tokens']
+        cached_input_tokens = cost_summary['cached_input_tokens']
         
         avg_time = sum(r['processing_time_sec'] for r in success) / len(success)
         total_sequential = sum(r['processing_time_sec'] for r in success)
         
         print(f"\n💰 COST:")
         print(f"   Total API Cost: ${total_cost:.4f}")
-        print(f"   Avg per product: ${total_cost/len(success):.6f}")
+        print(f"   Effective cost per product: ${total_cost/len(success):.6f} (cache/dedup reuse included)")
+        print(f"   Cost per billed product: ${cost_summary['cost_per_billed_product']:.6f} ({cost_summary['billed_products']:,} products made API calls)")
         print(f"   Total tokens: {total_tokens:,}")
         print(f"   Input tokens: {input_tokens:,}")
         print(f"   Output tokens: {output_tokens:,}")
-        
+        print(f"   Cached input tokens: {cached_input_tokens:,} ({cost_summary['cache_hit_ratio'] * 100:.1f}% prompt-cache hit ratio)")
+        print(f"   Prompt cache saved: ${cost_summary['prompt_cache_saved_cost']:.4f} (${cost_summary['uncached_cost']:.4f} without caching)")
+        if pack_stats['failed_pack_cost']:
+            print(f"   Failed packs: ${pack_stats['failed_pack_cost']:.4f} ({pack_stats['failed_pack_tokens']:,} tokens, included above)")
+        if hedge_wasted_cost:
+            print(f"   Losing hedges: ${hedge_wasted_cost:.4f} ({hedge_stats['wasted_tokens']:,} tokens, included above)")
+    
+    cache_stats = get_cache_stats()
+    if cache_stats['enabled'] and not TEST_STEP1_ONLY:
+        print(f"\n🗄️  RESPONSE CACHE ({cache_stats['mode']}):")
+        print(f"   Hits: {cache_stats['hits']:,} | Misses: {cache_stats['misses']:,} ({cache_stats['hit_rate'] * 100:.1f}% hit rate)")
+        print(f"   Saved: ${cache_stats['saved_cost']:.4f} ({cache_stats['saved_tokens']:,} tokens)")
+        print(f"   Entries: {cache_stats['entries']:,} ({cache_stats['size_mb']} MB)")
+    
+    dedup_stats = get_dedup_stats()
+    if dedup_stats['enabled'] and dedup_stats['records'] and not TEST_STEP1_ONLY:
+        print(f"\n🔁 DUPLICATE TITLES:")
+        print(f"   LLM requests: {dedup_stats['llm_requests']:,} for {dedup_stats['records']:,} records ({dedup_stats['dedup_ratio'] * 100:.1f}% deduplicated)")
+        print(f"   Saved: ${dedup_stats['saved_cost']:.4f} ({dedup_stats['saved_tokens']:,} tokens)")
+    
+    if pack_stats['enabled'] and not TEST_STEP1_ONLY:
+        print(f"\n📦 MULTI-PRODUCT PACKING:")
+        print(f"   Packed requests: {pack_stats['packs']:,} ({pack_stats['packed_products']:,} products, avg {pack_stats['avg_pack_size']} per request)")
+        print(f"   Failed packs: {pack_stats['failed_packs']:,} ({pack_stats['fallback_products']:,} products fell back to single calls, "
+              f"${pack_stats['failed_pack_cost']:.4f} spent on them)")
+    
+    concurrency_stats = get_concurrency_stats()
+    if concurrency_stats['enabled'] and concurrency_stats['requests'] and not TEST_STEP1_ONLY:
+        print(f"\n🚦 ADAPTIVE CONCURRENCY:")
+        print(f"   Limit: {concurrency_stats['current_limit']} now, peak {concurrency_stats['peak_limit']} (ceiling {concurrency_stats['max_limit']})")
+        print(f"   Decreases: {concurrency_stats['decreases']} (429s: {concurrency_stats['rate_limited']}, latency spikes: {concurrency_stats['latency_spikes']}, rate-limit headers: {concurrency_stats['header_throttles']})")
+    
+    rate_limit_stats = get_rate_limit_stats()
+    if rate_limit_stats['enabled'] and not TEST_STEP1_ONLY:
+        print(f"\n⏳ RATE LIMITER (RPM {rate_limit_stats['rpm_limit'] or '-'}, TPM {rate_limit_stats['tpm_limit'] or '-'} at {rate_limit_stats['target'] * 100:.0f}%):")
+        print(f"   Requests: {rate_limit_stats['requests']:,} | Waited: {rate_limit_stats['waits']:,} times, {rate_limit_stats['wait_seconds']}s total")
+        print(f"   Tokens estimated: {rate_limit_stats['estimated_tokens']:,} | actual: {rate_limit_stats['actual_tokens']:,}")
+    
+    retry_stats = get_retry_stats()
+    if retry_stats['calls'] and not TEST_STEP1_ONLY:
+        breaker = retry_stats['breaker']
+        print(f"\n🔁 RETRIES:")
+        print(f"   Retries: {retry_stats['retries']:,} of {retry_stats['calls']:,} calls ({retry_stats['retry_ratio'] * 100:.1f}%) | Gave up: {retry_stats['gave_up']:,} (budget exhausted: {retry_stats['budget_exhausted']:,})")
+        print(f"   Backoff: {retry_stats['backoff_seconds']}s total ({retry_stats['server_hinted_waits']:,} server-hinted)")
+        print(f"   Circuit breaker: {breaker['state']} | opened {breaker['opens']}x, paused {breaker['paused_calls']:,} calls for {breaker['paused_seconds']}s")
+    
+    if hedge_stats['enabled'] and hedge_stats['calls'] and not TEST_STEP1_ONLY:
+        print(f"\n🏁 HEDGED REQUESTS (p{hedge_stats['percentile']:g} trigger, max {hedge_stats['max_ratio'] * 100:.0f}%):")
+        print(f"   Hedges: {hedge_stats['hedges']:,} of {hedge_stats['calls']:,} calls ({hedge_stats['hedge_ratio'] * 100:.1f}%) | Hedge won: {hedge_stats['hedge_wins']:,} | Wasted: ${hedge_stats['wasted_cost']:.4f} ({hedge_stats['wasted_tokens']:,} tokens)")
+        print(f"   Latency p50 {hedge_stats['p50_sec']}s | p99 {hedge_stats['p99_sec']}s vs. {hedge_stats['p99_unhedged_sec']}s unhedged ({hedge_stats['p99_improvement_sec']}s better)")
+    
+    routing_stats = get_routing_stats()
+    if routing_stats['enabled'] and not TEST_STEP1_ONLY:
+        print(f"\n🧭 MODEL ROUTING (simple tier up to score {routing_stats['simple_max_score']:g}):")
+        for tier, tier_stats in routing_stats['tiers'].items():
+            latency = f"{tier_stats['avg_latency_sec']}s" if tier_stats['avg_latency_sec'] is not None else 'n/a'
+            print(f"   {tier.capitalize()} ({tier_stats['model']}, effort {tier_stats['reasoning_effort'] or 'default'}): "
+                  f"routed {tier_stats['routed']:,}, answered {tier_stats['products']:,} | "
+                  f"${tier_stats['avg_cost_per_product']:.6f} and {latency} per product")
+        print(f"   Escalated: {routing_stats['escalations']:,} ({routing_stats['escalation_rate'] * 100:.1f}% of simple) {routing_stats['escalation_reasons'] or ''}")
+    
+    shadow_stats = get_shadow_stats()  # Waits for in-flight shadow calls (LLM_SHADOW_DRAIN_SEC)
+    if shadow_stats['enabled'] and not TEST_STEP1_ONLY:
+        primary, shadow = shadow_stats['primary'], shadow_stats['shadow']
+        print(f"\n👥 SHADOW EVALUATION ({shadow_stats['rate'] * 100:g}% of titles):")
+        print(f"   Primary: {primary['model']} ({primary['latency_preset'] or 'default'} preset, {primary['rules_mode']} rules, {primary['output_mode']} output)")
+        print(f"   Shadow:  {shadow['model']} ({shadow['latency_preset'] or 'default'} preset, {shadow['rules_mode']} rules, {shadow['output_mode']} output)")
+        print(f"   Compared: {shadow_stats['compared']:,} of {shadow_stats['sampled']:,} sampled | Shadow errors: {shadow_stats['shadow_errors']:,} | "
+              f"Primary failed: {shadow_stats['primary_failed']:,} | Unfinished: {shadow_stats['unfinished']:,}")
+        if shadow_stats['compared']:
+            agreement = ' | '.join(f"{field} {rate * 100:.1f}%" for field, rate in shadow_stats['agreement'].items())
+            print(f"   Agreement: all fields {shadow_stats['all_fields_agreement'] * 100:.1f}% | {agreement}")
+            for side, values in (('Primary', primary), ('Shadow', shadow)):
+                latency = values['latency_sec']
+                print(f"   {side}: latency p50 {latency['p50']}s | p90 {latency['p90']}s | p99 {latency['p99']}s | "
+                      f"${values['cost_per_product']:.6f} and {values['tokens_per_product']:,} tokens per product")
+            print(f"   Shadow spend: ${shadow['cost']:.4f} (not in the run cost above) | Per-product pairs: {info['audit_path']}/shadow/")
+    
+    preset_stats = get_preset_stats()
+    if preset_stats['presets'] and not TEST_STEP1_ONLY:
+        efforts = ', '.join(f"{phase} {effort}" for phase, effort in preset_stats['efforts'].items()) or 'model defaults'
+        max_tokens = f"{preset_stats['max_completion_tokens']:,}" if preset_stats['max_completion_tokens'] else 'no'
+        print(f"\n⏱️  LATENCY PRESET ({preset_stats['preset']}: {efforts}; {max_tokens} completion token cap):")
+        for name, values in preset_stats['presets'].items():
+            latency, completion, reasoning = values['latency_sec'], values['completion_tokens'], values['reasoning_tokens']
+            latency = f"p50 {latency['p50']}s | p90 {latency['p90']}s | p99 {latency['p99']}s" if latency['p50'] is not None else 'n/a'
+            print(f"   {name} ({values['products']:,} products): latency {latency}")
+            print(f"      Completion tokens p50 {completion['p50']} | p90 {completion['p90']} | p99 {completion['p99']} "
+                  f"(reasoning p50 {reasoning['p50']} | p90 {reasoning['p90']})")
+            for phase, phase_stats in values['phases'].items():
+                latency = f"{phase_stats['avg_latency_sec']}s" if phase_stats['avg_latency_sec'] is not None else 'n/a'
+                print(f"      {phase.capitalize()} rounds: {phase_stats['rounds']:,} | {latency} | "
+                      f"{phase_stats['avg_completion_tokens']} completion ({phase_stats['avg_reasoning_tokens']} reasoning) tokens each")
+    
+    round_trip_stats = get_round_trip_stats()
+    if round_trip_stats['products'] and not TEST_STEP1_ONLY:
+        print(f"\n🔄 ROUND TRIPS (ingredient pre-scan {'on' if round_trip_stats['ingredient_prescan'] else 'off'}):")
+        print(f"   Avg API round trips per product: {round_trip_stats['avg_round_trips']}")
+        print(f"   Avg lookup calls per product: {round_trip_stats['avg_lookup_calls']} for {round_trip_stats['avg_looked_up_names']} ingredients "
+              f"(batch lookup {'on' if round_trip_stats['batch_lookup'] else 'off'})")
+        print(f"   Avg pre-resolved ingredients per product: {round_trip_stats['avg_prescanned_ingredients']}")
+        latency = f"{round_trip_stats['avg_llm_latency_sec']}s" if round_trip_stats['avg_llm_latency_sec'] is not None else 'n/a'
+        print(f"   Avg output tokens per product: {round_trip_stats['avg_output_tokens']} | Avg LLM latency: {latency} ({round_trip_stats['output_mode']} output)")
+        if round_trip_stats['avg_round_latency_sec'] is not None:
+            print(f"   Per round trip ({round_trip_stats['api']} API): {round_trip_stats['avg_prompt_tokens_per_round']:,} prompt tokens | "
+                  f"{round_trip_stats['avg_request_kb_per_round']} KB sent | {round_trip_stats['avg_round_latency_sec']}s")
+        if round_trip_stats['tool_result_saved_tokens']:
+            print(f"   Compact tool results: ~{round_trip_stats['avg_tool_result_saved_tokens']:,} prompt tokens saved per product "
+                  f"(~{round_trip_stats['tool_result_saved_tokens']:,} total)")
+        if round_trip_stats['resumed_products']:
+            print(f"   Resumed in place: {round_trip_stats['resumed_products']:,} products, {round_trip_stats['resumed_steps']} failed steps "
+                  f"(saved ~{round_trip_stats['resume_saved_tokens']:,} tokens, {round_trip_stats['resume_saved_seconds']}s vs. restarting)")
+    
+    if dead_letter_stats['enabled'] and dead_letter_stats['dead_letters']:
+        print(f"\n☠️  DEAD LETTERS:")
+        print(f"   Failed after main pass: {dead_letter_stats['dead_letters']:,} | Recovered by second pass: {dead_letter_stats['recovered']:,} | Still failing: {dead_letter_stats['remaining']:,}")
+        if dead_letter_stats['remaining']:
+            print(f"   Saved: {dead_letter_stats['file']} (re-run with --retry-errors {info['run_id']})")
+    
+    deadline_stats = deadline_scheduler.stats() if deadline_scheduler else {'enabled': False}
+    if deadline_stats['enabled']:
+        print(f"\n⏰ DEADLINE ({deadline_stats['deadline']}):")
+        print(f"   {'Met' if deadline_stats['met'] else 'Missed'} ({deadline_stats['margin_sec']}s margin) | "
+              f"Concurrency floor raised {deadline_stats['floor_raises']}x (peak {deadline_stats['peak_floor']})")
+        if deadline_stats['deferred']:
+            asins = deadline_stats['deferred_asins']
+            print(f"   Deferred: {deadline_stats['deferred']:,} records ({', '.join(asins[:10])}{', ...' if len(asins) > 10 else ''})")
+            print(f"   Re-run them with --retry-errors {info['run_id']}")
+        log_manager.log_step('run', f"Deadline {'met' if deadline_stats['met'] else 'missed'}: {deadline_stats['deferred']} records deferred")
+    
+    if success:
         print(f"\n⏱️  TIMING:")
         print(f"   Total (parallel): {duration:.2f}s ({duration/60:.2f} min)")
         print(f"   Avg per product: {avg_time:.2f}s")
@@ -613,7 +1163,27 @@ def main():
     log_manager.log_step('run', f"Success: {len(success)}, Filtered: {len(filtered)}, Errors: {len(errors)}")
     if success:
         log_manager.log_step('run', f"Total cost: ${total_cost:.4f}")
-        log_manager.log_step('run', f"Total tokens: {total_tokens:,} (input: {input_tokens:,}, output: {output_tokens:,})")
+        log_manager.log_step('run', f"Total tokens: {total_tokens:,} (input: {input_tokens:,}, cached: {cached_input_tokens:,}, output: {output_tokens:,})")
+        log_manager.log_step('run', f"Prompt cache: {cost_summary['cache_hit_ratio'] * 100:.1f}% hit ratio, saved ${cost_summary['prompt_cache_saved_cost']:.4f}; effective ${total_cost/len(success):.6f} per product, ${cost_summary['cost_per_billed_product']:.6f} per billed product")
+    if dedup_stats['enabled']:
+        log_manager.log_step('run', f"Dedup: {dedup_stats['followers']} of {dedup_stats['records']} records reused a duplicate title's result, saved ${dedup_stats['saved_cost']:.4f}")
+    if cache_stats['enabled']:
+        log_manager.log_step('run', f"Response cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, saved ${cache_stats['saved_cost']:.4f}")
+    if routing_stats['enabled']:
+        tiers = routing_stats['tiers']
+        log_manager.log_step('run', f"Model routing: {tiers['simple']['products']} simple ({tiers['simple']['model']}), {tiers['standard']['products']} standard ({tiers['standard']['model']}), {routing_stats['escalations']} escalated")
+    if shadow_stats['enabled'] and shadow_stats['compared']:
+        log_manager.log_step('run', f"Shadow {shadow_stats['shadow']['model']}: {shadow_stats['compared']} compared, {shadow_stats['all_fields_agreement'] * 100:.1f}% all-field agreement, "
+                                    f"${shadow_stats['shadow']['cost_per_product']:.6f} vs ${shadow_stats['primary']['cost_per_product']:.6f} per product, "
+                                    f"p50 {shadow_stats['shadow']['latency_sec']['p50']}s vs {shadow_stats['primary']['latency_sec']['p50']}s")
+    for name, values in preset_stats['presets'].items():
+        log_manager.log_step('run', f"Latency preset {name}: {values['products']} products, p50 {values['latency_sec']['p50']}s, p99 {values['latency_sec']['p99']}s, "
+                                    f"p50 {values['completion_tokens']['p50']} completion / {values['reasoning_tokens']['p50']} reasoning tokens")
+    if round_trip_stats['products']:
+        log_manager.log_step('run', f"Round trips: {round_trip_stats['avg_round_trips']} API calls, {round_trip_stats['avg_lookup_calls']} lookups per product (pre-scan {'on' if round_trip_stats['ingredient_prescan'] else 'off'})")
+        log_manager.log_step('run', f"Output ({round_trip_stats['output_mode']}): {round_trip_stats['avg_output_tokens']} output tokens, {round_trip_stats['avg_llm_latency_sec']}s LLM latency per product")
+        log_manager.log_step('run', f"Compact tool results: ~{round_trip_stats['avg_tool_result_saved_tokens']} prompt tokens saved per product")
+        log_manager.log_step('run', f"Per round trip ({round_trip_stats['api']} API): {round_trip_stats['avg_prompt_tokens_per_round']} prompt tokens, {round_trip_stats['avg_request_kb_per_round']} KB sent, {round_trip_stats['avg_round_latency_sec']}s")
     log_manager.log_step('run', f"Total duration: {duration:.2f}s")
     if not TEST_STEP1_ONLY:
         log_manager.log_step('run', f"Output CSV: {csv_file}")
@@ -624,11 +1194,47 @@ def main():
         'success': len(success),
         'filtered': len(filtered),
         'errors': len(errors),
+        'deferred': len(deferred),
         'total_cost': total_cost if success else 0,
         'total_tokens': total_tokens if success else 0,
         'input_tokens': input_tokens if success else 0,
         'output_tokens': output_tokens if success else 0,
+        'cached_input_tokens': cached_input_tokens if success else 0,
+        'cached_token_ratio': cost_summary['cache_hit_ratio'] if success else 0,
+        'cost': {
+            'model': llm_config.model,
+            'cached_input_cost': cost_summary['cached_input_cost'],
+            'uncached_cost': cost_summary['uncached_cost'],
+            'prompt_cache_saved_cost': cost_summary['prompt_cache_saved_cost'],
+            'effective_cost_per_product': cost_summary['effective_cost_per_product'],
+            'billed_products': cost_summary['billed_products'],
+            'cost_per_billed_product': cost_summary['cost_per_billed_product'],
+            'failed_pack_cost': pack_stats['failed_pack_cost'],
+            'hedge_wasted_cost': hedge_wasted_cost
+        },
+        'prompt_version': get_prompt_template().version,
         'duration_seconds': duration,
+        'llm_cache': cache_stats,
+        'dedup': dedup_stats,
+        'packing': pack_stats,
+        'round_trips': round_trip_stats,
+        'concurrency': concurrency_stats,
+        'rate_limit': rate_limit_stats,
+        'retries': retry_stats,
+        'hedging': hedge_stats,
+        'routing': routing_stats,
+        'latency_presets': preset_stats,
+        'shadow': shadow_stats,
+        'dead_letters': dead_letter_stats,
+        'deadline': deadline_stats,
+        'llm_mode': LLM_MODE,
+        'rules_mode': llm_config.rules_mode,
+        'output_mode': llm_config.output_mode,
+        'api': llm_config.api,
+        'compact_tool_results': llm_config.compact_tool_results,
+        'batch_lookup': llm_config.batch_lookup,
+        'step2_engine': ENGINE,
+        'max_workers': MAX_WORKERS,
         'test_mode_step1_only': TEST_STEP1_ONLY
     }
     if not TEST_STEP1_ONLY:
@@ -646,7 +1252,9 @@ def main():
         total_tokens=total_tokens if success else 0,
         input_tokens=input_tokens if success else 0,
         output_tokens=output_tokens if success else 0,
-        duration_seconds=duration
+        duration_seconds=duration,
+        cache_stats=cache_stats,
+        cost_summary=cost_summary if success else None
     )
     
     print(f"\n" + "="*80)
@@ -685,15 +1293,37 @@ def create_result_dict(asin: str, title: str, brand: str,
     }
 
 
-def apply_step2_llm(asin: str, title: str, brand: str, log_manager: LogManager, product_id: int):
+def apply_step2_llm(asin: str, title: str, brand: str, log_manager: LogManager, product_id: int,
+                    lookup_action: Optional[str] = None):
     """
-    Apply Step 2: LLM enrichment
+    Apply Step 2: LLM enrichment (lookup_action: the Step 1 action, for model routing)
     Returns: {'success': bool, 'data': dict} or {'success': False, 'error': str}
     """
     try:
         # LLM extraction
-        llm_result = extract_llm_attributes(title, asin, product_id, log_manager)
-        
+        llm_result = extract_llm_attributes(title, asin, product_id, log_manager, lookup_action=lookup_action)
+        return _build_step2_result(llm_result, asin, log_manager)
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
+
+
+async def apply_step2_llm_async(asin: str, title: str, brand: str, log_manager: LogManager, product_id: int,
+                                lookup_action: Optional[str] = None):
+    """
+    Apply Step 2: LLM enrichment (async engine)
+    Returns: {'success': bool, 'data': dict} or {'success': False, 'error': str}
+    """
+    try:
+        llm_result = await extract_llm_attributes_async(title, asin, product_id, log_manager,
+                                                        lookup_action=lookup_action)
+        return _build_step2_result(llm_result, asin, log_manager)
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
+
+
+def _build_step2_result(llm_result: Dict, asin: str, log_manager: LogManager) -> Dict:
+    """Turn a raw LLM extraction result into the Step 2 data dict (shared by both engines)"""
+    try:
         if not llm_result['success']:
             return {'success': False, 'error': llm_result.get('error', 'Unknown LLM error')}
         
@@ -779,8 +1409,44 @@ def process_llm_only(record_data):
     
     try:
         # Step 2: LLM Enrichment (already passed Step 1)
-        step2_result = apply_step2_llm(asin, title, brand, log_manager, product_id)
-        
+        step2_result = apply_step2_llm(asin, title, brand, log_manager, product_id,
+                                       lookup_action=record.get('lookup_action'))
+    except Exception as e:
+        return _llm_only_error(record_data, e)
+    
+    return _finish_llm_only(record_data, step2_result)
+
+
+async def process_llm_only_async(record_data):
+    """
+    Async version of process_llm_only for the asyncio engine.
+    Audit and DynamoDB writes are blocking, so they run in a worker thread.
+    Returns: (result_dict, error_flag)
+    """
+    idx, record, log_manager, db, run_id = record_data
+    product_id = idx + 1
+    asin = record.get('asin', f'P{product_id}')
+    title = record.get('title', '')
+    brand = record.get('brand', '')
+    
+    try:
+        step2_result = await apply_step2_llm_async(asin, title, brand, log_manager, product_id,
+                                                   lookup_action=record.get('lookup_action'))
+    except Exception as e:
+        return await asyncio.to_thread(_llm_only_error, record_data, e)
+    
+    return await asyncio.to_thread(_finish_llm_only, record_data, step2_result)
+
+
+def _finish_llm_only(record_data, step2_result: Dict):
+    """Build the output row, save audit and update DynamoDB for one Step 2 result"""
+    idx, record, log_manager, db, run_id = record_data
+    product_id = idx + 1
+    asin = record.get('asin', f'P{product_id}')
+    title = record.get('title', '')
+    brand = record.get('brand', '')
+    
+    try:
         if step2_result['success']:
             # Check if LLM detected it as REMOVE (non-supplement)
             if step2_result['data'].get('category') == 'REMOVE':
@@ -893,29 +1559,40 @@ def process_llm_only(record_data):
             return (error_result, True)
             
     except Exception as e:
-        # Unexpected error
-        error_result = create_result_dict(
-            asin=asin,
-            title=title,
-            brand=brand,
-            category='ERROR',
-            subcategory='ERROR',
-            reasoning=f"Processing Error: {str(e)}"
-        )
-        
-        log_manager.save_audit_json(
-            step_name='step2_llm',
-            data={
-                'product_id': product_id,
-                'asin': asin,
-                'error': str(e)
-            },
-            filename=f'{asin}.json'
-        )
-        
-        db.put_record(asin=asin, run_id=run_id, status='error', data={'error': str(e)})
-        
-        return (error_result, True)
+        return _llm_only_error(record_data, e)
+
+
+def _llm_only_error(record_data, e: Exception):
+    """Record an unexpected Step 2 processing error"""
+    idx, record, log_manager, db, run_id = record_data
+    product_id = idx + 1
+    asin = record.get('asin', f'P{product_id}')
+    title = record.get('title', '')
+    brand = record.get('brand', '')
+    
+    # Unexpected error
+    error_result = create_result_dict(
+        asin=asin,
+        title=title,
+        brand=brand,
+        category='ERROR',
+        subcategory='ERROR',
+        reasoning=f"Processing Error: {str(e)}"
+    )
+    
+    log_manager.save_audit_json(
+        step_name='step2_llm',
+        data={
+            'product_id': product_id,
+            'asin': asin,
+            'error': str(e)
+        },
+        filename=f'{asin}.json'
+    )
+    
+    db.put_record(asin=asin, run_id=run_id, status='error', data={'error': str(e)})
+    
+    return (error_result, True)
 
 
 def process_single_product(record_data):
@@ -989,7 +1666,8 @@ def process_single_product(record_data):
             return (filter_result, 1, None)  # Return result for CSV, count as filtered
         
         # Step 2: LLM extraction
-        llm_result = extract_llm_attributes(title, asin, product_id, log_manager)
+        llm_result = extract_llm_attributes(title, asin, product_id, log_manager,
+                                            lookup_action=step1_result.get('action'))
         
         if not llm_result['success']:
             # Error - create error result for CSV
@@ -1323,15 +2001,23 @@ def process_aws_mode(
                     filename=f'{asin}.json'
                 )
             else:
-                # Passed filter - queue for LLM processing
+                # Passed filter - queue for LLM processing (the Step 1 action feeds model routing)
+                record['lookup_action'] = step1_result.get('action')
                 llm_needed_tasks.append((idx, record, log_manager, db, run_folder))
         
         llm_count = len(llm_needed_tasks)
         print(f"✓ Step 1 complete: {filtered_count:,} filtered, {llm_count:,} need LLM enrichment")
         
-        # STEP 2: Process LLM-needed products with 200 parallel workers
+        # STEP 2: Process LLM-needed products in parallel (threads or asyncio)
         if llm_count > 0:
-            print(f"\nSTEP 2: LLM enrichment for {llm_count:,} products with 200 parallel workers...")
+            llm_config = get_llm_config()
+            step2_engine = llm_config.engine
+            step2_workers = llm_config.concurrency or 200
+            get_concurrency_limiter(step2_workers)  # Ceiling for the adaptive in-flight limit
+            if llm_config.llm_mode == 'batch':
+                print(f"\nSTEP 2: LLM enrichment for {llm_count:,} products via OpenAI Batch API...")
+            else:
+                print(f"\nSTEP 2: LLM enrichment for {llm_count:,} products with {step2_workers} parallel workers ({step2_engine} engine)...")
             print(f"Starting parallel processing... (progress updates every 100 products)")
             
             # Track overall processing status in DynamoDB
@@ -1351,50 +2037,81 @@ def process_aws_mode(
             )
             
             processed_count = 0
-            with ThreadPoolExecutor(max_workers=200) as executor:
-                futures = {executor.submit(process_llm_only, task): task[0] for task in llm_needed_tasks}
+            
+            def record_llm_outcome(outcome):
+                """Collect one Step 2 outcome and emit progress/heartbeat"""
+                nonlocal processed_count, error_count
+                result, error = outcome
                 
-                # Progress bar
-                with tqdm(total=llm_count, desc="LLM Processing", unit="product") as pbar:
-                    for future in as_completed(futures):
-                        result, error = future.result()
-                        
-                        if result:
-                            results.append(result)
-                        if error:
-                            error_count += 1
-                        
-                        processed_count += 1
-                        pbar.update(1)
-                        
-                        # CloudWatch progress updates every 100 products
-                        if processed_count % 100 == 0:
-                            progress_pct = round((processed_count / llm_count) * 100, 1)
-                            enriched_count = processed_count - error_count
-                            print(f"Progress: {processed_count:,}/{llm_count:,} ({progress_pct}%) | Enriched: {enriched_count:,} | Errors: {error_count}")
-                            
-                            # Update DynamoDB heartbeat
-                            db.put_record(
-                                asin=processing_key,
-                                run_id=run_folder,
-                                status='in_progress',
-                                data={
-                                    'total': total_records,
-                                    'filtered': filtered_count,
-                                    'llm_needed': llm_count,
-                                    'llm_processed': processed_count,
-                                    'enriched': enriched_count,
-                                    'errors': error_count,
-                                    'progress_pct': progress_pct,
-                                    'last_update': datetime.now().isoformat()
-                                }
-                            )
+                if result:
+                    results.append(result)
+                if error:
+                    error_count += 1
+                
+                processed_count += 1
+                
+                # CloudWatch progress updates every 100 products
+                if processed_count % 100 == 0:
+                    progress_pct = round((processed_count / llm_count) * 100, 1)
+                    enriched_count = processed_count - error_count
+                    print(f"Progress: {processed_count:,}/{llm_count:,} ({progress_pct}%) | Enriched: {enriched_count:,} | Errors: {error_count} | {concurrency_status()}")
+                    
+                    # Update DynamoDB heartbeat
+                    db.put_record(
+                        asin=processing_key,
+                        run_id=run_folder,
+                        status='in_progress',
+                        data={
+                            'total': total_records,
+                            'filtered': filtered_count,
+                            'llm_needed': llm_count,
+                            'llm_processed': processed_count,
+                            'enriched': enriched_count,
+                            'errors': error_count,
+                            'progress_pct': progress_pct,
+                            'concurrency_limit': get_concurrency_stats().get('current_limit'),
+                            'last_update': datetime.now().isoformat()
+                        }
+                    )
+            
+            if llm_config.llm_mode == 'batch':
+                # Offline: one multi-round Batch API job, then the usual audit/DynamoDB writes
+                items = [
+                    {'product_id': idx + 1, 'asin': record.get('asin', f'P{idx + 1}'), 'title': record.get('title', '')}
+                    for idx, record, *_ in llm_needed_tasks
+                ]
+                llm_results = extract_llm_attributes_batch(items, log_manager)
+                for task, item in zip(llm_needed_tasks, items):
+                    step2_result = _build_step2_result(llm_results[item['product_id']], item['asin'], log_manager)
+                    record_llm_outcome(_finish_llm_only(task, step2_result))
+            elif step2_engine == 'async':
+                run_async_engine(llm_needed_tasks, process_llm_only_async, step2_workers,
+                                 desc="LLM Processing", unit="product", on_result=record_llm_outcome,
+                                 status=concurrency_status)
+            else:
+                with ThreadPoolExecutor(max_workers=step2_workers) as executor:
+                    futures = {executor.submit(process_llm_only, task): task[0] for task in llm_needed_tasks}
+                    
+                    # Progress bar
+                    with tqdm(total=llm_count, desc="LLM Processing", unit="product") as pbar:
+                        for future in as_completed(futures):
+                            record_llm_outcome(future.result())
+                            pbar.set_postfix_str(concurrency_status(), refresh=False)
+                            pbar.update(1)
             
             # Final progress message
             print(f"\n✓ LLM processing complete!")
             print(f"   Total processed: {processed_count:,}/{llm_count:,}")
             print(f"   Enriched: {processed_count - error_count:,}")
             print(f"   Errors: {error_count}")
+            concurrency_stats = get_concurrency_stats()
+            if concurrency_stats['enabled']:
+                print(f"   Concurrency limit: {concurrency_stats['current_limit']} (peak {concurrency_stats['peak_limit']}, {concurrency_stats['decreases']} decreases)")
+            retry_stats = get_retry_stats()
+            print(f"   Retries: {retry_stats['retries']:,} (gave up {retry_stats['gave_up']:,}) | Circuit breaker opened {retry_stats['breaker']['opens']}x")
+            hedge_stats = get_hedge_stats()
+            if hedge_stats['enabled']:
+                print(f"   Hedges: {hedge_stats['hedges']:,} of {hedge_stats['calls']:,} calls | p99 {hedge_stats['p99_sec']}s (unhedged {hedge_stats['p99_unhedged_sec']}s)")
         else:
             print(f"\n✓ All products filtered - no LLM calls needed!")
         
@@ -1540,7 +2257,63 @@ if __name__ == '__main__':
         # AWS mode arguments
         parser.add_argument('--input-key', help='S3 input key (AWS mode)')
         
+        # Step 2 engine arguments (default from STEP2_ENGINE / LLM_CONCURRENCY env vars)
+        parser.add_argument('--engine', choices=['threads', 'async'], default=None,
+                           help='Step 2 fan-out: threads (ThreadPoolExecutor) or async (asyncio)')
+        parser.add_argument('--concurrency', type=int, default=None,
+                           help='Max parallel LLM calls (default: 1000 local, 200 AWS)')
+        
+        # Response cache arguments (default from LLM_CACHE env var)
+        cache_group = parser.add_mutually_exclusive_group()
+        cache_group.add_argument('--no-cache', action='store_const', const='off', dest='cache_mode',
+                                help='Bypass the persistent LLM response cache')
+        cache_group.add_argument('--refresh-cache', action='store_const', const='refresh', dest='cache_mode',
+                                help='Ignore cached responses and overwrite them with fresh results')
+        
+        parser.add_argument('--llm-mode', choices=['realtime', 'batch'], default=None,
+                           help='Step 2 transport: realtime (interactive) or batch (OpenAI Batch API, 50%% cheaper, up to 24h)')
+        parser.add_argument('--rules-mode', choices=['tools', 'local'], default=None,
+                           help='Business rules + post-processing: tools (LLM tool calls) or local (in-process, fewer round trips)')
+        parser.add_argument('--api', choices=['chat', 'responses'], default=None,
+                           help='Tool-loop API: chat (chat.completions) or responses (server-side state, rounds send only new tool outputs)')
+        parser.add_argument('--pack-size', type=int, default=None,
+                           help='Classify up to K titles per LLM request (1 = off; adapts between 1 and LLM_PACK_MAX_SIZE)')
+        parser.add_argument('--no-dedup', action='store_false', dest='dedup', default=None,
+                           help='Send every record to the LLM even if its title duplicates another')
+        parser.add_argument('--prescan', action='store_true', dest='ingredient_prescan', default=None,
+                           help='Pre-resolve unambiguous title ingredients and list them in the prompt (fewer lookup round trips)')
+        parser.add_argument('--batch-lookup', action='store_true', dest='batch_lookup', default=None,
+                           help='Offer lookup_ingredients so the LLM looks up all title ingredients in one tool call')
+        parser.add_argument('--lean-output', action='store_const', const='lean', dest='output_mode', default=None,
+                           help='Lean final answer: values and short codes only, no per-attribute reasoning (fewer output tokens)')
+        parser.add_argument('--compact-tool-results', action='store_true', dest='compact_tool_results', default=None,
+                           help='Send compact tool results (profiled fields, trimmed candidates) back to the LLM (fewer prompt tokens)')
+        parser.add_argument('--route-models', action='store_true', dest='route_models', default=None,
+                           help='Send simple titles to the cheaper LLM_ROUTE_SIMPLE_MODEL tier (escalated to OPENAI_MODEL if the answer fails validation)')
+        parser.add_argument('--latency-preset', choices=['fast', 'balanced', 'thorough'], default=None,
+                           help='reasoning_effort / max_completion_tokens per tool-loop round (fast = minimal effort, thorough = deeper final reasoning)')
+        parser.add_argument('--shadow-rate', type=float, default=None,
+                           help='Also send this fraction of titles (0-1) to the shadow model / prompt variant and report agreement, latency and cost (outputs unchanged)')
+        parser.add_argument('--shadow-model', default=None,
+                           help='Model for shadow evaluation (default LLM_SHADOW_MODEL, else the primary model)')
+        parser.add_argument('--hedge', action='store_true', dest='hedge', default=None,
+                           help='Duplicate LLM calls that outlive the p95 latency (first answer wins, capped by LLM_HEDGE_MAX_RATIO)')
+        parser.add_argument('--retry-errors', metavar='RUN_ID', default=None,
+                           help='Re-process only the dead letters of an earlier run (e.g. run_3) and patch its outputs (local mode)')
+        parser.add_argument('--no-redrive', action='store_false', dest='dlq_redrive', default=None,
+                           help='Do not re-drive failed records after the main pass (they are still saved as dead letters)')
+        parser.add_argument('--deadline', default=None,
+                           help='Finish by this time (45m, 2h, 17:30 or ISO datetime): concurrency adapts, late records are deferred to --retry-errors (local realtime mode)')
+        
         args = parser.parse_args()
+        configure_llm(engine=args.engine, concurrency=args.concurrency, cache_mode=args.cache_mode,
+                      dedup=args.dedup, llm_mode=args.llm_mode, pack_size=args.pack_size,
+                      rules_mode=args.rules_mode, ingredient_prescan=args.ingredient_prescan,
+                      dlq_redrive=args.dlq_redrive, hedge=args.hedge, output_mode=args.output_mode, api=args.api,
+                      compact_tool_results=args.compact_tool_results, batch_lookup=args.batch_lookup,
+                      route_models=args.route_models, latency_preset=args.latency_preset,
+                      shadow_rate=args.shadow_rate, shadow_model=args.shadow_model,
+                      run_deadline=parse_deadline(args.deadline) if args.deadline else None)
         
         if args.mode == 'aws':
             # AWS mode - use env vars (set by ECS task)
@@ -1556,6 +2329,12 @@ if __name__ == '__main__':
                 print("ERROR: S3_BUCKET and INPUT_KEY are required for AWS mode")
                 sys.exit(1)
             
+            # Shadow answers are compared against the local final records only -
+            # in AWS mode they would be paid for and never reported
+            if get_llm_config().shadow_rate > 0:
+                print("⚠️  Shadow evaluation (LLM_SHADOW_RATE / --shadow-rate) is local mode only - disabled")
+                configure_llm(shadow_rate=0.0)
+            
             process_aws_mode(
                 s3_bucket=S3_BUCKET,
                 input_key=INPUT_KEY,
@@ -1565,17 +2344,15 @@ if __name__ == '__main__':
                 dynamodb_table=DYNAMODB_TABLE,
                 sns_topic_arn=SNS_TOPIC_ARN
             )
+        elif args.retry_errors:
+            # Local mode - only the dead letters of an earlier run
+            if not args.input_file:
+                print("ERROR: --retry-errors needs the input file of the run (for its file ID)")
+                sys.exit(1)
+            retry_dead_letters(args.input_file, args.retry_errors)
         else:
-            # Local mode - existing behavior
-            # Override INPUT_FILE if provided via command line
-            if args.input_file:
-                # Temporarily set sys.argv for main() to read
-                original_argv = sys.argv
-                sys.argv = ['main.py', args.input_file]
-                main()
-                sys.argv = original_argv
-            else:
-                main()
+            # Local mode - existing behavior (default input file when none is given)
+            main(args.input_file)
     
     except Exception as e:
         # Emergency error logging - catches ANY error including startup failures
@@ -0,0 +1,77 @@
+"""
+Async Step 2 Engine - asyncio alternative to the ThreadPoolExecutor fan-out
+
+Step 2 workers spend almost all their time waiting on HTTP. Running them as
+coroutines on one event loop (bounded by a semaphore) keeps thousands of
+requests in flight without one OS thread - and its stack - per request.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional
+from tqdm import tqdm
+
+
+async def _run_bounded(
+    items: List[Any],
+    worker: Callable[[Any], Awaitable[Any]],
+    concurrency: int,
+    desc: str,
+    unit: str,
+    on_result: Optional[Callable[[Any], None]],
+    status: Optional[Callable[[], str]]
+) -> List[Any]:
+    """Run worker(item) for every item with at most `concurrency` in flight"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(item):
+        async with semaphore:
+            return await worker(item)
+
+    tasks = [asyncio.create_task(run_one(item)) for item in items]
+    results = []
+
+    with tqdm(total=len(tasks), desc=desc, unit=unit) as pbar:
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                result = await next_done
+            except Exception as e:
+                print(f"  ⚠️  Task failed: {e}")
+                pbar.update(1)
+                continue
+
+            results.append(result)
+            if on_result:
+                on_result(result)
+            if status:
+                pbar.set_postfix_str(status(), refresh=False)
+            pbar.update(1)
+
+    return results
+
+
+def run_async_engine(
+    items: List[Any],
+    worker: Callable[[Any], Awaitable[Any]],
+    concurrency: int,
+    desc: str = "  Processing",
+    unit: str = "record",
+    on_result: Optional[Callable[[Any], None]] = None,
+    status: Optional[Callable[[], str]] = None
+) -> List[Any]:
+    """
+    Process items with an async worker on a fresh event loop
+
+    Args:
+        items: Work items (records or task tuples)
+        worker: Coroutine function called once per item
+        concurrency: Max coroutines in flight (semaphore bound)
+        desc: Progress bar label
+        unit: Progress bar unit
+        on_result: Optional callback for each completed result (progress/heartbeat)
+        status: Optional callable whose text is shown after the progress bar
+
+    Returns:
+        Results in completion order (failed tasks are reported and skipped,
+        same as the ThreadPoolExecutor path)
+    """
+    return asyncio.run(_run_bounded(items, worker, max(1, concurrency), desc, unit, on_result, status))
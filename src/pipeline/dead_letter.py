@@ -0,0 +1,130 @@
+"""
+Dead-Letter Queue - Second pass for records that failed Step 2
+
+Records that still fail after every retry (API gave up, malformed answers,
+unexpected exceptions) are collected as dead letters instead of only
+ending up as 'error' rows:
+  1. after the main pass they are re-driven once more with a few workers,
+     a longer read timeout and packing off - the CSV and final audit rows
+     are then patched in place
+  2. whatever still fails is written to dead_letters.json in the run's
+     audit folder, so `--retry-errors run_N` can process only those records
+     later instead of re-running the whole file
+"""
+
+import json
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from src.llm.llm_config import get_llm_config, configure_llm
+from src.pipeline.step2_llm import reset_llm_client
+
+
+DEAD_LETTER_FILE = 'dead_letters.json'
+
+
+def _json_safe(value: Any) -> Any:
+    """Input-record value as plain JSON (NaN from empty CSV cells -> '')"""
+    if isinstance(value, float) and value != value:
+        return ''
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+class DeadLetterQueue:
+    """Failed records of one run, keyed by product_id (thread-safe)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[int, Dict[str, Any]] = {}
+
+    def add(self, product_id: int, record: Dict[str, Any], error: str, step_completed: int = 0,
+            status: str = 'error'):
+        """Add (or re-add after another failed attempt) a record (status: 'error' or 'deferred')"""
+        with self._lock:
+            previous = self._entries.get(product_id)
+            self._entries[product_id] = {
+                'product_id': product_id,
+                'asin': record.get('asin', f'P{product_id}'),
+                'title': record.get('title', ''),
+                'error': error,
+                'status': status,
+                'step_completed': step_completed,
+                'attempts': previous['attempts'] + 1 if previous else 1,
+                'failed_at': datetime.utcnow().isoformat(),
+                'record': {key: _json_safe(value) for key, value in record.items()}
+            }
+
+    def add_result(self, result: Dict[str, Any], record: Dict[str, Any]):
+        """Add an 'error' / 'deferred' result from process_single_record()"""
+        self.add(result['product_id'], record, result.get('error', 'Unknown error'), result.get('step_completed', 0),
+                 result.get('status', 'error'))
+
+    def remove(self, product_id: int):
+        with self._lock:
+            self._entries.pop(product_id, None)
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """Dead letters in input order"""
+        with self._lock:
+            return [self._entries[product_id] for product_id in sorted(self._entries)]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def save(self, audit_path: Path, stats: Optional[Dict[str, Any]] = None) -> Path:
+        """Write dead_letters.json into a run's audit folder (also when empty)"""
+        path = Path(audit_path) / DEAD_LETTER_FILE
+        entries = self.entries()
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'generated_at': datetime.utcnow().isoformat(),
+                'count': len(entries),
+                'stats': stats or {},
+                'dead_letters': entries
+            }, f, indent=2)
+        return path
+
+    @classmethod
+    def load(cls, audit_path: Path) -> Optional['DeadLetterQueue']:
+        """Read a run's dead_letters.json (None if the run has none)"""
+        path = Path(audit_path) / DEAD_LETTER_FILE
+        if not path.exists():
+            return None
+
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        queue = cls()
+        for entry in data.get('dead_letters', []):
+            queue._entries[int(entry['product_id'])] = entry
+        return queue
+
+
+@contextmanager
+def redrive_settings():
+    """
+    Gentler LLM settings for a dead-letter pass (restored afterwards)
+
+    Longer read timeout (the client is rebuilt to pick it up), twice the
+    per-product deadline and packing off, so a slow or oversized pack
+    cannot fail the same records again.
+    Concurrency is bounded by the caller's worker count.
+    """
+    config = get_llm_config()
+    saved = {'read_timeout': config.read_timeout, 'pack_size': config.pack_size,
+             'product_deadline_sec': config.product_deadline_sec}
+
+    configure_llm(read_timeout=max(config.read_timeout, config.dlq_read_timeout), pack_size=1,
+                  product_deadline_sec=config.product_deadline_sec * 2)
+    reset_llm_client()
+    try:
+        yield config
+    finally:
+        configure_llm(**saved)
+        reset_llm_client()
@@ -0,0 +1,162 @@
+"""
+Run Deadline - Finish a file by a wall-clock target (--deadline)
+
+Every product already has its own time budget (LLM_PRODUCT_DEADLINE_SEC);
+with a run deadline that budget is also capped at the target, and the
+scheduler steers the run towards it:
+  - the average LLM record time is measured as records complete (Step 1
+    filtered records finish instantly and only shrink the work); by Little's
+    law the rest of the file needs remaining * avg_time / time_left records
+    in flight, which becomes the floor of the adaptive concurrency limit
+    (AIMD cuts stop there)
+  - if even the ceiling cannot make it, a warning with the projected number
+    of deferred records is printed once
+  - records still unfinished at the target fail fast and are reported as
+    'deferred' - they go to the dead letters for `--retry-errors`
+"""
+
+import math
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from src.llm.concurrency import AdaptiveConcurrencyLimiter
+from src.utils.result_builder import build_deferred_result
+
+
+# Work is planned against this share of the time left (headroom for stragglers)
+DEADLINE_SAFETY = 0.85
+
+# Completed LLM records before the average record time is trusted
+MIN_COMPLETED = 5
+
+# Weight of the newest record time in the moving average
+RECORD_TIME_ALPHA = 0.1
+
+_DURATION = re.compile(r'^(?:(\d+(?:\.\d+)?)h)?(?:(\d+(?:\.\d+)?)m)?(?:(\d+(?:\.\d+)?)s)?$')
+
+
+def parse_deadline(text: str, now: Optional[datetime] = None) -> float:
+    """
+    Deadline as Unix time from a CLI value
+
+    Accepts a duration ('45m', '2h', '1h30m', '90s'), a time of day ('17:30',
+    tomorrow if already past) or an ISO datetime ('2026-01-31T18:00').
+
+    Raises:
+        ValueError for anything else (or an ISO datetime in the past)
+    """
+    now = now or datetime.now()
+    value = text.strip().lower()
+
+    match = _DURATION.match(value)
+    if value and match and any(match.groups()):
+        hours, minutes, seconds = (float(part or 0) for part in match.groups())
+        return (now + timedelta(hours=hours, minutes=minutes, seconds=seconds)).timestamp()
+
+    for fmt in ('%H:%M', '%H:%M:%S'):
+        try:
+            clock = datetime.strptime(value, fmt).time()
+        except ValueError:
+            continue
+        target = datetime.combine(now.date(), clock)
+        if target <= now:
+            target += timedelta(days=1)
+        return target.timestamp()
+
+    try:
+        target = datetime.fromisoformat(text.strip())
+    except ValueError:
+        raise ValueError(f"Invalid deadline '{text}' (use e.g. 45m, 2h, 17:30 or 2026-01-31T18:00)")
+    if target <= now:
+        raise ValueError(f"Deadline {target.isoformat()} has already passed")
+    return target.timestamp()
+
+
+class DeadlineScheduler:
+    """Adapts the concurrency floor to a run deadline and tracks deferred records (thread-safe)"""
+
+    def __init__(self, deadline: float, total_records: int, limiter: AdaptiveConcurrencyLimiter):
+        self.deadline = deadline
+        self.total_records = total_records
+        self.limiter = limiter
+        self.started_at = time.time()
+
+        self._lock = threading.Lock()
+        self._completed = 0  # Records that went through the LLM
+        self._filtered = 0
+        self._avg_record_sec = None
+        self._deferred: List[str] = []
+        self._warned = False
+        self._stats = {'floor_raises': 0, 'peak_floor': limiter.min_limit, 'projected_deferred': 0}
+
+    def time_left(self) -> float:
+        return self.deadline - time.time()
+
+    def on_result(self, result: Dict[str, Any]):
+        """Count a finished record and re-plan the concurrency floor"""
+        with self._lock:
+            if str(result.get('status', '')).startswith('filtered'):
+                self._filtered += 1
+                return
+            self._completed += 1
+            seconds = float(result.get('processing_time_sec') or 0)
+            if self._avg_record_sec is None:
+                self._avg_record_sec = seconds
+            else:
+                self._avg_record_sec += RECORD_TIME_ALPHA * (seconds - self._avg_record_sec)
+            completed, remaining = self._completed, self.total_records - self._filtered - self._completed
+            avg_record_sec = self._avg_record_sec
+        if completed >= MIN_COMPLETED:
+            self._adapt(avg_record_sec, remaining)
+
+    def _adapt(self, avg_record_sec: float, remaining: int):
+        time_left = self.time_left()
+        if remaining <= 0 or avg_record_sec <= 0 or time_left <= 0:
+            return
+
+        floor = math.ceil(remaining * avg_record_sec / (time_left * DEADLINE_SAFETY))
+
+        previous = self.limiter.min_limit
+        self.limiter.set_floor(floor)
+        with self._lock:
+            if self.limiter.min_limit > previous:
+                self._stats['floor_raises'] += 1
+                self._stats['peak_floor'] = max(self._stats['peak_floor'], self.limiter.min_limit)
+
+            if floor > self.limiter.max_limit and not self._warned:
+                # Infeasible even at the ceiling - project how many records will not make it
+                projected = max(0, int(remaining - self.limiter.max_limit * time_left / avg_record_sec))
+                self._stats['projected_deferred'] = projected
+                self._warned = True
+                print(f"\n⏰ Deadline not reachable at the {self.limiter.max_limit} concurrency ceiling: "
+                      f"~{projected:,} of {remaining:,} remaining records will be deferred")
+
+    def is_deferred(self, result: Dict[str, Any]) -> bool:
+        """True for a record that failed because the run deadline cut its time budget"""
+        return (result['status'] == 'error' and self.time_left() <= 1
+                and str(result.get('error', '')).startswith('Deadline exceeded'))
+
+    def defer(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Mark a record as deferred to a later --retry-errors run"""
+        with self._lock:
+            self._deferred.append(result['asin'])
+        return build_deferred_result(result, result.get('error', ''))
+
+    def stats(self) -> Dict[str, Any]:
+        """Deadline outcome for the run manifest"""
+        with self._lock:
+            stats = dict(self._stats)
+            deferred = list(self._deferred)
+        finished_at = time.time()
+        stats.update({
+            'enabled': True,
+            'deadline': datetime.fromtimestamp(self.deadline).isoformat(timespec='seconds'),
+            'met': finished_at <= self.deadline and not deferred,
+            'margin_sec': round(self.deadline - finished_at, 1),
+            'deferred': len(deferred),
+            'deferred_asins': deferred
+        })
+        return stats
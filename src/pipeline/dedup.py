@@ -0,0 +1,193 @@
+"""
+Title Dedup - Collapse duplicate titles into one LLM request per run
+
+Amazon exports list the same product under several ASINs, often with
+titles that differ only in case, punctuation or pack-size wording
+("60 Ct" vs "60 count", "Pack of 2" vs "2 Pack"). Records are grouped on a
+canonical title key between Step 1 and Step 2:
+  - the first record of a group (leader) makes the LLM request
+  - every other member (follower) waits for and reuses the leader's result
+  - each ASIN still gets its own audit files and output row
+
+Numbers are kept in the key, so genuinely different pack sizes still get
+their own request.
+"""
+
+import copy
+import re
+import threading
+import unicodedata
+from concurrent.futures import Future
+from typing import Any, Dict, Optional, Tuple
+
+from src.llm.gpt_client import zero_usage_metadata
+from src.llm.llm_config import get_llm_config
+
+
+# Pack-size / unit wording variants -> one spelling
+_UNIT_SYNONYMS = [
+    (r'\b(?:ct|cnt|count|counts)\b', 'count'),
+    (r'\b(?:pk|pck|pack|packs)\b', 'pack'),
+    (r'\b(?:caps|capsule|capsules)\b', 'capsules'),
+    (r'\b(?:tab|tabs|tablet|tablets)\b', 'tablets'),
+    (r'\b(?:softgel|softgels|soft gels?)\b', 'softgels'),
+    (r'\b(?:oz|ounce|ounces)\b', 'oz'),
+    (r'\b(?:fl oz|fluid oz)\b', 'fl oz'),
+    (r'\b(?:lb|lbs|pound|pounds)\b', 'lb'),
+    (r'\b(?:mg|milligram|milligrams)\b', 'mg'),
+    (r'\b(?:mcg|microgram|micrograms)\b', 'mcg'),
+    (r'\b(?:g|gram|grams)\b', 'g'),
+]
+_UNIT_PATTERNS = [(re.compile(pattern), replacement) for pattern, replacement in _UNIT_SYNONYMS]
+
+# "pack of 2" -> "2 pack"
+_PACK_OF = re.compile(r'\bpack of (\d+)\b')
+
+# "60count" -> "60 count"
+_NUMBER_UNIT = re.compile(r'(\d)([a-z])')
+
+
+def canonical_title(title: str) -> str:
+    """
+    Canonical title key for dedup grouping
+
+    Case, punctuation, whitespace and pack-size wording are normalized;
+    numbers and word order are kept.
+    """
+    text = unicodedata.normalize('NFKC', str(title or '')).lower()
+    text = re.sub(r'(\d)[.,](\d)', r'\1_\2', text)  # Protect decimals ("2.5 oz")
+    text = re.sub(r'[^\w\s]', ' ', text)
+    text = text.replace('_', '.')
+    text = _NUMBER_UNIT.sub(r'\1 \2', text)
+    text = ' '.join(text.split())
+
+    for pattern, replacement in _UNIT_PATTERNS:
+        text = pattern.sub(replacement, text)
+    text = _PACK_OF.sub(r'\1 pack', text)
+
+    return ' '.join(text.split())
+
+
+class TitleCoalescer:
+    """
+    Single-flight grouping of Step 2 requests by canonical title
+
+    Thread-safe; async callers await the same concurrent Future via
+    asyncio.wrap_future(), so both Step 2 engines share one implementation.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._groups: Dict[str, Future] = {}
+        self._leaders: Dict[str, str] = {}
+        self._stats = {
+            'records': 0,
+            'groups': 0,
+            'followers': 0,
+            'saved_cost': 0.0,
+            'saved_tokens': 0
+        }
+
+    def claim(self, title: str, asin: str) -> Tuple[str, Future, bool]:
+        """
+        Join the group for a title
+
+        Returns:
+            (group_key, future, is_leader) - the leader must call resolve();
+            followers wait on the future and pass its result to share()
+        """
+        key = canonical_title(title)
+
+        with self._lock:
+            self._stats['records'] += 1
+            future = self._groups.get(key)
+            if future is not None:
+                return key, future, False
+
+            future = Future()
+            self._groups[key] = future
+            self._leaders[key] = asin
+            self._stats['groups'] += 1
+            return key, future, True
+
+    def resolve(self, key: str, result: Dict[str, Any]):
+        """Publish the leader's result (failures are not reused by later records)"""
+        with self._lock:
+            future = self._groups.get(key)
+            if not result.get('success'):
+                self._groups.pop(key, None)
+                self._leaders.pop(key, None)
+
+        # Resolved outside the lock - done-callbacks may run inline
+        if future is not None and not future.done():
+            future.set_result(result)
+
+    def share(self, key: str, leader_result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Copy the leader's result for a follower
+
+        Returns:
+            Step 2 success dict with spend zeroed and _metadata['dedup'] set,
+            or None if the leader failed (follower should make its own request)
+        """
+        if not leader_result.get('success'):
+            return None
+
+        llm_result = copy.deepcopy(leader_result['data'])
+        metadata = llm_result.setdefault('_metadata', {})
+        leader_cost = metadata.get('total_cost', 0) or 0
+        leader_tokens = metadata.get('tokens_used', {}).get('total', 0) or 0
+
+        zero_usage_metadata(metadata)
+        metadata.pop('cache', None)
+        metadata['dedup'] = {
+            'follower': True,
+            'group_key': key,
+            'leader_asin': self._leaders.get(key),
+            'saved_cost': leader_cost,
+            'saved_tokens': leader_tokens
+        }
+
+        with self._lock:
+            self._stats['followers'] += 1
+            self._stats['saved_cost'] += leader_cost
+            self._stats['saved_tokens'] += leader_tokens
+
+        return {'success': True, 'data': llm_result}
+
+    def stats(self) -> Dict[str, Any]:
+        """Dedup counts and savings for the run manifest"""
+        with self._lock:
+            stats = dict(self._stats)
+
+        stats['enabled'] = True
+        stats['saved_cost'] = round(stats['saved_cost'], 6)
+        stats['llm_requests'] = stats['records'] - stats['followers']
+        stats['dedup_ratio'] = round(stats['followers'] / stats['records'], 4) if stats['records'] else 0
+        return stats
+
+
+# Global instance (lazy loaded)
+_coalescer = None
+_coalescer_lock = threading.Lock()
+
+
+def get_title_coalescer() -> Optional[TitleCoalescer]:
+    """Get the process-wide title coalescer (None when dedup is off)"""
+    global _coalescer
+
+    if not get_llm_config().dedup:
+        return None
+
+    if _coalescer is None:
+        with _coalescer_lock:
+            if _coalescer is None:
+                _coalescer = TitleCoalescer()
+
+    return _coalescer
+
+
+def get_dedup_stats() -> Dict[str, Any]:
+    """Stats for the run manifest ({'enabled': False} when dedup is off)"""
+    coalescer = get_title_coalescer()
+    return coalescer.stats() if coalescer else {'enabled': False}
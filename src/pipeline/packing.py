@@ -0,0 +1,279 @@
+"""
+Multi-Product Packing - Classify K titles per LLM request
+
+Every product otherwise pays for the full instruction prompt. Workers hand
+their title to a shared dispatcher which groups up to K waiting titles into
+ONE request (same rules from prompt_builder, K "ASIN | Title" lines at the
+end) and splits the {"products": [...]} answer back into per-product results.
+
+Safety:
+  - every member is validated; if ANY member is missing or malformed, the
+    whole pack falls back to single-product calls (its spend is billed to
+    the run total, see get_pack_stats)
+  - K adapts: grows by 1 after a clean pack, halves after a failed one
+"""
+
+import copy
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from src.llm.llm_config import get_llm_config
+
+
+# Fields every packed member must carry before it is accepted
+REQUIRED_MEMBER_FIELDS = ['age', 'gender', 'form', 'organic', 'ingredients']
+
+
+class PackSizeController:
+    """Adaptive pack size: additive increase on success, halve on failure"""
+
+    def __init__(self, initial: int, maximum: int, adaptive: bool = True):
+        self.maximum = max(1, maximum)
+        self.size = max(1, min(initial, self.maximum))
+        self.adaptive = adaptive
+        self._lock = threading.Lock()
+
+    def on_success(self):
+        if self.adaptive:
+            with self._lock:
+                self.size = min(self.maximum, self.size + 1)
+
+    def on_failure(self):
+        if self.adaptive:
+            with self._lock:
+                self.size = max(1, self.size // 2)
+
+
+def validate_member(member: Any, require_rules: bool = True) -> bool:
+    """Check one packed product answer has everything Step 2/3 needs"""
+    if not isinstance(member, dict) or not member.get('asin'):
+        return False
+    for field in REQUIRED_MEMBER_FIELDS:
+        if field not in member:
+            return False
+    if not require_rules:
+        # Business rules are applied locally after the response
+        return True
+    business_rules = member.get('business_rules')
+    return isinstance(business_rules, dict) and 'final_category' in business_rules
+
+
+def split_pack_result(llm_result: Dict[str, Any], pack: List[Dict[str, Any]],
+                      require_rules: bool = True) -> Optional[List[Dict[str, Any]]]:
+    """
+    Split a packed answer into per-product results (same order as pack)
+
+    Token usage and cost are divided evenly; each member keeps the tool calls
+    made for its own title plus the (unattributable) ingredient lookups and
+    tool errors.
+
+    Returns:
+        List of per-product llm_results, or None if any member is invalid
+    """
+    if 'error' in llm_result or not isinstance(llm_result.get('products'), list):
+        return None
+
+    by_asin = {}
+    for member in llm_result['products']:
+        if validate_member(member, require_rules):
+            by_asin[str(member['asin']).strip()] = member
+
+    if any(item['asin'] not in by_asin for item in pack):
+        return None
+
+    metadata = llm_result.get('_metadata', {})
+    tokens = metadata.get('tokens_used', {})
+    breakdown = metadata.get('cost_breakdown', {})
+    tool_calls = metadata.get('tool_calls') or []
+    count = len(pack)
+
+    members = []
+    for index, item in enumerate(pack):
+        member = copy.deepcopy(by_asin[item['asin']])
+        member.pop('asin', None)
+
+        own_calls = [
+            call for call in tool_calls
+            # Tool-error records keep the raw argument string - shared like the lookups
+            if not isinstance(call.get('arguments'), dict) or call['arguments'].get('title') in (None, item['title'])
+        ]
+        member['_metadata'] = {
+            'model': metadata.get('model'),
+            'reasoning_effort': metadata.get('reasoning_effort'),
+            'effort': metadata.get('effort'),  # Rounds of the whole pack - shared like round_trips
+            'tokens_used': {key: _share(value, count, index) for key, value in tokens.items()},
+            'total_cost': metadata.get('total_cost', 0) / count,
+            'cost_breakdown': {
+                key: (value / count if isinstance(value, float) else _share(value, count, index))
+                for key, value in breakdown.items()
+            },
+            'pricing': metadata.get('pricing'),
+            'tool_calls': own_calls or None,
+            'round_trips': metadata.get('round_trips', 1),  # Shared by the whole pack
+            'latency_sec': metadata.get('latency_sec'),  # Every member waited the whole call
+            'api': metadata.get('api'),
+            'request_chars': _share(metadata['request_chars'], count, index) if metadata.get('request_chars') else None,
+            'tool_result_savings': metadata.get('tool_result_savings'),  # Whole pack - shared like round_trips
+            'resume': metadata.get('resume'),
+            'pack': {
+                'size': count,
+                'position': index,
+                'asins': [p['asin'] for p in pack]
+            }
+        }
+        members.append(member)
+
+    return members
+
+
+def _share(value: int, count: int, index: int) -> int:
+    """Split an integer evenly (remainder goes to the first members)"""
+    return value // count + (1 if index < value % count else 0)
+
+
+class PackedDispatcher:
+    """
+    Groups concurrent single-title requests into packed LLM requests
+
+    submit() returns a Future resolved with the product's llm_result, or with
+    None when the caller should make its own single-product call (pack of one
+    or pack failure). Duplicate ASINs are held back for the next pack.
+    """
+
+    def __init__(self, call_pack: Callable[[List[Dict[str, Any]]], Dict[str, Any]],
+                 initial_size: int, max_size: int, adaptive: bool = True,
+                 max_wait_ms: float = 250, workers: int = 100, require_rules: bool = True):
+        self.call_pack = call_pack
+        self.require_rules = require_rules
+        self.controller = PackSizeController(initial_size, max_size, adaptive)
+        self.max_wait = max_wait_ms / 1000.0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pack')
+        self._queue: List[Dict[str, Any]] = []
+        self._cond = threading.Condition()
+        self._stats = {'packs': 0, 'packed_products': 0, 'failed_packs': 0, 'fallback_products': 0,
+                       'failed_pack_tokens': 0, 'failed_pack_cost': 0.0}
+        self._stats_lock = threading.Lock()
+
+        self._flusher = threading.Thread(target=self._flush_loop, name='pack-flusher', daemon=True)
+        self._flusher.start()
+
+    def submit(self, title: str, asin: str) -> Future:
+        """Queue a title for the next pack"""
+        future = Future()
+        with self._cond:
+            self._queue.append({'title': title, 'asin': str(asin).strip(), 'future': future, 'queued_at': time.monotonic()})
+            self._cond.notify()
+        return future
+
+    def _flush_loop(self):
+        """Cut packs of K titles (or whatever arrived within max_wait)"""
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+
+                size = self.controller.size
+                deadline = self._queue[0]['queued_at'] + self.max_wait
+                while len(self._queue) < size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                pack, rest, seen = [], [], set()
+                for item in self._queue:
+                    if len(pack) < size and item['asin'] not in seen:
+                        pack.append(item)
+                        seen.add(item['asin'])
+                    else:
+                        rest.append(item)
+                self._queue = rest
+
+            self._executor.submit(self._run_pack, pack)
+
+    def _run_pack(self, pack: List[Dict[str, Any]]):
+        """Send one packed request and resolve every member's future"""
+        if len(pack) == 1:
+            # Nothing to share - the normal single-product path is cheaper
+            pack[0]['future'].set_result(None)
+            return
+
+        # Spend of a failed pack belongs to no product - it is billed to the run via the stats
+        spent = {}
+        try:
+            llm_result = self.call_pack(pack)
+            spent = llm_result.get('_metadata') or {}
+            members = split_pack_result(llm_result, pack, self.require_rules)
+        except Exception as e:
+            # e.g. JSONDecodeError once the resume steps are used up (carries the spend as e.metadata)
+            spent = getattr(e, 'metadata', None) or {}
+            print(f"⚠️  Pack of {len(pack)} failed, falling back to single calls: {type(e).__name__}: {e}")
+            members = None
+
+        with self._stats_lock:
+            self._stats['packs'] += 1
+            if members is None:
+                self._stats['failed_packs'] += 1
+                self._stats['fallback_products'] += len(pack)
+                self._stats['failed_pack_tokens'] += (spent.get('tokens_used') or {}).get('total', 0) or 0
+                self._stats['failed_pack_cost'] += spent.get('total_cost', 0) or 0
+            else:
+                self._stats['packed_products'] += len(pack)
+
+        if members is None:
+            self.controller.on_failure()
+            for item in pack:
+                item['future'].set_result(None)
+            return
+
+        self.controller.on_success()
+        for item, member in zip(pack, members):
+            item['future'].set_result(member)
+
+    def stats(self) -> Dict[str, Any]:
+        """Pack counts for the run manifest"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['enabled'] = True
+        stats['failed_pack_cost'] = round(stats['failed_pack_cost'], 6)
+        stats['current_pack_size'] = self.controller.size
+        stats['avg_pack_size'] = round(stats['packed_products'] / (stats['packs'] - stats['failed_packs']), 2) \
+            if stats['packs'] > stats['failed_packs'] else 0
+        return stats
+
+
+# Global instance (lazy loaded)
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_pack_dispatcher(call_pack: Callable[[List[Dict[str, Any]]], Dict[str, Any]]) -> Optional[PackedDispatcher]:
+    """Get the process-wide dispatcher (None when pack size is 1 = packing off)"""
+    global _dispatcher
+
+    config = get_llm_config()
+    if config.pack_size <= 1:
+        return None
+
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = PackedDispatcher(
+                    call_pack,
+                    initial_size=config.pack_size,
+                    max_size=max(config.pack_max_size, config.pack_size),
+                    adaptive=config.pack_adaptive,
+                    max_wait_ms=config.pack_max_wait_ms,
+                    workers=config.pack_workers,
+                    # Lean answers and local rules mode fill business rules in after the response
+                    require_rules=config.rules_mode != 'local' and config.output_mode != 'lean'
+                )
+
+    return _dispatcher
+
+
+def get_pack_stats() -> Dict[str, Any]:
+    """Stats for the run manifest ({'enabled': False} when packing is off)"""
+    return _dispatcher.stats() if _dispatcher is not None else {'enabled': False, 'failed_pack_tokens': 0, 'failed_pack_cost': 0.0}
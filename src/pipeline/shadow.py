@@ -0,0 +1,295 @@
+"""
+Shadow Evaluation - Compare a second model / prompt variant on live titles
+
+Switching models needs evidence from real traffic. With LLM_SHADOW_RATE /
+--shadow-rate above 0, that fraction of Step 2 titles (picked by ASIN hash,
+so a re-run shadows the same products) is also sent to a shadow variant in
+the background, in parallel with the primary request:
+  - LLM_SHADOW_MODEL: another model (default: the primary model)
+  - LLM_SHADOW_LATENCY_PRESET: another reasoning_effort / token preset
+  - LLM_SHADOW_RULES_MODE / LLM_SHADOW_OUTPUT_MODE: another prompt variant
+The shadow answer never reaches the output, the response cache or the
+routing / preset stats. Once the product's final record is built, its
+category, subcategory, primary ingredient, form, age and gender are compared
+with the shadow's (derived the same way) and the pair is saved next to the
+final audit as shadow/<ASIN>.json.
+
+The report (run summary, manifest 'shadow') has per-field agreement, latency
+percentiles and cost per product for both sides. Shadow spend is real API
+spend; it is reported here, not added to the run's cost totals.
+
+Only titles with a live realtime primary call are shadowed - cache hits and
+duplicate-title followers have no latency or cost to compare, and Batch API
+runs are not shadowed. Shadowing is local mode only (AWS mode turns it off).
+"""
+
+import hashlib
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.llm.latency_presets import percentiles
+from src.llm.llm_config import get_llm_config
+
+
+# Final-record fields compared between primary and shadow
+COMPARE_FIELDS = ['category', 'subcategory', 'primary_ingredient', 'form', 'age', 'gender']
+
+# Disagreements kept in the report as examples
+MAX_EXAMPLES = 25
+
+
+def final_attributes(llm_result: Dict[str, Any], record: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Compared fields of an LLM answer, derived like the final record
+
+    Same precedence as main._complete_record: post-processing, then business
+    rules, then the Step 1 Amazon category of the record, then UNKNOWN.
+    """
+    postprocessing = llm_result.get('postprocessing') or {}
+    business_rules = llm_result.get('business_rules') or {}
+    source = postprocessing if postprocessing.get('final_category') else business_rules
+
+    if source.get('final_category'):
+        category = source.get('final_category')
+        subcategory = source.get('final_subcategory')
+        primary_ingredient = source.get('primary_ingredient')
+    elif record.get('nw_category') and record.get('nw_subcategory'):
+        category, subcategory, primary_ingredient = record['nw_category'], record['nw_subcategory'], 'UNKNOWN'
+    else:
+        category = subcategory = primary_ingredient = 'UNKNOWN'
+
+    return {
+        'category': category,
+        'subcategory': subcategory,
+        'primary_ingredient': primary_ingredient,
+        'form': llm_result.get('form', {}).get('value', 'N/A'),
+        'age': llm_result.get('age', {}).get('value', 'N/A'),
+        'gender': llm_result.get('gender', {}).get('value', 'N/A')
+    }
+
+
+def _normalize(value: Any) -> str:
+    """Comparison key (case and surrounding whitespace ignored)"""
+    return '' if value is None else str(value).strip().upper()
+
+
+class ShadowEvaluator:
+    """
+    Runs sampled titles through the shadow variant and compares the answers
+
+    submit() starts the shadow call when the primary call starts; observe()
+    pairs it with the product's final record once the shadow answer is in.
+    """
+
+    def __init__(self, call_shadow: Callable[[str, Dict[str, Any]], Dict[str, Any]], rate: float,
+                 variant: Dict[str, Any], primary: Dict[str, Any], workers: int = 8, drain_sec: float = 120.0):
+        self.call_shadow = call_shadow
+        self.rate = max(0.0, min(1.0, rate))
+        self.variant = variant
+        self.primary = primary
+        self.drain_sec = drain_sec
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='shadow')
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Tuple[Future, str]] = {}  # ASIN -> shadow call waiting for its final record
+        self._open: set = set()  # Paired shadow calls not compared yet
+        self._stats = {'sampled': 0, 'compared': 0, 'all_fields_agree': 0, 'shadow_errors': 0, 'primary_failed': 0}
+        self._agree = {field: 0 for field in COMPARE_FIELDS}
+        self._sides = {side: {'latency_sec': [], 'cost': 0.0, 'tokens': 0} for side in ('primary', 'shadow')}
+        self._examples: List[Dict[str, Any]] = []
+
+    def sampled(self, asin: str) -> bool:
+        """Deterministic per-ASIN sample at the configured rate"""
+        if self.rate >= 1.0:
+            return True
+        bucket = int(hashlib.sha1(str(asin).encode('utf-8')).hexdigest()[:8], 16) / 0xFFFFFFFF
+        return bucket < self.rate
+
+    def submit(self, title: str, asin: str) -> bool:
+        """Start the shadow call for a sampled title (False = not sampled)"""
+        if not self.sampled(asin):
+            return False
+        future = self._executor.submit(self._run, title)
+        with self._lock:
+            self._pending[str(asin).strip()] = (future, title)
+            self._stats['sampled'] += 1
+        return True
+
+    def _run(self, title: str) -> Tuple[Dict[str, Any], float]:
+        """Shadow answer and its wall time (queueing in the shadow pool excluded)"""
+        started = time.monotonic()
+        try:
+            llm_result = self.call_shadow(title, self.variant)
+        except Exception as e:
+            llm_result = {'error': str(e)}
+        return llm_result, time.monotonic() - started
+
+    def observe(self, record: Dict[str, Any], log_manager=None):
+        """Pair a product's final record with its shadow call (no-op if the product was not shadowed)"""
+        with self._lock:
+            entry = self._pending.pop(str(record.get('asin', '')).strip(), None)
+            if entry is None:
+                return
+            self._open.add(entry[0])
+        future, title = entry
+        future.add_done_callback(lambda done: self._compare(done, title, record, log_manager))
+
+    def _compare(self, future: Future, title: str, record: Dict[str, Any], log_manager):
+        """Compare the shadow answer with the final record, update the report and save the audit file"""
+        try:
+            if record.get('status') != 'success':
+                with self._lock:
+                    self._stats['primary_failed'] += 1
+                return
+
+            llm_result, wall_sec = future.result()
+            asin = record.get('asin')
+            if 'error' in llm_result:
+                with self._lock:
+                    self._stats['shadow_errors'] += 1
+                if log_manager is not None:
+                    log_manager.save_audit_json('shadow', {'asin': asin, 'title': title, 'variant': self.variant,
+                                                           'error': llm_result['error']}, f"{asin}.json")
+                return
+
+            primary_metadata = record.get('_metadata') or {}
+            shadow_metadata = llm_result.get('_metadata') or {}
+            primary = {field: record.get(field) for field in COMPARE_FIELDS}
+            shadow = final_attributes(llm_result, record)
+            agree = {field: _normalize(primary[field]) == _normalize(shadow[field]) for field in COMPARE_FIELDS}
+            sides = {
+                'primary': {
+                    'latency_sec': primary_metadata.get('latency_sec'),
+                    'cost': record.get('api_cost', 0) or 0,
+                    'tokens': record.get('tokens_used', 0) or 0
+                },
+                'shadow': {
+                    'latency_sec': shadow_metadata.get('latency_sec') or round(wall_sec, 3),
+                    'cost': shadow_metadata.get('total_cost', 0) or 0,
+                    'tokens': (shadow_metadata.get('tokens_used') or {}).get('total', 0) or 0
+                }
+            }
+
+            with self._lock:
+                self._stats['compared'] += 1
+                self._stats['all_fields_agree'] += all(agree.values())
+                for field, same in agree.items():
+                    self._agree[field] += same
+                for side, values in sides.items():
+                    if values['latency_sec'] is not None:
+                        self._sides[side]['latency_sec'].append(values['latency_sec'])
+                    self._sides[side]['cost'] += values['cost']
+                    self._sides[side]['tokens'] += values['tokens']
+                if not all(agree.values()) and len(self._examples) < MAX_EXAMPLES:
+                    self._examples.append({
+                        'asin': asin,
+                        'title': title,
+                        'fields': {field: {'primary': primary[field], 'shadow': shadow[field]}
+                                   for field, same in agree.items() if not same}
+                    })
+
+            if log_manager is not None:
+                log_manager.save_audit_json('shadow', {
+                    'asin': asin,
+                    'title': title,
+                    'all_fields_agree': all(agree.values()),
+                    'agree': agree,
+                    'primary': dict(primary, **sides['primary'], model=primary_metadata.get('model'),
+                                    prompt_version=primary_metadata.get('prompt_version')),
+                    'shadow': dict(shadow, **sides['shadow'], model=shadow_metadata.get('model'),
+                                   prompt_version=shadow_metadata.get('prompt_version'),
+                                   round_trips=shadow_metadata.get('round_trips')),
+                    'variant': self.variant
+                }, f"{asin}.json")
+        finally:
+            with self._lock:
+                self._open.discard(future)
+
+    def drain(self, timeout: Optional[float] = None) -> int:
+        """Wait for in-flight shadow calls (returns how many are still running)"""
+        with self._lock:
+            futures = list(self._open) + [future for future, _ in self._pending.values()]
+        if not futures:
+            return 0
+        _, not_done = wait(futures, timeout=self.drain_sec if timeout is None else timeout)
+        return len(not_done)
+
+    def stats(self) -> Dict[str, Any]:
+        """Agreement, latency and cost of both sides for the run manifest"""
+        unfinished = self.drain()
+        with self._lock:
+            stats = dict(self._stats)
+            agree = dict(self._agree)
+            sides = {side: {'latency_sec': list(values['latency_sec']), 'cost': values['cost'], 'tokens': values['tokens']}
+                     for side, values in self._sides.items()}
+            examples = list(self._examples)
+            unpaired = len(self._pending)
+
+        compared = stats['compared']
+        report = {}
+        for side, values in sides.items():
+            report[side] = dict(self.primary if side == 'primary' else self.variant, **{
+                'latency_sec': percentiles(values['latency_sec']),
+                'cost': round(values['cost'], 6),
+                'cost_per_product': round(values['cost'] / compared, 6) if compared else 0,
+                'tokens_per_product': round(values['tokens'] / compared) if compared else 0
+            })
+
+        stats.update({
+            'enabled': True,
+            'rate': self.rate,
+            'unfinished': unfinished,
+            'unpaired': unpaired,  # Primary ended without a final record (exception)
+            'agreement': {field: round(count / compared, 4) if compared else None for field, count in agree.items()},
+            'all_fields_agreement': round(stats['all_fields_agree'] / compared, 4) if compared else None,
+            'primary': report['primary'],
+            'shadow': report['shadow'],
+            'disagreements': examples
+        })
+        return stats
+
+
+# Global instance (lazy loaded)
+_evaluator = None
+_evaluator_lock = threading.Lock()
+
+
+def get_shadow_evaluator(call_shadow: Callable[[str, Dict[str, Any]], Dict[str, Any]]) -> Optional[ShadowEvaluator]:
+    """Get the process-wide evaluator (None when LLM_SHADOW_RATE is 0 = shadowing off)"""
+    global _evaluator
+
+    config = get_llm_config()
+    if config.shadow_rate <= 0:
+        return None
+
+    if _evaluator is None:
+        with _evaluator_lock:
+            if _evaluator is None:
+                primary = {
+                    'model': config.model,
+                    'latency_preset': config.latency_preset,
+                    'rules_mode': config.rules_mode,
+                    'output_mode': config.output_mode
+                }
+                variant = {
+                    'model': config.shadow_model or config.model,
+                    'latency_preset': config.shadow_latency_preset or config.latency_preset,
+                    'rules_mode': config.shadow_rules_mode or config.rules_mode,
+                    'output_mode': config.shadow_output_mode or config.output_mode
+                }
+                _evaluator = ShadowEvaluator(call_shadow, config.shadow_rate, variant, primary,
+                                             workers=config.shadow_workers, drain_sec=config.shadow_drain_sec)
+
+    return _evaluator
+
+
+def observe_shadow(record: Dict[str, Any], log_manager=None):
+    """Hand a finished record to the evaluator (no-op when shadowing is off)"""
+    if _evaluator is not None:
+        _evaluator.observe(record, log_manager)
+
+
+def get_shadow_stats() -> Dict[str, Any]:
+    """Report for the run manifest, after in-flight shadows finish ({'enabled': False} when off)"""
+    return _evaluator.stats() if _evaluator is not None else {'enabled': False}
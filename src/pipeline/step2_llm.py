@@ -2,14 +2,104 @@
 Step 2: LLM Extraction - Extract product attributes using GPT
 """
 
-from typing import Dict, Any
+import asyncio
+import json
+import threading
+from typing import Dict, Any, List, Optional
 from src.llm.gpt_client import GPTClient
-from src.llm.prompt_builder import build_complete_prompt
-from src.llm.tools import ALL_TOOLS
-from src.llm.tools.ingredient_lookup import lookup_ingredient
+from src.llm.llm_config import get_llm_config
+from src.llm.batch_client import BatchRunner
+from src.llm.prompt_builder import get_prompt_template
+from src.llm.response_schema import (
+    LEAN_PACK_RESPONSE_FORMAT_SCHEMA, LEAN_RESPONSE_FORMAT_SCHEMA, LEAN_VALUE_FIELDS, decode_lean_value
+)
+from src.llm.tools import ALL_TOOLS, LOCAL_RULES_TOOLS, BATCH_LOOKUP_TOOLS, TOOL_RESULT_PROFILES
+from src.llm.tools.ingredient_lookup import lookup_ingredient, lookup_ingredients, prescan_title_ingredients
 from src.llm.tools.business_rules_tool import apply_business_rules_tool
+from src.llm.tools.postprocessing_tool import apply_postprocessing_tool
 from src.core.log_manager import LogManager
 from src.llm.utils.error_handler import APIErrorHandler
+from src.llm.response_cache import get_response_cache
+from src.llm.model_router import TIER_SIMPLE, get_title_router, merge_spend
+from src.llm.latency_presets import get_round_policy, record_preset_usage, round_policy_for
+from src.pipeline.dedup import get_title_coalescer
+from src.pipeline.packing import get_pack_dispatcher
+from src.pipeline.shadow import get_shadow_evaluator
+
+
+# Process-wide client (lazy loaded) - shares one connection pool across all workers
+_llm_client = None
+_shadow_client = None  # Isolated client for shadow evaluation
+_llm_client_lock = threading.Lock()
+
+
+# Round trips / lookups per fresh LLM answer (cache hits and dedup followers excluded)
+_round_trip_stats = {
+    'products': 0,
+    'round_trips': 0.0,
+    'lookup_calls': 0,
+    'looked_up_names': 0,
+    'prescanned_ingredients': 0,
+    'resumed_products': 0,
+    'resumed_steps': 0,
+    'resume_saved_tokens': 0.0,
+    'resume_saved_seconds': 0.0,
+    'output_tokens': 0,
+    'prompt_tokens': 0,
+    'timed_products': 0,
+    'llm_seconds': 0.0,
+    'timed_round_trips': 0.0,
+    'round_seconds': 0.0,
+    'request_chars': 0,
+    'tool_result_saved_tokens': 0.0
+}
+_round_trip_lock = threading.Lock()
+
+
+def _build_llm_client(isolated: bool = False) -> GPTClient:
+    """GPTClient with every tool in ALL_TOOLS registered"""
+    client = GPTClient(isolated=isolated)
+    client.register_tool('lookup_ingredient', lookup_ingredient, TOOL_RESULT_PROFILES['lookup_ingredient'])
+    client.register_tool('lookup_ingredients', lookup_ingredients, TOOL_RESULT_PROFILES['lookup_ingredients'])
+    client.register_tool('apply_business_rules', apply_business_rules_tool, TOOL_RESULT_PROFILES['apply_business_rules'])
+    client.register_tool('apply_postprocessing', apply_postprocessing_tool, TOOL_RESULT_PROFILES['apply_postprocessing'])
+    return client
+
+
+def get_llm_client() -> GPTClient:
+    """Get the shared GPTClient with every tool in ALL_TOOLS pre-registered"""
+    global _llm_client
+    
+    if _llm_client is None:
+        with _llm_client_lock:
+            if _llm_client is None:
+                _llm_client = _build_llm_client()
+    
+    return _llm_client
+
+
+def get_shadow_client() -> GPTClient:
+    """Get the isolated client for shadow calls (own retry budget / breaker, no hedging or limiter)"""
+    global _shadow_client
+    
+    if _shadow_client is None:
+        with _llm_client_lock:
+            if _shadow_client is None:
+                _shadow_client = _build_llm_client(isolated=True)
+    
+    return _shadow_client
+
+
+def reset_llm_client():
+    """Close the shared clients so the next call picks up new config"""
+    global _llm_client, _shadow_client
+    
+    with _llm_client_lock:
+        for client in (_llm_client, _shadow_client):
+            if client is not None:
+                client.close()
+        _llm_client = None
+        _shadow_client = None
 
 
 def extract_llm_attributes(
@@ -17,7 +107,10 @@ def extract_llm_attributes(
     asin: str,
     product_id: int,
     log_manager: LogManager,
-    max_retries: int = 3
+    max_retries: int = 3,
+    lookup_action: Optional[str] = None,
+    reasoning_effort: Optional[str] = None,
+    max_completion_tokens: Optional[int] = None
 ) -> Dict[str, Any]:
     """
     Extract product attributes using LLM with tool calling
@@ -28,31 +121,551 @@ def extract_llm_attributes(
         product_id: Product ID for logging
         log_manager: Log manager instance
         max_retries: Max retry attempts for transient errors
+        lookup_action: Step 1 lookup action (REMAP / UNKNOWN) - a model-routing feature
+        reasoning_effort: reasoning_effort for every round (None = route / latency preset)
+        max_completion_tokens: Completion cap for every round (None = latency preset)
     
     Returns:
         Dict with 'success' flag and either 'data' or 'error'
         data contains: llm_result with extracted attributes + metadata
     """
     
+    # Duplicate titles in this run share one request (see dedup.py)
+    coalescer = get_title_coalescer()
+    if coalescer is None:
+        return _run_llm_extraction(title, asin, product_id, log_manager, max_retries, lookup_action,
+                                   reasoning_effort, max_completion_tokens)
+    
+    group_key, future, is_leader = coalescer.claim(title, asin)
+    if is_leader:
+        result = {'success': False, 'error': 'Duplicate-title leader did not complete'}
+        try:
+            result = _run_llm_extraction(title, asin, product_id, log_manager, max_retries, lookup_action,
+                                         reasoning_effort, max_completion_tokens)
+        finally:
+            # Always release followers, even if the leader raised
+            coalescer.resolve(group_key, result)
+        return result
+    
+    shared = coalescer.share(group_key, future.result())
+    if shared is None:
+        # Leader failed - make our own request
+        return _run_llm_extraction(title, asin, product_id, log_manager, max_retries, lookup_action,
+                                   reasoning_effort, max_completion_tokens)
+    
+    _log_dedup_follower(shared, asin, log_manager)
+    return shared
+
+
+def _run_llm_extraction(
+    title: str,
+    asin: str,
+    product_id: int,
+    log_manager: LogManager,
+    max_retries: int = 3,
+    lookup_action: Optional[str] = None,
+    reasoning_effort: Optional[str] = None,
+    max_completion_tokens: Optional[int] = None
+) -> Dict[str, Any]:
+    """Cache lookup + LLM request with retries for one title"""
+    
     log_manager.log_step('step2_llm', f"[{asin}] Starting LLM extraction: {title[:60]}...")
     
     # Initialize error handler
     error_handler = APIErrorHandler(log_manager, asin, max_retries)
     
+    # Compiled once per run - only the title differs between products
+    template = get_prompt_template()
+    
+    # Model tier for this title (None = routing off, configured model) - part of the cache key
+    router = get_title_router()
+    route = router.route(title, lookup_action) if router else None
+    
+    # Persistent cache - same title + prompt + reference data + model / effort = same answer
+    cache, cache_key, cached = _check_cache(title, asin, log_manager, template,
+                                            _cache_variant(route, reasoning_effort, max_completion_tokens))
+    if cached:
+        return cached
+    
+    # Shadow evaluation: sampled titles also go to the shadow variant, in the background
+    shadow = get_shadow_evaluator(_call_shadow)
+    if shadow is not None:
+        shadow.submit(title, asin)
+    
+    # Packing: share one request with other waiting titles (None = go single)
+    dispatcher = get_pack_dispatcher(_call_pack)
+    packed = dispatcher.submit(title, asin).result() if dispatcher else None
+    if packed is not None:
+        _log_packed(packed, asin, log_manager)
+        # Each member is cached under its own title's key (its share of the pack's spend). Packs
+        # always run on the configured model, so the key is the unrouted one, not the route's
+        final = _finalize_llm_result({'success': True, 'data': packed}, title, asin, log_manager, template)
+        if cache is not None:
+            _store_in_cache(cache, cache.make_key(title, template, _cache_variant(None)), title, final)
+        return final
+    
+    if route is not None:
+        router.count(route)
+    
     # Define the API call function
     def make_llm_call():
-        client = GPTClient()
-        client.register_tool('lookup_ingredient', lookup_ingredient)
-        client.register_tool('apply_business_rules', apply_business_rules_tool)
+        client = get_llm_client()
+        prompt = template.render(title)
         
-        prompt = build_complete_prompt(title)
-        # IMPORTANT: use_schema=False because business_rules is populated via tool call
-        # The schema is too strict and doesn't allow for the tool call workflow
-        return client.extract_attributes(prompt, tools=ALL_TOOLS, use_schema=False)
+        def call(tier_route):
+            # IMPORTANT: use_schema=False because business_rules is populated via tool call
+            # The schema is too strict and doesn't allow for the tool call workflow
+            return client.extract_attributes(prompt, tools=_tools_for(template), use_schema=False,
+                                             response_format=_response_format_for(template),
+                                             **_route_params(tier_route, reasoning_effort, max_completion_tokens))
+        
+        try:
+            first = call(route)
+            reason = _escalation_reason(first, route, router, template)
+        except json.JSONDecodeError as e:
+            # Unparseable simple-tier answer - escalate (its spend rides on the exception);
+            # other errors go to the retry handler
+            if route is None or route.tier != TIER_SIMPLE:
+                raise
+            first, reason = {'_metadata': getattr(e, 'metadata', None) or {}}, 'invalid_json'
+        if reason is None:
+            return _attach_route(first, route)
+        # Simple tier failed validation - the standard tier answers, both attempts are billed
+        escalated = router.escalate(route, reason)
+        return _attach_route(call(escalated), escalated, first, route, reason)
     
     # Execute with retry logic
     result = error_handler.execute_with_retry(make_llm_call, product_id)
     
+    final = _finalize_llm_result(result, title, asin, log_manager, template)
+    _store_in_cache(cache, cache_key, title, final)
+    return final
+
+
+async def extract_llm_attributes_async(
+    title: str,
+    asin: str,
+    product_id: int,
+    log_manager: LogManager,
+    max_retries: int = 3,
+    lookup_action: Optional[str] = None,
+    reasoning_effort: Optional[str] = None,
+    max_completion_tokens: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Async version of extract_llm_attributes() for the asyncio Step 2 engine
+    
+    Same prompt, tools, retry policy and return shape - only the HTTP calls
+    (and retry back-off) are awaited instead of blocking a thread.
+    """
+    
+    coalescer = get_title_coalescer()
+    if coalescer is None:
+        return await _run_llm_extraction_async(title, asin, product_id, log_manager, max_retries, lookup_action,
+                                               reasoning_effort, max_completion_tokens)
+    
+    group_key, future, is_leader = coalescer.claim(title, asin)
+    if is_leader:
+        result = {'success': False, 'error': 'Duplicate-title leader did not complete'}
+        try:
+            result = await _run_llm_extraction_async(title, asin, product_id, log_manager, max_retries, lookup_action,
+                                                     reasoning_effort, max_completion_tokens)
+        finally:
+            # Always release followers, even if the leader raised
+            coalescer.resolve(group_key, result)
+        return result
+    
+    shared = coalescer.share(group_key, await asyncio.wrap_future(future))
+    if shared is None:
+        return await _run_llm_extraction_async(title, asin, product_id, log_manager, max_retries, lookup_action,
+                                               reasoning_effort, max_completion_tokens)
+    
+    _log_dedup_follower(shared, asin, log_manager)
+    return shared
+
+
+async def _run_llm_extraction_async(
+    title: str,
+    asin: str,
+    product_id: int,
+    log_manager: LogManager,
+    max_retries: int = 3,
+    lookup_action: Optional[str] = None,
+    reasoning_effort: Optional[str] = None,
+    max_completion_tokens: Optional[int] = None
+) -> Dict[str, Any]:
+    """Async cache lookup + LLM request with retries for one title"""
+    
+    log_manager.log_step('step2_llm', f"[{asin}] Starting LLM extraction: {title[:60]}...")
+    
+    error_handler = APIErrorHandler(log_manager, asin, max_retries)
+    template = get_prompt_template()
+    
+    router = get_title_router()
+    route = router.route(title, lookup_action) if router else None
+    
+    cache, cache_key, cached = _check_cache(title, asin, log_manager, template,
+                                            _cache_variant(route, reasoning_effort, max_completion_tokens))
+    if cached:
+        return cached
+    
+    shadow = get_shadow_evaluator(_call_shadow)
+    if shadow is not None:
+        shadow.submit(title, asin)
+    
+    dispatcher = get_pack_dispatcher(_call_pack)
+    packed = await asyncio.wrap_future(dispatcher.submit(title, asin)) if dispatcher else None
+    if packed is not None:
+        _log_packed(packed, asin, log_manager)
+        # Each member is cached under its own title's key (its share of the pack's spend). Packs
+        # always run on the configured model, so the key is the unrouted one, not the route's
+        final = _finalize_llm_result({'success': True, 'data': packed}, title, asin, log_manager, template)
+        if cache is not None:
+            _store_in_cache(cache, cache.make_key(title, template, _cache_variant(None)), title, final)
+        return final
+    
+    if route is not None:
+        router.count(route)
+    
+    async def make_llm_call():
+        client = get_llm_client()
+        prompt = template.render(title)
+        
+        async def call(tier_route):
+            # IMPORTANT: use_schema=False because business_rules is populated via tool call
+            return await client.extract_attributes_async(prompt, tools=_tools_for(template), use_schema=False,
+                                                         response_format=_response_format_for(template),
+                                                         **_route_params(tier_route, reasoning_effort, max_completion_tokens))
+        
+        try:
+            first = await call(route)
+            reason = _escalation_reason(first, route, router, template)
+        except json.JSONDecodeError as e:
+            if route is None or route.tier != TIER_SIMPLE:
+                raise
+            first, reason = {'_metadata': getattr(e, 'metadata', None) or {}}, 'invalid_json'
+        if reason is None:
+            return _attach_route(first, route)
+        escalated = router.escalate(route, reason)
+        return _attach_route(await call(escalated), escalated, first, route, reason)
+    
+    result = await error_handler.execute_with_retry_async(make_llm_call, product_id)
+    
+    final = _finalize_llm_result(result, title, asin, log_manager, template)
+    _store_in_cache(cache, cache_key, title, final)
+    return final
+
+
+def extract_llm_attributes_batch(items: List[Dict[str, Any]], log_manager: LogManager) -> Dict[int, Dict[str, Any]]:
+    """
+    Extract attributes for many products through the OpenAI Batch API
+    
+    Same cache, dedup and result shape as extract_llm_attributes(); only the
+    transport differs (multi-round batches instead of interactive calls).
+    
+    Args:
+        items: Dicts with 'product_id', 'asin' and 'title'
+        log_manager: Log manager instance
+    
+    Returns:
+        product_id -> Dict with 'success' flag and either 'data' or 'error'
+    """
+    template = get_prompt_template()
+    coalescer = get_title_coalescer()
+    
+    results = {}
+    prompts = {}
+    leaders = {}
+    followers = []
+    
+    for item in items:
+        title, asin, product_id = item['title'], item['asin'], item['product_id']
+        group_key = None
+        
+        if coalescer is not None:
+            group_key, future, is_leader = coalescer.claim(title, asin)
+            if not is_leader:
+                followers.append((item, group_key, future))
+                continue
+        
+        # Batch requests keep the standard model (no routing) at the run's latency preset
+        cache, cache_key, cached = _check_cache(title, asin, log_manager, template, _cache_variant(None))
+        if cached:
+            results[product_id] = cached
+            if coalescer is not None:
+                coalescer.resolve(group_key, cached)
+            continue
+        
+        log_manager.log_step('step2_llm', f"[{asin}] Queued for batch LLM extraction: {title[:60]}...")
+        custom_id = str(product_id)
+        prompts[custom_id] = template.render(title)
+        leaders[custom_id] = (item, group_key, cache, cache_key)
+    
+    raw_results = {}
+    if prompts:
+        try:
+            runner = BatchRunner(get_llm_client())
+            # IMPORTANT: use_schema=False because business_rules is populated via tool call
+            raw_results = runner.run(prompts, tools=_tools_for(template), use_schema=False,
+                                     response_format=_response_format_for(template))
+        except Exception as e:
+            # Every queued product fails (and releases its duplicates)
+            raw_results = {custom_id: {'error': f"Batch submission failed: {e}", 'success': False} for custom_id in prompts}
+    
+    for custom_id, (item, group_key, cache, cache_key) in leaders.items():
+        llm_result = raw_results.get(custom_id, {'error': 'No result returned by batch', 'success': False})
+        final = _finalize_llm_result({'success': True, 'data': llm_result}, item['title'], item['asin'], log_manager, template)
+        _store_in_cache(cache, cache_key, item['title'], final)
+        results[item['product_id']] = final
+        if coalescer is not None:
+            coalescer.resolve(group_key, final)
+    
+    for item, group_key, future in followers:
+        leader_result = future.result()
+        shared = coalescer.share(group_key, leader_result)
+        if shared is None:
+            results[item['product_id']] = {'success': False, 'error': leader_result.get('error', 'Unknown LLM error')}
+            continue
+        _log_dedup_follower(shared, item['asin'], log_manager)
+        results[item['product_id']] = shared
+    
+    return results
+
+
+def _route_params(route, reasoning_effort: Optional[str] = None,
+                  max_completion_tokens: Optional[int] = None) -> Dict[str, Any]:
+    """
+    extract_attributes() model / reasoning_effort / max_completion_tokens
+
+    A route picks the model tier (none = configured model); explicit values
+    win over the route's effort. Whatever is left unset comes from the run's
+    latency preset per round (see latency_presets.py).
+    """
+    params = {}
+    if route is not None:
+        params = {'model': route.model, 'reasoning_effort': route.reasoning_effort}
+    if reasoning_effort:
+        params['reasoning_effort'] = reasoning_effort
+    if max_completion_tokens:
+        params['max_completion_tokens'] = max_completion_tokens
+    return params
+
+
+def _escalation_reason(llm_result: Dict[str, Any], route, router, template):
+    """Why a simple-tier answer must be re-run on the standard tier (None = keep it)"""
+    if route is None or route.tier != TIER_SIMPLE:
+        return None
+    return router.validate(llm_result, template.local_rules)
+
+
+def _attach_route(llm_result: Dict[str, Any], route, first: Dict[str, Any] = None, first_route=None,
+                  reason: str = None) -> Dict[str, Any]:
+    """Record the routing decision in the result metadata (and bill an escalated first attempt)"""
+    if route is None:
+        return llm_result
+    metadata = llm_result.setdefault('_metadata', {})
+    routing = route.metadata()
+    routing['escalated'] = first_route is not None
+    if first_route is not None:
+        first_metadata = (first or {}).get('_metadata') or {}
+        merge_spend(metadata, first_metadata)
+        routing.update({
+            'escalated_from': first_route.tier,
+            'escalation_reason': reason,
+            'first_attempt_cost': first_metadata.get('total_cost', 0) or 0
+        })
+    metadata['routing'] = routing
+    return llm_result
+
+
+def _call_pack(pack: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Send one packed request for several titles (used by the pack dispatcher)"""
+    client = get_llm_client()
+    template = get_prompt_template()
+    prompt = template.render_pack([(item['asin'], item['title']) for item in pack])
+    # IMPORTANT: use_schema=False - the packed answer is {"products": [...]}
+    return client.extract_attributes(prompt, tools=_tools_for(template), use_schema=False,
+                                     response_format=_response_format_for(template, packed=True))
+
+
+def _call_shadow(title: str, variant: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Run one title through the shadow variant (used by the shadow evaluator)
+    
+    No conversation restarts, cache, routing or run stats - the answer is
+    only compared. The isolated shadow client keeps its retries, breaker and
+    latencies apart from the primary requests. Lean / local-rules answers
+    are completed like primary answers.
+    """
+    client = get_shadow_client()
+    template = get_prompt_template(local_rules=variant['rules_mode'] == 'local', lean=variant['output_mode'] == 'lean')
+    llm_result = client.extract_attributes(template.render(title), tools=_tools_for(template), use_schema=False,
+                                           response_format=_response_format_for(template), model=variant['model'],
+                                           round_policy=round_policy_for(variant['latency_preset'], variant['rules_mode']))
+    if 'error' not in llm_result:
+        if template.lean:
+            _expand_lean_result(llm_result, title)
+        elif template.local_rules:
+            _apply_local_rules(llm_result, title)
+        llm_result.setdefault('_metadata', {})['prompt_version'] = template.version
+    return llm_result
+
+
+def _tools_for(template) -> List[Dict[str, Any]]:
+    """Tool definitions matching the prompt variant"""
+    tools = LOCAL_RULES_TOOLS if template.local_rules else ALL_TOOLS
+    return BATCH_LOOKUP_TOOLS + tools if template.batch_lookup else tools
+
+
+def _response_format_for(template, packed: bool = False):
+    """Strict lean schema for lean templates (None = free-form JSON as before)"""
+    if not template.lean:
+        return None
+    return LEAN_PACK_RESPONSE_FORMAT_SCHEMA if packed else LEAN_RESPONSE_FORMAT_SCHEMA
+
+
+def _apply_local_rules(llm_result: Dict[str, Any], title: str):
+    """
+    Run apply_business_rules + apply_postprocessing in-process on an LLM answer
+    
+    Fills business_rules / postprocessing exactly as the tool round trips would,
+    with reasoning taken from each tool's reasoning_context.
+    """
+    ingredients = extract_attributes_from_llm_result(llm_result)['ingredients']
+    age_group = llm_result.get('age', {}).get('value', '')
+    gender = llm_result.get('gender', {}).get('value', '')
+    
+    business_rules = apply_business_rules_tool(ingredients=ingredients, age_group=age_group, gender=gender, title=title)
+    postprocessing = apply_postprocessing_tool(ingredients=ingredients, age_group=age_group, gender=gender, title=title)
+    _fill_rules(llm_result, business_rules, postprocessing)
+    
+    # Same audit trail as tool calls, marked as local
+    metadata = llm_result.setdefault('_metadata', {})
+    arguments = {'ingredients': ingredients, 'age_group': age_group, 'gender': gender, 'title': title}
+    metadata['tool_calls'] = (metadata.get('tool_calls') or []) + [
+        {'function': 'apply_business_rules', 'arguments': arguments, 'result': business_rules, 'local': True},
+        {'function': 'apply_postprocessing', 'arguments': arguments, 'result': postprocessing, 'local': True}
+    ]
+    metadata['rules_mode'] = 'local'
+
+
+def _fill_rules(llm_result: Dict[str, Any], business_rules: Dict[str, Any], postprocessing: Dict[str, Any]):
+    """Set business_rules / postprocessing / primary_ingredient from the two tool results"""
+    business_rules['reasoning'] = business_rules['reasoning_context'] if business_rules['should_explain'] else ''
+    llm_result['business_rules'] = business_rules
+    llm_result['primary_ingredient'] = postprocessing['primary_ingredient']
+    llm_result['postprocessing'] = {
+        'combo_detected': postprocessing['combo_detected'],
+        'combos_applied': postprocessing['combos_applied'],
+        'final_category': postprocessing['final_category'],
+        'final_subcategory': postprocessing['final_subcategory'],
+        'primary_ingredient': postprocessing['primary_ingredient'],
+        'health_focus': postprocessing['health_focus'],
+        'high_level_category': postprocessing['high_level_category'],
+        'reasoning': postprocessing['reasoning_context']
+    }
+
+
+def _last_tool_result(metadata: Dict[str, Any], function: str):
+    """Result of the model's last successful call of a tool (None if it never succeeded)"""
+    for call in reversed(metadata.get('tool_calls') or []):
+        if call.get('function') == function and 'result' in call and not call.get('local'):
+            return call['result']
+    return None
+
+
+def _expand_lean_result(llm_result: Dict[str, Any], title: str):
+    """
+    Turn a lean answer into the full structure Step 2/3 read
+    
+    Codes are decoded and every attribute becomes {value, reasoning: ''}.
+    business_rules / postprocessing come from the model's last tool results;
+    if either is missing (or rules run locally) they are computed in-process.
+    """
+    reasoning = llm_result.pop('reasoning', None) or ''
+    for field in LEAN_VALUE_FIELDS:
+        llm_result[field] = {'value': decode_lean_value(field, llm_result.get(field, 'N/A')), 'reasoning': ''}
+    metadata = llm_result.setdefault('_metadata', {})
+    metadata['output_mode'] = 'lean'
+    
+    business_rules = _last_tool_result(metadata, 'apply_business_rules')
+    postprocessing = _last_tool_result(metadata, 'apply_postprocessing')
+    if business_rules is None or postprocessing is None:
+        _apply_local_rules(llm_result, title)
+    else:
+        _fill_rules(llm_result, dict(business_rules), postprocessing)
+    
+    # The model's own explanation (only asked for when should_explain is true)
+    if reasoning and llm_result['business_rules'].get('should_explain'):
+        llm_result['business_rules']['reasoning'] = reasoning
+
+
+def _log_packed(packed: Dict[str, Any], asin: str, log_manager: LogManager):
+    """Log a product classified inside a multi-product request"""
+    pack = packed['_metadata']['pack']
+    log_manager.log_step('step2_llm', f"[{asin}] PACKED - classified with {pack['size'] - 1} other products in one request")
+
+
+def _log_dedup_follower(shared: Dict[str, Any], asin: str, log_manager: LogManager):
+    """Log a record that reused a duplicate title's result"""
+    dedup = shared['data']['_metadata']['dedup']
+    log_manager.log_step(
+        'step2_llm',
+        f"[{asin}] DEDUP - reused result of {dedup['leader_asin']} (saved ${dedup['saved_cost']:.4f})"
+    )
+
+
+def _cache_variant(route, reasoning_effort: Optional[str] = None,
+                   max_completion_tokens: Optional[int] = None) -> str:
+    """
+    Model / reasoning_effort / token cap part of a title's cache key
+
+    Same inputs as _route_params plus the run's latency preset, so a cheap
+    simple-tier or low-effort answer is never served to a run that would
+    ask the standard model at full effort. '' when everything is default.
+    An escalated answer is stored under its simple route's key - the title
+    routes and escalates the same way next time.
+    """
+    params = {key: value for key, value in _route_params(route, reasoning_effort, max_completion_tokens).items()
+              if value and not (key == 'model' and value == get_llm_config().model)}
+    policy = get_round_policy()
+    if policy.efforts or policy.max_completion_tokens:
+        params['preset'] = {'efforts': policy.efforts, 'max_completion_tokens': policy.max_completion_tokens}
+    return json.dumps(params, sort_keys=True) if params else ''
+
+
+def _check_cache(title: str, asin: str, log_manager: LogManager, template, variant: str = ''):
+    """
+    Look up a title in the persistent response cache
+    
+    Returns:
+        (cache, cache_key, result) - result is a Step 2 success dict on a hit,
+        None on a miss; cache/cache_key are None when the cache is off
+    """
+    cache = get_response_cache()
+    if cache is None:
+        return None, None, None
+    
+    cache_key = cache.make_key(title, template, variant)
+    llm_result = cache.get(cache_key)
+    if llm_result is None:
+        return cache, cache_key, None
+    
+    llm_result['_metadata']['prompt_version'] = template.version
+    saved = llm_result['_metadata']['cache']['saved_cost']
+    log_manager.log_step('step2_llm', f"[{asin}] CACHE HIT - saved ${saved:.4f}")
+    return cache, cache_key, {'success': True, 'data': llm_result}
+
+
+def _store_in_cache(cache, cache_key: str, title: str, final: Dict[str, Any]):
+    """Cache a successful Step 2 result (errors are never cached)"""
+    if cache is not None and final['success']:
+        cache.put(cache_key, title, final['data'])
+
+
+def _finalize_llm_result(result: Dict[str, Any], title: str, asin: str, log_manager: LogManager, template) -> Dict[str, Any]:
+    """Check the retry handler result, log usage and return the Step 2 result (DRY helper)"""
+    
     # Check result
     if not result['success']:
         return result
@@ -65,17 +678,31 @@ def extract_llm_attributes(
         log_manager.log_step('step2_llm', f"[{asin}] ERROR in LLM result: {error_msg}")
         return {'success': False, 'error': error_msg}
     
+    # Lean answers are expanded first; local rules mode runs business rules +
+    # post-processing here, not as tool calls
+    if template.lean:
+        _expand_lean_result(llm_result, title)
+    elif template.local_rules:
+        _apply_local_rules(llm_result, title)
+    
     # Log success
     metadata = llm_result.get('_metadata', {})
+    metadata['prompt_version'] = template.version
+    _record_round_trips(metadata, title, template)
+    router = get_title_router()
+    if router is not None:
+        router.record(metadata)
+    record_preset_usage(metadata)
     tokens = metadata.get('tokens_used', {})  # ✅ FIXED: was 'tokens', should be 'tokens_used'
     total_tokens = tokens.get('total', 0)
     prompt_tokens = tokens.get('prompt', 0)
     completion_tokens = tokens.get('completion', 0)
+    cached_tokens = tokens.get('cached', 0)
     cost = metadata.get('total_cost', 0)
     
     log_manager.log_step(
         'step2_llm',
-        f"[{asin}] SUCCESS - Tokens: {total_tokens:,} (in: {prompt_tokens:,}, out: {completion_tokens:,}), Cost: ${cost:.4f}"
+        f"[{asin}] SUCCESS - Tokens: {total_tokens:,} (in: {prompt_tokens:,}, cached: {cached_tokens:,}, out: {completion_tokens:,}), Cost: ${cost:.4f}"
     )
     
     # Log extracted ingredients
@@ -85,6 +712,84 @@ def extract_llm_attributes(
     return {'success': True, 'data': llm_result}
 
 
+def _record_round_trips(metadata: Dict[str, Any], title: str, template):
+    """Count API round trips, ingredient lookups, resumed steps, tokens, payload and latency for one product"""
+    prescanned = len(prescan_title_ingredients(title)) if template.prescan else 0
+    lookup_calls = [call for call in (metadata.get('tool_calls') or [])
+                    if call.get('function') in ('lookup_ingredient', 'lookup_ingredients')]
+    lookups = len(lookup_calls)
+    looked_up = 0
+    for call in lookup_calls:
+        if call['function'] == 'lookup_ingredient':
+            looked_up += 1
+        elif isinstance(call.get('arguments'), dict):
+            looked_up += len(call['arguments'].get('ingredient_names') or [])
+    metadata['prescanned_ingredients'] = prescanned
+    
+    # A packed request's round trips are shared by its members
+    pack_size = metadata.get('pack', {}).get('size', 1)
+    resume = metadata.get('resume') or {}
+    with _round_trip_lock:
+        _round_trip_stats['products'] += 1
+        _round_trip_stats['round_trips'] += metadata.get('round_trips', 1) / pack_size
+        _round_trip_stats['lookup_calls'] += lookups
+        _round_trip_stats['looked_up_names'] += looked_up
+        _round_trip_stats['prescanned_ingredients'] += prescanned
+        _round_trip_stats['output_tokens'] += metadata.get('tokens_used', {}).get('completion', 0)
+        _round_trip_stats['prompt_tokens'] += metadata.get('tokens_used', {}).get('prompt', 0)
+        _round_trip_stats['tool_result_saved_tokens'] += (metadata.get('tool_result_savings') or {}).get('saved_prompt_tokens', 0) / pack_size
+        if metadata.get('latency_sec') is not None:
+            # Realtime calls only - a batch job's wall time says nothing about the format
+            _round_trip_stats['timed_products'] += 1
+            _round_trip_stats['llm_seconds'] += metadata['latency_sec']
+            _round_trip_stats['timed_round_trips'] += metadata.get('round_trips', 1) / pack_size
+            _round_trip_stats['round_seconds'] += metadata['latency_sec'] / max(1, metadata.get('round_trips', 1))
+            _round_trip_stats['request_chars'] += metadata.get('request_chars') or 0
+        if resume:
+            _round_trip_stats['resumed_products'] += 1
+            _round_trip_stats['resumed_steps'] += resume['steps'] / pack_size
+            _round_trip_stats['resume_saved_tokens'] += resume['saved_tokens'] / pack_size
+            _round_trip_stats['resume_saved_seconds'] += resume['saved_seconds']
+
+
+def get_round_trip_stats() -> Dict[str, Any]:
+    """Avg API round trips, lookup_ingredient calls, resumed steps, tokens and latency per product / round (for the run manifest)"""
+    with _round_trip_lock:
+        stats = dict(_round_trip_stats)
+    
+    products = stats['products']
+    template = get_prompt_template()
+    stats['ingredient_prescan'] = template.prescan
+    stats['output_mode'] = 'lean' if template.lean else 'full'
+    stats['round_trips'] = round(stats['round_trips'], 2)
+    stats['resumed_steps'] = round(stats['resumed_steps'], 2)
+    stats['resume_saved_tokens'] = round(stats['resume_saved_tokens'])
+    stats['resume_saved_seconds'] = round(stats['resume_saved_seconds'], 2)
+    stats['avg_round_trips'] = round(stats['round_trips'] / products, 2) if products else 0
+    stats['avg_lookup_calls'] = round(stats['lookup_calls'] / products, 2) if products else 0
+    stats['avg_looked_up_names'] = round(stats['looked_up_names'] / products, 2) if products else 0
+    stats['batch_lookup'] = template.batch_lookup
+    stats['avg_prescanned_ingredients'] = round(stats['prescanned_ingredients'] / products, 2) if products else 0
+    stats['llm_seconds'] = round(stats['llm_seconds'], 2)
+    stats['avg_output_tokens'] = round(stats['output_tokens'] / products, 1) if products else 0
+    stats['avg_llm_latency_sec'] = round(stats['llm_seconds'] / stats['timed_products'], 3) if stats['timed_products'] else None
+    
+    # Per round trip - chat.completions vs. Responses API (LLM_API)
+    stats['api'] = get_llm_config().api
+    stats['avg_prompt_tokens_per_round'] = round(stats['prompt_tokens'] / stats['round_trips']) if stats['round_trips'] else 0
+    stats['avg_request_kb_per_round'] = (round(stats['request_chars'] / 1024 / stats['timed_round_trips'], 2)
+                                         if stats['timed_round_trips'] else None)
+    stats['avg_round_latency_sec'] = round(stats['round_seconds'] / stats['timed_products'], 3) if stats['timed_products'] else None
+    stats['timed_round_trips'] = round(stats['timed_round_trips'], 2)
+    stats['round_seconds'] = round(stats['round_seconds'], 2)
+    
+    # Compact tool messages (LLM_COMPACT_TOOL_RESULTS)
+    stats['compact_tool_results'] = get_llm_config().compact_tool_results
+    stats['tool_result_saved_tokens'] = round(stats['tool_result_saved_tokens'])
+    stats['avg_tool_result_saved_tokens'] = round(stats['tool_result_saved_tokens'] / products, 1) if products else 0
+    return stats
+
+
 def extract_attributes_from_llm_result(llm_result: Dict[str, Any]) -> Dict[str, Any]:
     """
     Extract individual attributes from LLM result (DRY helper)
@@ -1,19 +1,28 @@
 #!/usr/bin/env python3
 """
 Cost Analysis Script - Extracts cost/token data from audit files and updates tracking
-Usage: 
-    Local (audit files): python analyze_costs.py --file-id 100_records --run-id run_9
-    Local (update JSON): python analyze_costs.py --file-id 100_records --run-id run_9 --update-tracker
-    S3 (with DynamoDB): python analyze_costs.py --s3 --bucket BUCKET --file-id 100_records --run-id run_1 --update-db
+Usage (from the repo root; `python -m src.utils.analyze_costs ...` works too):
+    Local (audit files): python src/utils/analyze_costs.py --file-id 100_records --run-id run_9
+    Local (update JSON): python src/utils/analyze_costs.py --file-id 100_records --run-id run_9 --update-tracker
+    S3 (with DynamoDB): python src/utils/analyze_costs.py --s3 --bucket BUCKET --file-id 100_records --run-id run_1 --update-db
+
+Costs are priced from reference_data/model_pricing.json (cached prompt tokens
+at the cached-input rate); old audit files without a cost are re-priced.
 """
 
 import json
+import sys
 import argparse
 from pathlib import Path
 from typing import Dict, List, Tuple, Optional
 from decimal import Decimal
 from datetime import datetime
 
+# Run as a script, the repo root is not on sys.path
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from src.llm.pricing import compute_cost, summarize_costs
+
 try:
     import boto3
     AWS_AVAILABLE = True
@@ -110,16 +119,14 @@ def analyze_costs(audit_data: List[Dict]) -> Tuple[Dict, List[Dict]]:
         tokens_breakdown = metadata.get('tokens_used', {})  # ✅ FIXED: was 'tokens'
         prompt_tokens = tokens_breakdown.get('prompt', 0)
         completion_tokens = tokens_breakdown.get('completion', 0)
+        cached_tokens = tokens_breakdown.get('cached', 0)
         
-        # If api_cost is missing/0 but tokens exist, calculate cost (for old audit files)
+        # If api_cost is missing/0 but tokens exist, price the tokens (for old audit files)
         if (not api_cost or api_cost == 0) and tokens_used == 0 and tokens_breakdown:
-            # Use tokens from metadata
             tokens_used = tokens_breakdown.get('total', 0)
-            # Calculate cost (GPT-4o mini pricing: $0.150/1M input, $0.600/1M output)
             if prompt_tokens > 0 or completion_tokens > 0:
-                input_cost = (prompt_tokens / 1_000_000) * 0.150
-                output_cost = (completion_tokens / 1_000_000) * 0.600
-                api_cost = input_cost + output_cost
+                api_cost = compute_cost(metadata.get('model') or '', prompt_tokens, cached_tokens,
+                                        completion_tokens)['total_cost']
         
         # Keep the most recent/complete record for each ASIN
         if asin not in products or status in ['success', 'step3_complete']:
@@ -129,7 +136,9 @@ def analyze_costs(audit_data: List[Dict]) -> Tuple[Dict, List[Dict]]:
                 'tokens_used': tokens_used,
                 'prompt_tokens': prompt_tokens,
                 'completion_tokens': completion_tokens,
+                'cached_tokens': cached_tokens,
                 'api_cost': api_cost,
+                '_metadata': metadata,
                 'processing_time_sec': processing_time,
                 'category': record.get('category', ''),
                 'subcategory': record.get('subcategory', ''),
@@ -145,6 +154,9 @@ def analyze_costs(audit_data: List[Dict]) -> Tuple[Dict, List[Dict]]:
     total_tokens = sum(p['tokens_used'] for p in success_products)
     total_prompt_tokens = sum(p['prompt_tokens'] for p in success_products)
     total_completion_tokens = sum(p['completion_tokens'] for p in success_products)
+    costs = summarize_costs(p.pop('_metadata') for p in success_products)
+    for product in products.values():
+        product.pop('_metadata', None)
     
     avg_cost = total_cost / len(success_products) if success_products else 0
     avg_tokens = total_tokens / len(success_products) if success_products else 0
@@ -159,7 +171,12 @@ def analyze_costs(audit_data: List[Dict]) -> Tuple[Dict, List[Dict]]:
         'total_tokens': total_tokens,
         'prompt_tokens': total_prompt_tokens,
         'completion_tokens': total_completion_tokens,
-        'avg_cost_per_product': avg_cost,
+        'cached_tokens': costs['cached_input_tokens'],
+        'cache_hit_ratio': costs['cache_hit_ratio'],
+        'prompt_cache_saved_cost': costs['prompt_cache_saved_cost'],
+        'avg_cost_per_product': avg_cost,  # Effective - cache/dedup reuse included
+        'billed_products': costs['billed_products'],
+        'cost_per_billed_product': costs['cost_per_billed_product'],
         'avg_tokens_per_product': avg_tokens,
         'avg_processing_time_sec': avg_time,
         'analyzed_at': datetime.utcnow().isoformat()
@@ -197,10 +214,13 @@ def update_dynamodb(table_name: str, file_id: str, run_id: str, summary: Dict, r
                     total_tokens = :total_tokens,
                     prompt_tokens = :prompt_tokens,
                     completion_tokens = :completion_tokens,
+                    cached_tokens = :cached_tokens,
+                    cache_hit_ratio = :cache_hit_ratio,
                     success_count = :success,
                     filtered_count = :filtered,
                     error_count = :errors,
                     avg_cost = :avg_cost,
+                    cost_per_billed_product = :billed_cost,
                     updated_at = :updated_at
             """,
             ExpressionAttributeValues={
@@ -209,10 +229,13 @@ def update_dynamodb(table_name: str, file_id: str, run_id: str, summary: Dict, r
                 ':total_tokens': summary['total_tokens'],
                 ':prompt_tokens': summary['prompt_tokens'],
                 ':completion_tokens': summary['completion_tokens'],
+                ':cached_tokens': summary['cached_tokens'],
+                ':cache_hit_ratio': Decimal(str(summary['cache_hit_ratio'])),
                 ':success': summary['success_count'],
                 ':filtered': summary['filtered_count'],
                 ':errors': summary['error_count'],
                 ':avg_cost': Decimal(str(summary['avg_cost_per_product'])),
+                ':billed_cost': Decimal(str(summary['cost_per_billed_product'])),
                 ':updated_at': datetime.utcnow().isoformat()
             },
             ReturnValues='UPDATED_NEW'
@@ -258,6 +281,11 @@ def update_file_tracker(file_id: str, run_id: str, summary: Dict, tracking_path:
         tracking_data[file_key]['total_tokens'] = summary['total_tokens']
         tracking_data[file_key]['input_tokens'] = summary['prompt_tokens']
         tracking_data[file_key]['output_tokens'] = summary['completion_tokens']
+        tracking_data[file_key]['cached_input_tokens'] = summary['cached_tokens']
+        tracking_data[file_key]['cache_hit_ratio'] = summary['cache_hit_ratio']
+        tracking_data[file_key]['prompt_cache_saved_cost'] = summary['prompt_cache_saved_cost']
+        tracking_data[file_key]['effective_cost_per_product'] = summary['avg_cost_per_product']
+        tracking_data[file_key]['cost_per_billed_product'] = summary['cost_per_billed_product']
         tracking_data[file_key]['success'] = summary['success_count']
         tracking_data[file_key]['filtered'] = summary['filtered_count']
         tracking_data[file_key]['errors'] = summary['error_count']
@@ -292,11 +320,14 @@ def print_summary(summary: Dict, per_product: List[Dict]):
     
     print(f"\n💰 COSTS:")
     print(f"   Total API Cost: ${summary['total_cost']:.4f}")
-    print(f"   Avg per product: ${summary['avg_cost_per_product']:.6f}")
+    print(f"   Effective cost per product: ${summary['avg_cost_per_product']:.6f} (cache/dedup reuse included)")
+    print(f"   Cost per billed product: ${summary['cost_per_billed_product']:.6f} ({summary['billed_products']:,} products made API calls)")
+    print(f"   Prompt cache saved: ${summary['prompt_cache_saved_cost']:.4f}")
     
     print(f"\n🔢 TOKENS:")
     print(f"   Total: {summary['total_tokens']:,}")
     print(f"   Input (prompt): {summary['prompt_tokens']:,}")
+    print(f"   Cached input: {summary['cached_tokens']:,} ({summary['cache_hit_ratio'] * 100:.1f}% prompt-cache hit ratio)")
     print(f"   Output (completion): {summary['completion_tokens']:,}")
     print(f"   Avg per product: {summary['avg_tokens_per_product']:.0f}")
     
@@ -103,3 +103,23 @@ def build_filtered_result(
     
     return result
 
+
+
+def build_deferred_result(
+    result: Dict[str, Any],
+    error_message: str
+) -> Dict[str, Any]:
+    """
+    Build deferred result dictionary (DRY)
+    
+    Args:
+        result: Error result of a record cut off by the run deadline
+        error_message: Why it did not finish
+    
+    Returns:
+        Updated result dict (picked up again by --retry-errors)
+    """
+    result['status'] = 'deferred'
+    result['error'] = error_message
+    result['reasoning'] = f"Deferred (run deadline reached): {error_message}"
+    return result
@@ -0,0 +1,319 @@
+"""
+BatchRunner tests against an in-memory files / batches client
+
+FakeOpenAI answers every uploaded request through a responder function
+(custom_id, request body) -> output line (None = still unfinished when the
+batch ends), so a test scripts what each round returns without touching
+the network.
+"""
+
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from src.llm import batch_client
+from src.llm.batch_client import BATCH_PRICE_MULTIPLIER, BatchRunner
+from src.llm.gpt_client import GPTClient
+from src.llm.latency_presets import build_round_policy
+from src.llm.llm_config import LLMConfig
+
+
+FINAL_ANSWER = {'form': {'value': 'CAPSULE'}, 'ingredients': [{'name': 'Vitamin D3', 'category': 'VITAMINS'}]}
+
+TOOLS = [{
+    'type': 'function',
+    'function': {
+        'name': 'lookup_ingredient',
+        'parameters': {'type': 'object', 'properties': {'name': {'type': 'string'}}}
+    }
+}]
+
+
+# ----- fake OpenAI client -----
+
+def completion(content=None, tool_calls=None, prompt_tokens=100, completion_tokens=20):
+    """chat.completion body with a final answer or tool calls"""
+    message = {'role': 'assistant', 'content': content}
+    if tool_calls:
+        message['tool_calls'] = [
+            {'id': f'call_{i}', 'type': 'function', 'function': {'name': name, 'arguments': json.dumps(args)}}
+            for i, (name, args) in enumerate(tool_calls)
+        ]
+    return {
+        'id': 'chatcmpl-test',
+        'object': 'chat.completion',
+        'created': 0,
+        'model': 'gpt-5-mini',
+        'choices': [{'index': 0, 'finish_reason': 'tool_calls' if tool_calls else 'stop', 'message': message}],
+        'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                  'total_tokens': prompt_tokens + completion_tokens}
+    }
+
+
+def ok(custom_id, body):
+    """Output-file line of a successful request"""
+    return {'custom_id': custom_id, 'response': {'status_code': 200, 'body': body}, 'error': None}
+
+
+def has_tool_result(body):
+    """Whether the request already carries a tool message"""
+    return any(message.get('role') == 'tool' for message in body['messages'])
+
+
+def tool_then_answer(custom_id, body):
+    """Ask for one lookup, then answer"""
+    if has_tool_result(body):
+        return ok(custom_id, completion(json.dumps(FINAL_ANSWER)))
+    return ok(custom_id, completion(tool_calls=[('lookup_ingredient', {'name': 'vitamin d3'})]))
+
+
+class FakeOpenAI:
+    """files / batches endpoints; batches finish at their first retrieve after one 'in_progress' poll"""
+
+    def __init__(self, respond, statuses=None, errors=None):
+        self.respond = respond
+        self.statuses = list(statuses or [])  # Terminal status per created batch (default 'completed')
+        self.errors = errors  # batch.errors.data messages for failed batches
+        self.files = SimpleNamespace(create=self._create_file, content=self._file_content)
+        self.batches = SimpleNamespace(create=self._create_batch, retrieve=self._retrieve_batch)
+        self.file_text = {}
+        self.submitted = []  # Request lines of each created batch
+        self._batches = {}
+
+    def _create_file(self, file, purpose):
+        name, payload = file
+        file_id = f'file-{len(self.file_text)}'
+        self.file_text[file_id] = payload.read().decode('utf-8')
+        return SimpleNamespace(id=file_id)
+
+    def _file_content(self, file_id):
+        return SimpleNamespace(text=self.file_text[file_id])
+
+    def _create_batch(self, input_file_id, endpoint, completion_window):
+        lines = [json.loads(line) for line in self.file_text[input_file_id].splitlines() if line.strip()]
+        self.submitted.append(lines)
+        output = [self.respond(line['custom_id'], line['body']) for line in lines]
+        output = [line for line in output if line is not None]
+        output_file_id = None
+        if output:
+            output_file_id = f'file-{len(self.file_text)}'
+            self.file_text[output_file_id] = '\n'.join(json.dumps(line) for line in output) + '\n'
+
+        batch_id = f'batch_{len(self._batches)}'
+        status = self.statuses.pop(0) if self.statuses else 'completed'
+        self._batches[batch_id] = {'status': status, 'output_file_id': output_file_id, 'polled': False,
+                                   'total': len(lines)}
+        return SimpleNamespace(id=batch_id)
+
+    def _retrieve_batch(self, batch_id):
+        batch = self._batches[batch_id]
+        counts = SimpleNamespace(completed=0, failed=0, total=batch['total'])
+        if not batch['polled']:
+            batch['polled'] = True
+            return SimpleNamespace(id=batch_id, status='in_progress', request_counts=counts)
+        errors = SimpleNamespace(data=[SimpleNamespace(message=m) for m in self.errors]) if self.errors else None
+        return SimpleNamespace(id=batch_id, status=batch['status'], request_counts=counts,
+                               output_file_id=batch['output_file_id'], error_file_id=None, errors=errors)
+
+
+# ----- fixtures -----
+
+@pytest.fixture
+def config():
+    config = LLMConfig()
+    config.model = 'gpt-5-mini'
+    config.batch_poll_interval = 0
+    config.batch_max_rounds = 4
+    config.resume_max_steps = 2
+    config.compact_tool_results = False
+    return config
+
+
+def make_runner(config, fake):
+    client = GPTClient(api_key='test-key', config=config)
+    client.register_tool('lookup_ingredient', lambda name: {'name': name, 'category': 'VITAMINS'})
+    client.client = fake
+    return BatchRunner(client, config)
+
+
+def run(runner, prompts):
+    return runner.run(prompts, tools=TOOLS, use_schema=False, round_policy=build_round_policy(None))
+
+
+# ----- tool-call rounds -----
+
+def test_tool_loop_resubmits_only_unfinished_conversations(config):
+    def respond(custom_id, body):
+        if custom_id == 'direct':
+            return ok(custom_id, completion(json.dumps(FINAL_ANSWER)))
+        return tool_then_answer(custom_id, body)
+
+    fake = FakeOpenAI(respond)
+    runner = make_runner(config, fake)
+    results = run(runner, {'direct': 'prompt 1', 'tools': 'prompt 2'})
+
+    assert [sorted(line['custom_id'] for line in lines) for lines in fake.submitted] == [['direct', 'tools'], ['tools']]
+    assert results['direct']['form'] == {'value': 'CAPSULE'}
+    assert results['direct']['_metadata']['batch']['rounds'] == 1
+    assert results['tools']['ingredients'] == FINAL_ANSWER['ingredients']
+
+    metadata = results['tools']['_metadata']
+    assert metadata['batch'] == {'rounds': 2, 'batch_ids': ['batch_0', 'batch_1']}
+    assert metadata['round_trips'] == 2
+    assert metadata['tokens_used']['total'] == 240
+    assert [call['function'] for call in metadata['tool_calls']] == ['lookup_ingredient']
+    assert metadata['tool_calls'][0]['result'] == {'name': 'vitamin d3', 'category': 'VITAMINS'}
+
+
+def test_second_round_carries_assistant_turn_and_tool_result(config):
+    fake = FakeOpenAI(tool_then_answer)
+    run(make_runner(config, fake), {'p': 'prompt'})
+
+    messages = fake.submitted[1][0]['body']['messages']
+    assert [message['role'] for message in messages] == ['user', 'assistant', 'tool']
+    assert messages[1]['tool_calls'][0]['id'] == 'call_0'
+    assert messages[2]['tool_call_id'] == 'call_0'
+    assert json.loads(messages[2]['content'])['category'] == 'VITAMINS'
+
+
+def test_batch_results_are_billed_at_batch_price(config):
+    runner = make_runner(config, FakeOpenAI(tool_then_answer))
+    metadata = run(runner, {'p': 'prompt'})['p']['_metadata']
+
+    interactive = runner.client._build_metadata(metadata['tokens_used'], [])
+    assert metadata['total_cost'] == pytest.approx(interactive['total_cost'] * BATCH_PRICE_MULTIPLIER)
+
+
+def test_invalid_json_is_repaired_in_the_next_round(config):
+    def respond(custom_id, body):
+        if body['messages'][-1]['role'] == 'user' and len(body['messages']) > 1:
+            return ok(custom_id, completion(json.dumps(FINAL_ANSWER)))
+        return ok(custom_id, completion('{"form": '))
+
+    result = run(make_runner(config, FakeOpenAI(respond)), {'p': 'prompt'})['p']
+
+    assert result['form'] == {'value': 'CAPSULE'}
+    assert result['_metadata']['resume']['steps'] == 1
+    assert result['_metadata']['batch']['rounds'] == 2
+
+
+def test_max_rounds_exhausted(config):
+    config.batch_max_rounds = 2
+
+    def respond(custom_id, body):
+        return ok(custom_id, completion(tool_calls=[('lookup_ingredient', {'name': 'zinc'})]))
+
+    fake = FakeOpenAI(respond)
+    results = run(make_runner(config, fake), {'p': 'prompt'})
+
+    assert len(fake.submitted) == 2
+    assert results['p'] == {'error': 'Tool-call loop did not finish within 2 batch rounds', 'success': False}
+
+
+# ----- splitting -----
+
+def test_chunk_splits_by_request_count(monkeypatch):
+    monkeypatch.setattr(batch_client, 'MAX_BATCH_REQUESTS', 2)
+    chunks = BatchRunner._chunk([(str(i), {'messages': []}) for i in range(5)])
+
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    assert [json.loads(line)['custom_id'] for chunk in chunks for line in chunk] == ['0', '1', '2', '3', '4']
+    assert json.loads(chunks[0][0])['url'] == batch_client.BATCH_ENDPOINT
+
+
+def test_chunk_splits_by_file_size(monkeypatch):
+    requests = [(str(i), {'messages': [{'role': 'user', 'content': 'x' * 100}]}) for i in range(3)]
+    line_bytes = len(BatchRunner._chunk(requests[:1])[0][0]) + 1
+    monkeypatch.setattr(batch_client, 'MAX_BATCH_FILE_BYTES', line_bytes * 2)
+
+    assert [len(chunk) for chunk in BatchRunner._chunk(requests)] == [2, 1]
+
+
+def test_oversized_request_still_gets_its_own_chunk(monkeypatch):
+    monkeypatch.setattr(batch_client, 'MAX_BATCH_FILE_BYTES', 10)
+    chunks = BatchRunner._chunk([('a', {'messages': []}), ('b', {'messages': []})])
+
+    assert [len(chunk) for chunk in chunks] == [1, 1]
+
+
+def test_split_round_merges_every_batch(config, monkeypatch):
+    monkeypatch.setattr(batch_client, 'MAX_BATCH_REQUESTS', 2)
+    fake = FakeOpenAI(lambda custom_id, body: ok(custom_id, completion(json.dumps(FINAL_ANSWER))))
+    runner = make_runner(config, fake)
+    results = run(runner, {str(i): f'prompt {i}' for i in range(5)})
+
+    assert [len(lines) for lines in fake.submitted] == [2, 2, 1]
+    assert all(result['form'] == {'value': 'CAPSULE'} for result in results.values())
+    assert runner.batch_ids == ['batch_0', 'batch_1', 'batch_2']
+
+
+# ----- result files -----
+
+def test_read_results_error_and_non_200_lines(config):
+    fake = FakeOpenAI(None)
+    fake.file_text['out'] = '\n'.join(json.dumps(line) for line in [
+        ok('good', completion('{}')),
+        {'custom_id': 'request_error', 'response': None, 'error': {'code': 'invalid', 'message': 'Bad request line'}},
+        {'custom_id': 'rate_limited', 'response': {'status_code': 429, 'body': {'error': {'message': 'Too many tokens'}}},
+         'error': None},
+        {'custom_id': 'server_error', 'response': {'status_code': 500, 'body': {}}, 'error': None}
+    ]) + '\n\n'
+
+    responses = make_runner(config, fake)._read_results('out')
+
+    assert responses['good'] == {'body': completion('{}')}
+    assert responses['request_error'] == {'error': 'Batch request failed: Bad request line'}
+    assert responses['rate_limited'] == {'error': 'Batch request failed: Too many tokens'}
+    assert responses['server_error'] == {'error': 'Batch request failed: 500'}
+
+
+def test_failed_request_line_fails_only_its_product(config):
+    def respond(custom_id, body):
+        if custom_id == 'bad':
+            return {'custom_id': custom_id, 'response': {'status_code': 400,
+                                                         'body': {'error': {'message': 'Invalid schema'}}}}
+        return ok(custom_id, completion(json.dumps(FINAL_ANSWER)))
+
+    results = run(make_runner(config, FakeOpenAI(respond)), {'good': 'prompt', 'bad': 'prompt'})
+
+    assert results['good']['form'] == {'value': 'CAPSULE'}
+    assert results['bad'] == {'error': 'Batch request failed: Invalid schema', 'success': False}
+
+
+# ----- expired / failed batches -----
+
+def test_expired_batch_keeps_finished_requests(config):
+    def respond(custom_id, body):
+        return ok(custom_id, completion(json.dumps(FINAL_ANSWER))) if custom_id == 'done' else None
+
+    results = run(make_runner(config, FakeOpenAI(respond, statuses=['expired'])), {'done': 'prompt', 'late': 'prompt'})
+
+    assert results['done']['form'] == {'value': 'CAPSULE'}
+    assert results['late'] == {'error': 'No result returned by batch', 'success': False}
+
+
+def test_expired_batch_in_a_later_round(config):
+    def respond(custom_id, body):
+        # Round 2 expires before 'slow' finishes
+        if custom_id == 'slow' and has_tool_result(body):
+            return None
+        return tool_then_answer(custom_id, body)
+
+    fake = FakeOpenAI(respond, statuses=['completed', 'expired'])
+    results = run(make_runner(config, fake), {'fast': 'prompt', 'slow': 'prompt'})
+
+    assert len(fake.submitted) == 2
+    assert results['fast']['_metadata']['batch']['rounds'] == 2
+    assert results['slow'] == {'error': 'No result returned by batch', 'success': False}
+
+
+def test_failed_batch_without_output_fails_every_product(config, capsys):
+    fake = FakeOpenAI(lambda custom_id, body: None, statuses=['failed'], errors=['Input file is invalid'])
+    results = run(make_runner(config, fake), {'a': 'prompt', 'b': 'prompt'})
+
+    assert results == {
+        'a': {'error': 'No result returned by batch', 'success': False},
+        'b': {'error': 'No result returned by batch', 'success': False}
+    }
+    assert 'Input file is invalid' in capsys.readouterr().out
@@ -0,0 +1,147 @@
+"""
+Multi-product packing tests - splitting packed answers and the pack dispatcher
+"""
+
+from src.pipeline.packing import PackedDispatcher, _share, split_pack_result
+
+
+def pack(*asins):
+    return [{'asin': asin, 'title': f'Title {asin}'} for asin in asins]
+
+
+def member(asin, **extra):
+    return dict({'asin': asin, 'age': 'ADULT', 'gender': 'UNISEX', 'form': 'CAPSULE', 'organic': False,
+                 'ingredients': [], 'business_rules': {'final_category': 'VITAMINS'}}, **extra)
+
+
+def packed_result(members, tokens=None, total_cost=0.03, tool_calls=None):
+    return {
+        'products': members,
+        '_metadata': {
+            'model': 'gpt-5-mini',
+            'tokens_used': tokens or {'prompt': 3000, 'completion': 900, 'total': 3900},
+            'total_cost': total_cost,
+            'cost_breakdown': {'uncached_cost': total_cost, 'cached_tokens': 0},
+            'tool_calls': tool_calls,
+            'round_trips': 2
+        }
+    }
+
+
+class FakePack:
+    """call_pack stand-in: answers every member, records the packs it saw"""
+
+    def __init__(self):
+        self.packs = []
+
+    def __call__(self, items):
+        self.packs.append([item['asin'] for item in items])
+        return packed_result([member(item['asin']) for item in items])
+
+
+# ----- split_pack_result -----
+
+def test_split_keeps_pack_order_and_strips_asin():
+    members = split_pack_result(packed_result([member('B'), member('A', form='TABLET')]), pack('A', 'B'))
+
+    assert [m['form'] for m in members] == ['TABLET', 'CAPSULE']
+    assert all('asin' not in m for m in members)
+    assert members[1]['_metadata']['pack'] == {'size': 2, 'position': 1, 'asins': ['A', 'B']}
+    assert members[0]['_metadata']['round_trips'] == 2
+
+
+def test_split_fails_when_a_member_is_missing():
+    assert split_pack_result(packed_result([member('A')]), pack('A', 'B')) is None
+
+
+def test_split_fails_when_a_member_is_malformed():
+    incomplete = member('B')
+    del incomplete['ingredients']
+    assert split_pack_result(packed_result([member('A'), incomplete]), pack('A', 'B')) is None
+
+    no_rules = member('B', business_rules={})
+    assert split_pack_result(packed_result([member('A'), no_rules]), pack('A', 'B')) is None
+    # Local rules / lean answers do not need them
+    assert split_pack_result(packed_result([member('A'), no_rules]), pack('A', 'B'), require_rules=False) is not None
+
+
+def test_split_fails_on_error_or_missing_products():
+    assert split_pack_result({'error': 'timeout'}, pack('A')) is None
+    assert split_pack_result({'products': {'A': member('A')}}, pack('A')) is None
+
+
+def test_split_divides_tokens_and_cost():
+    tokens = {'prompt': 3001, 'completion': 901, 'total': 3902}
+    members = split_pack_result(packed_result([member('A'), member('B'), member('C')], tokens=tokens, total_cost=0.03),
+                                pack('A', 'B', 'C'))
+
+    shares = [m['_metadata']['tokens_used'] for m in members]
+    assert [share['prompt'] for share in shares] == [1001, 1000, 1000]
+    assert [share['completion'] for share in shares] == [301, 300, 300]
+    assert sum(share['total'] for share in shares) == 3902
+    assert all(abs(m['_metadata']['total_cost'] - 0.01) < 1e-12 for m in members)
+
+
+def test_split_attributes_tool_calls():
+    tool_calls = [
+        {'function': 'lookup_health_focus', 'arguments': {'title': 'Title A'}},
+        {'function': 'lookup_health_focus', 'arguments': {'title': 'Title B'}},
+        {'function': 'lookup_ingredient', 'arguments': {'name': 'zinc'}},
+        # Tool error: the raw argument string could not be parsed - nobody owns it
+        {'function': 'lookup_health_focus', 'arguments': '{"title": "Title A"', 'error': 'JSONDecodeError'}
+    ]
+    members = split_pack_result(packed_result([member('A'), member('B')], tool_calls=tool_calls), pack('A', 'B'))
+
+    calls_a, calls_b = (m['_metadata']['tool_calls'] for m in members)
+    assert calls_a == [tool_calls[0], tool_calls[2], tool_calls[3]]
+    assert calls_b == [tool_calls[1], tool_calls[2], tool_calls[3]]
+
+
+# ----- _share -----
+
+def test_share_gives_remainder_to_first_members():
+    assert [_share(10, 4, index) for index in range(4)] == [3, 3, 2, 2]
+    assert [_share(2, 3, index) for index in range(3)] == [1, 1, 0]
+    assert [_share(9, 3, index) for index in range(3)] == [3, 3, 3]
+
+
+# ----- PackedDispatcher -----
+
+def test_dispatcher_packs_and_resolves_members():
+    call_pack = FakePack()
+    dispatcher = PackedDispatcher(call_pack, initial_size=3, max_size=3, max_wait_ms=2000, workers=2)
+
+    futures = [dispatcher.submit(f'Title {asin}', asin) for asin in ('A', 'B', 'C')]
+    results = [future.result(timeout=5) for future in futures]
+
+    assert call_pack.packs == [['A', 'B', 'C']]
+    assert [r['_metadata']['pack']['position'] for r in results] == [0, 1, 2]
+    stats = dispatcher.stats()
+    assert (stats['packs'], stats['packed_products'], stats['failed_packs']) == (1, 3, 0)
+
+
+def test_dispatcher_holds_back_duplicate_asins():
+    call_pack = FakePack()
+    dispatcher = PackedDispatcher(call_pack, initial_size=3, max_size=3, adaptive=False, max_wait_ms=200, workers=2)
+
+    first, duplicate, other = (dispatcher.submit(f'Title {asin}', asin) for asin in ('A', 'A', 'B'))
+
+    assert first.result(timeout=5) is not None
+    assert other.result(timeout=5) is not None
+    # Left alone in the next pack - a pack of one goes single
+    assert duplicate.result(timeout=5) is None
+    assert call_pack.packs == [['A', 'B']]
+
+
+def test_dispatcher_bills_failed_packs_and_falls_back():
+    def call_pack(items):
+        return packed_result([member(items[0]['asin'])], tokens={'total': 500}, total_cost=0.02)
+
+    dispatcher = PackedDispatcher(call_pack, initial_size=2, max_size=4, max_wait_ms=2000, workers=2)
+    futures = [dispatcher.submit(f'Title {asin}', asin) for asin in ('A', 'B')]
+
+    assert [future.result(timeout=5) for future in futures] == [None, None]
+    stats = dispatcher.stats()
+    assert (stats['failed_packs'], stats['fallback_products']) == (1, 2)
+    assert (stats['failed_pack_tokens'], stats['failed_pack_cost']) == (500, 0.02)
+    assert stats['current_pack_size'] == 1
@@ -0,0 +1,201 @@
+"""
+Responses API transport tests - request translation, conversation state and reply wrapping
+"""
+
+import json
+
+from openai.types.chat import ChatCompletionMessage
+from openai.types.responses import Response
+
+from src.llm.responses_api import ResponsesConversation, to_input_items, wrap_response
+
+
+TOOLS = [{
+    'type': 'function',
+    'function': {
+        'name': 'lookup_ingredient',
+        'description': 'Look up an ingredient',
+        'parameters': {'type': 'object', 'properties': {'name': {'type': 'string'}}},
+        'strict': True
+    }
+}]
+
+
+def response(response_id, output, input_tokens=1000, output_tokens=300, cached=0, reasoning=0):
+    """Responses API reply (real SDK type) with the given output items"""
+    return Response.model_validate({
+        'id': response_id,
+        'object': 'response',
+        'created_at': 1700000000,
+        'model': 'gpt-5-mini',
+        'status': 'completed',
+        'parallel_tool_calls': True,
+        'tool_choice': 'auto',
+        'tools': [],
+        'output': output,
+        'usage': {
+            'input_tokens': input_tokens,
+            'output_tokens': output_tokens,
+            'total_tokens': input_tokens + output_tokens,
+            'input_tokens_details': {'cached_tokens': cached},
+            'output_tokens_details': {'reasoning_tokens': reasoning}
+        }
+    })
+
+
+def function_call(call_id, name, arguments):
+    return {'type': 'function_call', 'id': f'fc_{call_id}', 'call_id': call_id, 'name': name,
+            'arguments': json.dumps(arguments), 'status': 'completed'}
+
+
+def text_message(*texts):
+    return {'type': 'message', 'id': 'msg_1', 'role': 'assistant', 'status': 'completed',
+            'content': [{'type': 'output_text', 'text': text, 'annotations': []} for text in texts]}
+
+
+def chat_params(messages, **extra):
+    return dict({'model': 'gpt-5-mini', 'messages': messages}, **extra)
+
+
+# ----- to_input_items -----
+
+def test_input_items_skip_assistant_turns():
+    assistant = {'role': 'assistant', 'content': None,
+                 'tool_calls': [{'id': 'call_a', 'type': 'function',
+                                 'function': {'name': 'lookup_ingredient', 'arguments': '{}'}}]}
+    items = to_input_items([
+        {'role': 'user', 'content': 'Classify: Zinc 50mg'},
+        assistant,
+        ChatCompletionMessage(role='assistant', content='{"form": '),  # SDK message object, as the tool loop keeps it
+        {'role': 'tool', 'tool_call_id': 'call_a', 'content': '{"category": "MINERALS"}'}
+    ])
+
+    assert items == [
+        {'role': 'user', 'content': 'Classify: Zinc 50mg'},
+        {'type': 'function_call_output', 'call_id': 'call_a', 'output': '{"category": "MINERALS"}'}
+    ]
+
+
+# ----- ResponsesConversation -----
+
+def test_first_request_sends_everything_without_previous_response():
+    conversation = ResponsesConversation()
+    request = conversation.request(chat_params(
+        [{'role': 'user', 'content': 'prompt'}], tools=TOOLS, tool_choice='auto', reasoning_effort='low',
+        max_completion_tokens=4000,
+        response_format={'type': 'json_schema', 'json_schema': {'name': 'result', 'schema': {'type': 'object'}}}
+    ))
+
+    assert 'previous_response_id' not in request
+    assert request['input'] == [{'role': 'user', 'content': 'prompt'}]
+    assert request['store'] is True
+    assert request['reasoning'] == {'effort': 'low'}
+    assert request['max_output_tokens'] == 4000
+    assert request['text'] == {'format': {'type': 'json_schema', 'name': 'result', 'schema': {'type': 'object'},
+                                          'strict': False}}
+    assert request['tools'] == [{'type': 'function', 'name': 'lookup_ingredient',
+                                 'parameters': TOOLS[0]['function']['parameters'],
+                                 'description': 'Look up an ingredient', 'strict': True}]
+    assert request['tool_choice'] == 'auto'
+
+
+def test_follow_up_sends_only_unsent_items():
+    conversation = ResponsesConversation()
+    messages = [{'role': 'user', 'content': 'prompt'}]
+    conversation.request(chat_params(messages))
+    conversation.advance(response('resp_1', [function_call('call_a', 'lookup_ingredient', {'name': 'zinc'})]))
+
+    messages.append({'role': 'assistant', 'content': None, 'tool_calls': []})
+    messages.append({'role': 'tool', 'tool_call_id': 'call_a', 'content': '{"category": "MINERALS"}'})
+    request = conversation.request(chat_params(messages))
+
+    assert request['previous_response_id'] == 'resp_1'
+    assert request['input'] == [{'type': 'function_call_output', 'call_id': 'call_a',
+                                 'output': '{"category": "MINERALS"}'}]
+
+    conversation.advance(response('resp_2', [text_message('{"form": ')]))
+    messages.append({'role': 'assistant', 'content': '{"form": '})
+    messages.append({'role': 'user', 'content': 'Return valid JSON'})
+    request = conversation.request(chat_params(messages))
+
+    assert request['previous_response_id'] == 'resp_2'
+    assert request['input'] == [{'role': 'user', 'content': 'Return valid JSON'}]
+
+
+def test_retries_fork_from_the_same_previous_response():
+    conversation = ResponsesConversation()
+    messages = [{'role': 'user', 'content': 'prompt'}]
+    conversation.request(chat_params(messages))
+    conversation.advance(response('resp_1', [function_call('call_a', 'lookup_ingredient', {'name': 'zinc'})]))
+    messages.append({'role': 'tool', 'tool_call_id': 'call_a', 'content': '{}'})
+
+    # A failed attempt (timeout, 429, losing hedge) never advances the conversation
+    first_attempt = conversation.request(chat_params(messages))
+    retry = conversation.request(chat_params(messages))
+
+    assert retry == first_attempt
+    assert retry['previous_response_id'] == 'resp_1'
+    assert retry['input'] == [{'type': 'function_call_output', 'call_id': 'call_a', 'output': '{}'}]
+
+
+def test_sent_messages_are_not_resent():
+    conversation = ResponsesConversation()
+    messages = [{'role': 'user', 'content': 'prompt'}]
+    conversation.request(chat_params(messages))
+    conversation.advance(response('resp_1', [text_message('{}')]))
+
+    request = conversation.request(chat_params(messages))
+
+    assert request['input'] == []
+    assert request['previous_response_id'] == 'resp_1'
+
+
+# ----- wrap_response -----
+
+def test_wrap_function_calls():
+    completion = wrap_response(response('resp_1', [
+        {'type': 'reasoning', 'id': 'rs_1', 'summary': []},
+        function_call('call_a', 'lookup_ingredient', {'name': 'zinc'}),
+        function_call('call_b', 'lookup_ingredient', {'name': 'vitamin c'})
+    ]))
+
+    choice = completion.choices[0]
+    assert completion.id == 'resp_1'
+    assert choice.finish_reason == 'tool_calls'
+    assert choice.message.content is None
+    assert [(call.id, call.function.name, json.loads(call.function.arguments))
+            for call in choice.message.tool_calls] == [
+        ('call_a', 'lookup_ingredient', {'name': 'zinc'}),
+        ('call_b', 'lookup_ingredient', {'name': 'vitamin c'})
+    ]
+
+
+def test_wrap_text_output():
+    completion = wrap_response(response('resp_2', [text_message('{"form": ', '"CAPSULE"}')]))
+
+    choice = completion.choices[0]
+    assert choice.finish_reason == 'stop'
+    assert choice.message.tool_calls is None
+    assert json.loads(choice.message.content) == {'form': 'CAPSULE'}
+    assert completion.model == 'gpt-5-mini'
+    assert completion.created == 1700000000
+
+
+def test_wrap_usage_details():
+    completion = wrap_response(response('resp_3', [text_message('{}')], input_tokens=1200, output_tokens=400,
+                                        cached=1024, reasoning=256))
+
+    usage = completion.usage
+    assert (usage.prompt_tokens, usage.completion_tokens, usage.total_tokens) == (1200, 400, 1600)
+    assert usage.prompt_tokens_details.cached_tokens == 1024
+    assert usage.completion_tokens_details.reasoning_tokens == 256
+
+
+def test_wrap_usage_without_details():
+    reply = response('resp_4', [text_message('{}')])
+    reply.usage.input_tokens_details = None
+    reply.usage.output_tokens_details = None
+
+    usage = wrap_response(reply).usage
+    assert usage.prompt_tokens_details.cached_tokens == 0
+    assert usage.completion_tokens_details.reasoning_tokens == 0
@@ -0,0 +1,187 @@
+"""
+Retry policy tests - server wait hints, retry budget, circuit breaker and retry decisions
+"""
+
+import time
+from email.utils import formatdate
+
+import httpx
+import openai
+
+from src.llm.utils.retry_policy import (
+    BREAKER_CLOSED, BREAKER_HALF_OPEN, BREAKER_OPEN, CircuitBreaker, RetryBudget, RetryPolicy, server_retry_after
+)
+
+
+REQUEST = httpx.Request('POST', 'https://api.openai.com/v1/chat/completions')
+
+
+def api_error(error_class, status, headers=None):
+    response = httpx.Response(status, headers=headers or {}, request=REQUEST)
+    return error_class('error', response=response, body=None)
+
+
+def rate_limited(**headers):
+    return api_error(openai.RateLimitError, 429, headers)
+
+
+def open_breaker(breaker, failures):
+    for _ in range(failures):
+        breaker.record(False)
+    assert breaker.state == BREAKER_OPEN
+
+
+# ----- server_retry_after -----
+
+def test_retry_after_seconds():
+    assert server_retry_after(rate_limited(**{'retry-after': '7'})) == 7.0
+
+
+def test_retry_after_ms_wins_over_seconds():
+    assert server_retry_after(rate_limited(**{'retry-after-ms': '1500', 'retry-after': '7'})) == 1.5
+
+
+def test_retry_after_http_date():
+    wait = server_retry_after(rate_limited(**{'retry-after': formatdate(time.time() + 30, usegmt=True)}))
+    assert 25 <= wait <= 30
+
+    past = server_retry_after(rate_limited(**{'retry-after': formatdate(time.time() - 30, usegmt=True)}))
+    assert past == 0.0
+
+
+def test_rate_limit_reset_headers_take_the_longest():
+    error = rate_limited(**{'x-ratelimit-reset-requests': '120ms', 'x-ratelimit-reset-tokens': '1m6s'})
+    assert server_retry_after(error) == 66.0
+
+
+def test_reset_headers_only_count_for_rate_limits():
+    error = api_error(openai.InternalServerError, 500, {'x-ratelimit-reset-requests': '5s'})
+    assert server_retry_after(error) is None
+
+
+def test_no_hint():
+    assert server_retry_after(rate_limited()) is None
+    assert server_retry_after(rate_limited(**{'retry-after': 'soon'})) is None
+    assert server_retry_after(openai.APIConnectionError(request=REQUEST)) is None
+
+
+# ----- RetryBudget -----
+
+def test_budget_runs_out_and_is_earned_back():
+    budget = RetryBudget(ratio=0.5, min_retries=1)
+
+    assert budget.try_spend()
+    assert not budget.try_spend()
+
+    budget.record_attempt()
+    assert not budget.try_spend()
+    budget.record_attempt()
+    assert budget.try_spend()
+
+
+def test_policy_gives_up_when_budget_is_exhausted():
+    policy = RetryPolicy(max_attempts=5, budget=RetryBudget(ratio=0, min_retries=1),
+                         breaker=CircuitBreaker(min_calls=100))
+    error = rate_limited(**{'retry-after': '2'})
+
+    assert policy.next_delay(error, 1, 0.0) == 2.0
+    assert policy.next_delay(error, 1, 0.0) is None
+
+    stats = policy.stats()
+    assert (stats['retries'], stats['gave_up'], stats['budget_exhausted']) == (1, 1, 1)
+    assert stats['server_hinted_waits'] == 1
+
+
+# ----- CircuitBreaker -----
+
+def test_breaker_opens_on_error_rate():
+    breaker = CircuitBreaker(error_rate=0.5, window=4, min_calls=4, cooldown_sec=60)
+    breaker.record(True)
+    breaker.record(True)
+    breaker.record(False)
+    assert breaker.state == BREAKER_CLOSED
+
+    breaker.record(False)
+    assert breaker.state == BREAKER_OPEN
+    assert breaker._admit() > 0
+    assert breaker.stats()['opens'] == 1
+
+
+def test_breaker_probe_success_closes():
+    breaker = CircuitBreaker(error_rate=0.5, window=4, min_calls=2, cooldown_sec=0.01)
+    open_breaker(breaker, 2)
+    time.sleep(0.02)
+
+    # One probe goes through, everyone else keeps waiting for its outcome
+    assert breaker._admit() == 0.0
+    assert breaker.state == BREAKER_HALF_OPEN
+    assert breaker._admit() > 0
+
+    breaker.record(True)
+    assert breaker.state == BREAKER_CLOSED
+    assert breaker._admit() == 0.0
+
+    # Old failures were cleared - one more does not re-open it
+    breaker.record(False)
+    assert breaker.state == BREAKER_CLOSED
+
+
+def test_breaker_probe_failure_reopens_with_longer_cooldown():
+    breaker = CircuitBreaker(error_rate=0.5, window=4, min_calls=2, cooldown_sec=0.01, max_cooldown_sec=0.03)
+    open_breaker(breaker, 2)
+    time.sleep(0.02)
+
+    assert breaker._admit() == 0.0
+    breaker.record(False)
+    assert breaker.state == BREAKER_OPEN
+    assert breaker._cooldown == 0.02
+    assert breaker.stats()['opens'] == 2
+
+    time.sleep(0.03)
+    assert breaker._admit() == 0.0
+    breaker.record(False)
+    assert breaker._cooldown == 0.03  # Capped
+
+
+def test_before_call_waits_out_the_cooldown():
+    breaker = CircuitBreaker(error_rate=0.5, window=4, min_calls=2, cooldown_sec=0.05)
+    open_breaker(breaker, 2)
+
+    started = time.monotonic()
+    breaker.before_call()
+
+    assert time.monotonic() - started >= 0.04
+    assert breaker.state == BREAKER_HALF_OPEN
+    assert breaker.stats()['paused_calls'] == 1
+
+
+# ----- RetryPolicy.next_delay -----
+
+def test_non_transient_errors_are_not_retried():
+    policy = RetryPolicy(breaker=CircuitBreaker(error_rate=0.5, window=4, min_calls=2))
+
+    for error in (api_error(openai.BadRequestError, 400), api_error(openai.AuthenticationError, 401),
+                  ValueError('bad JSON')):
+        assert policy.next_delay(error, 1, 0.0) is None
+
+    # Not an availability problem - the breaker counts them as successes
+    assert policy.breaker.state == BREAKER_CLOSED
+    assert policy.stats()['retries'] == 0
+
+
+def test_transient_errors_back_off_until_max_attempts():
+    policy = RetryPolicy(max_attempts=3, base_delay=1.0, max_delay=5.0, breaker=CircuitBreaker(min_calls=100))
+
+    for error in (rate_limited(), api_error(openai.InternalServerError, 503),
+                  openai.APIConnectionError(request=REQUEST), openai.APITimeoutError(request=REQUEST)):
+        delay = policy.next_delay(error, 1, 0.0)
+        assert 1.0 <= delay <= 5.0
+
+    assert 1.0 <= policy.next_delay(rate_limited(), 2, 4.0) <= 5.0
+    assert policy.next_delay(rate_limited(), 3, 4.0) is None
+    assert policy.stats()['gave_up'] == 1
+
+
+def test_server_hint_is_capped_by_max_delay():
+    policy = RetryPolicy(max_delay=10.0, breaker=CircuitBreaker(min_calls=100))
+    assert policy.next_delay(rate_limited(**{'retry-after': '120'}), 1, 0.0) == 10.0